@@ -39,6 +39,7 @@
 
  // forward
 class Read;
+struct hit_buffers;
 struct Runopts;
 struct Index;
 class References;
@@ -116,7 +117,7 @@ struct alignment_struct
 };
 
 void compute_lis_alignment(
-	Read & read, Runopts & opts, Index & index, References & refs, Readstats & readstats, Refstats & refstats,
+	Read & read, hit_buffers & hits, Runopts & opts, Index & index, References & refs, Readstats & readstats, Refstats & refstats,
 	bool & search,
 	uint32_t max_SW_score,
 	bool& read_to_count
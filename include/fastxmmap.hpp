@@ -0,0 +1,60 @@
+#pragma once
+/**
+ * FILE: fastxmmap.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Zero-copy scanner of non-compressed FASTA/FASTQ files. The file is memory mapped, the lines are found
+ * with 'memchr', and the records are returned as pointers into the mapped file. The sequence is only copied
+ * when it spans multiple lines (multi-line FASTA).
+ *
+ * The mapped pages are shared with the OS page cache, so the repeated passes over the same Reads file
+ * (index parts, post-processing, reports) don't copy the file into the process.
+ */
+
+#include <string>
+#include <cstdint>
+#include <cstddef>
+
+#include "common.hpp"
+
+/* a FASTA/FASTQ record. The pointers are into the mapped file, or into 'seqbuf' for multi-line sequences */
+struct FastxRec {
+	const char* header = 0; // including '>' or '@'
+	size_t header_len = 0;
+	const char* sequence = 0;
+	size_t seq_len = 0;
+	const char* quality = 0; // FASTQ only
+	size_t qual_len = 0;
+	bool has_plus = false; // FASTQ: the line after the sequence is the '+' separator
+	std::string seqbuf; // multi-line sequence
+	uint64_t offset = 0; // offset of the record in the file
+
+	std::string getHeader() const { return std::string(header, header_len); }
+	std::string getSequence() const { return std::string(sequence, seq_len); }
+	std::string getQuality() const { return std::string(quality, qual_len); }
+};
+
+class FastxMmap {
+public:
+	FastxMmap(const std::string & path);
+	~FastxMmap();
+
+	bool isOpen() { return data != 0 || (fsize == 0 && fd >= 0); }
+	bool next(FastxRec & rec); // scan the next record. False at the end of file
+	void seek(uint64_t offset); // continue scanning from the given offset. Must be a record start
+	bool isFastq() { return format == Format::FASTQ; }
+	size_t size() { return fsize; }
+
+private:
+	int fd;
+	const char* data; // mapped file
+	size_t fsize;
+	const char* pos; // scan position
+	const char* end;
+	Format format;
+	bool is_format_set;
+	const char* pending; // lookahead line (FASTA header of the next record)
+	size_t pending_len;
+
+	bool nextLine(const char* & line, size_t & len);
+}; // ~class FastxMmap
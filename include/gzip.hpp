@@ -1,10 +1,25 @@
 #pragma once
-/* 
+/*
  * FILE: gzip.hpp
  * Created: Feb 22, 2018 Thu
+ *
+ * Line reader for both compressed and non-compressed Reads files.
+ *
+ * Compressed input is inflated off the parsing thread:
+ *   - BGZF (blocked gzip e.g. produced by 'bgzip') - the blocks are split by a reader thread and
+ *     inflated in parallel on a pool of worker threads. The output is handed to 'getline' in the block order.
+ *   - plain gzip (single or multi-member) - a single inflate thread runs ahead of the parser.
  */
 
 #include <vector>
+#include <string>
+#include <map>
+#include <queue>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <atomic>
+#include <fstream>
 
 #include "zlib.h"
 
@@ -12,26 +27,74 @@
 
 #define OUT_SIZE 32768U /* out buffer size */
 #define IN_SIZE 16384      /* file input buffer size */
+#define GZ_CHUNK_SIZE 1048576U /* size of an inflated chunk handed to the parser (plain gzip) */
+#define GZ_MAX_CHUNKS 16 /* max number of inflated chunks waiting for the parser */
+#define BGZF_MAX_BLOCK 65536 /* max size of a BGZF block (both compressed and inflated) */
+#define GZ_ACCESS_SPAN 1048576U /* min distance in the inflated data between two access points */
+#define GZ_WINDOW 32768U /* deflate window size */
 #define RL_OK 0
 #define RL_END 1
 #define RL_ERR -1
 
+/*
+ * Position in a compressed file where the inflating can start without inflating the data before it.
+ * See zlib 'examples/zran.c'
+ */
+struct gz_access_point {
+	uint64_t out; // offset in the inflated data
+	uint64_t in; // offset in the compressed file
+	int bits; // number of bits (1..7) to use from the byte at 'in - 1'. -1: gzip member start i.e. no window is needed
+	std::string window; // up to GZ_WINDOW inflated bytes preceding 'out'
+};
+
 class Gzip
 {
 public:
-	Gzip(Runopts & opts) : opts(opts), line_start(0), pstrm(0) { if (opts.have_reads_gz) init(); }
+	Gzip(Runopts & opts) : opts(opts), cpos(0), chunk_pos(0), line_pos(0), points(0), next_seq(0), num_chunks(0), is_started(false), is_done(false), is_split(false), is_error(false), is_stop(false) {}
+	~Gzip() { stop(); }
 
-	int getline(std::ifstream & ifs, std::string & line);
+	int getline(std::istream & ifs, std::string & line);
+	void trackOffsets(std::vector<gz_access_point> * points) { this->points = points; } // enable 'tell' and collect the access points. Call before 'getline'
+	uint64_t tell() { return line_pos; } // offset of the last line in the (inflated) data. Requires 'trackOffsets'
 
 private:
 	Runopts & opts;
-	// zlib related
-	char* line_start; // pointer to the start of a line within the 'z_out' buffer
-	z_stream * pstrm;
-	std::vector<unsigned char> z_in; // IN buffer for compressed data
-	std::vector<unsigned char> z_out; // OUT buffer for decompressed data
+
+	std::string chunk; // current inflated chunk the lines are taken from
+	size_t cpos; // position in the current chunk
+	uint64_t chunk_pos; // offset of the current chunk in the inflated data
+	uint64_t line_pos; // offset of the last line in the inflated data
+	std::vector<gz_access_point> * points; // access points collected while inflating. Owned by the caller
+
+	// ordered hand-over of the inflated chunks from the inflate threads to the parser
+	std::map<uint64_t, std::string> done; // inflated chunks keyed by sequence number
+	uint64_t next_seq; // sequence number of the next chunk to hand to the parser
+	uint64_t num_chunks; // number of chunks produced so far. Final when 'is_done'
+	std::mutex dlock;
+	std::condition_variable cvDone; // signals a chunk is ready or the inflating is over
+	std::condition_variable cvSpace; // signals the parser consumed a chunk
+
+	// BGZF blocks waiting to be inflated
+	std::queue<std::pair<uint64_t, std::string>> blocks;
+	std::mutex block;
+	std::condition_variable cvBlocks; // signals a block is queued | taken, or the splitting is over
+
+	std::thread producer; // splits BGZF blocks | inflates plain gzip
+	std::vector<std::thread> workers; // inflate BGZF blocks
+	bool is_started;
+	bool is_done; // all the chunks were produced
+	bool is_split; // all the BGZF blocks were queued
+	std::atomic_bool is_error;
+	std::atomic_bool is_stop; // the parser is done before the end of the file
 
 private:
-	void init();
-	int inflatez(std::ifstream & ifs); // 'z' in the name to distinguish from zlib.inflate
-};
\ No newline at end of file
+	void start(std::istream & ifs);
+	void stop();
+	bool isBgzf(std::istream & ifs);
+	void inflateStream(std::istream & ifs); // plain gzip. Runs in 'producer'
+	void splitBlocks(std::istream & ifs); // BGZF. Runs in 'producer'
+	void inflateBlocks(); // BGZF. Runs in 'workers'
+	void putChunk(uint64_t seq, std::string && data);
+	void finish(uint64_t count, bool error);
+	bool nextChunk();
+};
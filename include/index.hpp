@@ -5,12 +5,14 @@
 */
 
 #include <vector>
+#include <string>
 #include <cstdint>
 
+#include "shm.hpp"
+#include "indexdb.hpp" // seq_pos, kmer_flat, bucket_layout, positions_compact
+
 // forward
 struct Runopts;
-struct kmer;
-struct kmer_origin;
 class Refstats;
 
 /**
@@ -22,8 +24,35 @@ struct Index {
 	uint32_t part = 0; // currently loaded index part
 	uint32_t number_elements = 0; /* number of positions in (L+1)-mer positions table */
 
-	std::vector<kmer> lookup_tbl; /**< reference to L/2-mer look up table */
-	std::vector<kmer_origin> positions_tbl; /**< reference to (L+1)-mer positions table */
+	std::vector<kmer_flat> lookup_tbl; /**< reference to L/2-mer look up table */
+	/**< (L+1)-mer positions table: positions of the (L+1)-mer 'i' are positions_tbl[positions_idx[i] .. positions_idx[i+1]) */
+	std::vector<seq_pos> positions_tbl;
+	std::vector<uint64_t> positions_idx; /**< number_elements + 1 offsets into 'positions_tbl' */
+	/**< the positions table in use: 'positions_tbl' and 'positions_idx', or the shared memory segment ('--shm') */
+	const seq_pos* positions = 0;
+	const uint64_t* positions_offsets = 0;
+	/**< compact positions table (indexdb --compact): bit-packed offsets and positions used in place, see 'positions_header' */
+	std::vector<uint64_t> positions_packed;
+	const uint64_t* packed_idx = 0;
+	const uint64_t* packed_pos = 0;
+	positions_compact widths = { 0, 0, 0, 0 };
+	bucket_layout bucket; /**< layout of the burst trie bucket entries */
+
+	// positions of the (L+1)-mer 'id' are getPosition(i) for i in [getPositionsBegin(id), getPositionsBegin(id + 1))
+	uint64_t getPositionsBegin(uint32_t id) const
+	{
+		return packed_idx == 0 ? positions_offsets[id] : get_bits(packed_idx, id * uint64_t(widths.idx_bits), widths.idx_bits);
+	}
+	seq_pos getPosition(uint64_t i) const
+	{
+		if (packed_pos == 0)
+			return positions[i];
+		uint64_t bitpos = i * (widths.pos_bits + widths.seq_bits);
+		seq_pos p;
+		p.pos = static_cast<uint32_t>(get_bits(packed_pos, bitpos, widths.pos_bits));
+		p.seq = static_cast<uint32_t>(get_bits(packed_pos, bitpos + widths.pos_bits, widths.seq_bits));
+		return p;
+	}
 
 	// Index stats
 	//long _match = 0;    /* Smith-Waterman score for a match */
@@ -36,4 +65,20 @@ struct Index {
 
 	void load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats);
 	void clear();
+
+private:
+	char* tries_map = 0; // memory mapped flat burst tries file. See 'flat_trie_header'
+	size_t tries_map_size = 0;
+	std::vector<char> tries_buf; // burst tries converted from the legacy index format (or read, if memory mapping is not available)
+	const char* tries_data = 0; // the trie nodes and buckets the look-up table points into
+	uint64_t tries_data_size = 0;
+	ShmSegment shm; // '--shm' shared memory segment the index part is attached from
+
+	void loadFiles(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats);
+	bool loadFlatTries(std::string & btriefile, uint32_t limit);
+	void loadLegacyTries(std::string & btriefile, uint32_t limit);
+	void setTries(const uint64_t* tries, uint32_t limit);
+	void loadPositions(std::string & posfile);
+	bool loadShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats);
+	bool publishShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats);
 }; // ~struct Index
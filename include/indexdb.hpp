@@ -36,6 +36,9 @@
 #define INDEXDB_H
 
 #include <sys/types.h>
+#include <string>
+#include <vector>
+#include <cstring> // memcpy
 #include "ssw.h"
 #include "common.hpp"
 
@@ -94,6 +97,148 @@ struct kmer
 	uint32_t count; // count of 9-mers
 };
 
+/*! @brief Node element of a mini burst trie in the flat (position independent) layout.
+
+	Same as NodeElement, except the pointer to the child trie node or to the bucket
+	is replaced by the distance in bytes from this node element ('offset'),
+	so the burst tries file can be memory mapped and searched in place.
+*/
+struct FlatNodeElement
+{
+	uint32_t offset; // distance (bytes) from this node element to the child trie node (flag 1) or to the bucket (flag 2)
+	uint32_t size; // size (in bytes) of the bucket
+	uint32_t flag; // 0 :: empty; 1 :: trie node; 2 :: bucket
+
+	const FlatNodeElement* child() const { return reinterpret_cast<const FlatNodeElement*>(reinterpret_cast<const char*>(this) + offset); }
+	const unsigned char* bucket() const { return reinterpret_cast<const unsigned char*>(this) + offset; }
+};
+
+/*! @brief Header of the flat burst tries file '<index>.bursttrie_<part>.dat'
+
+	File layout:
+
+	  flat_trie_header
+	  bucket_layout                  compact layout only (FLAT_TRIE_VERSION_COMPACT)
+	  uint64_t tries[num_kmers][2]   offset in the data of the forward and the reverse mini burst trie
+	                                 of each L/2-mer (FLAT_TRIE_NONE if the trie does not exist)
+	  char data[data_size]           the tries. Each trie is laid out breadth-first starting with its root node.
+
+	In the compact layout (indexdb --compact) the bucket entries are packed (see 'bucket_layout')
+	and each bucket is padded to 4 bytes, so the trie nodes stay aligned.
+
+	Indexes built by earlier versions of indexdb have no header (legacy format) and are converted
+	into the flat layout on loading.
+*/
+struct flat_trie_header {
+	char magic[8]; // FLAT_TRIE_MAGIC
+	uint32_t version;
+	uint32_t num_kmers; // number of L/2-mers i.e. the size of the look-up table
+	uint64_t data_size; // size of the tries data
+};
+
+const char FLAT_TRIE_MAGIC[8] = { 'S', 'M', 'R', 'T', 'R', 'I', 'E', 'F' };
+const uint32_t FLAT_TRIE_VERSION = 1;
+const uint32_t FLAT_TRIE_VERSION_COMPACT = 2;
+const uint64_t FLAT_TRIE_NONE = 0xFFFFFFFFFFFFFFFFULL;
+
+/*! @brief Layout of a burst trie bucket entry: the L-mer tail encoded 2 bits/nt followed by the id
+	of the (L+1)-mer in the positions table, both little-endian.
+
+	The default layout is ENTRYSIZE bytes: 4 bytes tail, 4 bytes id. The compact layout uses only the bytes
+	needed for the longest tail and the largest id of the index part, but at least 4 bytes per entry,
+	so that the tail and the id are each read as one 4-byte word.
+*/
+struct bucket_layout {
+	uint32_t entry_size = ENTRYSIZE; // bytes of an entry
+	uint32_t key_size = sizeof(uint32_t); // bytes of the L-mer tail
+	uint32_t id_size = sizeof(uint32_t); // bytes of the id. The id ends the entry
+	uint32_t reserved = 0;
+
+	uint32_t getKey(const unsigned char* entry) const
+	{
+		uint32_t key = 0;
+		memcpy(&key, entry, sizeof(key)); // only the bits of the tail are used
+		return key;
+	}
+	uint32_t getId(const unsigned char* entry) const
+	{
+		uint32_t id = 0;
+		memcpy(&id, entry + entry_size - sizeof(id), sizeof(id));
+		return id >> (8 * (sizeof(id) - id_size));
+	}
+};
+
+/*! @brief Header of the (L+1)-mer positions table file '<index>.pos_<part>.dat'
+
+	File layout (CSR):
+
+	  positions_header
+	  uint64_t positions_idx[number_elements + 1]   positions of the (L+1)-mer 'i' are
+	                                                positions[positions_idx[i] .. positions_idx[i+1])
+	  seq_pos positions[num_positions]
+
+	File layout (compact, indexdb --compact):
+
+	  positions_header                            version POSITIONS_VERSION_COMPACT
+	  positions_compact
+	  uint64_t idx[idx_words]                     positions_idx bit-packed 'idx_bits' each
+	  uint64_t positions[pos_words]               positions bit-packed: 'pos_bits' position followed by 'seq_bits' sequence number
+
+	Indexes built by earlier versions of indexdb have no header (legacy format): the number of
+	(L+1)-mers followed by the number of positions and the positions of each (L+1)-mer.
+*/
+struct positions_header {
+	char magic[8]; // POSITIONS_MAGIC
+	uint32_t version;
+	uint32_t number_elements; // number of unique (L+1)-mers
+	uint64_t num_positions; // total number of positions
+};
+
+const char POSITIONS_MAGIC[8] = { 'S', 'M', 'R', 'P', 'O', 'S', 'T', 'B' };
+const uint32_t POSITIONS_VERSION = 1;
+const uint32_t POSITIONS_VERSION_COMPACT = 2;
+
+// widths of the bit-packed positions table (see 'positions_header')
+struct positions_compact {
+	uint32_t idx_bits; // bits of an offset: enough for 'num_positions'
+	uint32_t pos_bits; // bits of a position: enough for the longest reference sequence
+	uint32_t seq_bits; // bits of a sequence number: enough for the number of sequences of the part
+	uint32_t reserved;
+};
+
+// number of 64-bit words holding 'num_values' bit-packed values. One spare word lets 'get_bits' read two words at the end
+inline uint64_t packed_words(uint64_t num_values, uint32_t width)
+{
+	return (num_values * width + 63) / 64 + 1;
+}
+
+// value of 'width' <= 64 bits starting at bit 'bitpos' of a bit-packed array
+inline uint64_t get_bits(const uint64_t* words, uint64_t bitpos, uint32_t width)
+{
+	uint64_t w = bitpos >> 6;
+	uint32_t off = bitpos & 63;
+	uint64_t value = words[w] >> off;
+	if (off + width > 64)
+		value |= words[w + 1] << (64 - off);
+	return width == 64 ? value : value & ((1ULL << width) - 1);
+}
+
+// number of bits needed for the values up to 'max_value'
+inline uint32_t bits_for(uint64_t max_value)
+{
+	uint32_t bits = 1;
+	while (bits < 64 && (max_value >> bits) != 0) ++bits;
+	return bits;
+}
+
+// L/2-mer look-up table entry of the loaded index: the mini burst tries in the flat layout
+struct kmer_flat
+{
+	const FlatNodeElement* trie_F = 0; // forward mini burst trie
+	const FlatNodeElement* trie_R = 0; // reverse mini burst trie
+	uint32_t count = 0; // count of 9-mers
+};
+
 // data structure to store information on index parts built
 struct index_parts_stats {
     unsigned long int start_part; // where the section starts in the file
@@ -101,6 +246,107 @@ struct index_parts_stats {
     uint32_t numseq_part; // the number of sequences in this part
 };
 
+/*! @brief Predicted memory (bytes) of an index part while it is searched by sortmerna.
+
+	Stored in the '.stats' file after the reference sequence ids:
+
+	  char magic[8]                  PART_MEM_MAGIC
+	  uint16_t num_parts
+	  part_mem_stats parts[num_parts]
+
+	Indexes built by earlier versions of indexdb have none.
+*/
+struct part_mem_stats {
+	uint64_t kmer; // L/2-mer look-up table
+	uint64_t tries; // burst tries file, mapped whole
+	uint64_t positions; // (L+1)-mer positions table
+	uint64_t references; // reference sequences of the part
+	uint64_t total() const { return kmer + tries + positions + references; }
+};
+
+const char PART_MEM_MAGIC[8] = { 'S', 'M', 'R', 'P', 'M', 'E', 'M', 'S' };
+
+/*! @brief CRC-32 of the section of the reference file each index part was built from, see 'index_parts_stats'.
+	Stored in the '.stats' file after the predicted search memory of the parts:
+
+	  char magic[8]                  PART_CRC_MAGIC
+	  uint16_t num_parts
+	  uint32_t crc[num_parts]        zlib 'crc32' of the uncompressed bytes of the section
+
+	'--append' keeps an index part only if the section of the reference file is unchanged.
+*/
+const char PART_CRC_MAGIC[8] = { 'S', 'M', 'R', 'P', 'C', 'R', 'C', 'S' };
+
+/*! @brief Reference sequences of an index part encoded the way 'References::load' loads them
+	from the reference file ('<index>.ref_<part>.dat'). Mapped by sortmerna instead of parsing the reference file.
+
+	  ref_store_header
+	  uint64_t seq_offsets[num_refs + 1]     start of each sequence in 'sequences'
+	  uint64_t header_offsets[num_refs + 1]  start of each header in 'headers'
+	  char sequences[]                       encoded by 'nt_table', see 'References::convert_fix'
+	  char headers[]                         header lines, trailing spaces trimmed
+
+	The section of the reference file it was built from is recorded to validate it against the '.stats' file.
+*/
+struct ref_store_header {
+	char magic[8]; // REF_STORE_MAGIC
+	uint32_t version;
+	uint32_t num_refs; // number of sequences of the part
+	uint64_t src_size; // size of the reference file
+	uint64_t start_part; // section of the reference file, see 'index_parts_stats'
+	uint64_t seq_part_size;
+	uint64_t seqs_pos; // file offset of 'sequences'
+	uint64_t headers_pos; // file offset of 'headers'
+	uint64_t size; // size of the file
+};
+
+const char REF_STORE_MAGIC[8] = { 'S', 'M', 'R', 'R', 'E', 'F', 'S', 'T' };
+const uint32_t REF_STORE_VERSION = 1;
+
+/*! @brief Catalog of the reference sequences of all the parts of an index ('<index>.refcat'), loaded by sortmerna
+	at startup for the SAM @SQ lines, the OTU map ids and the look-ups of a reference sequence by id.
+
+	  ref_catalog_header
+	  ref_catalog_rec recs[num_refs]         ordered by part, then by the order of the sequences in the part
+	  char ids[]                             the ids as in 'References::BaseRecord::getId', not terminated
+
+	The sequences too long to be indexed are not in any part and are not in the catalog.
+*/
+struct ref_catalog_header {
+	char magic[8]; // REF_CATALOG_MAGIC
+	uint32_t version;
+	uint32_t num_parts; // number of index parts
+	uint64_t num_refs; // number of sequences of all the parts
+	uint64_t src_size; // size of the reference file
+	uint64_t ids_pos; // file offset of 'ids'
+	uint64_t size; // size of the file
+};
+
+struct ref_catalog_rec {
+	uint64_t header_pos; // offset of the header line in the (uncompressed) reference file
+	uint64_t id_pos; // offset of the id in 'ids'
+	uint32_t id_len;
+	uint32_t seq_len; // length of the sequence as loaded by sortmerna, see 'References::BaseRecord::getSeqLen'
+	uint32_t part; // index part of the sequence
+	uint32_t ordinal; // number of the sequence in its index part i.e. its position in 'References::buffer'
+};
+
+const char REF_CATALOG_MAGIC[8] = { 'S', 'M', 'R', 'R', 'C', 'A', 'T', 'L' };
+const uint32_t REF_CATALOG_VERSION = 1;
+
+// contents of the '.stats' file of an existing index (indexdb --append)
+struct index_stats {
+    size_t filesize = 0; // size of the reference file the index was built from
+    double background_freq[4] = { 0.0, 0.0, 0.0, 0.0 }; // A/C/G/T distribution
+    uint64_t full_len = 0; // total length of the reference sequences
+    uint32_t lnwin = 0; // seed length
+    uint64_t numseq = 0; // number of reference sequences
+    std::vector<index_parts_stats> parts;
+    std::vector<std::pair<std::string, uint32_t>> sam_sq; // sequence id and length of each reference sequence
+    std::vector<part_mem_stats> part_mem; // predicted search memory of each part. Empty if not recorded
+    std::vector<uint32_t> part_crc; // CRC-32 of the reference file section of each part. Empty if not recorded
+};
+
 
 
 #endif
@@ -15,6 +15,7 @@
 struct Runopts {
 	std::string kvdbPath; // '-d' (opt_d_KeyValDatabase) key-value database for alignment results
 	std::string readsfile; // '--reads | --reads-gz' reads file path
+	std::string readsfile_r2; // second '--reads | --reads-gz' reads file: mates (R2) of the paired-end reads in 'readsfile'
 	std::string filetype_ar; // '--aligned' aligned reads output file
 	std::string filetype_or; // '--other' rejected reads output file
 	std::string cmdline;
@@ -29,7 +30,11 @@ struct Runopts {
 	int num_read_thread_rep = 1; // number of report reader threads
 	int num_proc_thread_rep = 1; // number of report processor threads
 
-	int queue_size_max = 100; // max number of Reads in the Read and Write queues. 10 works OK.
+	int num_inflate_thread = 0; // '--thgz' number of threads inflating BGZF reads. Default - up to 4 depending on the number of cores
+
+	int queue_size_max = 8192; // max number of Reads in the Read and Write queues. Held in batches of READ_BATCH_SIZE, at least READS_QUEUE_MIN_SLOTS batches
+
+	int64_t prefetch_mem = -1; // '--prefetch_mem' memory (MB) for the searched and the prefetched index parts. -1 (default) - half of the physical memory, 0 - no prefetching
 
 	long match = 2; // '--match' SW score (positive integer) for a match               TODO: change to int8_t
 	long mismatch = -3; // '--mismatch' SW penalty (negative integer) for a mismatch   TODO: change to int8_t
@@ -72,6 +77,9 @@ struct Runopts {
 	bool have_reads_gz = false; // '--reads-gz' flags reads file is compressed and can be read
 	bool yes_SQ = false; // --SQ add SQ tags to the SAM file
 	bool interactive = false; // start interactive session
+	bool read_store = false; // '--read_store' parse the reads once into a binary read store used by all the passes
+	bool stream = false; // '--reads -' | '--reads-gz -' the reads are piped on stdin and aligned in a single pass over all the index parts
+	bool shm = false; // '--shm' attach the index parts and references from POSIX shared memory, publish them if not yet there
 
 	// DEBUG options
 	bool dbg_put_kvdb = false; // if True - do Not put records into Key-value DB. Debugging Memory Consumption.
@@ -95,10 +103,13 @@ struct Runopts {
 	/* '--passes' (optional): for each index file three intervals at which to place the seed on the read. <-- Refstats::load
 		Defaults: 0 */
 	std::vector<std::vector<uint32_t>> skiplengths;
+	/* Smith-Waterman scoring matrix 5x5 (A,C,G,T,N) shared by all the Reads. See 'initScoringMatrix' */
+	std::vector<int8_t> scoring_matrix;
 
 	Runopts(int argc, char**argv, bool dryrun)
 	{ 
 		process(argc, argv, dryrun);
+		initScoringMatrix();
 		if (skiplengths.empty())
 		{
 			for ( int i = 0; i < indexfiles.size(); ++i )
@@ -127,6 +138,7 @@ private:
 private:
 	// Functions
 	void process(int argc, char**argv, bool dryrun);
+	void initScoringMatrix();
 	void optReads(char **argv, int &narg);
 	void optReadsGz(char **argv, int &narg);
 	void optRef(char **argv, int &narg);
@@ -153,6 +165,9 @@ private:
 	void optEdges(char **argv, int &narg);
 	void optFullSearch(char **argv, int &narg);
 	void optSQ(char **argv, int &narg);
+	void optReadStore(char **argv, int &narg);
+	void optPrefetchMem(char **argv, int &narg);
+	void optShm(char **argv, int &narg);
 	void optPasses(char **argv, int &narg);
 	void optId(char **argv, int &narg);
 	void optCoverage(char **argv, int &narg);
@@ -163,6 +178,7 @@ private:
 	void opt_threads(char **argv, int &narg);
 	void opt_threads_pp(char **argv, int &narg); // post-proc threads --thpp 1:1
 	void opt_threads_rep(char **argv, int &narg); // report threads --threp 1:1 
+	void opt_threads_gz(char **argv, int &narg); // BGZF inflate threads --thgz 4
 	void opt_a_numProcThreads(char **argv, int &narg);
 	void opt_e_Evalue(char **argv, int &narg);
 	void opt_F_ForwardOnly(char **argv, int &narg);
@@ -44,12 +44,15 @@ class Read;
 class Refstats;
 struct Readstats;
 struct Runopts;
+class RunContext;
 
 class Output {
 public:
 	// output streams for aligned reads (FASTA/FASTQ, SAM and BLAST-like)
 	std::ofstream fastaout; // fasta/fastq
 	std::ofstream fastaNonAlignOut; // fasta/fastq non-aligned (other)
+	std::ofstream fastaout_rev; // fasta/fastq mates (R2) of the paired-end reads in two files
+	std::ofstream fastaNonAlignOut_rev; // fasta/fastq non-aligned (other) mates (R2)
 	std::ofstream samout; // SAM
 	std::ofstream blastout; // BLAST
 	std::ofstream logstream;
@@ -58,6 +61,8 @@ public:
 
 	// file names
 	std::string fastaOutFile; // fasta/fastq
+	std::string fastaOutFile_rev; // fasta/fastq mates (R2). Paired-end reads in two files only
+	std::string otherFile_rev; // fasta/fastq non-aligned mates (R2). Paired-end reads in two files only
 	std::string samoutFile; //
 	std::string blastoutFile; // BLAST out file
 	std::string logfile;
@@ -84,7 +89,7 @@ public:
 		Read & read
 	);
 
-	void writeSamHeader(Runopts & opts);
+	void writeSamHeader(Runopts & opts, Refstats & refstats);
 
 	void report_fasta(Runopts & opts, std::vector<Read> & reads);
 	void report_denovo(Runopts & opts, std::vector<Read> & reads);
@@ -95,8 +100,9 @@ public:
 
 private:
 	void init(Runopts & opts, Readstats & readstats);
+	void writeFastx(std::ofstream & strm, std::ofstream & strm_rev, Read & read);
 
 }; // ~class Output
 
 
-void generateReports(Runopts & opts, Readstats & readstats, Output & output);
\ No newline at end of file
+void generateReports(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx);
\ No newline at end of file
@@ -39,6 +39,7 @@
 // forward
 struct Readstats;
 class Output;
+class RunContext;
 
 /*! @fn align()
 	@brief Traverse the query input and indexed database and output
@@ -67,7 +68,21 @@ class Output;
 		   otherwise continue searching for other LIS or more
 		   L-mers using smaller intervals </li>
 	</ol>
+	The Key-value database, the index statistics and the references are taken from the run context
+	shared with the post-processing and the reports
 */
-void align(Runopts & opts, Readstats & readstats, Output & output);
+void align(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx);
+
+/*! @fn alignStream()
+	@brief align the reads piped on stdin ('--reads -') in a single pass:
+	<ol>
+	  <li> load all the index parts and keep them resident </li>
+	  <li> search each read on every index part, post-process and report it
+		   as soon as it is read i.e. no Key-value DB and no pre-pass over the reads </li>
+	  <li> accumulate the Reads statistics as the reads arrive and write the log at the end </li>
+	</ol>
+	The E-value search space is computed per read. See 'Refstats::getMinimalScore'
+*/
+void alignStream(Runopts & opts, Readstats & readstats, Output & output);
 
 // ~PARALLELTRAVERSAL_H
@@ -8,9 +8,11 @@
 #include <string>
 #include <vector>
 #include <functional>
+#include <mutex>
 
 // forward
 class Read;
+struct hit_buffers;
 class ReadsQueue;
 struct Runopts;
 struct Index;
@@ -35,7 +37,7 @@ public:
 		Readstats & readstats, 
 		Refstats & refstats,
 		//std::function<void(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read)> callback
-		void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, bool isLastStrand)
+		void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, hit_buffers & hits, bool isLastStrand)
 	) :
 		id(id),
 		readQueue(readQueue),
@@ -54,7 +56,7 @@ public:
 protected:
 	void run();
 	//std::function<void(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read)> callback;
-	void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, bool isLastStrand);
+	void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, hit_buffers & hits, bool isLastStrand);
 
 protected:
 	std::string id;
@@ -68,6 +70,53 @@ protected:
 	Refstats & refstats;
 }; // ~class Processor
 
+/* 
+ * performs alignment on all the index parts, post-processing and reporting in a single pass. See 'alignStream'
+ */
+class StreamProcessor {
+public:
+	StreamProcessor(
+		std::string id,
+		ReadsQueue & readQueue,
+		Runopts & opts,
+		std::vector<Index> & indices,
+		std::vector<References> & refs,
+		Output & output,
+		Readstats & readstats,
+		Refstats & refstats,
+		std::mutex & report_lock,
+		void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, hit_buffers & hits, bool isLastStrand)
+	) :
+		id(id),
+		readQueue(readQueue),
+		opts(opts),
+		indices(indices),
+		refs(refs),
+		output(output),
+		readstats(readstats),
+		refstats(refstats),
+		report_lock(report_lock),
+		callback(callback)
+	{}
+
+	void operator()() { run(); }
+
+protected:
+	void run();
+	void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, hit_buffers & hits, bool isLastStrand);
+
+protected:
+	std::string id;
+	ReadsQueue & readQueue;
+	Runopts & opts;
+	std::vector<Index> & indices; // all the index parts. Resident for the whole run
+	std::vector<References> & refs; // references of each index part
+	Output & output;
+	Readstats & readstats;
+	Refstats & refstats;
+	std::mutex & report_lock; // serializes the post-processing and the reporting
+}; // ~class StreamProcessor
+
 /* performs post-alignment tasks like calculating statistics */
 class PostProcessor {
 public:
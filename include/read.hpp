@@ -17,6 +17,30 @@
 
 class References; // forward
 
+/*
+ * Scratch buffers of the seed search and the LIS alignment. One per Processor thread, reused for all the Reads
+ * and strands, so the search does not allocate per Read, and the Reads carry no search state through the queues.
+ */
+struct hit_buffers
+{
+	// array of positions of window hits on the reference sequence in given index/part for the current Read and strand.
+	// Cleared after each strand
+	// [0] : {id = 568 win = 0 	}
+	// ...
+	// [4] : {id = 1248788 win = 72 }
+	//        |            |_k-mer start position on read
+	//        |_k-mer id on reference (index into 'positions_tbl')
+	std::vector<id_win> id_win_hits;
+	std::vector<id_win> id_hits; // ids of the k-mers that hit the database on the current window
+	std::vector<UCHAR> bitvec; // window (prefix/suffix) bitvector
+	std::vector<bool> read_pos_searched; // read positions already searched in the burst trie
+	// every position of the window hits as (k-mer position on the reference << 32 | k-mer position on the read),
+	// grouped by reference. See 'compute_lis_alignment'
+	std::vector<uint64_t> ref_hits;
+	std::vector<uint32_t> ref_hits_end; // per reference of the index part: number of its hits, then the end of its group in 'ref_hits'
+	std::vector<uint32_t> ref_hits_seqs; // references with hits, i.e. the non-zero entries of 'ref_hits_end'
+};
+
 struct alignment_struct2
 {
 	uint32_t max_size; // max size of alignv i.e. max number of alignments to store (see options '-N', '--best N') TODO: remove?
@@ -73,22 +97,10 @@ public:
 	bool null_align_output = false; // flags NULL alignment was output to file (needs to be done once only)
 	uint16_t max_SW_count = 0; // count of matches that have Max Smith-Waterman score for this read
 	int32_t num_alignments = 0; // number of alignments to output per read
-	uint32_t readhit = 0; // number of seeds matches between read and database. (? readhit == id_win_hits.size)
+	uint32_t readhit = 0; // number of windows with seed matches between read and database. See 'hit_buffers::id_win_hits'
 	int32_t best = 0; // init with opts.min_lis, see 'this.init'. Don't DB store/restore (bug 51).
 
-	// array of positions of window hits on the reference sequence in given index/part. 
-	// Only used during alignment on a particular index/part. No need to store on disk.
-	// Reset on each new index part
-	// [0] : {id = 568 win = 0 	}
-	// ...
-	// [4] : {id = 1248788 win = 72 }
-	//        |            |_k-mer start position on read
-	//        |_k-mer id on reference (index into 'positions_tbl')
-	std::vector<id_win> id_win_hits;
-
 	alignment_struct2 hits_align_info; // stored in DB
-
-	std::vector<int8_t> scoring_matrix; // initScoringMatrix   orig: int8_t* scoring_matrix
 	// <------------------------------ store in database
 
 	Read()
@@ -151,9 +163,7 @@ public:
 		num_alignments = that.num_alignments;
 		readhit = that.readhit;
 		best = that.best;
-		id_win_hits = that.id_win_hits;
 		hits_align_info = that.hits_align_info;
-		scoring_matrix = that.scoring_matrix;
 	}
 
 	// copy assignment
@@ -184,27 +194,65 @@ public:
 		num_alignments = that.num_alignments;
 		readhit = that.readhit;
 		best = that.best;
-		id_win_hits = that.id_win_hits;
 		hits_align_info = that.hits_align_info;
-		scoring_matrix = that.scoring_matrix;
 
 		return *this; // by convention always return *this
 	}
 
-	void initScoringMatrix(Runopts & opts);
+	// move constructor. Used when passing the Reads through the queues
+	Read(Read && that) noexcept
+	{
+		*this = std::move(that);
+	}
+
+	// move assignment
+	Read & operator=(Read && that) noexcept
+	{
+		if (&that == this) return *this;
+
+		id = that.id;
+		isValid = that.isValid;
+		isEmpty = that.isEmpty;
+		is03 = that.is03;
+		is04 = that.is04;
+		isRestored = that.isRestored;
+		header = std::move(that.header);
+		sequence = std::move(that.sequence);
+		quality = std::move(that.quality);
+		format = that.format;
+		isequence = std::move(that.isequence);
+		reversed = that.reversed;
+		ambiguous_nt = std::move(that.ambiguous_nt);
+		lastIndex = that.lastIndex;
+		lastPart = that.lastPart;
+		hit = that.hit;
+		hit_denovo = that.hit_denovo;
+		null_align_output = that.null_align_output;
+		max_SW_count = that.max_SW_count;
+		num_alignments = that.num_alignments;
+		readhit = that.readhit;
+		best = that.best;
+		hits_align_info = std::move(that.hits_align_info);
+
+		that.isEmpty = true; // the moved-from Read is a placeholder
+
+		return *this;
+	}
 
 	// convert char "sequence" to 0..3 alphabet "isequence", and populate "ambiguous_nt"
 	void seqToIntStr() 
 	{
-		for (std::string::iterator it = sequence.begin(); it != sequence.end(); ++it)
+		size_t pos = isequence.size();
+		isequence.resize(pos + sequence.size()); // single allocation
+		for (std::string::iterator it = sequence.begin(); it != sequence.end(); ++it, ++pos)
 		{
 			char c = nt_table[(int)*it];
 			if (c == 4) // ambiguous nt. 4 is max value in nt_table
 			{
-				ambiguous_nt.push_back(static_cast<int>(isequence.size())); // i.e. add current position to the vector
+				ambiguous_nt.push_back(static_cast<int>(pos)); // i.e. add current position to the vector
 				c = 0;
 			}
-			isequence += c;
+			isequence[pos] = c;
 		}
 		is03 = true;
 	}
@@ -267,21 +315,24 @@ public:
 		num_alignments = 0;
 		readhit = 0;
 		best = 0;
-		id_win_hits.clear();
 		hits_align_info.clear();
-		scoring_matrix.clear();
 	}
 
 	void init(Runopts & opts, KeyValueDatabase & kvdb, unsigned int readId)
+	{
+		init(opts, readId);
+		//unmarshallJson(kvdb); // get matches from Key-value database
+		restoreFromDb(kvdb); // get matches from Key-value database
+	}
+
+	// init a read that has no stored matches e.g. the reads from stdin
+	void init(Runopts & opts, unsigned int readId)
 	{
 		id = readId;
 		if (opts.num_alignments > 0) num_alignments = opts.num_alignments;
 		if (opts.min_lis > 0) best = opts.min_lis;
 		validate();
 		seqToIntStr();
-		//unmarshallJson(kvdb); // get matches from Key-value database
-		restoreFromDb(kvdb); // get matches from Key-value database
-		initScoringMatrix(opts);
 	}
 
 	std::string matchesToJson(); // convert to Json string to store in DB
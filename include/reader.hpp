@@ -8,23 +8,33 @@
 
 #include <string>
 #include <fstream> // std::ifstream
+#include <chrono>
 
 #include "readsqueue.hpp"
 #include "kvdb.hpp"
 #include "options.hpp"
+#include "readstats.hpp"
 
 class Read; // forward
 
 // reads Reads and Readstats files, generates Read objects and pushes them onto ReadsQueue
 class Reader {
 public:
-	Reader(std::string id, Runopts & opts, ReadsQueue & readQueue, KeyValueDatabase & kvdb, int loopCount)
+	/*
+	 * @param shard      number of this Reader [0..num_shards). Each Reader pushes only its own part of the Reads file
+	 * @param num_shards number of Readers sharing the Reads file
+	 */
+	Reader(std::string id, Runopts & opts, ReadsQueue & readQueue, KeyValueDatabase & kvdb, Readstats & readstats,
+		int loopCount, int shard = 0, int num_shards = 1)
 		: 
 		id(id),
 		opts(opts),
 		readQueue(readQueue),
 		kvdb(kvdb),
-		loopCount(loopCount)
+		readstats(readstats),
+		loopCount(loopCount),
+		shard(shard),
+		num_shards(num_shards)
 	{}
 
 	void operator()() { read(); }
@@ -32,9 +42,47 @@ public:
 	static bool loadReadByIdx(Runopts & opts, Read & read);
 	static bool loadReadById(Runopts & opts, Read & read);
 private:
+	static bool scanReadByIdx(Runopts & opts, const std::string & readsfile, Read & read); // scan the Reads file up to the read 'read.id'
+	void readPaired(); // interleave the paired-end reads from two files
+	bool readStore(); // stream reads from the read store
+	bool readMmap(); // scan the memory mapped reads file
+	void addRead(Read & read); // add the read to the batch for the queue
+	void done(unsigned int num_reads, std::chrono::duration<double> elapsed); // signal the queue this Reader is done
+
 	std::string id;
 	int loopCount; // counter of processing iterations.
 	Runopts & opts;
 	ReadsQueue & readQueue; // shared with Processor
+	ReadBatch batch; // Reads to push on the queue
 	KeyValueDatabase & kvdb; // key-value database
+	Readstats & readstats; // provides the read checkpoints for sharding the Reads file
+	int shard; // number of this Reader
+	int num_shards; // number of Readers
+};
+
+/*
+ * Reads the reads piped on stdin ('--reads -') and the mates from the second Reads file if given.
+ * No Key-value DB and no pre-pass: the Reads statistics (number of reads and nucleotides) are accumulated
+ * in 'Readstats' as the reads arrive.
+ */
+class StreamReader {
+public:
+	StreamReader(std::string id, Runopts & opts, ReadsQueue & readQueue, Readstats & readstats)
+		:
+		id(id),
+		opts(opts),
+		readQueue(readQueue),
+		readstats(readstats)
+	{}
+
+	void operator()() { read(); }
+	void read();
+private:
+	void addRead(Read & read, unsigned int read_id); // count and add the read to the batch for the queue
+
+	std::string id;
+	Runopts & opts;
+	ReadsQueue & readQueue; // shared with StreamProcessor
+	ReadBatch batch; // Reads to push on the queue
+	Readstats & readstats;
 };
\ No newline at end of file
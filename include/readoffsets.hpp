@@ -0,0 +1,72 @@
+#pragma once
+/**
+ * FILE: readoffsets.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Sidecar index of the Reads file for random access to a read by its ID ('Reader::loadReadByIdx').
+ * Built on the first pass over the reads ('Readstats::calculate') next to the Key-value DB, and reused
+ * as long as the Reads file does not change.
+ *
+ * File layout:
+ *
+ *   readoffsets_header                     fixed size, rewritten when the index is committed
+ *   uint64_t offsets[num_recs]             offset of each record in the Reads file (in the inflated data if compressed)
+ *   access point[num_points]               compressed Reads file only:
+ *                                            uint64_t out, uint64_t in, int32_t bits, uint32_t window_len, char window[window_len]
+ *
+ * A record of a compressed file is loaded by inflating from the closest preceding access point ('gz_access_point').
+ */
+
+#include <string>
+#include <fstream>
+#include <vector>
+#include <cstdint>
+#include <algorithm> // std::fill_n
+
+#include "common.hpp"
+#include "gzip.hpp"
+
+// forward
+struct Runopts;
+class Read;
+
+struct readoffsets_header {
+	char magic[8]; // READOFFSETS_MAGIC
+	uint32_t version;
+	uint32_t is_gz; // 1: offsets are in the inflated data
+	uint64_t src_size; // size of the Reads file. Used to validate the index
+	int64_t  src_mtime; // modification time of the Reads file
+	uint64_t num_recs; // number of records i.e. number of Reads pushed by the Reader
+	uint64_t num_points; // number of access points
+	uint64_t points_pos; // file offset of the access points
+};
+
+const char READOFFSETS_MAGIC[8] = { 'S', 'M', 'R', 'O', 'F', 'F', 'S', 'T' };
+const uint32_t READOFFSETS_VERSION = 1;
+
+class ReadOffsets {
+public:
+	ReadOffsets(Runopts & opts) : opts(opts) { std::fill_n((char*)&header, sizeof(header), 0); }
+	~ReadOffsets() { close(); }
+
+	static std::string getPath(Runopts & opts);
+
+	// writing
+	bool create(); // open a new index for writing
+	void add(uint64_t offset); // offset of the next record
+	void commit(std::vector<gz_access_point> & points); // write the access points and the final header
+
+	// reading
+	bool open(); // open an existing index. False if the index is missing or stale
+	bool loadByIdx(Read & read); // load the read 'read.id' from the Reads file
+	void close();
+
+	readoffsets_header header;
+private:
+	Runopts & opts;
+	std::fstream fs;
+	std::vector<char> buf; // stream buffer
+	std::vector<gz_access_point> points; // loaded lazily when reading
+
+	bool loadPoints();
+}; // ~class ReadOffsets
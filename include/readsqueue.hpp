@@ -9,6 +9,10 @@
 #include <condition_variable>
 #include <sstream>
 #include <atomic>
+#include <vector>
+#include <algorithm> // std::max
+#include <chrono>
+#include <cstdint>
 
 #include "common.hpp"
 #include "read.hpp"
@@ -16,41 +20,67 @@
 #ifdef LOCKQEUEU
 #include <queue>
 #else
-#include "concurrentqueue.h"
+#include "blockingconcurrentqueue.h"
 #endif
 
+#define READ_BATCH_SIZE 512 // number of Reads in a batch. Even, to keep paired reads in one batch
+#define READS_QUEUE_MIN_SLOTS 16 // min number of batches the queue can hold
+#define READS_QUEUE_WAIT_MIN 1000 // usec. Initial wait of a blocked consumer | producer. Doubled on each retry
+#define READS_QUEUE_WAIT_MAX 100000 // usec. Max wait between the retries
+
+static_assert(READ_BATCH_SIZE % 2 == 0, "the paired reads must not be split between the batches");
+
+typedef std::vector<Read> ReadBatch; // unit of transport through the queue
 
 /**
  * Queue for Reads' records. Concurrently accessed by the Reader (producer) and the Processors (consumers)
+ *
+ * The Reads are transported in batches of up to READ_BATCH_SIZE, which are moved in and out of the queue
+ * i.e. neither the batches nor the Reads are copied. The emptied batch buffers are kept in a pool
+ * and handed back to the producers, so the batch storage is allocated only once.
+ *
+ * The consumers block in 'pop' until a batch is available or the stream is over i.e. the idle threads sleep
+ * instead of spinning. When the last pusher is done, the end of stream is signalled to all the consumers
+ * (lock-free queue: an empty batch is queued as the end marker, and each consumer that wakes up on it passes it on).
+ *
+ * The default build defines LOCKQEUEU ('common.hpp') i.e. uses the locking std::queue, on which the consumers
+ * wait on 'cvQueue'. The lock-free moodycamel queue is only built with LOCKQEUEU undefined.
  */
 class ReadsQueue 
 {
 	std::string id;
-	int capacity; // max size of the queue
+	int capacity; // max number of batches in the queue
 
-	std::atomic_uint numPushed; // shared
-	std::atomic_uint numPopped; // shared
+	std::atomic_uint numPushed; // shared. Number of Reads
+	std::atomic_uint numPopped; // shared. Number of Reads
 	std::atomic_uint pushers; // counter of threads that push reads on this queue. When zero - the pushing is over.
 #ifdef LOCKQEUEU
-	std::queue<Read> recs; // shared: Reader & Processors, Writer & Processors
+	std::queue<ReadBatch> recs; // shared: Reader & Processors, Writer & Processors
 #else
-	moodycamel::ConcurrentQueue<Read> recs; // lockless queue
+	moodycamel::BlockingConcurrentQueue<ReadBatch> recs; // lockless queue. Consumers wait on a semaphore
 #endif
 
 	std::mutex qlock; // lock for push/pop on queue
 	std::condition_variable cvQueue;
 
+	std::vector<ReadBatch> spares; // pool of the emptied batch buffers
+	std::mutex slock; // lock for the pool
+
 public:
+	/*
+	 * @param capacity  max number of Reads in the queue (Runopts::queue_size_max). Rounded down to whole batches,
+	 *                  at least READS_QUEUE_MIN_SLOTS batches i.e. READS_QUEUE_MIN_SLOTS * READ_BATCH_SIZE Reads
+	 */
 	ReadsQueue(std::string id, int capacity, int numPushers)
 		:
 		id(id),
-		capacity(capacity),
+		capacity(std::max(READS_QUEUE_MIN_SLOTS, capacity / READ_BATCH_SIZE)),
 		numPushed(0),
 		numPopped(0),
 		pushers(numPushers)
 #ifndef LOCKQEUEU
 		,
-		recs(capacity) // set initial capacity
+		recs(std::max(READS_QUEUE_MIN_SLOTS, capacity / READ_BATCH_SIZE)) // set initial capacity
 #endif
 	{
 		std::stringstream ss;
@@ -59,9 +89,9 @@ public:
 	}
 
 	~ReadsQueue() {
+		std::stringstream ss;
 #ifdef LOCKQEUEU
 		size_t recsize = recs.size();
-		std::stringstream ss;
 #else
 		size_t recsize = recs.size_approx();
 #endif
@@ -69,48 +99,115 @@ public:
 		std::cout << ss.str();
 	}
 
-	void push(Read & rec) 
+	/*
+	 * Move the batch into the queue. On return 'batch' is an empty (recycled) buffer ready for filling
+	 */
+	void push(ReadBatch & batch) 
 	{
+		if (batch.empty()) return;
+		unsigned int num_reads = static_cast<unsigned int>(batch.size());
 #ifdef LOCKQEUEU
 		std::unique_lock<std::mutex> lmq(qlock);
 		cvQueue.wait(lmq, [this] { return recs.size() < capacity; });
-		recs.push(std::move(rec));
-
-		//ss << id << " Pushed id: " << rec.id << " Index: " << rec.lastIndex << " Part: " << rec.lastPart 
-		//	<< " header: " << rec.header << " sequence: " << rec.sequence << std::endl;
-		//std::cout << ss.str(); ss.str("");
-
+		recs.push(std::move(batch));
 		cvQueue.notify_one();
+		lmq.unlock();
 #else
-		recs.enqueue(rec);
+		// the producer backs off while the queue is full
+		for (int64_t wait = READS_QUEUE_WAIT_MIN; recs.size_approx() >= static_cast<size_t>(capacity);
+			wait = std::min<int64_t>(wait * 2, READS_QUEUE_WAIT_MAX))
+		{
+			std::this_thread::sleep_for(std::chrono::microseconds(wait));
+		}
+		recs.enqueue(std::move(batch));
 #endif
-		++numPushed;
+		numPushed += num_reads;
+		getSpare(batch);
 	}
 
-	Read pop() 
+	/*
+	 * Take the next batch. The buffer previously held by 'batch' is recycled.
+	 * Blocks until a batch is available. Returns False at the end of stream i.e. no batches and no pushers
+	 */
+	bool pop(ReadBatch & batch) 
 	{
-		Read rec;
+		recycle(batch);
+		bool found = false;
 #ifdef LOCKQEUEU
 		std::unique_lock<std::mutex> lmq(qlock);
 		cvQueue.wait(lmq, [this] { return (pushers.load() == 0 && recs.empty()) || !recs.empty(); }); // if False - keep waiting, else - proceed.
 		if (!recs.empty()) 
 		{
-			rec = recs.front();
+			batch = std::move(recs.front());
 			recs.pop();
-			++numPopped;
-			if (numPopped.load() % 100000 == 0)
+			found = true;
+		}
+		cvQueue.notify_one();
+		lmq.unlock();
+#else
+		// sleep on the queue semaphore. The wait is bounded to re-check the pushers, and grows while idle
+		for (int64_t wait = READS_QUEUE_WAIT_MIN; ; wait = std::min<int64_t>(wait * 2, READS_QUEUE_WAIT_MAX))
+		{
+			found = recs.wait_dequeue_timed(batch, wait);
+			if (found || pushers.load() == 0)
+			{
+				// the pushers are done - the last batches are surely visible
+				if (!found)
+					found = recs.try_dequeue(batch);
+				break;
+			}
+		}
+		if (found && batch.empty()) // end of stream marker
+		{
+			// no order between the producers i.e. the marker may overtake the last batches. Take what is left
+			ReadBatch marker = std::move(batch);
+			batch = ReadBatch();
+			found = recs.try_dequeue(batch);
+			recs.enqueue(std::move(marker)); // pass the marker on to the next consumer
+		}
+#endif
+		if (found)
+		{
+			unsigned int popped = numPopped += static_cast<unsigned int>(batch.size());
+			if (popped / 100000 != (popped - batch.size()) / 100000)
 			{
 				std::stringstream ss;
-				ss << STAMP << id << " Popped id: " << rec.id << "\r";
+				ss << STAMP << id << " Popped id: " << batch.back().id << "\r";
 				std::cout << ss.str();
 			}
 		}
-		cvQueue.notify_one();
-#else
-		bool found = recs.try_dequeue(rec);
-		if (found) ++numPopped;
-#endif
-		return rec;
+		return found;
+	}
+
+	/*
+	 * Return the emptied batch buffer to the pool
+	 */
+	void recycle(ReadBatch & batch)
+	{
+		if (batch.capacity() == 0) return;
+		batch.clear();
+		std::lock_guard<std::mutex> lms(slock);
+		if (spares.size() < static_cast<size_t>(capacity))
+			spares.push_back(std::move(batch));
+		batch = ReadBatch();
+	}
+
+	/*
+	 * Take an empty batch buffer from the pool, or allocate a new one
+	 */
+	void getSpare(ReadBatch & batch)
+	{
+		{
+			std::lock_guard<std::mutex> lms(slock);
+			if (!spares.empty())
+			{
+				batch = std::move(spares.back());
+				spares.pop_back();
+				return;
+			}
+		}
+		batch = ReadBatch();
+		batch.reserve(READ_BATCH_SIZE);
 	}
 
 	// done when no more adding and no records
@@ -121,29 +218,29 @@ public:
 		bool done = (pushers.load() == 0 && recs.empty());
 		cvQueue.notify_one(); // otherwise pop can stuck not knowing the adding stopped
 #else
-		bool done = (numPushers == 0 && recs.size_approx() == 0);
+		bool done = (pushers.load() == 0 && recs.size_approx() == 0);
 #endif
 		return done;
 	}
 
 	// call from main thread when no other threads running
 	void reset(int nPushers) {
+#ifndef LOCKQEUEU
+		ReadBatch marker;
+		while (recs.try_dequeue(marker)) {} // remove the end of stream marker
+#endif
 		pushers = nPushers;
 		std::stringstream ss;
 		ss << STAMP << id << ": pushers: " << pushers.load() << std::endl;
 		std::cout << ss.str();
 	}
 
+	// number of Reads in the queue
 	size_t size()
 	{
-#ifdef LOCKQEUEU
-		std::lock_guard<std::mutex> lqm(qlock);
-		size_t sz = recs.size();
-		cvQueue.notify_one();
-		return sz;
-#else
-		return recs.size_approx();
-#endif
+		unsigned int pushed = numPushed.load();
+		unsigned int popped = numPopped.load();
+		return pushed > popped ? pushed - popped : 0; // the counters are updated outside the queue lock
 	}
 
 	/* 
@@ -161,7 +258,16 @@ public:
 
 	void decrPushers()
 	{
-		--pushers;
+		if (--pushers == 0)
+		{
+			// end of stream - wake up all the consumers
+#ifdef LOCKQEUEU
+			std::lock_guard<std::mutex> lmq(qlock);
+			cvQueue.notify_all();
+#else
+			recs.enqueue(ReadBatch());
+#endif
+		}
 		std::stringstream ss;
 		ss << STAMP << "id: " << id << " pushers: " << pushers.load() << std::endl;
 		std::cout << ss.str();
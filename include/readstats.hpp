@@ -20,6 +20,14 @@
 // forward
 class KeyValueDatabase;
 
+#define READ_CHECKPOINT_INTERVAL 16384 // number of reads between two checkpoints. Even, to keep paired reads in one shard
+
+/* position of a read in the Reads file. Used to split the file between multiple Reader threads */
+struct read_checkpoint {
+	uint64_t offset; // file offset of the read record
+	uint64_t read_id; // ID of the read
+};
+
 struct Readstats {
 	Runopts & opts;
 
@@ -34,6 +42,7 @@ struct Readstats {
 
 	// Non-synchronized
 	uint64_t number_total_read; // total number of reads in file. Should be known before processing and index loading. 'calculate'
+	                            // Reads from stdin: counted by the Reader as the reads arrive 'StreamReader'
 	off_t    full_file_size; // the size of the full reads file (in bytes). 'calculate'
 	uint64_t full_read_main; // total number of nucleotides in all reads i.e. sum of length of All read sequences 'calculate'
 	// TODO: thread accessed: 'compute_lis_alignment' - synchronize
@@ -48,6 +57,10 @@ struct Readstats {
 	// TODO: Store in DB? Can be very big.
 	std::map<std::string, std::vector<std::string>> otu_map;
 
+	// file offsets of every READ_CHECKPOINT_INTERVAL-th read (non-compressed Reads file). 'calculateMmap'
+	// Used to assign byte ranges of the Reads file and the starting read IDs to multiple Reader threads
+	std::vector<read_checkpoint> checkpoints;
+
 	static const std::string dbkey;
 	bool stats_calc_done; // flags 'computeStats' was called
 
@@ -67,13 +80,17 @@ struct Readstats {
 	{
 		opts.exit_early = check_file_format();
 		calcSuffix();
-		if (!opts.exit_early)
+		if (!opts.exit_early && !opts.stream && !(opts.read_store && opts.readsfile_r2.empty() && restoreFromStore()))
 			calculate(); // number_total_read only
 	}
 
 	~Readstats() {}
 
-	void calculate(); // calculate statistics from readsfile
+	void calculate(); // calculate statistics from readsfile. Builds the read store if '--read_store'
+	bool calculateMmap(); // 'calculate' on the memory mapped reads file
+	void calculatePaired(); // 'calculate' on the paired-end reads in two files
+	bool restoreFromStore(); // restore statistics from the read store header
+	bool getShard(int shard, int num_shards, uint64_t & beg, uint64_t & end, uint64_t & read_id); // byte range of a Reader shard
 	bool check_file_format();
 	void calcSuffix();
 	std::string toString();
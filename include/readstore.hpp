@@ -0,0 +1,80 @@
+#pragma once
+/**
+ * FILE: readstore.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Compact binary store of the Reads file. Built once on the first pass over the reads ('Readstats::calculate')
+ * and used by all the subsequent passes (alignment per index part, post-processing, reports) instead of
+ * re-parsing (and re-inflating) the original FASTA/FASTQ file.
+ *
+ * File layout:
+ *
+ *   readstore_header                           fixed size, rewritten when the store is closed
+ *   record[0] .. record[num_recs - 1]          variable size, sequential
+ *   uint64_t offsets[num_recs]                 fixed offset table: file offset of each record
+ *
+ * Record layout:
+ *
+ *   uint32_t header_len, char header[header_len]
+ *   uint32_t seq_len, uint8_t packed[(seq_len + 3) / 4]   2-bit sequence A,C,G,T -> 0,1,2,3. 4 bases per byte
+ *   uint32_t num_exc, { uint32_t pos, char ch } [num_exc]  ambiguity list: chars the 2-bit code cannot restore (N, lower case, IUPAC)
+ *   uint32_t qual_len, char quality[qual_len]             0 for FASTA
+ */
+
+#include <string>
+#include <fstream>
+#include <vector>
+#include <cstdint>
+
+#include "common.hpp"
+
+// forward
+struct Runopts;
+class Read;
+
+struct readstore_header {
+	char magic[8]; // READSTORE_MAGIC
+	uint32_t version;
+	uint32_t format; // 0: FASTA, 1: FASTQ
+	uint64_t src_size; // size of the original Reads file. Used to validate the store
+	int64_t  src_mtime; // modification time of the original Reads file
+	uint64_t num_recs; // number of records i.e. number of Reads pushed by the Reader
+	uint64_t number_total_read; // see 'Readstats::number_total_read'
+	uint64_t full_read_main; // see 'Readstats::full_read_main'
+	uint64_t offsets_pos; // file offset of the offset table
+};
+
+const char READSTORE_MAGIC[8] = { 'S', 'M', 'R', 'R', 'E', 'A', 'D', 'S' };
+const uint32_t READSTORE_VERSION = 1;
+
+class ReadStore {
+public:
+	ReadStore(Runopts & opts) : opts(opts), pos(0) { std::fill_n((char*)&header, sizeof(header), 0); }
+	~ReadStore() { close(); }
+
+	static std::string getPath(Runopts & opts);
+	static bool getSrcStat(Runopts & opts, uint64_t & size, int64_t & mtime); // size and modification time of the Reads file
+
+	// writing
+	bool create(); // open a new store for writing
+	void add(const std::string & rheader, const std::string & sequence, const std::string & quality);
+	void commit(Format format, uint64_t number_total_read, uint64_t full_read_main); // write the offset table and the final header
+
+	// reading
+	bool open(); // open an existing store for reading. False if the store is missing or stale
+	bool next(Read & read); // load the next record into the read. False at the end of the store
+	bool seek(uint64_t idx); // position at the record 'idx' for 'next'
+	bool loadByIdx(Read & read); // random access by 'read.id' using the offset table
+	void close();
+
+	readstore_header header;
+private:
+	Runopts & opts;
+	std::fstream fs;
+	std::vector<uint64_t> offsets; // offset table. Filled when writing. Loaded lazily when reading
+	std::vector<char> buf; // record buffer
+	uint64_t pos; // current file position when writing, current record number when reading
+
+	bool loadOffsets();
+	bool readRecord(Read & read);
+}; // ~class ReadStore
@@ -0,0 +1,43 @@
+#pragma once
+/**
+ * FILE: refcatalog.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Catalog of the reference sequences of an index: the id, the length and the index part of every indexed sequence,
+ * loaded from '<index>.refcat' (see 'ref_catalog_header'). The SAM @SQ lines, the OTU map ids and the look-ups
+ * by id are read from the catalog instead of the reference file and the headers of the loaded references.
+ *
+ * Indexes built by earlier versions of indexdb have no catalog. The ids and the lengths recorded in the '.stats' file
+ * are used for the SAM @SQ lines then, and the sequences are not known by part.
+ */
+
+#include <cstdint>
+#include <string>
+#include <vector>
+#include <utility> // std::pair
+
+#include "indexdb.hpp" // ref_catalog_rec
+
+class RefCatalog {
+public:
+	RefCatalog() {}
+	~RefCatalog() {}
+
+	bool load(const std::string & path, uint64_t src_size, const std::vector<index_parts_stats> & parts); // false if there is no valid catalog
+	void build(const std::vector<std::pair<std::string, uint32_t>> & sam_sq); // ids and lengths from the '.stats' file. No parts
+
+	size_t size() const { return recs.size(); }
+	const ref_catalog_rec & at(size_t i) const { return recs[i]; }
+	const ref_catalog_rec* find(uint32_t part, uint32_t ordinal) const; // sequence of an index part. NULL if not known by part
+	const ref_catalog_rec* find(const std::string & id) const; // first sequence with the id. NULL if none
+	std::string getId(const ref_catalog_rec & rec) const { return ids.substr(rec.id_pos, rec.id_len); }
+
+private:
+	std::vector<ref_catalog_rec> recs;
+	std::string ids;
+	std::vector<uint64_t> part_first; // first record of each part, and the number of records. Empty without parts
+	std::vector<uint32_t> slots; // open addressing hash table of the ids: record number + 1, 0 if the slot is free
+
+	void index(); // fill 'slots'
+	static uint64_t hash(const char* id, size_t len);
+}; // ~class RefCatalog
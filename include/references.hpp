@@ -7,12 +7,14 @@
 #include <cstdint>
 #include <string>
 #include <vector>
+#include <memory> // std::shared_ptr
 #include <algorithm>
 
 #include "common.hpp" // Format, FASTA_HEADER_START, FASTQ_HEADER_START
 
 // forward
 class Refstats;
+class RefCatalog;
 struct Runopts;
 
 class References {
@@ -22,19 +24,26 @@ public:
 		size_t nid; // index into Reference file
 		std::string id; // ID from header
 		std::string header;
-		std::string sequence;
+		std::string sequence; // empty if the sequence is in the mapped reference store or shared memory segment. Use 'getSeq'
 		std::string quality; // "" (fasta) | "xxx..." (fastq)
+		const char* seq; // sequence in the mapped reference store or shared memory segment
+		size_t seq_len;
 		Format format; // FASTA | FATSQ
 		bool isEmpty;
-		BaseRecord(): isEmpty(true) {}
+		BaseRecord(): seq(0), seq_len(0), isEmpty(true) {}
 		void clear()
 		{
 			header.clear();
 			sequence.clear();
 			quality.clear();
+			seq = 0;
+			seq_len = 0;
 			isEmpty = true;
 		}
 
+		const char* getSeq() const { return seq != 0 ? seq : sequence.data(); } // the encoded sequence
+		size_t getSeqLen() const { return seq != 0 ? seq_len : sequence.size(); }
+
 		std::string getId() {
 			std::string id = header.substr(0, header.find(' '));
 			id.erase(id.begin(), std::find_if(id.begin(), id.end(), [](auto ch) {return !(ch == FASTA_HEADER_START || ch == FASTQ_HEADER_START);}));
@@ -44,13 +53,13 @@ public:
 
 	std::vector<BaseRecord> buffer; // Container for references TODO: change name?
 
-	References(): num(0), part(0) {}
+	References(): num(0), part(0), catalog(0) {}
 	~References() {}
 
 	void load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats); // load references into the buffer given index number and index part
 	void convert_fix(std::string & seq); // convert sequence to numberical form and fix ambiguous chars
 	std::string convertChar(int idx); // convert numerical form to char string
-	int findref(std::string id);
+	int findref(std::string id); // index of the reference with the id, -1 if not in this part
 	void clear();
 
 public:
@@ -59,4 +68,10 @@ public:
 
 private:
 	bool load_for_search;
+	const RefCatalog* catalog; // catalog of the index. Owned by 'Refstats'
+	std::shared_ptr<char> store; // the mapped reference store ('<index>.ref_<part>.dat') or shared memory segment ('--shm'). Unmapped with the last copy
+
+	bool loadStore(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats);
+	bool loadShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts);
+	void publishShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts);
 }; // ~class References
@@ -6,19 +6,43 @@
 
 #include <cstdint>
 #include <vector>
+#include <string>
 #include <utility> // std::pair
 
 #include "indexdb.hpp" // index_parts_stats;
+#include "refcatalog.hpp"
 
 // forward
 struct Readstats;
 struct Runopts;
 
+/*
+ * Cache of the Gumbel parameters computed by the ALP simulation, next to the index ('<index>.gumbel').
+ * The records are appended, one per scoring and background frequencies the index was searched with.
+ *
+ *   char magic[8]                          GUMBEL_CACHE_MAGIC
+ *   uint32_t version                       GUMBEL_CACHE_VERSION. Changes with the ALP simulation parameters in 'Refstats::load'
+ *   gumbel_cache_rec[]
+ */
+struct gumbel_cache_rec {
+	int64_t scoring[16]; // A,C,G,T substitution matrix. Key
+	int64_t gap_open; // Key
+	int64_t gap_extension; // Key
+	double background_freq[4]; // A,C,G,T frequencies of the reference. Key
+	double lambda;
+	double K;
+};
+
+const char GUMBEL_CACHE_MAGIC[8] = { 'S', 'M', 'R', 'G', 'U', 'M', 'B', 'L' };
+const uint32_t GUMBEL_CACHE_VERSION = 1;
+
 
 class Refstats {
 public:
 	std::vector<uint16_t> num_index_parts; /* number of parts in each index file i.e. each index can have multiple parts. <--load */
 	std::vector<std::vector<index_parts_stats>> index_parts_stats_vec; /* index parts statistics */
+	std::vector<std::vector<part_mem_stats>> part_mem; /* predicted search memory of each index part. Empty if the index does not record it */
+	std::vector<RefCatalog> catalogs; /* ids and lengths of the reference sequences of each index. See 'RefCatalog' */
 	std::vector<uint64_t> full_ref;   /* corrected size of each reference index (for computing E-value) <--load */
 	std::vector<uint64_t> full_read;  /* corrected size of reads (for computing E-value) <--load */
 	std::vector<uint32_t> lnwin;      /* length of seed (sliding window L). Unique per DB. Const. Obtained in Main thread. Thread safe. See 'load_stats' */
@@ -27,11 +51,21 @@ public:
 	std::vector<std::pair<double, double>> gumbel; // Gumbel parameters Lambda and K. <--'load_stats'
 	std::vector<uint64_t> numbvs; /* number of bitvectors at depth > 0 in [w_1] reverse or [w_2] forward */
 	std::vector<uint64_t> numseq;  /* total number of reference sequences in one complete reference database */
+	std::vector<double> entropy; /* Shannon's entropy of the reference nucleotide distribution. Length correction of the search space */
+	double evalue; /* E-value threshold '-e' */
+	bool is_per_read; /* the search space is computed per read i.e. the size of the reads is not known before the alignment. '--reads -' */
 
 public:
 	Refstats(Runopts & opts, Readstats & readstats);
 	~Refstats() {}
 
+	uint32_t getMinimalScore(uint16_t index_num, size_t read_len); // minimal SW score to reach the E-value threshold
+	double getEvalue(uint16_t index_num, size_t read_len, int32_t score); // E-value of the alignment score
+
 private:
+	double searchSpace(uint16_t index_num, size_t read_len); // corrected (reference size * read size) of a single read
+
 	void load(Runopts & opts, Readstats & readstats); // called at constructions
+	bool findGumbel(const std::string & path, gumbel_cache_rec & rec); // lambda and K of the record key if cached
+	void storeGumbel(const std::string & path, const gumbel_cache_rec & rec);
 };
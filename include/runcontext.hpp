@@ -0,0 +1,51 @@
+#pragma once
+/**
+ * FILE: runcontext.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Objects shared by the tasks of a run ('align', 'postProcess', 'generateReports'), so that '--task 4'
+ * opens the Key-value database, computes the index statistics and loads the references of each index part
+ * once per process instead of once per task.
+ *
+ * The references of an index part are kept for the next task only if the references of all the parts fit
+ * into the memory budget ('--prefetch_mem') together with the two index parts searched while aligning.
+ * Otherwise each task loads them again, as before.
+ */
+
+#include <cstdint>
+#include <map>
+#include <memory> // std::unique_ptr
+#include <mutex>
+#include <utility> // std::pair
+
+#include "options.hpp"
+#include "references.hpp"
+
+// forward
+struct Readstats;
+class Refstats;
+class KeyValueDatabase;
+
+class RunContext {
+public:
+	RunContext(Runopts & opts, Readstats & readstats);
+	~RunContext();
+
+	KeyValueDatabase & getKvdb(); // opened on the first use
+	Refstats & getRefstats(); // computed on the first use. Call before any 'getRefs'
+	References & getRefs(uint16_t index_num, uint16_t idx_part); // references of the index part, loaded unless kept by an earlier task
+	void releaseRefs(uint16_t index_num, uint16_t idx_part); // done with the references of the index part by the current task
+
+	uint64_t partMemSize(uint16_t index_num, uint16_t idx_part); // memory (bytes) of a loaded index part and its references
+	uint64_t refsMemSize(uint16_t index_num, uint16_t idx_part); // memory (bytes) of the references of an index part
+	uint64_t memBudget(); // memory (bytes) for the loaded index parts and references. See '--prefetch_mem'
+
+private:
+	Runopts & opts;
+	Readstats & readstats;
+	std::unique_ptr<KeyValueDatabase> kvdb;
+	std::unique_ptr<Refstats> refstats;
+	std::map<std::pair<uint16_t, uint16_t>, References> refs; // loaded references by (index number, index part)
+	std::mutex refs_lock; // 'refs' is looked up by the prefetcher thread while aligning
+	bool keep_refs = false; // keep the references between the tasks. Set with 'refstats'
+}; // ~class RunContext
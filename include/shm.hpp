@@ -0,0 +1,61 @@
+#pragma once
+/**
+ * FILE: shm.hpp
+ * Created: Oct 17, 2026 Sat
+ *
+ * Named POSIX shared memory segments holding the loaded index parts and reference sequences ('--shm').
+ * The first process to load a part publishes it, the later processes map the segment read-only and skip the loading.
+ * The segments stay in the system after the processes exit (see '/dev/shm' on Linux), and are replaced
+ * when the index or the reference files change.
+ * A segment left incomplete by a publishing process that died, or that is not complete after SHM_PUBLISH_TIMEOUT,
+ * is removed by the next process, which publishes it again.
+ *
+ * Segment layout:
+ *
+ *   shm_header                             'ready' is set last by the publishing process
+ *   data                                   Index: 'Index::publishShm'  References: 'References::publishShm'
+ */
+
+#include <string>
+#include <vector>
+#include <cstdint>
+
+struct shm_header {
+	char magic[8]; // SHM_INDEX_MAGIC | SHM_REFS_MAGIC
+	uint32_t version;
+	uint32_t ready; // 1: the segment is completely written
+	uint64_t size; // size of the segment
+	uint64_t src_size; // total size of the source files. Used to validate the segment
+	int64_t  src_mtime; // combined modification times of the source files
+	uint64_t counts[6]; // layout specific sizes
+	int64_t owner_pid; // the publishing process
+	int64_t created; // time the publishing started
+};
+
+const char SHM_INDEX_MAGIC[8] = { 'S', 'M', 'R', 'S', 'H', 'M', 'I', 'X' };
+const char SHM_REFS_MAGIC[8] = { 'S', 'M', 'R', 'S', 'H', 'M', 'R', 'F' };
+const uint32_t SHM_VERSION = 3;
+const int64_t SHM_PUBLISH_TIMEOUT = 3600; // seconds to complete a segment, after which an incomplete segment is stale
+
+class ShmSegment {
+public:
+	ShmSegment() {}
+	~ShmSegment() {} // the mapping is released in 'detach'
+
+	static std::string getName(const std::string & path, uint32_t part, const char * kind);
+	static bool getSrcStat(const std::vector<std::string> & files, uint64_t & size, int64_t & mtime);
+
+	bool attach(const std::string & name, const char * magic, uint64_t src_size, int64_t src_mtime); // map an existing segment read-only
+	char* create(const std::string & name, const char * magic, uint64_t src_size, int64_t src_mtime, uint64_t data_size); // new segment to publish
+	void commit(); // mark the segment ready
+	void detach();
+	static bool removeStale(const std::string & name); // remove the segment if its publishing process has died or timed out
+
+	shm_header* header() { return reinterpret_cast<shm_header*>(base); }
+	const char* data() { return base + sizeof(shm_header); }
+
+private:
+	char* base = 0;
+	size_t size = 0;
+	std::string name; // set while publishing
+}; // ~class ShmSegment
@@ -92,7 +92,7 @@ struct id_win
 		pattern = |------ [p_1] ------|------ [p_2] --....--|<br/>
 				  |------ trie -------|----- tail ----....--|<br/>
 
-	@param NodeElement* trie_t
+	@param FlatNodeElement* trie_t
 	@param uint32_t lev_t
 	@param unsigned char depth
 	@param MYBITSET *win_k1_ptr
@@ -102,10 +102,11 @@ struct id_win
 	@param uint32_t readn,
 	@param uint32_t win_num,
 	@param uint32_t partialwin
+	@param bucket_layout &bucket
 	@return none
 */
 void traversetrie_align(
-	NodeElement *trie_t /**< root node to mini burst trie */,
+	const FlatNodeElement *trie_t /**< root node to mini burst trie */,
 	uint32_t lev_t /**< initial Levenshtein automaton state */,
 	unsigned char depth /**< trie node depth */,
 	UCHAR *win_k1_ptr /**< pointer to start of forward L/2-mer bitvector */,
@@ -115,5 +116,6 @@ void traversetrie_align(
 	int64_t readn /**< read number */,
 	uint32_t win_num /**< sliding window (seed) number on read */,
 	uint32_t partialwin, /**< */
+	const bucket_layout & bucket, /**< layout of the bucket entries of the index part */
 	Runopts & opts
 );
\ No newline at end of file
@@ -43,19 +43,24 @@
 #include <errno.h>
 #include <unistd.h>
 #include <iostream>
+#include <thread>
+#include <unordered_set>
+#include <algorithm> // std::find_if
+#include <cctype> // isspace
+#include <cstdio> // std::remove
 
 #include "version.h"
 #include "build_version.h"
 #include "indexdb.hpp"
+#include "references.hpp" // References::BaseRecord
 #include "cmph.h"
+#include "zlib.h"
 #include <sys/stat.h> //for creating tmp dir
 
 #if defined(_WIN32)
 #include <Winsock.h>
-const std::string ENV_TMPDIR = "TMP";
 const char PATH_SEPARATOR = '\\';
 #else
-const std::string ENV_TMPDIR = "TMPDIR";
 const char PATH_SEPARATOR = '/';
 #endif
 
@@ -108,6 +113,14 @@ uint32_t partialwin_gv = 0;
 uint32_t mask32 = 0;
 uint64_t mask64 = 0;
 
+/* layout of the bucket entries written to the burst tries file of the current index part (see '--compact') */
+bucket_layout bucket_gv;
+
+/* size of the burst tries: bytes per unique (L+1)-mer (its forward and reverse bucket entries) plus bytes per
+   non-empty trie (the trie nodes). Fitted on rRNA databases within 3%, rounded up (see '--auto-parts') */
+const double TRIE_BYTES_PER_KEY = 22;
+const double TRIE_BYTES_PER_TRIE = 46;
+
 uint32_t total_num_trie_nodes = 0;
 uint32_t size_of_all_buckets = 0;
 uint32_t sizeoftrie = 0;
@@ -543,6 +556,519 @@ void search_for_id(NodeElement* trie_node, unsigned char* kmer_id_short_F_ptr, u
 }//~search_for_id()
 
 
+/*
+ *
+ * @function for_each_window: slide the 19-mer window over the sequence
+ * and call 'visit' for every window with the window number, the 9-mer
+ * prefix and suffix keys, the 19-mer, and the pointers to the 10-mers to
+ * insert into the forward and the reverse mini-burst tries
+ * @param vector<unsigned char>& myseq: the sequence in integer alphabet {0,1,2,3}
+ * @param vector<unsigned char>& myseqr: buffer for the reverse sequence
+ * @param uint32_t interval: index every interval-th 19-mer
+ * @param Visit visit: callback
+ * @return void
+ *
+ *******************************************************************/
+template <typename Visit>
+inline void for_each_window(std::vector<unsigned char>& myseq,
+	std::vector<unsigned char>& myseqr,
+	uint32_t interval,
+	Visit visit)
+{
+	uint32_t len = (uint32_t)myseq.size();
+
+	// create a reverse sequence using the forward
+	myseqr.assign(myseq.rbegin(), myseq.rend());
+
+	// 9-mer prefix of 19-mer
+	uint32_t kmer_key_short_f = 0;
+	// 9-mer suffix of 19-mer
+	uint32_t kmer_key_short_r = 0;
+	// pointer to next letter to add to 9-mer prefix
+	unsigned char* kmer_key_short_f_p = &myseq[0];
+	// pointer to next letter to add to 9-mer suffix
+	unsigned char* kmer_key_short_r_p = &myseq[partialwin_gv + 1];
+	// pointer to 10-mer of reverse 19-mer to insert
+	// into the mini-burst trie
+	unsigned char* kmer_key_short_r_rp = &myseqr[len - partialwin_gv - 1];
+	// 19-mer
+	unsigned long long int kmer_key = 0;
+	// pointer to 19-mer
+	unsigned char* kmer_key_ptr = &myseq[0];
+
+	// initialize the prefix and suffix 9-mers
+	for (uint32_t j = 0; j < partialwin_gv; j++)
+	{
+		(kmer_key_short_f <<= 2) |= (int)*kmer_key_short_f_p++;
+		(kmer_key_short_r <<= 2) |= (int)*kmer_key_short_r_p++;
+	}
+
+	// initialize the 19-mer
+	for (uint32_t j = 0; j < pread_gv; j++) (kmer_key <<= 2) |= (int)*kmer_key_ptr++;
+
+	uint32_t numwin = (len - pread_gv + interval) / interval;
+	uint32_t index_pos = 0;
+
+	// for all 19-mers on the sequence
+	for (uint32_t j = 0; j < numwin; j++)
+	{
+		visit(j, index_pos, kmer_key_short_f, kmer_key_short_r, kmer_key, kmer_key_short_f_p, kmer_key_short_r_rp);
+
+		// shift 19-mer window and both 9-mers
+		if (j != numwin - 1)
+		{
+			for (uint32_t shift = 0; shift < interval; shift++)
+			{
+				((kmer_key_short_f <<= 2) &= mask32) |= (int)*kmer_key_short_f_p++;
+				((kmer_key_short_r <<= 2) &= mask32) |= (int)*kmer_key_short_r_p++;
+				((kmer_key <<= 2) &= mask64) |= (int)*kmer_key_ptr++;
+				kmer_key_short_r_rp--;
+				index_pos++;
+			}
+		}
+	}//~for all 19-mers on the sequence
+}//~for_each_window()
+
+
+
+/*
+ *
+ * @function run_shards: run 'worker(shard)' for every shard on its own thread
+ * @param uint32_t num_threads: number of shards
+ * @param Worker worker: callback
+ * @return void
+ *
+ *******************************************************************/
+template <typename Worker>
+inline void run_shards(uint32_t num_threads, Worker worker)
+{
+	if (num_threads == 1)
+	{
+		worker(0);
+		return;
+	}
+	std::vector<std::thread> threads;
+	for (uint32_t shard = 0; shard < num_threads; shard++)
+		threads.push_back(std::thread(worker, shard));
+	for (auto & thread : threads)
+		thread.join();
+}//~run_shards()
+
+
+
+/*
+ *
+ * @function build_burst_tries: insert all the 19-mers of the index part
+ * into the mini-burst tries and collect the unique 18-mers for the MPHF.
+ * The look-up table is sharded by 9-mer among the threads. Every thread visits
+ * the windows in the order of the serial build, and updates only the 9-mers
+ * (counts and tries) of its shard, so each trie receives its 19-mers in the same
+ * order and the index is identical to the one built by a single thread.
+ * @param vector<vector<unsigned char>>& part_seqs: sequences of the index part
+ * @param kmer* lookup_table: pointer to the 9-mer lookup table
+ * @param uint32_t interval: index every interval-th 19-mer
+ * @param uint32_t num_threads: number of threads
+ * @param vector<uint64_t>& keys: the unique 18-mers in the order they were found
+ * @return void
+ *
+ *******************************************************************/
+void build_burst_tries(std::vector<std::vector<unsigned char>>& part_seqs,
+	kmer* lookup_table,
+	uint32_t interval,
+	uint32_t num_threads,
+	std::vector<uint64_t>& keys)
+{
+	// number of the first window of each sequence
+	std::vector<uint64_t> seq_win(part_seqs.size() + 1, 0);
+	for (size_t s = 0; s < part_seqs.size(); s++)
+		seq_win[s + 1] = seq_win[s] + (part_seqs[s].size() - pread_gv + interval) / interval;
+
+	// windows with an 18-mer not yet in the burst tries. Set by the thread owning the 9-mer prefix
+	std::vector<char> new_positions(seq_win.back(), 0);
+	// keep track which L/2-mers have been counted for by the forward sliding L/2-mer
+	std::vector<char> incremented_by_forward((1 << lnwin_gv), 0);
+
+	run_shards(num_threads, [&](uint32_t shard)
+	{
+		std::vector<unsigned char> myseqr;
+		for (size_t s = 0; s < part_seqs.size(); s++)
+		{
+			for_each_window(part_seqs[s], myseqr, interval, [&](uint32_t j, uint32_t index_pos,
+				uint32_t kmer_key_short_f, uint32_t kmer_key_short_r, unsigned long long int kmer_key,
+				unsigned char* kmer_key_short_f_p, unsigned char* kmer_key_short_r_rp)
+			{
+				// ****** add the forward 19-mer
+				if (kmer_key_short_f % num_threads == shard)
+				{
+					lookup_table[kmer_key_short_f].count++;
+					incremented_by_forward[kmer_key_short_f] = 1;
+
+					// new position for 18-mer in positions_tbl
+					bool new_position = true;
+
+					// forward 19-mer does not exist in the burst trie (duplicates not allowed)
+					if (lookup_table[kmer_key_short_f].trie_F == NULL ||
+						!search_burst_trie(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p, new_position))
+					{
+						// create a trie node if it doesn't exist
+						if (lookup_table[kmer_key_short_f].trie_F == NULL)
+						{
+							lookup_table[kmer_key_short_f].trie_F = (NodeElement*)malloc(4 * sizeof(NodeElement));
+							if (lookup_table[kmer_key_short_f].trie_F == NULL)
+							{
+								std::cerr << RED << "  ERROR" << COLOFF << ": could not allocate memory for trie_node in indexdb.cpp" << std::endl;
+								exit(EXIT_FAILURE);
+							}
+							memset(lookup_table[kmer_key_short_f].trie_F, 0, 4 * sizeof(NodeElement));
+						}
+
+						insert_prefix(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p);
+					}
+
+					// 18-mer doesn't exist in the burst trie, add it to the keys
+					if (new_position) new_positions[seq_win[s] + j] = 1;
+				}
+
+				// ****** add the reverse 19-mer
+				if (kmer_key_short_r % num_threads == shard)
+				{
+					// increment 9-mer count only if it wasn't already
+					// incremented by kmer_key_short_f before
+					if (!incremented_by_forward[kmer_key_short_r]) lookup_table[kmer_key_short_r].count++;
+
+					bool new_position = true;
+
+					// reverse 19-mer does not exist in the burst trie
+					if (lookup_table[kmer_key_short_r].trie_R == NULL ||
+						!search_burst_trie(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp, new_position))
+					{
+						// create a trie node if it doesn't exist
+						if (lookup_table[kmer_key_short_r].trie_R == NULL)
+						{
+							lookup_table[kmer_key_short_r].trie_R = (NodeElement*)malloc(4 * sizeof(NodeElement));
+							if (lookup_table[kmer_key_short_r].trie_R == NULL)
+							{
+								std::cerr << RED << "  ERROR" << COLOFF << ": could not allocate memory for trie_node in indexdb.cpp" << std::endl;
+								exit(EXIT_FAILURE);
+							}
+							memset(lookup_table[kmer_key_short_r].trie_R, 0, 4 * sizeof(NodeElement));
+						}
+
+						insert_prefix(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp);
+					}
+				}
+			});
+		}
+	});
+
+	// collect the unique 18-mers in the order they were found
+	std::vector<unsigned char> myseqr;
+	for (size_t s = 0; s < part_seqs.size(); s++)
+	{
+		for_each_window(part_seqs[s], myseqr, interval, [&](uint32_t j, uint32_t index_pos,
+			uint32_t kmer_key_short_f, uint32_t kmer_key_short_r, unsigned long long int kmer_key,
+			unsigned char* kmer_key_short_f_p, unsigned char* kmer_key_short_r_rp)
+		{
+			if (new_positions[seq_win[s] + j])
+				keys.push_back(kmer_key >> 2);
+		});
+	}
+}//~build_burst_tries()
+
+
+
+/*
+ *
+ * @function build_positions: set the MPHF ids of the 19-mers in the burst
+ * tries and build the positions lookup table. The ids are computed in parallel
+ * by sequence, the tries are then sharded by 9-mer and the positions table by
+ * id, so that the positions of each id are added in the order of the serial build.
+ * @param vector<vector<unsigned char>>& part_seqs: sequences of the index part
+ * @param kmer* lookup_table: pointer to the 9-mer lookup table
+ * @param cmph_t* hash: MPHF on the unique 18-mers
+ * @param kmer_origin* positions_tbl: the positions lookup table
+ * @param uint32_t interval: index every interval-th 19-mer
+ * @param uint32_t max_pos: maximum number of positions to store for each 18-mer
+ * @param uint32_t num_threads: number of threads
+ * @return void
+ *
+ *******************************************************************/
+void build_positions(std::vector<std::vector<unsigned char>>& part_seqs,
+	kmer* lookup_table,
+	cmph_t* hash,
+	kmer_origin* positions_tbl,
+	uint32_t interval,
+	uint32_t max_pos,
+	uint32_t num_threads)
+{
+	// number of the first window of each sequence
+	std::vector<uint64_t> seq_win(part_seqs.size() + 1, 0);
+	for (size_t s = 0; s < part_seqs.size(); s++)
+		seq_win[s + 1] = seq_win[s] + (part_seqs[s].size() - pread_gv + interval) / interval;
+
+	// MPHF ids of all the windows
+	std::vector<uint32_t> ids(seq_win.back(), 0);
+
+	run_shards(num_threads, [&](uint32_t shard)
+	{
+		std::vector<unsigned char> myseqr;
+		for (size_t s = shard; s < part_seqs.size(); s += num_threads)
+		{
+			for_each_window(part_seqs[s], myseqr, interval, [&](uint32_t j, uint32_t index_pos,
+				uint32_t kmer_key_short_f, uint32_t kmer_key_short_r, unsigned long long int kmer_key,
+				unsigned char* kmer_key_short_f_p, unsigned char* kmer_key_short_r_rp)
+			{
+				uint64_t key = kmer_key >> 2;
+				ids[seq_win[s] + j] = cmph_search(hash, (const char*)&key, (cmph_uint32)sizeof(uint64_t));
+			});
+		}
+	});
+
+	run_shards(num_threads, [&](uint32_t shard)
+	{
+		std::vector<unsigned char> myseqr;
+		for (size_t s = 0; s < part_seqs.size(); s++)
+		{
+			for_each_window(part_seqs[s], myseqr, interval, [&](uint32_t j, uint32_t index_pos,
+				uint32_t kmer_key_short_f, uint32_t kmer_key_short_r, unsigned long long int kmer_key,
+				unsigned char* kmer_key_short_f_p, unsigned char* kmer_key_short_r_rp)
+			{
+				uint32_t id = ids[seq_win[s] + j];
+
+				if (kmer_key_short_f % num_threads == shard)
+					add_id_to_burst_trie(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p, id);
+				if (kmer_key_short_r % num_threads == shard)
+					add_id_to_burst_trie(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp, id);
+				if (id % num_threads == shard)
+					add_kmer_to_table(positions_tbl + id, (uint32_t)s, index_pos, max_pos);
+			});
+		}
+	});
+}//~build_positions()
+
+
+
+/*
+ *
+ * @function flat_bucket_size: size of a bucket in the burst tries file,
+ * in the layout 'bucket_gv' and padded to keep the trie nodes aligned
+ * @param uint32_t size: size of the bucket in memory (ENTRYSIZE entries)
+ * @return uint32_t
+ *
+ *******************************************************************/
+inline uint32_t flat_bucket_size(uint32_t size)
+{
+	uint32_t packed = size / ENTRYSIZE * bucket_gv.entry_size;
+	return (packed + 3) & ~3U;
+}//~flat_bucket_size()
+
+
+
+/*
+ *
+ * @function put_bits: store a value in a bit-packed array (see 'get_bits')
+ * @param uint64_t* words: the array, zeroed
+ * @param uint64_t bitpos: the first bit of the value
+ * @param uint32_t width: number of bits of the value <= 64
+ * @param uint64_t value
+ * @return void
+ *
+ *******************************************************************/
+inline void put_bits(uint64_t* words, uint64_t bitpos, uint32_t width, uint64_t value)
+{
+	uint64_t w = bitpos >> 6;
+	uint32_t off = bitpos & 63;
+	words[w] |= value << off;
+	if (off + width > 64)
+		words[w + 1] |= value >> (64 - off);
+}//~put_bits()
+
+
+
+/*
+ *
+ * @function ref_record_mem: memory of a reference sequence loaded for the
+ * search (see 'References::BaseRecord'): the record, the sequence, and the
+ * header and the id estimated by the id
+ * @param uint64_t len: length of the sequence
+ * @param size_t id_len: length of the sequence id
+ * @return uint64_t bytes
+ *
+ *******************************************************************/
+inline uint64_t ref_record_mem(uint64_t len, size_t id_len)
+{
+	const uint64_t alloc_overhead = 16; // per heap allocation
+	return sizeof(References::BaseRecord) + len + 2 * id_len + 3 * (1 + alloc_overhead);
+}//~ref_record_mem()
+
+
+
+/*
+ *
+ * @function add_ref_line: append a line of a reference sequence encoded
+ * the way 'References::load' encodes it: the trailing spaces trimmed, every
+ * character but the space converted by 'nt_table'
+ * @param std::string& refseq: the encoded sequence
+ * @param std::string& line: the line. Cleared
+ * @return void
+ *
+ *******************************************************************/
+inline void add_ref_line(std::string & refseq, std::string & line)
+{
+	size_t len = line.size();
+	while (len > 0 && isspace((unsigned char)line[len - 1])) --len;
+	for (size_t i = 0; i < len; ++i)
+		refseq.push_back(line[i] == ' ' ? ' ' : nt_table[line[i] & 0x7f]);
+	line.clear();
+}//~add_ref_line()
+
+
+
+/*
+ *
+ * @function write_ref_store: write the reference sequences of an index
+ * part for mapping by sortmerna (see 'ref_store_header')
+ * @param std::string path: the '.ref_<part>.dat' file
+ * @param std::vector<std::string>& headers: the header lines
+ * @param std::vector<std::string>& refseqs: the sequences (see 'add_ref_line')
+ * @param ref_store_header& hdr: the section of the reference file
+ * @return void
+ *
+ *******************************************************************/
+void write_ref_store(std::string path, std::vector<std::string> & headers, std::vector<std::string> & refseqs, ref_store_header & hdr)
+{
+	std::vector<uint64_t> seq_offsets(1, 0);
+	std::vector<uint64_t> header_offsets(1, 0);
+	for (size_t i = 0; i < refseqs.size(); ++i)
+	{
+		seq_offsets.push_back(seq_offsets.back() + refseqs[i].size());
+		header_offsets.push_back(header_offsets.back() + headers[i].size());
+	}
+
+	memcpy(hdr.magic, REF_STORE_MAGIC, sizeof(hdr.magic));
+	hdr.version = REF_STORE_VERSION;
+	hdr.num_refs = (uint32_t)refseqs.size();
+	hdr.seqs_pos = sizeof(ref_store_header) + 2 * sizeof(uint64_t) * (refseqs.size() + 1);
+	hdr.headers_pos = hdr.seqs_pos + seq_offsets.back();
+	hdr.size = hdr.headers_pos + header_offsets.back();
+
+	std::ofstream os(path.c_str(), std::ios::binary);
+	os.write(reinterpret_cast<const char*>(&hdr), sizeof(hdr));
+	os.write(reinterpret_cast<const char*>(seq_offsets.data()), sizeof(uint64_t) * seq_offsets.size());
+	os.write(reinterpret_cast<const char*>(header_offsets.data()), sizeof(uint64_t) * header_offsets.size());
+	for (auto & refseq : refseqs)
+		os.write(refseq.data(), refseq.size());
+	for (auto & header : headers)
+		os.write(header.data(), header.size());
+	if (!os.good())
+	{
+		std::cerr << RED << "  ERROR" << COLOFF << ": could not write the reference sequences to " << path << std::endl;
+		exit(EXIT_FAILURE);
+	}
+}//~write_ref_store()
+
+
+
+/*
+ *
+ * @function add_catalog_rec: add a reference sequence of an index part
+ * to the catalog of the index (see 'ref_catalog_header')
+ * @param std::vector<ref_catalog_rec>& recs: the catalog records
+ * @param std::string& ids: the catalog ids
+ * @param std::string& header: the header line as in the reference store, starting with '>'
+ * @param uint64_t header_pos: offset of the header line in the reference file
+ * @param uint32_t seq_len: length of the encoded sequence (see 'add_ref_line')
+ * @param uint32_t part: the index part
+ * @param uint32_t ordinal: number of the sequence in the index part
+ * @return void
+ *
+ *******************************************************************/
+void add_catalog_rec(std::vector<ref_catalog_rec> & recs, std::string & ids, const std::string & header,
+	uint64_t header_pos, uint32_t seq_len, uint32_t part, uint32_t ordinal)
+{
+	// the id the way 'References::BaseRecord::getId' takes it from the header
+	size_t end = std::min(header.find(' '), header.size());
+	size_t start = 0;
+	while (start < end && (header[start] == FASTA_HEADER_START || header[start] == FASTQ_HEADER_START)) ++start;
+
+	ref_catalog_rec rec;
+	rec.header_pos = header_pos;
+	rec.id_pos = ids.size();
+	rec.id_len = (uint32_t)(end - start);
+	rec.seq_len = seq_len;
+	rec.part = part;
+	rec.ordinal = ordinal;
+	recs.push_back(rec);
+	ids.append(header, start, end - start);
+}//~add_catalog_rec()
+
+
+
+/*
+ *
+ * @function write_ref_catalog: write the catalog of the reference
+ * sequences of an index for sortmerna (see 'ref_catalog_header')
+ * @param std::string path: the '.refcat' file
+ * @param std::vector<ref_catalog_rec>& recs: the catalog records
+ * @param std::string& ids: the catalog ids
+ * @param uint32_t num_parts: number of index parts
+ * @param uint64_t src_size: size of the reference file
+ * @return void
+ *
+ *******************************************************************/
+void write_ref_catalog(std::string path, std::vector<ref_catalog_rec> & recs, std::string & ids, uint32_t num_parts, uint64_t src_size)
+{
+	ref_catalog_header hdr;
+	memset(&hdr, 0, sizeof(hdr));
+	memcpy(hdr.magic, REF_CATALOG_MAGIC, sizeof(hdr.magic));
+	hdr.version = REF_CATALOG_VERSION;
+	hdr.num_parts = num_parts;
+	hdr.num_refs = recs.size();
+	hdr.src_size = src_size;
+	hdr.ids_pos = sizeof(ref_catalog_header) + sizeof(ref_catalog_rec) * recs.size();
+	hdr.size = hdr.ids_pos + ids.size();
+
+	std::ofstream os(path.c_str(), std::ios::binary);
+	os.write(reinterpret_cast<const char*>(&hdr), sizeof(hdr));
+	os.write(reinterpret_cast<const char*>(recs.data()), sizeof(ref_catalog_rec) * recs.size());
+	os.write(ids.data(), ids.size());
+	if (!os.good())
+	{
+		std::cerr << RED << "  ERROR" << COLOFF << ": could not write the reference catalog to " << path << std::endl;
+		exit(EXIT_FAILURE);
+	}
+}//~write_ref_catalog()
+
+
+
+/*
+ *
+ * @function load_ref_catalog: read the catalog of an existing index.
+ * Used by '--append' to keep the records of the kept index parts.
+ * @param std::string path: the '.refcat' file
+ * @param index_stats& stats: the '.stats' of the index
+ * @param std::vector<ref_catalog_rec>& recs: the loaded catalog records
+ * @param std::string& ids: the loaded catalog ids
+ * @return false if there is no catalog of the index e.g. the index was built by an earlier indexdb
+ *
+ *******************************************************************/
+bool load_ref_catalog(std::string path, index_stats & stats, std::vector<ref_catalog_rec> & recs, std::string & ids)
+{
+	std::ifstream is(path.c_str(), std::ios::in | std::ios::binary);
+	ref_catalog_header hdr;
+	if (!is.read(reinterpret_cast<char*>(&hdr), sizeof(hdr)) || memcmp(hdr.magic, REF_CATALOG_MAGIC, sizeof(hdr.magic)) != 0
+		|| hdr.version != REF_CATALOG_VERSION || hdr.num_parts != stats.parts.size() || hdr.src_size != stats.filesize
+		|| hdr.ids_pos != sizeof(ref_catalog_header) + sizeof(ref_catalog_rec) * hdr.num_refs)
+		return false;
+
+	recs.resize(hdr.num_refs);
+	ids.resize(hdr.size - hdr.ids_pos);
+	is.read(reinterpret_cast<char*>(recs.data()), sizeof(ref_catalog_rec) * recs.size());
+	is.read(&ids[0], ids.size());
+	return is.good();
+}//~load_ref_catalog()
+
+
 
 /*
  *
@@ -575,7 +1101,7 @@ void traversetrie(NodeElement* trie_node, uint32_t depth)
 			// pad to alignment length (16-byte line)
 			// int padding = 16-((trie_node->size)%16);
 			// size_of_all_buckets+=(trie_node->size + padding);
-			size_of_all_buckets += trie_node->size;
+			size_of_all_buckets += flat_bucket_size(trie_node->size);
 
 			if (largest_bucket_size < trie_node->size) largest_bucket_size = trie_node->size;
 
@@ -699,167 +1225,142 @@ void traversetrie_debug(NodeElement* trie_node, uint32_t depth, uint32_t &total_
 
 /*
  *
- * @function load index: write to binary file the 9-mer look-up
- * tables and the mini-burst tries
- * @param string root: the file name of the index
+ * @function load index: write to binary file the mini-burst tries
+ * of the 9-mer look-up table in the flat layout (see 'flat_trie_header').
+ * The pointers of the trie nodes are replaced by offsets, so that
+ * sortmerna can memory map the file and search the tries in place.
  * @param kmer* lookup_table: pointer to the 9-mer lookup table
+ * @param char* outfile: the burst tries file
  * @return void
  * @version 1.0 Jan 16, 2013
  *
  *******************************************************************/
-void load_index(kmer* lookup_table, char* outfile)
+void load_index(kmer* lookup_table, char* outfile, bool is_compact)
 {
-	// output the mini-burst tries
-	std::ofstream btrie(outfile, std::ofstream::binary);
-
-	uint32_t sizeoftries[2] = { 0 };
-
-	// loop through all 9-mers
-	for (uint32_t i = 0; i < (uint32_t)(1 << lnwin_gv); i++)
+	// trie node or bucket to be written
+	struct trie_item
+	{
+		void* ptr;
+		uint32_t size; // bucket size
+		bool is_node;
+	};
+
+	uint32_t num_kmers = (uint32_t)(1 << lnwin_gv);
+	std::vector<uint64_t> tries(2 * (size_t)num_kmers, FLAT_TRIE_NONE);
+	flat_trie_header header;
+	memset(&header, 0, sizeof(header));
+	memcpy(header.magic, FLAT_TRIE_MAGIC, sizeof(header.magic));
+	header.version = is_compact ? FLAT_TRIE_VERSION_COMPACT : FLAT_TRIE_VERSION;
+	header.num_kmers = num_kmers;
+
+	// 1. offsets of the two mini-burst tries for each 9-mer
+	for (uint32_t i = 0; i < num_kmers; i++)
 	{
-		NodeElement* trienode = NULL;
-
-#ifdef see_binary_output
-		cout << "9-mer = " << i; //TESTING
-#endif
-
-	// 1. output size for the two mini-burst tries for each 9-mer
 		for (int j = 0; j < 2; j++)
 		{
+			NodeElement* trienode = j == 0 ? lookup_table[i].trie_F : lookup_table[i].trie_R;
+			if (trienode == NULL) continue;
+
 			total_num_trie_nodes = 0;
 			size_of_all_buckets = 0;
-			if (j == 0) trienode = lookup_table[i].trie_F;
-			else trienode = lookup_table[i].trie_R;
+			traversetrie(trienode, 0);
 
-			if (trienode != NULL) traversetrie(trienode, 0);
-
-			sizeoftrie = total_num_trie_nodes * sizeof(NodeElement) * 4 + size_of_all_buckets * sizeof(char);
-			sizeoftries[j] = sizeoftrie;
-			btrie.write(reinterpret_cast<const char*>(&sizeoftrie), sizeof(uint32_t));
-
-#ifdef see_binary_output
-			if (j == 0) cout << "\tsizeoftrie f = " << sizeoftrie; //TESTING
-			else cout << "\tsizeoftrie r = " << sizeoftrie; //TESTING
-#endif
+			sizeoftrie = total_num_trie_nodes * sizeof(FlatNodeElement) * 4 + size_of_all_buckets * sizeof(char);
+			tries[2 * i + j] = header.data_size;
+			header.data_size += sizeoftrie;
 		}
+	}
 
-#ifdef see_binary_output
-		cout << "\tlookup_tbl[i].count = " << lookup_table[i].count << endl; //TESTING
-#endif        
-	// 2. output both mini-burst tries into binary file
+	std::ofstream btrie(outfile, std::ofstream::binary);
+	btrie.write(reinterpret_cast<const char*>(&header), sizeof(header));
+	if (is_compact)
+		btrie.write(reinterpret_cast<const char*>(&bucket_gv), sizeof(bucket_gv));
+	btrie.write(reinterpret_cast<const char*>(tries.data()), tries.size() * sizeof(uint64_t));
+	std::vector<unsigned char> packed; // bucket in the compact layout
+
+	// 2. output the mini-burst tries breadth-first. The trie nodes and the buckets are written in the order
+	//    they are reached, so the offset of each one is known when its parent node element is written
+	for (uint32_t i = 0; i < num_kmers; i++)
+	{
 		for (int j = 0; j < 2; j++)
 		{
-			// the mini-burst trie exists, load into memory
-			if (sizeoftries[j] != 0)
-			{
-				if (j == 0)
-				{
-					trienode = lookup_table[i].trie_F;
-#ifdef see_binary_output
-					cout << "forward burst-trie \n"; //TESTING
-#endif
-				}
-				else
-				{
-					trienode = lookup_table[i].trie_R;
-#ifdef see_binary_output
-					cout << "reverse burst-trie \n"; //TESTING
-#endif
-				}
+			NodeElement* trienode = j == 0 ? lookup_table[i].trie_F : lookup_table[i].trie_R;
+			if (trienode == NULL) continue;
 
-				// queue of node elements for breadth-first traversal
-				std::deque<NodeElement*> nodes;
-
-				// load first set of NodeElements into the queue & write to file
-				for (int i = 0; i < 4; i++)
-				{
-					nodes.push_back(trienode);
-					btrie.write(reinterpret_cast<const char*>(&(trienode->flag)), sizeof(char));
-#ifdef see_binary_output
-					cout << " " << (int)trienode->flag; //TESTING
-#endif
-					trienode++;
-				}
+			std::deque<trie_item> items;
+			items.push_back({ trienode, 0, true });
+			uint64_t pos = 0; // offset in the trie of the item being written
+			uint64_t next = 4 * sizeof(FlatNodeElement); // offset in the trie of the next item reached
 
-				int depth = 0;
-				int poplimit = 4;
-				int numpops = 0;
-				int topop = 0;
+			while (!items.empty())
+			{
+				trie_item item = items.front();
+				items.pop_front();
 
-				while (!nodes.empty())
+				// bucket node, add bucket content to output file
+				if (!item.is_node)
 				{
-					// increment depth of burst trie
-					if (numpops == poplimit)
+					if (is_compact)
 					{
-						depth++;
-						poplimit = topop;
-						numpops = 0;
-						topop = 0;
+						// the tail and the id of each entry, little-endian, without the unused high bytes
+						packed.assign(flat_bucket_size(item.size), 0);
+						const uint32_t* entry = reinterpret_cast<const uint32_t*>(item.ptr);
+						for (uint32_t e = 0; e < item.size / ENTRYSIZE; e++, entry += 2)
+						{
+							memcpy(&packed[e * bucket_gv.entry_size], &entry[0], bucket_gv.key_size);
+							memcpy(&packed[e * bucket_gv.entry_size + bucket_gv.key_size], &entry[1], bucket_gv.id_size);
+						}
+						btrie.write(reinterpret_cast<const char*>(packed.data()), packed.size());
+						pos += packed.size();
 					}
+					else
+					{
+						btrie.write(reinterpret_cast<const char*>(item.ptr), item.size);
+						pos += item.size;
+					}
+					continue;
+				}
 
-					trienode = nodes.front();
-
-					switch (trienode->flag)
+				NodeElement* node = (NodeElement*)item.ptr;
+				for (int k = 0; k < 4; k++, node++)
+				{
+					FlatNodeElement elem = { 0, 0, (uint32_t)node->flag };
+					uint64_t elem_pos = pos + k * sizeof(FlatNodeElement);
+					switch (node->flag)
 					{
 						// empty node
 					case 0:
-					{
-						;
-					}
-					break;
-					// trie node, add child trie node to queue
+						break;
+						// trie node, add child trie node to queue
 					case 1:
 					{
-						NodeElement *child = trienode->nodetype.trie;
-						for (int i = 0; i < 4; i++)
-						{
-							nodes.push_back(child);
-							btrie.write(reinterpret_cast<const char*>(&(child->flag)), sizeof(char));
-#ifdef see_binary_output
-							cout << " " << (int)child->flag; //TESTING
-#endif
-							child++;
-						}
-						topop += 4;
+						elem.offset = (uint32_t)(next - elem_pos);
+						items.push_back({ node->nodetype.trie, 0, true });
+						next += 4 * sizeof(FlatNodeElement);
 					}
 					break;
-					// bucket node, add bucket to output file
+					// bucket node, add bucket to queue
 					case 2:
 					{
-						char* bucket = (char*)(trienode->nodetype.bucket);
-
-						// bucket information
-						uint32_t sizeofbucket = trienode->size;
-
-#ifdef see_binary_output
-						cout << "\tsizeofbucket = " << sizeofbucket; //TESTING
-#endif                 
-						btrie.write(reinterpret_cast<const char*>(&sizeofbucket), sizeof(uint32_t));
-
-						// bucket content
-						char* start = (char*)bucket;
-
-						btrie.write(reinterpret_cast<const char*>(start), sizeofbucket);
+						elem.offset = (uint32_t)(next - elem_pos);
+						elem.size = node->size / ENTRYSIZE * bucket_gv.entry_size;
+						items.push_back({ node->nodetype.bucket, node->size, false });
+						next += flat_bucket_size(node->size);
 					}
 					break;
 					// ?
 					default:
 					{
 						std::cerr << RED << "  ERROR" << COLOFF 
-							<<": flag is set to " << trienode->flag << " (load_index)" << std::endl;
+							<<": flag is set to " << (int)node->flag << " (load_index)" << std::endl;
 						exit(EXIT_FAILURE);
 					}
 					break;
 					}
-
-					nodes.pop_front();
-					numpops++;
-
-#ifdef see_binary_output
-					if (numpops % 4 == 0) cout << "\n"; //TESTING
-#endif             
-				}//~while the queue is not empty
-			}//~if mini-burst trie exists
+					btrie.write(reinterpret_cast<const char*>(&elem), sizeof(elem));
+				}
+				pos += 4 * sizeof(FlatNodeElement);
+			}//~while the queue is not empty
 		}//~for each mini-burst trie in the 9-mer
 	}//~for each 9-mer
 	btrie.close();
@@ -867,6 +1368,114 @@ void load_index(kmer* lookup_table, char* outfile)
 
 
 
+/*
+ *
+ * @function load_stats: read the '.stats' file of an existing index.
+ * Used by '--append' to index only the sequences added to the reference file since.
+ * @param string statsfile: the '.stats' file
+ * @param index_stats& stats: the loaded statistics
+ * @return false if the file cannot be read
+ *
+ *******************************************************************/
+bool load_stats(const std::string & statsfile, index_stats & stats)
+{
+	std::ifstream is(statsfile, std::ios::in | std::ios::binary);
+	if (!is.good())
+		return false;
+
+	uint32_t fasta_len = 0;
+	is.read(reinterpret_cast<char*>(&stats.filesize), sizeof(size_t));
+	is.read(reinterpret_cast<char*>(&fasta_len), sizeof(uint32_t));
+	is.seekg(fasta_len, std::ios::cur); // the fasta file name
+	is.read(reinterpret_cast<char*>(stats.background_freq), sizeof(double) * 4);
+	is.read(reinterpret_cast<char*>(&stats.full_len), sizeof(uint64_t));
+	is.read(reinterpret_cast<char*>(&stats.lnwin), sizeof(uint32_t));
+	is.read(reinterpret_cast<char*>(&stats.numseq), sizeof(uint64_t));
+
+	uint16_t num_parts = 0;
+	is.read(reinterpret_cast<char*>(&num_parts), sizeof(uint16_t));
+	stats.parts.resize(num_parts);
+	if (num_parts > 0)
+		is.read(reinterpret_cast<char*>(stats.parts.data()), sizeof(index_parts_stats) * num_parts);
+
+	uint32_t num_sq = 0;
+	is.read(reinterpret_cast<char*>(&num_sq), sizeof(uint32_t));
+	for (uint32_t j = 0; j < num_sq && is.good(); j++)
+	{
+		uint32_t len_id = 0;
+		uint32_t len = 0;
+		is.read(reinterpret_cast<char*>(&len_id), sizeof(uint32_t));
+		std::string id(len_id, '\0');
+		is.read(&id[0], len_id);
+		is.read(reinterpret_cast<char*>(&len), sizeof(uint32_t));
+		stats.sam_sq.push_back(std::pair<std::string, uint32_t>(id, len));
+	}
+
+	bool is_loaded = is.good() && num_parts > 0 && stats.sam_sq.size() == stats.numseq;
+
+	// predicted search memory and checksums of the parts, if recorded
+	char magic[sizeof(PART_MEM_MAGIC)] = { 0 };
+	bool have_magic = is_loaded && is.read(magic, sizeof(magic));
+	if (have_magic && memcmp(magic, PART_MEM_MAGIC, sizeof(magic)) == 0)
+	{
+		uint16_t num_mem = 0;
+		is.read(reinterpret_cast<char*>(&num_mem), sizeof(uint16_t));
+		stats.part_mem.resize(num_mem);
+		is.read(reinterpret_cast<char*>(stats.part_mem.data()), sizeof(part_mem_stats) * num_mem);
+		if (!is.good() || num_mem != num_parts)
+			stats.part_mem.clear();
+		have_magic = is.good() && is.read(magic, sizeof(magic));
+	}
+	if (have_magic && memcmp(magic, PART_CRC_MAGIC, sizeof(magic)) == 0)
+	{
+		uint16_t num_crc = 0;
+		is.read(reinterpret_cast<char*>(&num_crc), sizeof(uint16_t));
+		stats.part_crc.resize(num_crc);
+		is.read(reinterpret_cast<char*>(stats.part_crc.data()), sizeof(uint32_t) * num_crc);
+		if (!is.good() || num_crc != num_parts)
+			stats.part_crc.clear();
+	}
+
+	return is_loaded;
+}//~load_stats()
+
+
+
+/*
+ *
+ * @function part_crcs: CRC-32 of the sections of the reference file the index parts were built from,
+ * see 'PART_CRC_MAGIC'. The file is read forward from its beginning.
+ * @param gzFile fp: the reference file
+ * @param vector<index_parts_stats>& parts: the index parts
+ * @param size_t first: the first part to compute the checksum of
+ * @param vector<uint32_t>& crcs: the checksums of the parts 'first' on are appended
+ * @return false if a section is past the end of the file
+ *
+ *******************************************************************/
+bool part_crcs(gzFile fp, const std::vector<index_parts_stats> & parts, size_t first, std::vector<uint32_t> & crcs)
+{
+	std::vector<char> buf(1 << 16);
+	gzrewind(fp);
+	for (size_t j = first; j < parts.size(); j++)
+	{
+		if (gzseek(fp, parts[j].start_part, SEEK_SET) != (z_off_t)parts[j].start_part)
+			return false;
+		uLong crc = crc32(0L, Z_NULL, 0);
+		for (unsigned long int left = parts[j].seq_part_size; left > 0; )
+		{
+			int len = gzread(fp, buf.data(), (unsigned)std::min<unsigned long int>(left, buf.size()));
+			if (len <= 0)
+				return false;
+			crc = crc32(crc, reinterpret_cast<const Bytef*>(buf.data()), len);
+			left -= len;
+		}
+		crcs.push_back((uint32_t)crc);
+	}
+	return true;
+}//~part_crcs()
+
+
+
 /*
  *
  * FUNCTION 	: welcome()
@@ -933,7 +1542,7 @@ namespace {
 			<<      "--tmpdir" << COLOFF 
 			<<              "        " << UNDL
 			<<                      "STRING" << COLOFF 
-			<<                            "          directory where to write temporary files" << std::endl
+			<<                            "          (deprecated, ignored) the keys for the hash are kept in memory" << std::endl
 			<< "     " << BOLD
 			<<      "-m" << COLOFF
 			<<        "              " << UNDL
@@ -961,6 +1570,36 @@ namespace {
 			<<                         "             maximum number of positions to store for each unique L-mer  "<<UNDL
 			<<                                                                                                  "10000" << COLOFF << std::endl
 			<< "                                      (setting --max_pos 0 will store all positions)" << std::endl
+			<< "     " << BOLD
+			<<      "--threads" << COLOFF
+			<<               "       " << UNDL
+			<<                      "INT" << COLOFF
+			<<                         "             number of threads for building the index                    "<<UNDL
+			<<                                                                                                  "1" << COLOFF << std::endl
+			<< "     " << BOLD
+			<<      "--mph" << COLOFF
+			<<           "           " << UNDL
+			<<                      "STRING" << COLOFF
+			<<                            "          minimal perfect hash algorithm: chm, bdz or chd                 "<<UNDL
+			<<                                                                                                  "bdz" << COLOFF << std::endl
+			<< "     " << BOLD
+			<<      "--append" << COLOFF
+			<<              "        " << UNDL
+			<<                      "BOOL" << COLOFF
+			<<                          "            index only the sequences appended to the FASTA file since the index" << std::endl
+			<< "                                      was built. Use the same -m, --auto-parts, --interval and --max_pos as for the index" << std::endl
+			<< "     " << BOLD
+			<<      "--compact" << COLOFF
+			<<               "       " << UNDL
+			<<                      "BOOL" << COLOFF
+			<<                          "            compact index: bit-packed positions table and packed burst trie" << std::endl
+			<< "                                      buckets. About 2/3 of the memory per L-mer, i.e. fewer index parts" << std::endl
+			<< "     " << BOLD
+			<<      "--auto-parts" << COLOFF
+			<<                  "    " << UNDL
+			<<                      "INT" << COLOFF
+			<<                         "             the memory (in Mbytes) for searching an index part. The fewest" << std::endl
+			<< "                                      parts are built whose predicted search memory fits, instead of -m" << std::endl
 			<< "     " << BOLD 
 			<<      "-v" << COLOFF
 			<<        "              " << UNDL 
@@ -997,17 +1636,22 @@ int main(int argc, char** argv)
 	// memory of index
 	double mem = 0;
 	bool mem_is_set = false;
+	double auto_parts_mem = 0; // '--auto-parts' search memory (Mbytes) per index part
 	bool lnwin_set = false;
 	bool interval_set = false;
 	bool max_pos_set = false;
+	bool threads_set = false;
+	bool mph_set = false;
+	bool append = false; // '--append' index only the sequences appended to the reference files
+	bool compact = false; // '--compact' bit-packed positions table and packed burst trie buckets
 
 	// vector of (FASTA file, index name) pairs for constructing index
 	std::vector<std::pair<std::string, std::string>> myfiles;
 
-	// pointer to temporary directory
-	char* ptr_tmpdir = NULL;
 	uint32_t interval = 0;
 	uint32_t max_pos = 0;
+	uint32_t num_threads = 1; // '--threads' number of threads building the burst tries and the positions table
+	CMPH_ALGO mph_algo = CMPH_BDZ; // '--mph' minimal perfect hash algorithm
 
 	timeval t;
 
@@ -1165,7 +1809,7 @@ int main(int argc, char** argv)
 					narg += 2;
 				}
 			}
-			// the tmpdir
+			// the tmpdir. Kept for compatibility, the keys for CMPH are no longer written to disk
 			else if (strcmp(myoption, "tmpdir") == 0)
 			{
 				if (argv[narg + 1] == NULL)
@@ -1176,7 +1820,6 @@ int main(int argc, char** argv)
 				}
 				else
 				{
-					ptr_tmpdir = argv[narg + 1];
 					narg += 2;
 				}
 			}
@@ -1256,6 +1899,101 @@ int main(int argc, char** argv)
 					printlist();
 				}
 			}
+			// number of threads
+			else if (strcmp(myoption, "threads") == 0)
+			{
+				if (argv[narg + 1] == NULL || !isdigit(argv[narg + 1][0]) || atoi(argv[narg + 1]) <= 0)
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF 
+						<< ": --threads requires a positive integer as input (ex. --threads 8)." << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				if (threads_set)
+				{
+					std::cerr << std::endl << RED << "  ERROR"<< COLOFF 
+						<< ": --threads has been set twice, please verify your choice" << std::endl;
+					printlist();
+				}
+				num_threads = atoi(argv[narg + 1]);
+				threads_set = true;
+				narg += 2;
+			}
+			// minimal perfect hash algorithm
+			else if (strcmp(myoption, "mph") == 0)
+			{
+				if (argv[narg + 1] == NULL)
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF
+						<< ": --mph requires an algorithm name: chm, bdz or chd (ex. --mph bdz)." << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				if (mph_set)
+				{
+					std::cerr << std::endl << RED << "  ERROR"<< COLOFF 
+						<< ": --mph has been set twice, please verify your choice" << std::endl;
+					printlist();
+				}
+				if (strcmp(argv[narg + 1], "chm") == 0) mph_algo = CMPH_CHM;
+				else if (strcmp(argv[narg + 1], "bdz") == 0) mph_algo = CMPH_BDZ;
+				else if (strcmp(argv[narg + 1], "chd") == 0) mph_algo = CMPH_CHD;
+				else
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF
+						<< ": unknown --mph algorithm " << argv[narg + 1] << ". Use one of: chm, bdz, chd" << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				mph_set = true;
+				narg += 2;
+			}
+			// index only the sequences appended to the reference files since the indexes were built
+			else if (strcmp(myoption, "append") == 0)
+			{
+				if (append)
+				{
+					std::cerr << std::endl << RED << "  ERROR"<< COLOFF 
+						<< ": --append has been set twice, please verify your choice" << std::endl;
+					printlist();
+				}
+				append = true;
+				narg++;
+			}
+			// compact index
+			else if (strcmp(myoption, "compact") == 0)
+			{
+				if (compact)
+				{
+					std::cerr << std::endl << RED << "  ERROR"<< COLOFF 
+						<< ": --compact has been set twice, please verify your choice" << std::endl;
+					printlist();
+				}
+				compact = true;
+				narg++;
+			}
+			// size the index parts by their search memory
+			else if (strcmp(myoption, "auto-parts") == 0)
+			{
+				if (argv[narg + 1] == NULL)
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF
+						<< ": --auto-parts requires the memory (in Mbytes) for searching an index part (ex. --auto-parts 4096)." << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				if (auto_parts_mem > 0)
+				{
+					std::cerr << std::endl << RED << "  ERROR"<< COLOFF 
+						<< ": --auto-parts has been set twice, please verify your choice" << std::endl;
+					printlist();
+				}
+				char *pEnd = NULL;
+				auto_parts_mem = strtod(argv[narg + 1], &pEnd);
+				if (auto_parts_mem <= 0)
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF
+						<< ": --auto-parts [INT] must be a positive value (in Mbyte)." << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				narg += 2;
+			}
 			else
 			{
 				std::cerr << std::endl << RED << "  ERROR"<< COLOFF <<": unknown option --" << myoption << std::endl;
@@ -1376,144 +2114,34 @@ int main(int argc, char** argv)
 	// default memory for building index (3072 Mbytes)
 	if (!mem_is_set) mem = 3072;
 
-	mask32 = (1 << lnwin_gv) - 1;
-	mask64 = (2ULL << ((pread_gv * 2) - 1)) - 1;
-
-	// temporary file to store keys for building the CMPH
-	int32_t pid = getpid();
-	char pidStr[4000];
-	sprintf(pidStr, "%d", pid);
-	char keys_str[4000] = "";
-	char* tmpdir_env = NULL;
+	// estimated memory (Mbytes) of the index per L-mer. The compact index packs the positions
+	// (8 bytes each otherwise) and the bucket entries, the trie nodes are unchanged
+	double lmer_mem = compact ? 6.5e-6 : 9.5e-6;
 
-	// tmpdir provided
-	if (ptr_tmpdir != NULL)
+	// '--auto-parts': the fixed memory of a part, the look-up table and the offsets of the tries, is taken
+	// off the search memory. The rest is shared by the sequences of the part (see 'add_seq_mem')
+	bool auto_parts = auto_parts_mem > 0;
+	if (auto_parts)
 	{
-		char tmp_str[4000] = "";
-		strcat(tmp_str, ptr_tmpdir);
-		char* ptr_tmpdir_t = ptr_tmpdir;
-		while (*ptr_tmpdir_t++ != '\0');
-		if (*(ptr_tmpdir_t - 2) != '/') strcat(tmp_str, "/");
-
-		// test_pid.txt
-		char tmp_str_test[4100] = "";
-		strcat(tmp_str_test, tmp_str);
-		strcat(tmp_str_test, "test_");
-		strcat(tmp_str_test, pidStr);
-		strcat(tmp_str_test, ".txt");
-
-		FILE *tmp = fopen(tmp_str_test, "w+");
-		if (tmp == NULL)
+		if (mem_is_set)
 		{
-			std::cerr << std::endl << RED << "  ERROR" << COLOFF 
-				<< ": cannot access directory " << ptr_tmpdir << ": " << strerror(errno) << std::endl;
+			std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": -m and --auto-parts cannot be set together." << std::endl;
 			exit(EXIT_FAILURE);
 		}
-		else
-		{
-			// remove temporary test file
-			if (remove(tmp_str_test) != 0)
-				std::cerr << YELLOW << "WARNING" << COLOFF << ": could not delete temporary file " << tmp_str_test << std::endl;
-
-			// set the working directory
-			memcpy(keys_str, tmp_str, 4000);
-		}
-	}
-	// tmpdir not provided, try $TMPDIR, /tmp and local directories
-	else
-	{
-		bool try_further = true;
-
-		// try TMPDIR
-		tmpdir_env = getenv(ENV_TMPDIR.data());
-		if ( tmpdir_env != NULL && strcmp(tmpdir_env, "") != 0 )
-		{
-			std::string tmp_dir(tmpdir_env);
-			if (tmp_dir[tmp_dir.size() - 1] != PATH_SEPARATOR)
-				tmp_dir += PATH_SEPARATOR;
-
-			std::string tmp_file = tmp_dir + "test" + pidStr + ".txt";
-
-			FILE *tmp = fopen(tmp_file.data(), "w+");
-			if (tmp == NULL)
-			{
-				std::cerr << std::endl << YELLOW << "  WARNING"<< COLOFF 
-					<< ": no write permissions in directory "<< tmpdir_env << ": "<< strerror(errno) << std::endl
-					<< "  will try /tmp/." << std::endl;
-			}
-			else
-			{
-				// remove the temporary test file
-				fclose(tmp);
-				if (remove(tmp_file.data()) != 0)
-					std::cerr << YELLOW << "  WARNING" << COLOFF << ": could not delete temporary file " << tmp_file.data() << std::endl;
-
-				// set working directory
-				memcpy(keys_str, tmp_dir.data(), 4000);
-
-				try_further = false;
-			}
-		}
-		// try "/tmp" directory
-		if (try_further)
-		{
-			char tmp_str[4000] = "";
-			strcat(tmp_str, "/tmp/test_");
-			strcat(tmp_str, pidStr);
-			strcat(tmp_str, ".txt");
-
-			FILE *tmp = fopen(tmp_str, "w+");
-			if (tmp == NULL)
-			{
-				std::cerr << std::endl << YELLOW << "  WARNING" << COLOFF 
-					<< ": no write permissions in directory /tmp/: " << strerror(errno) << std::endl
-					<< "  will try local directory." << std::endl;
-			}
-			else
-			{
-				// remove the temporary test file
-				if (remove(tmp_str) != 0)
-					std::cerr << YELLOW << "  WARNING" << COLOFF << ": could not delete temporary file " << tmp_str << std::endl;
-
-				// set working directory
-				strcat(keys_str, "/tmp/");
-
-				try_further = false;
-			}
-		}
-		// try the local directory
-		if (try_further)
+		uint64_t limit = 1ULL << lnwin_gv;
+		double part_fixed_mem = (limit * sizeof(kmer_flat) + sizeof(flat_trie_header) + sizeof(bucket_layout)
+			+ 2 * sizeof(uint64_t) * limit) / 1048576.0;
+		if (auto_parts_mem <= part_fixed_mem)
 		{
-			char tmp_str[4000] = "";
-			strcat(tmp_str, "./test_");
-			strcat(tmp_str, pidStr);
-			strcat(tmp_str, ".txt");
-
-			FILE *tmp = fopen(tmp_str, "w+");
-			if (tmp == NULL)
-			{
-				std::cerr << std::endl << RED << "  ERROR" << COLOFF 
-					<< ": no write permissions in current directory: "<< strerror(errno) << std::endl
-					<< "  Please set --tmpdir to a writable directory,"
-					<< " or change the write permissions in $TMPDIR, e.g. /tmp/ (Linux), or current directory." << std::endl;
-				exit(EXIT_FAILURE);
-			}
-			else
-			{
-				// remove the temporary test file
-				if (remove(tmp_str) != 0)
-					std::cerr << YELLOW << "  WARNING" << COLOFF << ": could not delete temporary file " << tmp_str << std::endl;
-
-				// set working directory
-				strcat(keys_str, "./");
-				try_further = false;
-			}
+			std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": --auto-parts must be more than "
+				<< part_fixed_mem << " Mbytes, the memory of an empty index part." << std::endl;
+			exit(EXIT_FAILURE);
 		}
+		mem = auto_parts_mem - part_fixed_mem;
 	}
 
-	strcat(keys_str, "sortmerna_keys_");
-	strcat(keys_str, pidStr);
-	strcat(keys_str, ".txt");
+	mask32 = (1 << lnwin_gv) - 1;
+	mask64 = (2ULL << ((pread_gv * 2) - 1)) - 1;
 
 	// the list of arguments is correct, welcome the user!
 	if (verbose) welcome();
@@ -1526,6 +2154,11 @@ int main(int argc, char** argv)
 		eprintf("    Maximum positions to store per unique K-mer: all\n");
 	else
 		eprintf("    Maximum positions to store per unique K-mer: %d\n", max_pos);
+	eprintf("    Number of threads: %d\n", num_threads);
+	eprintf("    Minimal perfect hash: %s\n", cmph_names[mph_algo]);
+	eprintf("    Compact index: %s\n", compact ? "yes" : "no");
+	if (auto_parts)
+		eprintf("    Search memory per index part: %.2f Mbytes\n", auto_parts_mem);
 
 	eprintf("\n  Total number of databases to index: %d\n", (int)myfiles.size());
 
@@ -1536,24 +2169,61 @@ int main(int argc, char** argv)
 		// vector of structs storing information on which sequences from 
 		// the original FASTA file were added to each index part
 		std::vector<index_parts_stats> index_parts_stats_vec;
-
-		// Process reference input file
-		FILE *fp = fopen((char*)(myfiles[newindex].first).c_str(), "r");
+		// predicted search memory of each index part
+		std::vector<part_mem_stats> index_part_mem_vec;
+		// CRC-32 of the reference file section of each index part
+		std::vector<uint32_t> index_part_crc_vec;
+		// the catalog of the indexed reference sequences
+		std::vector<ref_catalog_rec> catalog_recs;
+		std::string catalog_ids;
+		bool have_catalog = true; // false if the index appended to has none
+
+		// Process reference input file. Plain or gzipped FASTA, zlib reads both
+		gzFile fp = gzopen((char*)(myfiles[newindex].first).c_str(), "rb");
 		if (fp == NULL)
 		{
 			std::cerr << RED << "  ERROR" << COLOFF << ": could not open file " << myfiles[newindex].first << std::endl;
 			exit(EXIT_FAILURE);
 		}
+		gzbuffer(fp, 1 << 20);
+
+		// '--append': the index built from the sequences at the start of the reference file
+		index_stats prev_stats;
+		if (append)
+		{
+			if (!load_stats(myfiles[newindex].second + ".stats", prev_stats))
+			{
+				std::cerr << std::endl << RED << "  ERROR" << COLOFF
+					<< ": --append requires an existing index, but '" << myfiles[newindex].second + ".stats"
+					<< "' does not exist or cannot be read. Build the index without --append" << std::endl;
+				exit(EXIT_FAILURE);
+			}
+			// the new parts use the seed length of the index
+			if (prev_stats.lnwin != lnwin_gv)
+			{
+				if (lnwin_set)
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": -L " << lnwin_gv
+						<< " differs from the seed length " << prev_stats.lnwin << " of the index " << myfiles[newindex].second << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				lnwin_gv = prev_stats.lnwin;
+				pread_gv = lnwin_gv + 1;
+				partialwin_gv = lnwin_gv / 2;
+				mask32 = (1 << lnwin_gv) - 1;
+				mask64 = (2ULL << ((pread_gv * 2) - 1)) - 1;
+			}
+		}
 
 		eprintf("\n  Begin indexing file %s%s%s under index name %s%s%s: \n",
 			BLUE, (char*)(myfiles[newindex].first).c_str(),
 			COLOFF, BLUE, (char*)(myfiles[newindex].second).c_str(),
 			COLOFF);
 
-		// get full file size
-		fseek(fp, 0L, SEEK_END);
-		size_t filesize = ftell(fp);
-		fseek(fp, 0L, SEEK_SET);
+		// get full file size (as stored on disk i.e. compressed if gzipped)
+		struct stat file_stat;
+		stat(myfiles[newindex].first.c_str(), &file_stat);
+		size_t filesize = file_stat.st_size;
 
 		// STEP 1 ************************************************************
 		// For file part_0, (a) compute the nucleotide background frequencies;
@@ -1572,12 +2242,29 @@ int main(int argc, char** argv)
 		uint64_t full_len = 0;
 		int nt = 0;
 
+		// '--append': where the appended sequences start, the first sequence of the last index part
+		long int append_start = -1;
+		uint64_t last_part_seq = 0;
+		bool have_last_part = false;
+		bool is_modified = false; // the sequences the index was built from have changed
+
 		eprintf("  Collecting sequence distribution statistics ..");
 
 		TIME(s);
 		do
 		{
-			nt = fgetc(fp);
+			if (append)
+			{
+				long int start_seq = gztell(fp);
+				if (strs / 2 == prev_stats.numseq)
+					append_start = start_seq;
+				if (strs / 2 < prev_stats.numseq && start_seq == (long int)prev_stats.parts.back().start_part)
+				{
+					last_part_seq = strs / 2;
+					have_last_part = true;
+				}
+			}
+			nt = gzgetc(fp);
 
 			// name of sequence for SAM format @SQ
 			char read_header[2000];
@@ -1597,7 +2284,7 @@ int main(int argc, char** argv)
 			bool stop = false;
 			while (nt != '\n')
 			{
-				nt = fgetc(fp);
+				nt = gzgetc(fp);
 				if (nt != '\n' && nt != ' ' && nt != '\t' && !stop)
 					*pt_h++ = nt;
 				else stop = true;
@@ -1607,7 +2294,7 @@ int main(int argc, char** argv)
 			len = 0;
 
 			// scan through the sequence, count its length
-			nt = fgetc(fp);
+			nt = gzgetc(fp);
 			while (nt != '>' && nt != EOF)
 			{
 				// skip line feed, carriage return or empty space in the sequence
@@ -1616,12 +2303,14 @@ int main(int argc, char** argv)
 					len++;
 					if (nt != 'N') background_freq[(int)map_nt[nt]]++;
 				}
-				nt = fgetc(fp);
+				nt = gzgetc(fp);
 			}
 			// add sequence name and length to sam_header_
 			std::string s(read_header);
 			sam_sq_header.push_back(std::pair<std::string, uint32_t>(s, len));
-			if (nt != EOF) ungetc(nt, fp);
+			if (append && sam_sq_header.size() <= prev_stats.numseq && sam_sq_header.back() != prev_stats.sam_sq[sam_sq_header.size() - 1])
+				is_modified = true;
+			if (nt != EOF) gzungetc(nt, fp);
 			full_len += len;
 			if (len < pread_gv)
 			{
@@ -1638,10 +2327,40 @@ int main(int argc, char** argv)
 		TIME(f);
 
 		// set file pointer back to the beginning of file
-		rewind(fp);
+		gzrewind(fp);
 
 		eprintf("  done  [%f sec]\n", (f - s));
 
+		if (append)
+		{
+			// the kept parts are of the sections of the reference file they were built from, byte for byte
+			std::vector<uint32_t> crcs;
+			if (!is_modified && have_last_part && strs / 2 >= prev_stats.numseq)
+			{
+				if (prev_stats.part_crc.size() != prev_stats.parts.size())
+				{
+					std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": the index " << myfiles[newindex].second
+						<< " has no checksums of its parts to validate them against " << myfiles[newindex].first
+						<< ". Build the index without --append" << std::endl;
+					exit(EXIT_FAILURE);
+				}
+				is_modified = !part_crcs(fp, prev_stats.parts, 0, crcs) || crcs != prev_stats.part_crc;
+				gzrewind(fp);
+			}
+			if (is_modified || !have_last_part || strs / 2 < prev_stats.numseq)
+			{
+				std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": the sequences the index " << myfiles[newindex].second
+					<< " was built from have changed in " << myfiles[newindex].first << ". --append only indexes the sequences"
+					<< " added at the end of the file. Build the index without --append" << std::endl;
+				exit(EXIT_FAILURE);
+			}
+			if (append_start < 0)
+			{
+				eprintf("  No sequences were appended to %s, the index is up to date.\n", myfiles[newindex].first.c_str());
+				gzclose(fp);
+				continue;
+			}
+		}
 
 		/* STEP 1 END ***************************************************************************/
 
@@ -1649,11 +2368,11 @@ int main(int argc, char** argv)
 		/* For every part of total index,
 			 (a) build the burst trie and set all 19-mer ids to 0
 			 (b) count the number of unique 19-mers in the database
-			 (c) output the unique 19-mers into a file for MPHF */
+			 (c) collect the unique 19-mers for MPHF */
 
 			 // number of the index part
 		uint16_t part = 0;
-		// starting position given by ftell() where to
+		// starting position given by gztell() where to
 		// begin reading the reference sequences
 		unsigned long int start_part = 0;
 		// number of bytes of reference sequences to read
@@ -1661,24 +2380,128 @@ int main(int argc, char** argv)
 		// total size of index so far in bytes
 		double index_size = 0;
 
+		// sequence read past the end of the previous index part. It starts the
+		// current part, so the file is never read backwards
+		bool have_carry = false;
+		std::string carry_header;
+		std::vector<unsigned char> carry_seq;
+		std::string carry_refseq;
+		long int carry_start = 0;
+		long int carry_end = 0;
+		int carry_nt = 0;
+
+		// '--append': keep the index parts built so far and index the appended sequences from where they start.
+		// While the last part has memory left, the appended sequences go into it, i.e. the last part is rebuilt
+		if (append)
+		{
+			// memory of the last part, estimated as when it was built
+			double last_part_size = 0;
+			for (uint64_t j = last_part_seq; j < prev_stats.numseq; j++)
+			{
+				double estimated_seq_mem = (prev_stats.sam_sq[j].second - pread_gv + 1)*lmer_mem;
+				if (estimated_seq_mem <= mem) last_part_size += estimated_seq_mem;
+			}
+			double estimated_seq_mem = (sam_sq_header[prev_stats.numseq].second - pread_gv + 1)*lmer_mem;
+
+			// '--auto-parts': the memory of a part is predicted from all its sequences, the last part is always rebuilt
+			size_t num_kept = prev_stats.parts.size();
+			long int append_at = append_start;
+			if (auto_parts || last_part_size + estimated_seq_mem <= mem)
+			{
+				--num_kept;
+				append_at = prev_stats.parts.back().start_part;
+			}
+			index_parts_stats_vec.assign(prev_stats.parts.begin(), prev_stats.parts.begin() + num_kept);
+			if (prev_stats.part_mem.size() == prev_stats.parts.size())
+				index_part_mem_vec.assign(prev_stats.part_mem.begin(), prev_stats.part_mem.begin() + num_kept);
+			index_part_crc_vec.assign(prev_stats.part_crc.begin(), prev_stats.part_crc.begin() + num_kept);
+			part = (uint16_t)num_kept;
+			gzseek(fp, append_at, SEEK_SET);
+
+			// the catalog records of the kept parts
+			have_catalog = load_ref_catalog(myfiles[newindex].second + ".refcat", prev_stats, catalog_recs, catalog_ids);
+			if (have_catalog)
+			{
+				size_t num_kept_recs = 0;
+				while (num_kept_recs < catalog_recs.size() && catalog_recs[num_kept_recs].part < num_kept) ++num_kept_recs;
+				catalog_recs.resize(num_kept_recs);
+				catalog_ids.resize(num_kept_recs > 0 ? catalog_recs.back().id_pos + catalog_recs.back().id_len : 0);
+			}
+			else
+			{
+				std::cerr << std::endl << YELLOW << "  WARNING" << COLOFF << ": the index " << myfiles[newindex].second
+					<< " has no reference catalog (.refcat), sortmerna will take the ids from the reference file."
+					<< " Build the index without --append to create it" << std::endl;
+			}
+
+			// the reference sequences of the kept parts are now of the appended reference file
+			for (size_t j = 0; j < num_kept; j++)
+			{
+				std::fstream ref_store((myfiles[newindex].second + ".ref_" + std::to_string(j) + ".dat").c_str(),
+					std::ios::in | std::ios::out | std::ios::binary);
+				ref_store_header ref_header;
+				if (ref_store.read(reinterpret_cast<char*>(&ref_header), sizeof(ref_header))
+					&& memcmp(ref_header.magic, REF_STORE_MAGIC, sizeof(ref_header.magic)) == 0)
+				{
+					ref_header.src_size = filesize;
+					ref_store.seekp(0);
+					ref_store.write(reinterpret_cast<const char*>(&ref_header), sizeof(ref_header));
+				}
+			}
+
+			eprintf("  Appending %llu sequences to the index of %llu sequences, %s\n",
+				(unsigned long long)(strs / 2 - prev_stats.numseq), (unsigned long long)prev_stats.numseq,
+				num_kept < prev_stats.parts.size() ? "rebuilding its last part" : "keeping all its parts");
+		}
+
+		// '--auto-parts': the unique (L+1)-mers of the index part, which predict the size of its tries and positions table
+		std::unordered_set<uint64_t> part_keys;
+		std::vector<uint64_t> seq_keys; // the unique (L+1)-mers added by the last sequence
+		std::vector<bool> part_tries(2 << lnwin_gv); // the non-empty forward and reverse tries of the index part
+		std::vector<uint32_t> seq_tries; // the tries started by the last sequence
+		std::vector<unsigned char> seq_r;
+		double key_mem = TRIE_BYTES_PER_KEY + (compact ? 4 : sizeof(uint64_t));
+		double position_mem = compact ? (bits_for(maxlen) + bits_for(strs / 2)) / 8.0 : sizeof(seq_pos);
+
+		// increase of the search memory (Mbytes) of the part by adding the sequence with the id 'id_len' long
+		auto add_seq_mem = [&](std::vector<unsigned char>& seq, size_t id_len) -> double
+		{
+			uint64_t num_positions = 0;
+			seq_keys.clear();
+			seq_tries.clear();
+			for_each_window(seq, seq_r, interval, [&](uint32_t j, uint32_t index_pos,
+				uint32_t kmer_key_short_f, uint32_t kmer_key_short_r, unsigned long long int kmer_key,
+				unsigned char* kmer_key_short_f_p, unsigned char* kmer_key_short_r_rp)
+			{
+				num_positions++;
+				if (part_keys.insert(kmer_key >> 2).second)
+					seq_keys.push_back(kmer_key >> 2);
+				for (uint32_t trie : { kmer_key_short_f, (1U << lnwin_gv) + kmer_key_short_r })
+				{
+					if (!part_tries[trie])
+					{
+						part_tries[trie] = true;
+						seq_tries.push_back(trie);
+					}
+				}
+			});
+			return (seq_keys.size() * key_mem + seq_tries.size() * TRIE_BYTES_PER_TRIE + num_positions * position_mem + ref_record_mem(seq.size(), id_len)) / 1048576.0;
+		};
+
 		// for each index part of the reference sequences
 		do
 		{
 			// number of sequences in part size
 			uint32_t numseq_part = 0;
+			// memory of the reference sequences of the part while searched
+			uint64_t part_refs_mem = 0;
 
-			// set the file pointer to the beginning of the current part
-			start_part = ftell(fp);
+			// the beginning of the current part
+			start_part = have_carry ? carry_start : gztell(fp);
 
-			// output file storing all s-mer (19-mer) words in the reference
-			// sequences, required for CMPH to build minimal perfect
-			// hash functions
-			FILE *keys = fopen(keys_str, "w+");
-			if (keys == NULL)
-			{
-				std::cerr << RED << "  ERROR" << COLOFF << ": could not open " << keys_str << " file for writing" << std::endl;
-				exit(EXIT_FAILURE);
-			}
+			// all unique 18-mers in the reference sequences,
+			// required for CMPH to build minimal perfect hash functions
+			std::vector<uint64_t> keys;
 
 			// count of unique 19-mers in database
 			uint32_t number_elements = 0;
@@ -1694,11 +2517,16 @@ int main(int argc, char** argv)
 
 			memset(lookup_table, 0, (1 << lnwin_gv) * sizeof(kmer));
 
-			// bool vector to keep track which L/2-mers have been counted for by the forward sliding L/2-mer
-			std::vector<bool> incremented_by_forward((1 << lnwin_gv));
+			// encoded reference sequences of the index part
+			std::vector<std::vector<unsigned char>> part_seqs;
+			// the reference sequences and their headers as loaded by sortmerna (see 'write_ref_store')
+			std::vector<std::string> part_refseqs;
+			std::vector<std::string> part_headers;
 
 			// total size of index so far in bytes
 			index_size = 0;
+			part_keys.clear();
+			std::fill(part_tries.begin(), part_tries.end(), false);
 
 			eprintf("\n  start index part # %d: \n", part);
 			eprintf("    (1/3) building burst tries ..");
@@ -1716,199 +2544,132 @@ int main(int argc, char** argv)
 			// or suffix of a 19-mer in the mini-burst trie, we need to recover all of the 18-mer occurrences in the database
 			do
 			{
-				// start of current sequence in file
-				long int start_seq = ftell(fp);
-				nt = fgetc(fp);
+				// start and end of current sequence in file
+				long int start_seq = 0;
+				long int end_seq = 0;
+				std::string header;
+				std::vector<unsigned char> myseq;
+				std::string refseq;
+
+				if (have_carry)
+				{
+					start_seq = carry_start;
+					end_seq = carry_end;
+					header.swap(carry_header);
+					myseq.swap(carry_seq);
+					refseq.swap(carry_refseq);
+					nt = carry_nt;
+					have_carry = false;
+				}
+				else
+				{
+					start_seq = gztell(fp);
+					nt = gzgetc(fp); // '>'
 
-				// scan to end of header name
-				while (nt != '\n') nt = fgetc(fp);
+					// read the header name
+					nt = gzgetc(fp);
+					while (nt != '\n' && nt != EOF)
+					{
+						header.push_back((char)nt);
+						nt = gzgetc(fp);
+					}
 
-				unsigned char* myseq = new unsigned char[maxlen];
-				unsigned char* myseqr = new unsigned char[maxlen];
-				uint32_t _j = 0;
-				len = 0;
+					myseq.reserve(maxlen);
+					refseq.reserve(maxlen);
+					std::string line;
 
-				nt = fgetc(fp);
-				// encode each sequence using integer alphabet {0,1,2,3}
-				while (nt != '>' && nt != EOF)
-				{
-					// skip line feed, carriage return or empty space in the sequence
-					if (nt != '\n' && nt != ' ')
+					nt = gzgetc(fp);
+					// encode each sequence using integer alphabet {0,1,2,3}
+					while (nt != '>' && nt != EOF)
 					{
-						len++;
-						// exact character
-						myseq[_j++] = map_nt[nt];
+						// skip line feed, carriage return or empty space in the sequence
+						if (nt != '\n' && nt != ' ')
+						{
+							// exact character
+							myseq.push_back(map_nt[nt]);
+						}
+						if (nt == '\n')
+							add_ref_line(refseq, line);
+						else
+							line.push_back((char)nt);
+						nt = gzgetc(fp);
 					}
-					nt = fgetc(fp);
-				}
+					add_ref_line(refseq, line);
 
-				// end of current sequence in file
-				if (nt != EOF) ungetc(nt, fp);
+					// end of current sequence in file
+					if (nt != EOF) gzungetc(nt, fp);
 
-				long int end_seq = ftell(fp);
+					end_seq = gztell(fp);
+				}
+				len = (uint32_t)myseq.size();
 
 				// check the addition of this sequence will not overflow the
-				// maximum memory (estimated memory 10 bytes per L-mer)
-				double estimated_seq_mem = (len - pread_gv + 1)*9.5e-6;
+				// maximum memory (estimated memory 10 bytes per L-mer,
+				// or predicted search memory with '--auto-parts')
+				size_t id_len = std::min(header.find_first_of(" \t"), header.size());
+				double estimated_seq_mem = auto_parts ? add_seq_mem(myseq, id_len) : (len - pread_gv + 1)*lmer_mem;
+				bool is_added = estimated_seq_mem <= mem && index_size + estimated_seq_mem <= mem;
+				if (auto_parts && !is_added)
+				{
+					for (auto key : seq_keys)
+						part_keys.erase(key);
+					for (auto trie : seq_tries)
+						part_tries[trie] = false;
+				}
 
 				// the sequence alone is too large, it will not fit into maximum
 				// memory, skip it
-				if (estimated_seq_mem > mem)
+				if (estimated_seq_mem > mem && (index_size == 0 || !auto_parts))
 				{
-					fseek(fp, start_seq, SEEK_SET);
-					std::cerr << std::endl << YELLOW << "  WARNING" << COLOFF << ": the index for sequence `";
-					int c = 0;
-					do
-					{
-						c = fgetc(fp);
-						std::cerr << c;
-					} while (c != '\n');
-
-					std::cerr << "` will not fit into " << mem << " Mbytes memory, it will be skipped.";
-					std::cerr << "  If memory can be increased, please try `-m " << estimated_seq_mem << "` Mbytes.";
-					fseek(fp, end_seq, SEEK_SET);
+					std::cerr << std::endl << YELLOW << "  WARNING" << COLOFF << ": the index for sequence `" << header
+						<< "` will not fit into " << mem << " Mbytes memory, it will be skipped.";
+					if (auto_parts)
+						std::cerr << "  If memory can be increased, please try `--auto-parts " << auto_parts_mem - mem + estimated_seq_mem << "` Mbytes.";
+					else
+						std::cerr << "  If memory can be increased, please try `-m " << estimated_seq_mem << "` Mbytes.";
 					continue;
 				}
 				// the additional sequence will overflow the maximum index memory,
 				// write existing index to disk and start a new index
-				else if (index_size + estimated_seq_mem > mem)
+				else if (!is_added)
 				{
+					// keep the sequence for the next index part
+					have_carry = true;
+					carry_start = start_seq;
+					carry_end = end_seq;
+					carry_header.swap(header);
+					carry_seq.swap(myseq);
+					carry_refseq.swap(refseq);
+					carry_nt = nt;
+
 					// set the character to something other than EOF
 					if (nt == EOF) nt = 'A';
 
-					// reset the file pointer to the beginning of current sequence
-					// (which will be added to the next index part)
-					fseek(fp, start_seq, SEEK_SET);
-
 					break;
 				}
 				// add the additional sequence to the index
 				else
 				{
 					index_size += estimated_seq_mem;
+					part_refs_mem += ref_record_mem(len, id_len);
 
 					// record the number of bytes of raw reference sequences added to this part
-					seq_part_size = ftell(fp) - start_part;
+					seq_part_size = end_seq - start_part;
 					// record the number of sequences in this part
 					numseq_part++;
 				}
 
-				// create a reverse sequence using the forward
-				unsigned char* ptr = &myseq[len - 1];
-
-				for (_j = 0; _j < len; _j++) myseqr[_j] = *ptr--;
-				// 9-mer prefix of 19-mer
-				uint32_t kmer_key_short_f = 0;
-				// 9-mer suffix of 19-mer
-				uint32_t kmer_key_short_r = 0;
-				// pointer to next letter to add to 9-mer prefix
-				unsigned char* kmer_key_short_f_p = &myseq[0];
-				// pointer to next letter to add to 9-mer suffix
-				unsigned char* kmer_key_short_r_p = &myseq[partialwin_gv + 1];
-				// pointer to 10-mer of reverse 19-mer to insert
-				// into the mini-burst trie
-				unsigned char* kmer_key_short_r_rp = &myseqr[len - partialwin_gv - 1];
-				// 19-mer
-				unsigned long long int kmer_key = 0;
-				// pointer to 19-mer
-				unsigned char* kmer_key_ptr = &myseq[0];
-
-				// initialize the prefix and suffix 9-mers
-				for (uint32_t j = 0; j < partialwin_gv; j++)
-				{
-					(kmer_key_short_f <<= 2) |= (int)*kmer_key_short_f_p++;
-					(kmer_key_short_r <<= 2) |= (int)*kmer_key_short_r_p++;
-				}
-
-				// initialize the 19-mer
-				for (uint32_t j = 0; j < pread_gv; j++) (kmer_key <<= 2) |= (int)*kmer_key_ptr++;
-
-				uint32_t numwin = (len - pread_gv + interval) / interval; //TESTING
-				uint32_t index_pos = 0;
-
-				// for all 19-mers on the sequence
-				for (uint32_t j = 0; j < numwin; j++) //TESTING
-				{
-					lookup_table[kmer_key_short_f].count++;
-					incremented_by_forward[kmer_key_short_f] = true;
-					// increment 9-mer count only if it wasn't already
-					// incremented by kmer_key_short_f before
-					if (!incremented_by_forward[kmer_key_short_r]) lookup_table[kmer_key_short_r].count++;
-
-					// ****** add the forward 19-mer
-
-					// new position for 18-mer in positions_tbl
-					bool new_position = true;
-
-					// forward 19-mer does not exist in the burst trie (duplicates not allowed)
-					if (lookup_table[kmer_key_short_f].trie_F == NULL ||
-						((lookup_table[kmer_key_short_f].trie_F != NULL) && !search_burst_trie(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p, new_position)))
-					{
-						// create a trie node if it doesn't exist
-						if (lookup_table[kmer_key_short_f].trie_F == NULL)
-						{
-							lookup_table[kmer_key_short_f].trie_F = (NodeElement*)malloc(4 * sizeof(NodeElement));
-							if (lookup_table[kmer_key_short_f].trie_F == NULL)
-							{
-								std::cerr << RED << "  ERROR" << COLOFF << ": could not allocate memory for trie_node in indexdb.cpp" << std::endl;
-								exit(EXIT_FAILURE);
-							}
-							memset(lookup_table[kmer_key_short_f].trie_F, 0, 4 * sizeof(NodeElement));
-						}
-
-						insert_prefix(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p);
-					}
-
-					// 18-mer doesn't exist in the burst trie, add it to keys file
-					if (new_position)
-					{
-						// increment number of unique 18-mers
-						number_elements++;
-						fprintf(keys, "%llu\n", (kmer_key >> 2));
-					}
-
-					// ****** add the reverse 19-mer
-					new_position = true;
-
-					// reverse 19-mer does not exist in the burst trie
-					if (lookup_table[kmer_key_short_r].trie_R == NULL ||
-						((lookup_table[kmer_key_short_r].trie_R != NULL) && !search_burst_trie(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp, new_position)))
-					{
-						// create a trie node if it doesn't exist
-						if (lookup_table[kmer_key_short_r].trie_R == NULL)
-						{
-							lookup_table[kmer_key_short_r].trie_R = (NodeElement*)malloc(4 * sizeof(NodeElement));
-							if (lookup_table[kmer_key_short_r].trie_R == NULL)
-							{
-								std::cerr << RED << "  ERROR" << COLOFF << ": could not allocate memory for trie_node in indexdb.cpp" << std::endl;
-								exit(EXIT_FAILURE);
-							}
-							memset(lookup_table[kmer_key_short_r].trie_R, 0, 4 * sizeof(NodeElement));
-						}
-
-						insert_prefix(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp);
-					}
-
-					// shift 19-mer window and both 9-mers
-					if (j != numwin - 1)
-					{
-						for (uint32_t shift = 0; shift < interval; shift++)
-						{
-							((kmer_key_short_f <<= 2) &= mask32) |= (int)*kmer_key_short_f_p++;
-							((kmer_key_short_r <<= 2) &= mask32) |= (int)*kmer_key_short_r_p++;
-							((kmer_key <<= 2) &= mask64) |= (int)*kmer_key_ptr++;
-							kmer_key_short_r_rp--;
-							index_pos++;
-						}
-					}
-
-				}//~for all 19-mers on the sequence
-
-				delete[] myseq;
-				delete[] myseqr;
-
+				part_seqs.push_back(std::move(myseq));
+				part_refseqs.push_back(std::move(refseq));
+				header.erase(std::find_if(header.rbegin(), header.rend(), [](char ch) { return !isspace((unsigned char)ch); }).base(), header.end());
+				part_headers.push_back('>' + header);
+				add_catalog_rec(catalog_recs, catalog_ids, part_headers.back(), start_seq, (uint32_t)part_refseqs.back().size(), part, numseq_part - 1);
 			} while (nt != EOF); // all file
 
+			// insert the 19-mers into the burst tries
+			build_burst_tries(part_seqs, lookup_table, interval, num_threads, keys);
+			number_elements = (uint32_t)keys.size();
+
 			TIME(f);
 
 			// no index can be created, all reference sequences are too large to fit alone into maximum memory
@@ -1919,10 +2680,6 @@ int main(int argc, char** argv)
 					RED, COLOFF, mem);
 				break;
 			}
-			// continue to build hash and positions tables
-			else index_size = 0;
-
-			rewind(keys);
 
 			eprintf(" done  [%f sec]\n", (f - s));
 
@@ -1931,33 +2688,33 @@ int main(int argc, char** argv)
 			TIME(s);
 			cmph_t *hash = NULL;
 
-			FILE * keys_fd = keys;
-			if (keys_fd == NULL)
-			{
-				std::cerr << "File '"<< keys_str << "' not found" << std::endl;
-				exit(EXIT_FAILURE);
-			}
-			cmph_io_adapter_t *source = cmph_io_nlfile_adapter(keys_fd);
+			// the keys are the 18-mers in binary, read directly from the vector
+			cmph_io_adapter_t *source = cmph_io_struct_vector_adapter(keys.data(),
+				(cmph_uint32)sizeof(uint64_t), 0, (cmph_uint32)sizeof(uint64_t), (cmph_uint32)keys.size());
 
+			// CMPH draws its hash seeds from rand(). Seed it by the part, so that a part is built the same
+			// whether or not the parts before it were built by the same process (--append)
+			srand(part + 1);
 			cmph_config_t *config = cmph_config_new(source);
-			cmph_config_set_algo(config, CMPH_CHM);
+			cmph_config_set_algo(config, mph_algo);
 			hash = cmph_new(config);
 			cmph_config_destroy(config);
 
-			// Destroy file adapter
-			cmph_io_nlfile_adapter_destroy(source);
-			fclose(keys_fd);
+			// Destroy vector adapter
+			cmph_io_struct_vector_adapter_destroy(source);
+			std::vector<uint64_t>().swap(keys);
+
+			if (hash == NULL)
+			{
+				std::cerr << std::endl << RED << "  ERROR" << COLOFF << ": failed to build the " << cmph_names[mph_algo]
+					<< " minimal perfect hash on " << number_elements << " keys. Try another algorithm (--mph)." << std::endl;
+				exit(EXIT_FAILURE);
+			}
 
 			TIME(f);
 
 			eprintf(" done  [%f sec]\n", (f - s));
 
-			int ret = remove(keys_str);
-			if (ret != 0)
-			{
-				std::cerr << YELLOW << "  WARNING" << COLOFF << ": could not delete temporary file " << keys_str << std::endl;
-			}
-
 			// 5. add ids to burst trie
 			// 6. build the positions lookup table using MPHF
 
@@ -1976,141 +2733,16 @@ int main(int argc, char** argv)
 
 			memset(positions_tbl, 0, number_elements * sizeof(kmer_origin));
 
-			// sequence number
-			uint32_t i = 0;
-
-			// reset the file pointer to the beginning of the current part
-			fseek(fp, start_part, SEEK_SET);
-
+			// the encoded sequences of the part are reused from step (1/3)
 			TIME(s);
-			do
-			{
-				long int start_seq = ftell(fp);
-				nt = fgetc(fp);
-
-				//cout << ">"; //TESTING2
-
-				// scan to end of header name
-				while (nt != '\n')
-				{
-					nt = fgetc(fp);
-					// if ( nt != '\n' ) cout << (char)nt; //TESTING
-				}
-
-				unsigned char* myseq = new unsigned char[maxlen];
-				unsigned char* myseqr = new unsigned char[maxlen];
-				uint32_t _j = 0;
-				len = 0;
-
-				// encode each sequence using integer alphabet {0,1,2,3}
-				nt = fgetc(fp);
-				while (nt != '>' && nt != EOF)
-				{
-					// skip line feed, carriage return or empty space in the sequence
-					if (nt != '\n' && nt != ' ')
-					{
-						len++;
-						// exact character
-						myseq[_j++] = map_nt[nt];
-					}
-					nt = fgetc(fp);
-				}
-
-				// put back the >
-				if (nt != EOF) ungetc(nt, fp);
-
-				// check the addition of this sequence will not overflow the maximum memory
-				double estimated_seq_mem = (len - pread_gv + 1)*9.5e-6;
-
-				// the sequence alone is too large, it will not fit into maximum memory, skip it
-				if (estimated_seq_mem > mem) continue;
-				// the additional sequence will overflow the maximum index memory,
-				// write existing index to disk and start a new index
-				else if (index_size + estimated_seq_mem > mem)
-				{
-					// set the character to something other than EOF
-					if (nt == EOF) nt = 'A';
-
-					// scan back to start of sequence for next index part
-					fseek(fp, start_seq, SEEK_SET);
-					break;
-				}
-				// add the additional sequence to the index
-				else
-				{
-					index_size += estimated_seq_mem;
-				}
-
-				// create a reverse sequence using the forward
-				unsigned char* ptr = &myseq[len - 1];
-
-				for (_j = 0; _j < len; _j++) myseqr[_j] = *ptr--;
-
-				uint32_t kmer_key_short_f = 0;
-				uint32_t kmer_key_short_r = 0;
-				unsigned char* kmer_key_short_f_p = &myseq[0];
-				unsigned char* kmer_key_short_r_p = &myseq[partialwin_gv + 1];
-				unsigned char* kmer_key_short_r_rp = &myseqr[len - partialwin_gv - 1];
-				unsigned long long int kmer_key = 0;
-				unsigned char* kmer_key_ptr = &myseq[0];
-
-				// initialize the 9-mers
-				for (uint32_t j = 0; j < partialwin_gv; j++)
-				{
-					(kmer_key_short_f <<= 2) |= (int)*kmer_key_short_f_p++;
-					(kmer_key_short_r <<= 2) |= (int)*kmer_key_short_r_p++;
-				}
-
-				// initialize the 19-mer
-				for (uint32_t j = 0; j < pread_gv; j++) (kmer_key <<= 2) |= (int)*kmer_key_ptr++;
-
-				uint32_t numwin = (len - pread_gv + interval) / interval; //TESTING
-				uint32_t id = 0;
-
-				uint32_t index_pos = 0; //TESTING
-
-				// for all 19-mers on the sequence
-				for (uint32_t j = 0; j < numwin; j++) //TESTING
-				{
-					// character array to hold an unsigned long long integer for CMPH
-					char a[38] = { 0 };
-					sprintf(a, "%llu", (kmer_key >> 2));
-					const char *key = a;
-					id = cmph_search(hash, key, (cmph_uint32)strlen(key));
-
-					//cout << "\t" << id << "=" << (kmer_key>>2); //TESTING
-
-					add_id_to_burst_trie(lookup_table[kmer_key_short_f].trie_F, kmer_key_short_f_p, id);
-					add_id_to_burst_trie(lookup_table[kmer_key_short_r].trie_R, kmer_key_short_r_rp, id);
-
-					add_kmer_to_table(positions_tbl + id, i, index_pos, max_pos);
-
-					// shift the 19-mer and 9-mers
-					if (j != numwin - 1)
-					{
-						for (uint32_t shift = 0; shift < interval; shift++)
-						{
-							((kmer_key_short_f <<= 2) &= mask32) |= (int)*kmer_key_short_f_p++;
-							((kmer_key_short_r <<= 2) &= mask32) |= (int)*kmer_key_short_r_p++;
-							((kmer_key <<= 2) &= mask64) |= (int)*kmer_key_ptr++;
-							kmer_key_short_r_rp--;
-							index_pos++;
-						}
-					}
-				} 
-
-				delete[] myseq;
-				delete[] myseqr;
-
-				// next sequence
-				i++;
-
-			} while (nt != EOF); // for all file     
+			// set the ids in the burst tries and fill the positions table
+			build_positions(part_seqs, lookup_table, hash, positions_tbl, interval, max_pos, num_threads);
 
 			TIME(f);
 			eprintf(" done [%f sec]\n", (f - s));
 
-			eprintf("    total number of sequences in this part = %d\n", i);
+			eprintf("    total number of sequences in this part = %d\n", (int)part_seqs.size());
+			part_seqs.clear();
 
 			// Destroy hash
 			cmph_destroy(hash);
@@ -2300,7 +2932,6 @@ int main(int argc, char** argv)
 			std::stringstream prt_str;
 			prt_str << part;
 			std::string part_str = prt_str.str();
-			eprintf("      temporary file was here: %s\n", keys_str);
 			// 1. load the kmer 'count' variable /index/kmer.dat
 			std::ofstream oskmer((char*)(myfiles[newindex].second + ".kmer_" + part_str + ".dat").c_str(), std::ios::binary);
 			eprintf("      writing kmer data to %s\n", (myfiles[newindex].second + ".kmer_" + part_str + ".dat").c_str());
@@ -2317,26 +2948,105 @@ int main(int argc, char** argv)
 			}
 			oskmer.close();
 			// 2. mini-burst tries
+			// the bucket entries of the compact index are sized to the tails and the ids of this part
+			bucket_gv = bucket_layout();
+			if (compact)
+			{
+				bucket_gv.key_size = (2 * partialwin_gv + 7) / 8;
+				bucket_gv.id_size = (bits_for(number_elements > 0 ? number_elements - 1 : 0) + 7) / 8;
+				if (bucket_gv.key_size + bucket_gv.id_size < sizeof(uint32_t))
+					bucket_gv.id_size = sizeof(uint32_t) - bucket_gv.key_size;
+				bucket_gv.entry_size = bucket_gv.key_size + bucket_gv.id_size;
+			}
 			// load 9-mer look-up table and mini-burst tries to /index/bursttrief.dat
 			eprintf("      writing burst tries to %s\n",
 				(myfiles[newindex].second + ".bursttrie_" + part_str + ".dat").c_str());
 			load_index(lookup_table, (char*)(myfiles[newindex].second + ".bursttrie_" +
-				part_str + ".dat").c_str());
+				part_str + ".dat").c_str(), compact);
 			// 3. 19-mer position look up tables
 			std::ofstream ospos((char*)(myfiles[newindex].second + ".pos_" +
 				part_str + ".dat").c_str(), std::ios::binary);
 			eprintf("      writing position lookup table to %s\n",
 				(myfiles[newindex].second + ".pos_" + part_str + ".dat").c_str());
-			// number of unique 19-mers
-			ospos.write(reinterpret_cast<const char*>(&number_elements), sizeof(uint32_t));
-			// the positions
+			// offsets of the positions of each 19-mer in the contiguous positions array
+			std::vector<uint64_t> positions_idx(number_elements + 1, 0);
 			for (uint32_t j = 0; j < number_elements; j++)
+				positions_idx[j + 1] = positions_idx[j] + positions_tbl[j].size;
+			positions_header pos_header;
+			memset(&pos_header, 0, sizeof(pos_header));
+			memcpy(pos_header.magic, POSITIONS_MAGIC, sizeof(pos_header.magic));
+			pos_header.version = compact ? POSITIONS_VERSION_COMPACT : POSITIONS_VERSION;
+			pos_header.number_elements = number_elements;
+			pos_header.num_positions = positions_idx[number_elements];
+			ospos.write(reinterpret_cast<const char*>(&pos_header), sizeof(pos_header));
+			if (compact)
+			{
+				// the offsets and the positions bit-packed, the widths sized to this part
+				positions_compact widths;
+				memset(&widths, 0, sizeof(widths));
+				widths.idx_bits = bits_for(pos_header.num_positions);
+				widths.pos_bits = bits_for(maxlen);
+				widths.seq_bits = bits_for(numseq_part > 0 ? numseq_part - 1 : 0);
+				ospos.write(reinterpret_cast<const char*>(&widths), sizeof(widths));
+
+				std::vector<uint64_t> idx_words(packed_words(number_elements + 1ULL, widths.idx_bits), 0);
+				for (uint32_t j = 0; j <= number_elements; j++)
+					put_bits(idx_words.data(), j * (uint64_t)widths.idx_bits, widths.idx_bits, positions_idx[j]);
+				ospos.write(reinterpret_cast<const char*>(idx_words.data()), idx_words.size() * sizeof(uint64_t));
+				std::vector<uint64_t>().swap(idx_words);
+
+				uint32_t width = widths.pos_bits + widths.seq_bits;
+				std::vector<uint64_t> pos_words(packed_words(pos_header.num_positions, width), 0);
+				for (uint32_t j = 0; j < number_elements; j++)
+				{
+					for (uint32_t k = 0; k < positions_tbl[j].size; k++)
+					{
+						uint64_t bitpos = (positions_idx[j] + k) * width;
+						put_bits(pos_words.data(), bitpos, widths.pos_bits, positions_tbl[j].arr[k].pos);
+						put_bits(pos_words.data(), bitpos + widths.pos_bits, widths.seq_bits, positions_tbl[j].arr[k].seq);
+					}
+				}
+				ospos.write(reinterpret_cast<const char*>(pos_words.data()), pos_words.size() * sizeof(uint64_t));
+			}
+			else
 			{
-				uint32_t size = positions_tbl[j].size;
-				ospos.write(reinterpret_cast<const char*>(&size), sizeof(uint32_t));
-				ospos.write(reinterpret_cast<const char*>(positions_tbl[j].arr), sizeof(seq_pos)*size);
+				ospos.write(reinterpret_cast<const char*>(positions_idx.data()), positions_idx.size() * sizeof(uint64_t));
+				// the positions
+				for (uint32_t j = 0; j < number_elements; j++)
+				{
+					ospos.write(reinterpret_cast<const char*>(positions_tbl[j].arr), sizeof(seq_pos)*positions_tbl[j].size);
+				}
 			}
 			ospos.close();
+			// reference sequences of the part for sortmerna
+			eprintf("      writing reference sequences to %s\n",
+				(myfiles[newindex].second + ".ref_" + part_str + ".dat").c_str());
+			ref_store_header ref_header;
+			memset(&ref_header, 0, sizeof(ref_header));
+			ref_header.src_size = filesize;
+			ref_header.start_part = start_part;
+			ref_header.seq_part_size = seq_part_size;
+			write_ref_store(myfiles[newindex].second + ".ref_" + part_str + ".dat", part_headers, part_refseqs, ref_header);
+			std::vector<std::string>().swap(part_refseqs);
+			std::vector<std::string>().swap(part_headers);
+			// 4. predicted search memory of the part: the tries file is mapped whole, the positions table
+			// is loaded without its header
+			part_mem_stats thismem;
+			struct stat part_stat;
+			thismem.kmer = (uint64_t(1) << lnwin_gv) * sizeof(kmer_flat);
+			thismem.tries = stat((myfiles[newindex].second + ".bursttrie_" + part_str + ".dat").c_str(), &part_stat) == 0
+				? part_stat.st_size : 0;
+			thismem.positions = stat((myfiles[newindex].second + ".pos_" + part_str + ".dat").c_str(), &part_stat) == 0
+				? part_stat.st_size - sizeof(pos_header) - (compact ? sizeof(positions_compact) : 0) : 0;
+			thismem.references = part_refs_mem;
+			index_part_mem_vec.push_back(thismem);
+			eprintf("      predicted search memory: %.2f Mbytes\n", thismem.total() / 1048576.0);
+			if (auto_parts && thismem.total() / 1048576.0 > auto_parts_mem)
+			{
+				std::cerr << std::endl << YELLOW << "  WARNING" << COLOFF << ": the predicted search memory of the index part "
+					<< part << " is " << thismem.total() / 1048576.0 << " Mbytes, above --auto-parts " << auto_parts_mem
+					<< " Mbytes. Its sequences share fewer L-mers than estimated." << std::endl;
+			}
 			// Free malloc'd memory
 			// Table of unique 19-mer positions
 			for (uint32_t z = 0; z < number_elements; z++)
@@ -2420,13 +3130,40 @@ int main(int argc, char** argv)
 				stats.write(reinterpret_cast<const char*>(&(sam_sq_header[j].second)), sizeof(uint32_t));
 			}
 
+			// predicted search memory of each index part. Not known for the parts of an index built
+			// by an earlier version of indexdb (--append)
+			if (index_part_mem_vec.size() == part)
+			{
+				stats.write(PART_MEM_MAGIC, sizeof(PART_MEM_MAGIC));
+				stats.write(reinterpret_cast<const char*>(&part), sizeof(uint16_t));
+				stats.write(reinterpret_cast<const char*>(index_part_mem_vec.data()), sizeof(part_mem_stats) * part);
+			}
+
+			// checksums of the sections of the reference file of the parts, validated by '--append'
+			if (part_crcs(fp, index_parts_stats_vec, index_part_crc_vec.size(), index_part_crc_vec))
+			{
+				stats.write(PART_CRC_MAGIC, sizeof(PART_CRC_MAGIC));
+				stats.write(reinterpret_cast<const char*>(&part), sizeof(uint16_t));
+				stats.write(reinterpret_cast<const char*>(index_part_crc_vec.data()), sizeof(uint32_t) * part);
+			}
+
 			stats.close();
 
+			// the catalog of the reference sequences of all the parts
+			std::string catalog_path = myfiles[newindex].second + ".refcat";
+			if (have_catalog)
+			{
+				eprintf("      writing reference catalog to %s\n", catalog_path.c_str());
+				write_ref_catalog(catalog_path, catalog_recs, catalog_ids, part, filesize);
+			}
+			else
+				std::remove(catalog_path.c_str());
+
 			eprintf("    done.\n\n");
 		}
 
 		// Free map'd memory
-		fclose(fp);
+		gzclose(fp);
 
 	} // for every FASTA file, index name pair listed after --ref option
 
@@ -97,7 +97,7 @@ void find_lis( deque<pair<uint32_t, uint32_t>> &a, vector<uint32_t> &b )
  */
 void compute_lis_alignment
 	(
-		Read & read, Runopts & opts, Index & index, References & refs, Readstats & readstats, Refstats & refstats,
+		Read & read, hit_buffers & hits, Runopts & opts, Index & index, References & refs, Readstats & readstats, Refstats & refstats,
 		bool & search,
 		uint32_t max_SW_score,
 		bool& read_to_count
@@ -112,39 +112,56 @@ void compute_lis_alignment
 	if (read.readhit < (uint32_t)opts.seed_hits)
 		return;
 
-	// map <reference number : number of the k-mer occurrences>
-	map<uint32_t, uint32_t> kmer_count_map;
-	// vector to hold 'kmer_count_map' content for Sorting (as map cannot be sorted)
+	// candidate references and their number of the k-mer occurrences
 	vector<uint32pair> kmer_count_vec;
-	map<uint32_t, uint32_t>::iterator map_it;
 	uint32_t max_ref = 0; // reference with max kmer occurrences
 	uint32_t max_occur = 0; // number of kmer occurrences on the 'max_ref'
 
+	// reset the counts of the previous call
+	vector<uint32_t> & ref_hits_end = hits.ref_hits_end;
+	for (auto seq : hits.ref_hits_seqs)
+		ref_hits_end[seq] = 0;
+	hits.ref_hits_seqs.clear();
+	if (ref_hits_end.size() < refs.buffer.size())
+		ref_hits_end.resize(refs.buffer.size(), 0);
+
 	// 1. Find all candidate references by using Read's kmer hits information.
 	//    For every reference, compute the number of kmer hits belonging to it
-	for (auto hit : read.id_win_hits)
+	for (auto hit : hits.id_win_hits)
 	{
-		seq_pos* positions_tbl_ptr = index.positions_tbl[hit.id].arr;
 		// loop all positions of id
-		for (uint32_t j = 0; j < index.positions_tbl[hit.id].size; j++)
+		for (uint64_t i = index.getPositionsBegin(hit.id), end = index.getPositionsBegin(hit.id + 1); i < end; ++i)
 		{
-			uint32_t seq = positions_tbl_ptr++->seq;
-			if ((map_it = kmer_count_map.find(seq)) != kmer_count_map.end())
-				map_it->second++; // sequence already in the map, increment its frequency value
-			else
-				kmer_count_map[seq] = 1; // sequence not in the map, add it
+			uint32_t seq = index.getPosition(i).seq;
+			if (ref_hits_end[seq]++ == 0)
+				hits.ref_hits_seqs.push_back(seq); // first hit on the sequence
 		}
 	}
 
-	// copy frequency map to vector for sorting
-	// consider only candidate references that have enough seed hits
-	for (auto freq_pair: kmer_count_map)
+	// consider only candidate references that have enough seed hits,
+	// and lay out the group of the hits of each reference
+	uint32_t num_hits = 0;
+	for (auto seq : hits.ref_hits_seqs)
 	{
-		if (freq_pair.second >= (uint32_t)opts.seed_hits)
-			kmer_count_vec.push_back(freq_pair);
+		uint32_t seq_hits = ref_hits_end[seq];
+		if (seq_hits >= (uint32_t)opts.seed_hits)
+			kmer_count_vec.push_back(uint32pair(seq, seq_hits));
+		ref_hits_end[seq] = num_hits; // start of the group. The end once the hits are placed
+		num_hits += seq_hits;
 	}
 
-	kmer_count_map.clear();
+	// place the hits into the group of their reference, in a second pass over the positions.
+	// 'hits_per_ref' of a candidate is its group once sorted
+	vector<uint64_t> & ref_hits = hits.ref_hits;
+	ref_hits.resize(num_hits);
+	for (auto hit : hits.id_win_hits)
+	{
+		for (uint64_t i = index.getPositionsBegin(hit.id), end = index.getPositionsBegin(hit.id + 1); i < end; ++i)
+		{
+			seq_pos p = index.getPosition(i);
+			ref_hits[ref_hits_end[p.seq]++] = (uint64_t(p.pos) << 32) | hit.win;
+		}
+	}
 
 	// sort sequences by frequency in descending order
 	std::sort(kmer_count_vec.begin(), kmer_count_vec.end(),
@@ -197,30 +214,20 @@ void compute_lis_alignment
 		vector<uint32pair> hits_per_ref;
 
 		//
-		// 3. populate 'hits_per_ref'
+		// 3. populate 'hits_per_ref' from the group of the reference
 		//
-		for ( auto hit: read.id_win_hits )
+		auto group_end = ref_hits.begin() + ref_hits_end[max_ref];
+		auto group_begin = group_end - max_occur;
+
+		// sort the positions in ascending order, the positions on the read ascending for equal reference positions
+		std::sort(group_begin, group_end);
+
+		hits_per_ref.reserve(max_occur);
+		for (auto it = group_begin; it != group_end; ++it)
 		{
-			uint32_t num_hits = index.positions_tbl[hit.id].size;
-			seq_pos* positions_tbl_ptr = index.positions_tbl[hit.id].arr;
-			// loop through every position of id
-			for (uint32_t j = 0; j < num_hits; j++)
-			{
-				if (positions_tbl_ptr->seq == max_ref)
-				{
-					hits_per_ref.push_back(uint32pair(positions_tbl_ptr->pos, hit.win));
-				}
-				positions_tbl_ptr++;
-			}
+			hits_per_ref.push_back(uint32pair(static_cast<uint32_t>(*it >> 32), static_cast<uint32_t>(*it)));
 		}
 
-		// sort the positions in ascending order
-		std::sort(hits_per_ref.begin(), hits_per_ref.end(), [](uint32pair e1, uint32pair e2) {
-			if (e1.first == e2.first) 
-				return (e1.second ASCENDING e2.second); // order references ascending for equal reference positions
-			return (e1.first ASCENDING e2.first);
-		}); // smallest
-
 		// iterate over the set of hits, output windows of
 		// length == read which have at least ratio hits
 		vector<uint32pair>::iterator hits_per_ref_iter = hits_per_ref.begin();
@@ -286,7 +293,7 @@ void compute_lis_alignment
 						uint32_t align_ref_start = 0;
 						uint32_t align_que_start = 0;
 						uint32_t align_length = 0;
-						uint32_t reflen = refs.buffer[max_ref].sequence.length();
+						uint32_t reflen = refs.buffer[max_ref].getSeqLen();
 						uint32_t edges = 0;
 						if (opts.as_percent)
 							edges = (((double)opts.edges / 100.0)*read.sequence.length());
@@ -374,18 +381,18 @@ void compute_lis_alignment
                        
 						// create profile for read
 						s_profile* profile = 0;
-						profile = ssw_init((int8_t*)(&read.isequence[0] + align_que_start), (align_length - head - tail), &read.scoring_matrix[0], 5, 2);
+						profile = ssw_init((int8_t*)(&read.isequence[0] + align_que_start), (align_length - head - tail), &opts.scoring_matrix[0], 5, 2);
 
 						s_align* result = 0;
 
 						result = ssw_align(
 							profile,
-							(int8_t*)refs.buffer[max_ref].sequence.c_str() + align_ref_start - head,
+							(int8_t*)refs.buffer[max_ref].getSeq() + align_ref_start - head,
 							align_length,
 							opts.gap_open,
 							opts.gap_extension,
 							2,
-							refstats.minimal_score[index.index_num], // minimal_score_index_num
+							refstats.getMinimalScore(index.index_num, read.sequence.size()), // minimal_score_index_num
 							0,
 							0
 						);
@@ -395,7 +402,7 @@ void compute_lis_alignment
 							init_destroy(&profile);
 
 						// check alignment satisfies all thresholds
-						if ( result != 0 && result->score1 > refstats.minimal_score[index.index_num] )
+						if ( result != 0 && result->score1 > refstats.getMinimalScore(index.index_num, read.sequence.size()) )
 								aligned = true;
 
 						// Alignment succeeded, output (--all) or store (--best)
@@ -106,13 +106,9 @@ void computeStats(Read & read, Readstats & readstats, Refstats & refstats, Refer
 					// fill OTU map with highest-scoring alignment for the read
 					if (opts.otumapout)
 					{
-						// reference sequence identifier for mapped read
-						std::string refhead = refs.buffer[read.hits_align_info.alignv[p].ref_seq].header;
-						std::string ref_seq_str = refhead.substr(0, refhead.find(' '));
-						// left trim '>' or '@'
-						ref_seq_str.erase(ref_seq_str.begin(),
-							std::find_if(ref_seq_str.begin(), ref_seq_str.end(),
-								[](auto ch) {return !(ch == FASTA_HEADER_START || ch == FASTQ_HEADER_START);}));
+						// reference sequence identifier for mapped read, from the catalog if the index has one
+						const ref_catalog_rec* ref_rec = refstats.catalogs[refs.num].find(refs.part, read.hits_align_info.alignv[p].ref_seq);
+						std::string ref_seq_str = ref_rec ? refstats.catalogs[refs.num].getId(*ref_rec) : refs.buffer[read.hits_align_info.alignv[p].ref_seq].id;
 
 						// read identifier
 						std::string read_seq_str = read.header.substr(0, read.header.find(' '));
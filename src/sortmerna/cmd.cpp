@@ -110,6 +110,8 @@ void CmdSession::cmdRead(Runopts & opts, std::string & cmd)
 			read.id = std::stoi(readid);
 			bool isok = Reader::loadReadByIdx(opts, read);
 			ss << "Read load OK " << isok << std::endl;
+			if (isok)
+				ss << read.header << std::endl << read.sequence << std::endl;
 		}
 	}
 	std::cout << ss.str(); ss.str("");
@@ -194,6 +196,7 @@ void CmdSession::cmdIndex(Runopts & opts, std::string & cmd)
 		read.id,
 		std::stoi(posval),
 		refstats.partialwin[index.index_num],
+		index.bucket,
 		opts
 	);
 
@@ -204,28 +207,34 @@ void CmdSession::cmdIndex(Runopts & opts, std::string & cmd)
 
 	for (auto it = id_hits.begin(); it != id_hits.end(); ++it)
 	{
+		// copy: the positions table may be mapped read-only or bit-packed
+		std::vector<seq_pos> arr;
+		for (uint64_t i = index.getPositionsBegin(it->id), end = index.getPositionsBegin(it->id + 1); i < end; ++i)
+			arr.push_back(index.getPosition(i));
+		uint32_t size = static_cast<uint32_t>(arr.size());
+
 		// sort matches by Reference ID
-		std::sort(&index.positions_tbl[it->id].arr[0],
-			&index.positions_tbl[it->id].arr[index.positions_tbl[it->id].size - 1],
+		std::sort(arr.begin(),
+			arr.end(),
 			[](seq_pos a, seq_pos b) { return a.seq > b.seq; });
 
-		std::cout << "kmer iD: " << it->id << " Num hits: " << index.positions_tbl[it->id].size << std::endl;
+		std::cout << "kmer iD: " << it->id << " Num hits: " << size << std::endl;
 
-		for ( uint32_t i = 0; i < index.positions_tbl[it->id].size; ++i)
+		for ( uint32_t i = 0; i < size; ++i)
 		{
 			// populate frequency map
-			auto map_it = seq_kmer_freq_map.find(index.positions_tbl[it->id].arr[i].seq);
+			auto map_it = seq_kmer_freq_map.find(arr[i].seq);
 			if (map_it != seq_kmer_freq_map.end())
 				map_it->second++; // increment the frequency
 			else
-				seq_kmer_freq_map[index.positions_tbl[it->id].arr[i].seq] = 1; // add seq to map with freq = 1
+				seq_kmer_freq_map[arr[i].seq] = 1; // add seq to map with freq = 1
 
-			if (index.positions_tbl[it->id].arr[i].seq == std::stoi(refid))
+			if (arr[i].seq == std::stoi(refid))
 				std::cout << "Found match in Ref: " << std::stoi(refid) 
-				<< " at Ref pos: " << index.positions_tbl[it->id].arr[i].pos 
+				<< " at Ref pos: " << arr[i].pos 
 				<< " hit number: " << i << std::endl;
 		}
-		//std::cout << "Max Reference number: " << index.positions_tbl[it->id].arr[0].seq << std::endl;
+		//std::cout << "Max Reference number: " << arr[0].seq << std::endl;
 	}
 
 	// copy frequency map pairs to vector
@@ -0,0 +1,198 @@
+/**
+ * FILE: fastxmmap.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Zero-copy scanner of non-compressed FASTA/FASTQ files. See 'fastxmmap.hpp'
+ */
+
+#include <cstring> // memchr
+
+#include <fcntl.h>
+#include <sys/types.h>
+#include <sys/stat.h>
+#if !defined(_WIN32)
+#include <unistd.h>
+#include <sys/mman.h>
+#endif
+
+#include "fastxmmap.hpp"
+
+// whitespace as in 'std::isspace' in the "C" locale
+inline bool isSpaceChar(char ch)
+{
+	return ch == ' ' || (ch >= '\t' && ch <= '\r');
+}
+
+/*
+ * Map the file. On failure (or on Windows) 'isOpen' is False and the caller falls back to the stream parsing.
+ */
+FastxMmap::FastxMmap(const std::string & path)
+	:
+	fd(-1),
+	data(0),
+	fsize(0),
+	pos(0),
+	end(0),
+	format(Format::FASTA),
+	is_format_set(false),
+	pending(0),
+	pending_len(0)
+{
+#if !defined(_WIN32)
+	fd = open(path.data(), O_RDONLY);
+	if (fd < 0)
+		return;
+
+	struct stat info;
+	if (fstat(fd, &info) != 0)
+	{
+		close(fd);
+		fd = -1;
+		return;
+	}
+	fsize = static_cast<size_t>(info.st_size);
+	if (fsize == 0)
+		return;
+
+	void* addr = mmap(0, fsize, PROT_READ, MAP_SHARED, fd, 0);
+	if (addr == MAP_FAILED)
+	{
+		close(fd);
+		fd = -1;
+		fsize = 0;
+		return;
+	}
+	madvise(addr, fsize, MADV_SEQUENTIAL);
+	data = static_cast<const char*>(addr);
+	pos = data;
+	end = data + fsize;
+
+	// the format is given by the first non-space char in the file
+	for (const char* ch = data; ch < end; ++ch)
+	{
+		if (!isSpaceChar(*ch))
+		{
+			format = *ch == FASTQ_HEADER_START ? Format::FASTQ : Format::FASTA;
+			is_format_set = true;
+			break;
+		}
+	}
+#endif
+} // ~FastxMmap::FastxMmap
+
+FastxMmap::~FastxMmap()
+{
+#if !defined(_WIN32)
+	if (data)
+		munmap(const_cast<char*>(data), fsize);
+	if (fd >= 0)
+		close(fd);
+#endif
+}
+
+void FastxMmap::seek(uint64_t offset)
+{
+	pos = data + (offset < fsize ? offset : fsize);
+	pending = 0;
+	pending_len = 0;
+}
+
+/*
+ * Next non-empty line, right-trimmed of whitespace (removes '\r' too)
+ */
+bool FastxMmap::nextLine(const char* & line, size_t & len)
+{
+	while (pos < end)
+	{
+		const char* nl = static_cast<const char*>(std::memchr(pos, '\n', end - pos));
+		const char* line_end = nl ? nl : end;
+		line = pos;
+		pos = nl ? nl + 1 : end;
+
+		while (line_end > line && isSpaceChar(line_end[-1]))
+			--line_end;
+		len = line_end - line;
+		if (len > 0)
+			return true;
+	}
+	return false;
+} // ~FastxMmap::nextLine
+
+/*
+ * fastq: 0(header), 1(seq), 2(+), 3(quality)
+ * fasta: 0(header), 1..n(seq)
+ */
+bool FastxMmap::next(FastxRec & rec)
+{
+	const char* line = 0;
+	size_t len = 0;
+
+	if (pending)
+	{
+		line = pending;
+		len = pending_len;
+		pending = 0;
+	}
+	else if (!nextLine(line, len))
+		return false;
+
+	if (!is_format_set)
+	{
+		format = line[0] == FASTQ_HEADER_START ? Format::FASTQ : Format::FASTA;
+		is_format_set = true;
+	}
+
+	rec.offset = line - data;
+	rec.header = line;
+	rec.header_len = len;
+	rec.sequence = line + len; // empty sequence
+	rec.seq_len = 0;
+	rec.quality = 0;
+	rec.qual_len = 0;
+	rec.has_plus = false;
+	rec.seqbuf.clear();
+
+	if (format == Format::FASTQ)
+	{
+		if (nextLine(line, len))
+		{
+			rec.sequence = line;
+			rec.seq_len = len;
+			if (nextLine(line, len)) // '+'
+			{
+				rec.has_plus = line[0] == '+';
+				if (nextLine(line, len))
+				{
+					rec.quality = line;
+					rec.qual_len = len;
+				}
+			}
+		}
+		return true;
+	}
+
+	while (nextLine(line, len))
+	{
+		if (line[0] == FASTA_HEADER_START)
+		{
+			pending = line;
+			pending_len = len;
+			break;
+		}
+		if (rec.seq_len == 0)
+		{
+			rec.sequence = line; // single line - no copy
+			rec.seq_len = len;
+		}
+		else
+		{
+			if (rec.seqbuf.empty())
+				rec.seqbuf.assign(rec.sequence, rec.seq_len);
+			rec.seqbuf.append(line, len);
+			rec.sequence = rec.seqbuf.data();
+			rec.seq_len = rec.seqbuf.size();
+		}
+	}
+	return true;
+} // ~FastxMmap::next
@@ -1,4 +1,4 @@
-/* 
+/*
  * FILE: gzip.cpp
  * Created: Feb 22, 2018 Thu
  * @copyright 2016-19 Clarity Genomics BVBA
@@ -8,177 +8,436 @@
 #include <sstream>
 #include <iostream>
 #include <string>
-#include <cassert>
+#include <cstring> // memchr
 #include <algorithm>
 
 #include "gzip.hpp"
 
-/* 
+/*
  * return values: RL_OK (0) | RL_END (1)  | RL_ERR (-1)
  */
-int Gzip::getline(std::ifstream & ifs, std::string & line)
+int Gzip::getline(std::istream & ifs, std::string & line)
 {
-	char* line_end = 0;
-	int ret = RL_OK;
-
 	line.clear();
 
-	if (opts.have_reads_gz)
+	if (!opts.have_reads_gz) // non-compressed file
 	{
-		bool line_ready = false;
-		for (; !line_ready; )
-		{
-			if (!line_start || !line_start[0])
-			{
-				ret = Gzip::inflatez(ifs); // inflate
+		if (ifs.eof()) return RL_END;
 
-				if (ret == Z_STREAM_END && pstrm->avail_out == OUT_SIZE) 
-					return RL_END;
+		if (points)
+			line_pos = static_cast<uint64_t>(ifs.tellg());
+		std::getline(ifs, line);
+		//if (ifs.fail()) return RL_ERR;
+		return RL_OK;
+	}
 
-				if (ret < 0) 
-					return RL_ERR;
+	if (!is_started)
+		start(ifs);
 
-				if (!line_start)
-					line_start = (char*)z_out.data();
-			}
+	line_pos = chunk_pos + cpos;
 
-			//line_end = strstr(line_start, "\n"); // returns 0 if '\n' not found
-			line_end = std::find(line_start, (char*)&z_out[0] + OUT_SIZE - pstrm->avail_out - 1, 10); // '\n'
-			//line_end = std::find_if(line_start, (char*)&z_out[0] + OUT_SIZE - strm.avail_out - 1, [l = std::locale{}](auto ch) { return ch == 10; });
-			//line_end = std::find_if(line_start, (char*)&z_out[0] + OUT_SIZE - strm.avail_out - 1, [l = std::locale{}](auto ch) { return std::isspace(ch, l); });
-			if (line_end && line_end[0] == 10)
-			{
-				std::copy(line_start, line_end, std::back_inserter(line));
-
-				if (line_end < (char*)&z_out[0] + OUT_SIZE - pstrm->avail_out - 1) // check there is data after line_end
-					line_start = line_end + 1; // skip '\n'
-				else
-				{
-					line_start = 0; // no more data in OUT buffer - flag to inflate more
-					pstrm->avail_out = 0; // mark OUT buffer as Full to reflush from the beginning [bug 61]
-				}
-
-				line_ready = true; // DEBUG: 
-				
-				//if (line == "@SRR1635864.196 196 length=101")
-				//	std::cout << "HERE";
-			}
-			else
+	for (;;)
+	{
+		if (cpos < chunk.size())
+		{
+			const char* line_start = chunk.data() + cpos;
+			const char* line_end = static_cast<const char*>(std::memchr(line_start, '\n', chunk.size() - cpos));
+			if (line_end)
 			{
-				line_end = (char*)&z_out[0] + OUT_SIZE - pstrm->avail_out; // end of data in out buffer
-				std::copy(line_start, line_end, std::back_inserter(line));
-				line_start = (pstrm->avail_out == 0) ? 0 : line_end;
-				line_end = 0;
-				line_ready = false;
+				line.append(line_start, line_end);
+				cpos = line_end - chunk.data() + 1; // skip '\n'
+				return RL_OK;
 			}
-		} // ~for !line_ready
+			line.append(line_start, chunk.size() - cpos); // the line continues in the next chunk
+			cpos = chunk.size();
+		}
+
+		if (!nextChunk())
+		{
+			if (is_error)
+				return RL_ERR;
+			return line.empty() ? RL_END : RL_OK; // the last line may have no '\n'
+		}
 	}
-	else // non-compressed file
+} // ~Gzip::getline
+
+/*
+ * Called from getline on the first call. Starts the inflating threads.
+ */
+void Gzip::start(std::istream & ifs)
+{
+	is_started = true;
+
+	// a non-seekable input (reads piped on stdin) cannot be probed and rewound. It is inflated as a multi-member gzip
+	if (ifs.tellg() != std::streampos(-1) && isBgzf(ifs))
 	{
-		if (ifs.eof()) return RL_END;
+		int num_workers = opts.num_inflate_thread;
+		if (num_workers <= 0)
+			num_workers = std::max(1, std::min(4, static_cast<int>(std::thread::hardware_concurrency()) / 2));
 
-		std::getline(ifs, line);
-		//if (ifs.fail()) return RL_ERR;
+		{
+			std::stringstream ss;
+			ss << STAMP << "BGZF input detected. Using " << num_workers << " inflate threads" << std::endl;
+			std::cout << ss.str();
+		}
+
+		for (int i = 0; i < num_workers; ++i)
+			workers.emplace_back(&Gzip::inflateBlocks, this);
+		producer = std::thread(&Gzip::splitBlocks, this, std::ref(ifs));
 	}
+	else
+	{
+		producer = std::thread(&Gzip::inflateStream, this, std::ref(ifs));
+	}
+} // ~Gzip::start
 
-	return RL_OK;
-} // ~Gzip::getline
+/*
+ * Called from destructor. Stops the inflating threads e.g. when the parser is done before the end of the file.
+ */
+void Gzip::stop()
+{
+	is_stop = true;
+	{
+		std::lock_guard<std::mutex> lmd(dlock);
+		cvSpace.notify_all();
+	}
+	{
+		std::lock_guard<std::mutex> lmb(block);
+		cvBlocks.notify_all();
+	}
+	if (producer.joinable())
+		producer.join();
+	for (auto & worker : workers)
+		if (worker.joinable())
+			worker.join();
+} // ~Gzip::stop
 
 /*
- * Called from getline
+ * BGZF is a multi-member gzip with the 'BC' extra subfield in each member header, which holds the block size.
  */
-int Gzip::inflatez(std::ifstream & ifs)
+bool Gzip::isBgzf(std::istream & ifs)
 {
-	int ret;
-	std::stringstream ss;
+	unsigned char hdr[18];
+	ifs.read(reinterpret_cast<char*>(hdr), sizeof(hdr));
+	bool isbgzf = ifs.gcount() == sizeof(hdr)
+		&& hdr[0] == 31 && hdr[1] == 139 && hdr[2] == 8 && (hdr[3] & 4) // gzip, deflate, FEXTRA
+		&& hdr[12] == 'B' && hdr[13] == 'C' && hdr[14] == 2 && hdr[15] == 0; // BC subfield of length 2
+	ifs.clear();
+	ifs.seekg(0);
+	return isbgzf;
+} // ~Gzip::isBgzf
 
-	for (;;)
+/*
+ * Hand the inflated chunk over to the parser. Blocks while the chunk is too far ahead of the parser.
+ */
+void Gzip::putChunk(uint64_t seq, std::string && data)
+{
+	std::unique_lock<std::mutex> lmd(dlock);
+	cvSpace.wait(lmd, [this, seq] { return seq < next_seq + GZ_MAX_CHUNKS || is_stop || is_error; });
+	if (is_stop || is_error) return;
+	done.emplace(seq, std::move(data));
+	cvDone.notify_one();
+}
+
+void Gzip::finish(uint64_t count, bool error)
+{
+	{
+		std::lock_guard<std::mutex> lmd(dlock);
+		if (error)
+			is_error = true;
+		else
+		{
+			num_chunks = count;
+			is_done = true;
+		}
+		cvDone.notify_one();
+		cvSpace.notify_all();
+	}
+	if (error)
+	{
+		std::lock_guard<std::mutex> lmb(block);
+		cvBlocks.notify_all(); // release the BGZF splitter and workers
+	}
+} // ~Gzip::finish
+
+/*
+ * Take the next chunk in order. Returns False at the end of data or on error.
+ */
+bool Gzip::nextChunk()
+{
+	std::unique_lock<std::mutex> lmd(dlock);
+	cvDone.wait(lmd, [this] { return done.count(next_seq) > 0 || (is_done && next_seq >= num_chunks) || is_error; });
+	auto it = done.find(next_seq);
+	if (is_error || it == done.end())
+		return false;
+
+	chunk_pos += chunk.size();
+	chunk = std::move(it->second);
+	cpos = 0;
+	done.erase(it);
+	++next_seq;
+	cvSpace.notify_all();
+
+	return true;
+} // ~Gzip::nextChunk
+
+/*
+ * Plain gzip: inflate the whole stream ahead of the parser. Multiple members are inflated one after another.
+ * Runs in the 'producer' thread.
+ *
+ * If the access points are collected, the inflating stops at every deflate block boundary (Z_BLOCK),
+ * and a point is added every GZ_ACCESS_SPAN of the inflated data.
+ */
+void Gzip::inflateStream(std::istream & ifs)
+{
+	z_stream strm;
+	std::vector<unsigned char> z_in(IN_SIZE); // IN buffer for compressed data
+	std::string out(GZ_CHUNK_SIZE, 0); // OUT buffer for decompressed data
+	std::string tail; // last GZ_WINDOW inflated bytes preceding 'out'. Access points only
+	uint64_t seq = 0;
+	uint64_t num_members = 0; // number of gzip members inflated
+	uint64_t in_pos = 0; // number of compressed bytes read
+	bool is_member_start = true; // no data yet inflated from the current member
+	int flush = points ? Z_BLOCK : Z_NO_FLUSH;
+	int ret = Z_OK;
+
+	strm.zalloc = Z_NULL;
+	strm.zfree = Z_NULL;
+	strm.opaque = Z_NULL;
+	strm.avail_in = 0;
+	strm.next_in = Z_NULL;
+	ret = inflateInit2(&strm, 47); // 32 + 15: gzip or zlib, automatic header detection
+	if (ret != Z_OK) {
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": inflateInit2 failed. Error: " << ret << std::endl;
+		finish(0, true);
+		return;
+	}
+	strm.next_out = reinterpret_cast<unsigned char*>(&out[0]);
+	strm.avail_out = GZ_CHUNK_SIZE;
+
+	while (!is_stop)
 	{
-		if (pstrm->avail_in == 0 && !ifs.eof()) // in buffer empty
+		if (strm.avail_in == 0)
 		{
-			std::fill(z_in.begin(), z_in.end(), 0); // reset buffer to 0
-			ifs.read((char*)z_in.data(), IN_SIZE);
+			ifs.read(reinterpret_cast<char*>(z_in.data()), IN_SIZE);
 			if (!ifs.eof() && ifs.fail())
 			{
-				(void)inflateEnd(pstrm);
-				return Z_ERRNO;
+				(void)inflateEnd(&strm);
+				finish(seq, true);
+				return;
+			}
+			strm.avail_in = static_cast<uInt>(ifs.gcount());
+			strm.next_in = z_in.data();
+			in_pos += strm.avail_in;
+			if (strm.avail_in == 0)
+			{
+				if (!is_member_start)
+					std::cout << STAMP << "WARNING: unexpected end of the compressed file" << std::endl;
+				break;
 			}
-
-			pstrm->avail_in = ifs.gcount();
-			pstrm->next_in = z_in.data();
 		}
 
-		if (pstrm->avail_in == 0 && ifs.eof())
+		ret = inflate(&strm, flush);
+		if (ret == Z_STREAM_END)
 		{
-			if (pstrm->avail_out < OUT_SIZE)
-				pstrm->avail_out = OUT_SIZE;
-
-			ret = inflateEnd(pstrm); // free up the resources
+			// next member, if any
+			inflateReset(&strm);
+			is_member_start = true;
+			++num_members;
+		}
+		else if (ret == Z_DATA_ERROR && is_member_start && num_members > 0)
+		{
+			std::cout << STAMP << "WARNING: trailing garbage after the last gzip member ignored" << std::endl;
+			break;
+		}
+		else if (ret != Z_OK && ret != Z_BUF_ERROR)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": inflate failed. Error: " << ret << std::endl;
+			(void)inflateEnd(&strm);
+			finish(seq, true);
+			return;
+		}
+		else
+			is_member_start = false;
 
-			if (ret != Z_STREAM_END)
+		// block boundary (not after the last block of a member)
+		if (points && ret == Z_OK && (strm.data_type & 128) && !(strm.data_type & 64))
+		{
+			size_t len = GZ_CHUNK_SIZE - strm.avail_out; // inflated into 'out'
+			uint64_t out_pos = seq * GZ_CHUNK_SIZE + len;
+			if (points->empty() || out_pos - points->back().out >= GZ_ACCESS_SPAN)
 			{
-				std::cout << __FILE__ << ":" << __LINE__ << "  WARNING: inflateEnd status is " << ret << std::endl;
+				gz_access_point point;
+				point.out = out_pos;
+				point.in = in_pos - strm.avail_in;
+				point.bits = strm.data_type & 7;
+				if (len < GZ_WINDOW)
+					point.window = tail.substr(tail.size() - std::min<size_t>(tail.size(), GZ_WINDOW - len));
+				point.window.append(out, len - std::min<size_t>(len, GZ_WINDOW), std::min<size_t>(len, GZ_WINDOW));
+				points->push_back(std::move(point));
 			}
+		}
+
+		if (strm.avail_out == 0) // out buffer is full - hand it over
+		{
+			if (points)
+				tail = out.substr(GZ_CHUNK_SIZE - GZ_WINDOW);
+			putChunk(seq++, std::move(out));
+			out.assign(GZ_CHUNK_SIZE, 0);
+			strm.next_out = reinterpret_cast<unsigned char*>(&out[0]);
+			strm.avail_out = GZ_CHUNK_SIZE;
+		}
+	} // ~while
+
+	if (strm.avail_out < GZ_CHUNK_SIZE)
+	{
+		out.resize(GZ_CHUNK_SIZE - strm.avail_out);
+		putChunk(seq++, std::move(out));
+	}
+	(void)inflateEnd(&strm); // free up the resources
+	finish(seq, false);
+} // ~Gzip::inflateStream
+
+/*
+ * BGZF: read the blocks and queue them for the workers. Runs in the 'producer' thread.
+ */
+void Gzip::splitBlocks(std::istream & ifs)
+{
+	uint64_t seq = 0;
+	uint64_t in_pos = 0; // offset of the block in the compressed file
+	uint64_t out_pos = 0; // offset of the block in the inflated data
+	bool error = false;
+	unsigned char hdr[12];
+	std::string blk;
+
+	while (!is_stop)
+	{
+		ifs.read(reinterpret_cast<char*>(hdr), sizeof(hdr));
+		if (ifs.gcount() == 0)
+			break; // end of file
 
-			return Z_STREAM_END;
+		uint16_t xlen = hdr[10] | (hdr[11] << 8);
+		if (ifs.gcount() != sizeof(hdr) || hdr[0] != 31 || hdr[1] != 139 || !(hdr[3] & 4))
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": invalid BGZF block header. Block: " << seq << std::endl;
+			error = true;
+			break;
 		}
 
-		if (pstrm->avail_out == 0) // out buffer is full - reset
+		blk.assign(reinterpret_cast<char*>(hdr), sizeof(hdr));
+		blk.resize(sizeof(hdr) + xlen);
+		ifs.read(&blk[sizeof(hdr)], xlen);
+
+		// find the 'BC' subfield holding the total block size - 1
+		uint32_t bsize = 0;
+		for (uint16_t i = 0; i + 4 <= xlen; )
+		{
+			const unsigned char* sf = reinterpret_cast<const unsigned char*>(&blk[sizeof(hdr) + i]);
+			uint16_t slen = sf[2] | (sf[3] << 8);
+			if (sf[0] == 'B' && sf[1] == 'C' && slen == 2 && i + 6 <= xlen)
+			{
+				bsize = (sf[4] | (sf[5] << 8)) + 1;
+				break;
+			}
+			i += 4 + slen;
+		}
+		if (bsize < sizeof(hdr) + xlen + 8 || bsize > BGZF_MAX_BLOCK)
 		{
-			std::fill(z_out.begin(), z_out.end(), 0); // reset buffer to 0
-			pstrm->avail_out = OUT_SIZE;
-			pstrm->next_out = z_out.data();
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": invalid BGZF block size: " << bsize << " Block: " << seq << std::endl;
+			error = true;
+			break;
 		}
 
-		ret = inflate(pstrm, Z_NO_FLUSH); //  Z_NO_FLUSH Z_SYNC_FLUSH Z_BLOCK
-		assert(ret != Z_STREAM_ERROR);
-		switch (ret)
+		size_t rest = bsize - sizeof(hdr) - xlen;
+		blk.resize(bsize);
+		ifs.read(&blk[sizeof(hdr) + xlen], rest);
+		if (static_cast<size_t>(ifs.gcount()) != rest)
 		{
-		case Z_NEED_DICT:
-			ret = Z_DATA_ERROR; /* and fall through */
-		case Z_DATA_ERROR:
-		case Z_MEM_ERROR:
-			(void)inflateEnd(pstrm);
-			return ret;
-		case Z_STREAM_END:
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": truncated BGZF block: " << seq << std::endl;
+			error = true;
 			break;
 		}
 
-		// OUT buffer holds Inflated data
-		// IN buffer holds Compressed data
-		// avail_out == 0 means OUT buffer is Full i.e. no space left
-		// avail_in  == 0 means  IN buffer is Empty
-		// second condition checks if there is still data left in OUT buffer when IN buffer is empty
-		if ( pstrm->avail_out == 0 || ( pstrm->avail_out < OUT_SIZE && pstrm->avail_in == 0 ) ) 
+		// every block is a gzip member i.e. an access point that needs no window
+		if (points)
+		{
+			const unsigned char* tail = reinterpret_cast<const unsigned char*>(blk.data() + bsize - 4); // ISIZE
+			uint32_t isize = tail[0] | (tail[1] << 8) | (tail[2] << 16) | (static_cast<uint32_t>(tail[3]) << 24);
+			if (points->empty() || out_pos - points->back().out >= GZ_ACCESS_SPAN)
+				points->push_back({ out_pos, in_pos, -1, std::string() });
+			in_pos += bsize;
+			out_pos += isize;
+		}
+
+		std::unique_lock<std::mutex> lmb(block);
+		cvBlocks.wait(lmb, [this] { return blocks.size() < 2 * workers.size() || is_stop || is_error; });
+		if (is_stop || is_error)
 			break;
-	} // for(;;)
+		blocks.emplace(seq++, std::move(blk));
+		cvBlocks.notify_all();
+	} // ~while
 
-	return ret;// == Z_STREAM_END ? Z_OK : Z_DATA_ERROR;
-} // ~Gzip::inflatez
+	{
+		std::lock_guard<std::mutex> lmb(block);
+		is_split = true;
+		cvBlocks.notify_all();
+	}
 
-/* 
- * Called from constructor
+	if (error)
+		finish(seq, true);
+	else
+		finish(seq, false);
+} // ~Gzip::splitBlocks
+
+/*
+ * BGZF: inflate the queued blocks. Each block is a complete gzip member. Runs in the 'workers' threads.
  */
-void Gzip::init()
+void Gzip::inflateBlocks()
 {
-	static z_stream strm; // TODO: better way i.e. no 'static' ?
-	pstrm = &strm;
-
+	z_stream strm;
 	strm.zalloc = Z_NULL;
 	strm.zfree = Z_NULL;
 	strm.opaque = Z_NULL;
 	strm.avail_in = 0;
 	strm.next_in = Z_NULL;
-	int ret = inflateInit2(&strm, 47);
-	if (ret != Z_OK) {
-		std::cerr << "Reader::initZstream failed. Error: " << ret << std::endl;
-		exit(EXIT_FAILURE);;
+	if (inflateInit2(&strm, 31) != Z_OK) // 16 + 15: gzip only
+	{
+		finish(0, true);
+		return;
 	}
 
-	strm.avail_out = 0;
+	for (;;)
+	{
+		std::pair<uint64_t, std::string> blk;
+		{
+			std::unique_lock<std::mutex> lmb(block);
+			cvBlocks.wait(lmb, [this] { return !blocks.empty() || is_split || is_stop || is_error; });
+			if (blocks.empty() || is_stop || is_error)
+				break;
+			blk = std::move(blocks.front());
+			blocks.pop();
+			cvBlocks.notify_all();
+		}
+
+		// ISIZE: the last 4 bytes of the member
+		const unsigned char* tail = reinterpret_cast<const unsigned char*>(blk.second.data() + blk.second.size() - 4);
+		uint32_t isize = tail[0] | (tail[1] << 8) | (tail[2] << 16) | (static_cast<uint32_t>(tail[3]) << 24);
+		std::string out(isize, 0);
 
-	z_in.resize(IN_SIZE);
-	z_out.resize(OUT_SIZE);
-	std::fill(z_in.begin(), z_in.end(), 0); // fill IN buffer with 0s
-	std::fill(z_out.begin(), z_out.end(), 0); // fill OUT buffer wiht 0s
-} // ~Gzip::init
\ No newline at end of file
+		inflateReset(&strm);
+		strm.next_in = reinterpret_cast<unsigned char*>(&blk.second[0]);
+		strm.avail_in = static_cast<uInt>(blk.second.size());
+		strm.next_out = reinterpret_cast<unsigned char*>(&out[0]);
+		strm.avail_out = isize;
+		int ret = inflate(&strm, Z_FINISH);
+		if (ret != Z_STREAM_END || isize > BGZF_MAX_BLOCK)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed to inflate BGZF block " << blk.first << " Error: " << ret << std::endl;
+			finish(0, true);
+			break;
+		}
+
+		putChunk(blk.first, std::move(out));
+	}
+	(void)inflateEnd(&strm);
+} // ~Gzip::inflateBlocks
@@ -39,15 +39,48 @@
 #include <cstdint>
 #include <fstream>
 #include <ios>
+#include <cstring> // memcmp
+
+#include <fcntl.h>
+#if !defined(_WIN32)
+#include <unistd.h>
+#include <sys/mman.h>
+#endif
 
 #include "index.hpp"
 #include "indexdb.hpp"
 #include "paralleltraversal.hpp"
 #include "references.hpp"
 #include "refstats.hpp"
+#include "options.hpp"
 
+#define SHM_ALIGN(size) (((size) + 7) & ~uint64_t(7)) // keep the arrays in a shared memory segment 8-byte aligned
 
+/*
+ * Load an index part. With '--shm' the part is attached from the shared memory segment published by
+ * another process. If there is none yet, the part is loaded from the files and published.
+ */
 void Index::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
+{
+	bool is_attached = opts.shm && loadShm(idx_num, idx_part, opts, refstats);
+	if (!is_attached)
+	{
+		loadFiles(idx_num, idx_part, opts, refstats);
+
+		// publish and use the shared copy instead of the private one
+		if (opts.shm && publishShm(idx_num, idx_part, opts, refstats))
+		{
+			clear();
+			if (!loadShm(idx_num, idx_part, opts, refstats))
+				loadFiles(idx_num, idx_part, opts, refstats);
+		}
+	}
+
+	index_num = idx_num;
+	part = idx_part;
+} // ~Index::load
+
+void Index::loadFiles(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
 {
 	// STEP 1: load the kmer 'count' variables (dbname.kmer.dat)
 	std::string idxfile = opts.indexfiles[idx_num].second + ".kmer_" + std::to_string(idx_part) + ".dat";
@@ -64,12 +97,12 @@ void Index::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats &
 
 	for (uint32_t i = 0; i < limit && !inkmer.eof(); i++)
 	{
-		lookup_tbl.push_back(kmer());
+		lookup_tbl.push_back(kmer_flat());
 		inkmer.read(reinterpret_cast<char*>(&(lookup_tbl[i].count)), sizeof(uint32_t));
 	}
 	inkmer.close();
 
-	// STEP 2: load the burst tries ( bursttrief.dat, bursttrier.dat )
+	// STEP 2: load the burst tries (bursttrie.dat)
 	std::string btriefile = opts.indexfiles[idx_num].second + ".bursttrie_" + std::to_string(idx_part) + ".dat";
 	std::ifstream btrie(btriefile, std::ios::in | std::ios::binary);
 	if (!btrie.good())
@@ -78,12 +111,123 @@ void Index::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats &
 		fprintf(stderr, "  Make sure you have constructed your index using the command `indexdb'. See `indexdb -h' for help.\n\n");
 		exit(EXIT_FAILURE);
 	}
+	btrie.close();
+
+	if (!loadFlatTries(btriefile, limit))
+		loadLegacyTries(btriefile, limit);
+
+	// STEP 3: load the position reference tables (pos.dat)
+	std::string posfile = opts.indexfiles[idx_num].second + ".pos_" + std::to_string(idx_part) + ".dat";
+	std::ifstream inreff(posfile, std::ios::in | std::ios::binary);
+
+	if (!inreff.good())
+	{
+		fprintf(stderr, "\n  ERROR: The database name '%s' does not exist.\n\n", posfile.c_str());
+		exit(EXIT_FAILURE);
+	}
+	inreff.close();
+
+	loadPositions(posfile);
+} // ~Index::loadFiles
+
+/*
+ * Map the burst tries file written by indexdb in the flat layout (see 'flat_trie_header') and point the look-up
+ * table into it. The tries are position independent, so they are searched in place without any rebuilding.
+ *
+ * @return false if the file is not in the flat layout i.e. the index was built by an earlier version of indexdb
+ */
+bool Index::loadFlatTries(std::string & btriefile, uint32_t limit)
+{
+	flat_trie_header header;
+	std::ifstream btrie(btriefile, std::ios::in | std::ios::binary);
+	btrie.read(reinterpret_cast<char*>(&header), sizeof(header));
+	if (!btrie || memcmp(header.magic, FLAT_TRIE_MAGIC, sizeof(header.magic)) != 0)
+		return false;
+
+	// the compact layout has the layout of the bucket entries after the header
+	bool is_compact = header.version == FLAT_TRIE_VERSION_COMPACT;
+	bucket = bucket_layout();
+	if (is_compact)
+		btrie.read(reinterpret_cast<char*>(&bucket), sizeof(bucket));
+
+	btrie.seekg(0, std::ios_base::end);
+	size_t fsize = static_cast<size_t>(btrie.tellg());
+	size_t tries_pos = sizeof(header) + (is_compact ? sizeof(bucket) : 0);
+	size_t data_pos = tries_pos + 2 * sizeof(uint64_t) * header.num_kmers;
+	bool is_valid_bucket = bucket.entry_size >= sizeof(uint32_t) && bucket.id_size <= sizeof(uint32_t)
+		&& bucket.id_size <= bucket.entry_size;
+	if ((header.version != FLAT_TRIE_VERSION && !is_compact) || !btrie || !is_valid_bucket
+		|| header.num_kmers != limit || fsize != data_pos + header.data_size)
+	{
+		fprintf(stderr, "\n  %sERROR%s: the burst tries file '%s' is corrupt or was built by a different version of indexdb.\n", RED, COLOFF, btriefile.c_str());
+		fprintf(stderr, "  Rebuild the index using the command `indexdb'.\n\n");
+		exit(EXIT_FAILURE);
+	}
+
+	const char* base = NULL;
+#if !defined(_WIN32)
+	int fd = open(btriefile.data(), O_RDONLY);
+	if (fd >= 0)
+	{
+		void* addr = mmap(0, fsize, PROT_READ, MAP_SHARED, fd, 0);
+		close(fd); // the mapping keeps the file referenced
+		if (addr != MAP_FAILED)
+		{
+			madvise(addr, fsize, MADV_WILLNEED); // start reading the tries in, the part may be prefetched ahead of the search
+			tries_map = static_cast<char*>(addr);
+			tries_map_size = fsize;
+			base = tries_map;
+		}
+	}
+#endif
+	// memory mapping not available - read the whole file
+	if (base == NULL)
+	{
+		tries_buf.resize(fsize);
+		btrie.seekg(0);
+		btrie.read(tries_buf.data(), fsize);
+		base = tries_buf.data();
+	}
+	btrie.close();
+
+	tries_data = base + data_pos;
+	tries_data_size = header.data_size;
+	setTries(reinterpret_cast<const uint64_t*>(base + tries_pos), limit);
+
+	return true;
+} // ~Index::loadFlatTries
+
+/*
+ * Point the look-up table into 'tries_data' given the offsets of the forward and reverse tries of each 9-mer
+ */
+void Index::setTries(const uint64_t* tries, uint32_t limit)
+{
+	for (uint32_t i = 0; i < limit && i < lookup_tbl.size(); i++)
+	{
+		if (lookup_tbl[i].count == 0) continue;
+		if (tries[2 * i] != FLAT_TRIE_NONE)
+			lookup_tbl[i].trie_F = reinterpret_cast<const FlatNodeElement*>(tries_data + tries[2 * i]);
+		if (tries[2 * i + 1] != FLAT_TRIE_NONE)
+			lookup_tbl[i].trie_R = reinterpret_cast<const FlatNodeElement*>(tries_data + tries[2 * i + 1]);
+	}
+} // ~Index::setTries
+
+/*
+ * Convert the burst tries of an index built by an earlier version of indexdb into the flat layout.
+ * The legacy file stores for each 9-mer the sizes of the two tries followed by the tries written breadth-first:
+ * the flags of the 4 node elements of each trie node, and the size and the content of each bucket.
+ */
+void Index::loadLegacyTries(std::string & btriefile, uint32_t limit)
+{
+	std::ifstream btrie(btriefile, std::ios::in | std::ios::binary);
+	std::vector<uint64_t> tries(2 * static_cast<size_t>(limit), FLAT_TRIE_NONE); // offsets of the tries in 'tries_buf'
+	std::deque<size_t> nodes; // offsets of the trie nodes to fill
+	std::deque<char> flags; // flags of the node elements given in the binary file
 
 	// loop through all 9-mers
 	for (uint32_t i = 0; i < limit && !btrie.eof(); i++)
 	{
 		uint32_t sizeoftries[2] = { 0 };
-		char *dst = NULL; // ptr to block of memory for two mini-burst tries
 
 		// the size of both mini-burst tries
 		for (int j = 0; j < 2; j++)
@@ -91,201 +235,341 @@ void Index::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats &
 			btrie.read(reinterpret_cast<char*>(&sizeoftries[j]), sizeof(uint32_t));
 		}
 
-		// allocate contiguous memory for both mini-burst tries if they exist
-		if (lookup_tbl[i].count != 0)
+		if (i >= lookup_tbl.size() || lookup_tbl[i].count == 0) continue;
+
+		// load 2 burst tries per 9-mer
+		for (int j = 0; j < 2; j++)
 		{
-			dst = new char[(sizeoftries[0] + sizeoftries[1])]();
-			if (dst == NULL)
+			if (sizeoftries[j] == 0) continue;
+
+			// the root trie node
+			tries[2 * i + j] = tries_buf.size();
+			nodes.push_back(tries_buf.size());
+			tries_buf.resize(tries_buf.size() + 4 * sizeof(FlatNodeElement));
+			for (int k = 0; k < 4; k++)
 			{
-				fprintf(stderr, "  ERROR: failed to allocate memory for mini-burst tries\n");
-				exit(EXIT_FAILURE);
+				char tmp;
+				btrie.read(&tmp, sizeof(char));
+				flags.push_back(tmp);
 			}
-			// load 2 burst tries per 9-mer
-			for (int j = 0; j < 2; j++)
+
+			// build the mini-burst trie
+			while (!nodes.empty())
 			{
-				// mini-burst trie exists
-				if (sizeoftries[j] != 0)
+				size_t node = nodes.front();
+				// trie node elements
+				for (int k = 0; k < 4; k++, node += sizeof(FlatNodeElement))
 				{
-					NodeElement newnode[4]; // create a root trie node
-					// copy the root trie node into the beginning of burst trie array
-					memcpy(dst, &newnode[0], sizeof(NodeElement) * 4);
-					memset(dst, 0, sizeof(NodeElement) * 4);
-					if (j == 0) lookup_tbl[i].trie_F = (NodeElement*)dst;
-					else lookup_tbl[i].trie_R = (NodeElement*)dst;
-					// queue to store the trie nodes as we create them
-					std::deque<NodeElement*> nodes;
-					nodes.push_back((NodeElement*)dst);
-					((NodeElement *&)dst) += 4;
-					// queue to store the flags of node elements given in the binary file
-					std::deque<char> flags;
-					// read the first trie node
-					for (int i = 0; i < 4; i++)
+					FlatNodeElement elem = { 0, 0, 0 };
+					elem.flag = static_cast<unsigned char>(flags.front());
+					flags.pop_front();
+					switch (elem.flag)
 					{
-						char tmp;
-						btrie.read(reinterpret_cast<char*>(&tmp), sizeof(char));
-						flags.push_back(tmp);
-					}
-					// build the mini-burst trie
-					while (!nodes.empty())
+					// empty
+					case 0:
+						break;
+					// trie node
+					case 1:
 					{
-						// ptr to traverse each trie node
-						NodeElement* node = nodes.front();
-						// trie node elements
-						for (int i = 0; i < 4; i++)
+						for (int m = 0; m < 4; m++)
 						{
-							unsigned char flag = flags.front();
-							// what does the node element point to
-							switch (flag)
-							{
-								// set values to 0
-							case 0:
-							{
-								node->flag = 0;
-								node->size = 0;
-								node->nodetype.trie = NULL;
-							}
-							break;
-							// trie node
-							case 1:
-							{
-								// read the trie node
-								for (int i = 0; i < 4; i++)
-								{
-									char tmp;
-									btrie.read(reinterpret_cast<char*>(&tmp), sizeof(char));
-									flags.push_back(tmp);
-								}
-								node->flag = 1;
-								node->size = 0;
-								NodeElement newnode[4];
-								memcpy((NodeElement*)dst, &newnode[0], sizeof(NodeElement) * 4);
-								nodes.push_back((NodeElement*)dst);
-								node->nodetype.trie = (NodeElement*)dst;
-								((NodeElement *&)dst) += 4;
-							}
-							break;
-							// bucket
-							case 2:
-							{
-								uint32_t sizeofbucket = 0;
-								// read the bucket info
-								btrie.read(reinterpret_cast<char*>(&sizeofbucket), sizeof(uint32_t));
-
-								char* bucket = new char[sizeofbucket]();
-								if (bucket == NULL)
-								{
-									fprintf(stderr, "\n  %sERROR%s: failed to allocate memory for allocate bucket (paralleltraversal.cpp)\n", RED, COLOFF);
-									exit(EXIT_FAILURE);
-								}
-								btrie.read(reinterpret_cast<char*>(bucket), sizeofbucket);
-								// copy the bucket into the burst trie array
-								memcpy((void*)dst, (void*)bucket, sizeofbucket);
-								delete[] bucket;
-								bucket = NULL;
-								// assign pointers from trie node to the bucket
-								node->flag = flag;
-								node->nodetype.bucket = dst;
-								node->size = sizeofbucket;
-								dst = ((char *)dst) + sizeofbucket;
-							}
-							break;
-							// ?
-							default:
-							{
-								fprintf(stderr, "\n  %sERROR%s: flag is set to %d (load_index)\n", RED, COLOFF, flag);
-								exit(EXIT_FAILURE);
-							}
-							break;
-							}
-							flags.pop_front();
-							node++;
-						}//~loop through 4 node elements in a trie node 
-						nodes.pop_front();
-					}//~while !nodes.empty()
-				}//~if mini-burst trie exists
-				else
-				{
-					if (j == 0) lookup_tbl[i].trie_F = NULL;
-					else lookup_tbl[i].trie_R = NULL;
-				}
-			}//~for both mini-burst tries
-		}//~if ( sizeoftries != 0 )
-		else
-		{
-			lookup_tbl[i].trie_F = NULL;
-			lookup_tbl[i].trie_R = NULL;
-		}
+							char tmp;
+							btrie.read(&tmp, sizeof(char));
+							flags.push_back(tmp);
+						}
+						elem.offset = static_cast<uint32_t>(tries_buf.size() - node);
+						nodes.push_back(tries_buf.size());
+						tries_buf.resize(tries_buf.size() + 4 * sizeof(FlatNodeElement));
+					}
+					break;
+					// bucket
+					case 2:
+					{
+						btrie.read(reinterpret_cast<char*>(&elem.size), sizeof(uint32_t));
+						elem.offset = static_cast<uint32_t>(tries_buf.size() - node);
+						tries_buf.resize(tries_buf.size() + elem.size);
+						btrie.read(&tries_buf[tries_buf.size() - elem.size], elem.size);
+					}
+					break;
+					// ?
+					default:
+					{
+						fprintf(stderr, "\n  %sERROR%s: flag is set to %d (load_index)\n", RED, COLOFF, elem.flag);
+						exit(EXIT_FAILURE);
+					}
+					break;
+					}
+					memcpy(&tries_buf[node], &elem, sizeof(elem));
+				}//~loop through 4 node elements in a trie node
+				nodes.pop_front();
+			}//~while !nodes.empty()
+		}//~for both mini-burst tries
 	}//~for all 9-mers in the look-up table
 	btrie.close();
 
-	// STEP 3: load the position reference tables (pos.dat)
-	std::string posfile = opts.indexfiles[idx_num].second + ".pos_" + std::to_string(idx_part) + ".dat";
+	// the buffer is complete - point the look-up table into it
+	tries_data = tries_buf.data();
+	tries_data_size = tries_buf.size();
+	setTries(tries.data(), limit);
+} // ~Index::loadLegacyTries
+
+/*
+ * Load the (L+1)-mer positions table into the contiguous 'positions_tbl' and its offsets 'positions_idx'.
+ * Tables written by indexdb in the CSR layout (see 'positions_header') are loaded with one read per array.
+ * Legacy tables are read in a single pass directly into 'positions_tbl', which is sized up front from the file size.
+ * Compact tables (indexdb --compact) are kept bit-packed in 'positions_packed', see 'Index::getPosition'.
+ */
+void Index::loadPositions(std::string & posfile)
+{
 	std::ifstream inreff(posfile, std::ios::in | std::ios::binary);
+	inreff.seekg(0, std::ios_base::end);
+	uint64_t fsize = static_cast<uint64_t>(inreff.tellg());
+	inreff.seekg(0);
 
-	if (!inreff.good())
+	positions_header header;
+	inreff.read(reinterpret_cast<char*>(&header), sizeof(header));
+
+	if (inreff && memcmp(header.magic, POSITIONS_MAGIC, sizeof(header.magic)) == 0)
 	{
-		fprintf(stderr, "\n  ERROR: The database name '%s' does not exist.\n\n", posfile.c_str());
+		number_elements = header.number_elements;
+		bool is_compact = header.version == POSITIONS_VERSION_COMPACT;
+		uint64_t idx_words = 0;
+		uint64_t pos_words = 0;
+		if (is_compact)
+		{
+			inreff.read(reinterpret_cast<char*>(&widths), sizeof(widths));
+			if (inreff && widths.idx_bits <= 64 && widths.pos_bits + widths.seq_bits <= 64)
+			{
+				idx_words = packed_words(number_elements + 1ULL, widths.idx_bits);
+				pos_words = packed_words(header.num_positions, widths.pos_bits + widths.seq_bits);
+			}
+		}
+		bool is_valid = is_compact
+			? inreff && idx_words > 0 && fsize == sizeof(header) + sizeof(widths) + (idx_words + pos_words) * sizeof(uint64_t)
+			: header.version == POSITIONS_VERSION && fsize == sizeof(header)
+				+ (number_elements + 1ULL) * sizeof(uint64_t) + header.num_positions * sizeof(seq_pos);
+		if (!is_valid)
+		{
+			fprintf(stderr, "\n  %sERROR%s: the positions table '%s' is corrupt or was built by a different version of indexdb.\n", RED, COLOFF, posfile.c_str());
+			fprintf(stderr, "  Rebuild the index using the command `indexdb'.\n\n");
+			exit(EXIT_FAILURE);
+		}
+
+		// the compact table is searched as is
+		if (is_compact)
+		{
+			positions_packed.resize(idx_words + pos_words);
+			inreff.read(reinterpret_cast<char*>(positions_packed.data()), positions_packed.size() * sizeof(uint64_t));
+			if (!inreff || get_bits(positions_packed.data(), number_elements * uint64_t(widths.idx_bits), widths.idx_bits) != header.num_positions)
+			{
+				fprintf(stderr, "\n  %sERROR%s: failed to read the positions table '%s'\n\n", RED, COLOFF, posfile.c_str());
+				exit(EXIT_FAILURE);
+			}
+			packed_idx = positions_packed.data();
+			packed_pos = packed_idx + idx_words;
+			return;
+		}
+		positions_idx.resize(number_elements + 1ULL);
+		inreff.read(reinterpret_cast<char*>(positions_idx.data()), positions_idx.size() * sizeof(uint64_t));
+		positions_tbl.resize(header.num_positions);
+		inreff.read(reinterpret_cast<char*>(positions_tbl.data()), positions_tbl.size() * sizeof(seq_pos));
+	}
+	else
+	{
+		// legacy: uint32_t number_elements, then for each (L+1)-mer: uint32_t size, seq_pos arr[size]
+		inreff.clear();
+		inreff.seekg(0);
+		number_elements = 0;
+		if (fsize == 0) // empty reference file
+		{
+			positions_idx.assign(1, 0);
+			positions = positions_tbl.data();
+			positions_offsets = positions_idx.data();
+			return;
+		}
+		inreff.read(reinterpret_cast<char*>(&number_elements), sizeof(uint32_t));
+		uint64_t hdr_size = sizeof(uint32_t) * (number_elements + 1ULL);
+		positions_idx.resize(number_elements + 1ULL);
+		positions_tbl.resize(fsize > hdr_size ? (fsize - hdr_size) / sizeof(seq_pos) : 0);
+		positions_idx[0] = 0;
+		for (uint32_t i = 0; i < number_elements; i++)
+		{
+			uint32_t size = 0;
+			inreff.read(reinterpret_cast<char*>(&size), sizeof(uint32_t));
+			positions_idx[i + 1] = positions_idx[i] + size;
+			if (positions_idx[i + 1] > positions_tbl.size()) break;
+			inreff.read(reinterpret_cast<char*>(&positions_tbl[positions_idx[i]]), sizeof(seq_pos)*size);
+		}
+	}
+
+	if (!inreff || positions_idx[number_elements] != positions_tbl.size())
+	{
+		fprintf(stderr, "\n  %sERROR%s: failed to read the positions table '%s'\n\n", RED, COLOFF, posfile.c_str());
 		exit(EXIT_FAILURE);
 	}
+	inreff.close();
 
-	uint32_t size = 0;
-	inreff.read(reinterpret_cast<char*>(&number_elements), sizeof(uint32_t));
-	positions_tbl.reserve(number_elements); // = new kmer_origin[number_elements]();
+	positions = positions_tbl.data();
+	positions_offsets = positions_idx.data();
+} // ~Index::loadPositions
 
-	if (positions_tbl.capacity() == 0)
+/*
+ * Attach the index part from the shared memory segment. The burst tries and the positions table are used in place,
+ * only the look-up table is built in the process memory.
+ *
+ * Segment data:
+ *   uint32_t count[num_kmers]                          padded to 8 bytes
+ *   uint64_t tries[2 * num_kmers]                      offsets of the forward and reverse tries in the trie data
+ *   char     tries_data[tries_data_size]               padded to 8 bytes
+ *   uint64_t positions_idx[number_elements + 1]        compact index: the bit-packed offsets and positions
+ *   seq_pos  positions[num_positions]                  (see 'positions_header')
+ *
+ * The layout of the bucket entries and the widths of the compact positions table are in the header 'counts'.
+ */
+bool Index::loadShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
+{
+	std::string prefix = opts.indexfiles[idx_num].second;
+	std::string spart = std::to_string(idx_part);
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	if (!ShmSegment::getSrcStat({ prefix + ".kmer_" + spart + ".dat", prefix + ".bursttrie_" + spart + ".dat", prefix + ".pos_" + spart + ".dat" }, src_size, src_mtime)
+		|| !shm.attach(ShmSegment::getName(prefix, idx_part, "idx"), SHM_INDEX_MAGIC, src_size, src_mtime))
+		return false;
+
+	uint32_t limit = 1 << refstats.lnwin[idx_num];
+	const uint64_t* counts = shm.header()->counts;
+	if (counts[0] != limit)
 	{
-		fprintf(stderr, "  ERROR: could not allocate memory for positions_tbl (main(), paralleltraversal.cpp)\n");
-		exit(EXIT_FAILURE);
+		shm.detach();
+		return false;
 	}
 
-	for (uint32_t i = 0; i < number_elements; i++)
+	const char* data = shm.data();
+	const uint32_t* kmer_counts = reinterpret_cast<const uint32_t*>(data);
+	data += SHM_ALIGN(limit * sizeof(uint32_t));
+	const uint64_t* tries = reinterpret_cast<const uint64_t*>(data);
+	data += 2 * sizeof(uint64_t) * limit;
+	tries_data = data;
+	tries_data_size = counts[1];
+	data += SHM_ALIGN(tries_data_size);
+	number_elements = static_cast<uint32_t>(counts[2]);
+	bucket.entry_size = counts[4] & 0xFF;
+	bucket.key_size = (counts[4] >> 8) & 0xFF;
+	bucket.id_size = (counts[4] >> 16) & 0xFF;
+	if (counts[5] != 0)
 	{
-		/* the number of positions */
-		positions_tbl.push_back(kmer_origin());
-		inreff.read(reinterpret_cast<char*>(&size), sizeof(uint32_t));
-		positions_tbl[i].size = size;
-		/* the sequence seq_pos array */
-		positions_tbl[i].arr = new seq_pos[size]();
-		if (positions_tbl[i].arr == NULL)
-		{
-			fprintf(stderr, "  ERROR: could not allocate memory for positions_tbl (paralleltraversal.cpp)\n");
-			exit(EXIT_FAILURE);
-		}
-		inreff.read(reinterpret_cast<char*>(positions_tbl[i].arr), sizeof(seq_pos)*size);
+		widths.idx_bits = counts[5] & 0xFF;
+		widths.pos_bits = (counts[5] >> 8) & 0xFF;
+		widths.seq_bits = (counts[5] >> 16) & 0xFF;
+		packed_idx = reinterpret_cast<const uint64_t*>(data);
+		packed_pos = packed_idx + packed_words(number_elements + 1ULL, widths.idx_bits);
+	}
+	else
+	{
+		positions_offsets = reinterpret_cast<const uint64_t*>(data);
+		data += (number_elements + 1ULL) * sizeof(uint64_t);
+		positions = reinterpret_cast<const seq_pos*>(data);
 	}
 
-	inreff.close();
-	index_num = idx_num;
-	part = idx_part;
-} // ~Index::load
+	lookup_tbl.resize(limit);
+	for (uint32_t i = 0; i < limit; i++)
+		lookup_tbl[i].count = kmer_counts[i];
+	setTries(tries, limit);
 
-void Index::clear()
+	return true;
+} // ~Index::loadShm
+
+/*
+ * Publish the loaded index part into a new shared memory segment. See 'loadShm' for the layout.
+ *
+ * @return false if the part was published by another process meanwhile, or the segment could not be created
+ */
+bool Index::publishShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
 {
-	// lookup_tbl
-	for (int i = 0; i < lookup_tbl.size(); i++)
+	std::string prefix = opts.indexfiles[idx_num].second;
+	std::string spart = std::to_string(idx_part);
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	if (!ShmSegment::getSrcStat({ prefix + ".kmer_" + spart + ".dat", prefix + ".bursttrie_" + spart + ".dat", prefix + ".pos_" + spart + ".dat" }, src_size, src_mtime))
+		return false;
+
+	uint32_t limit = 1 << refstats.lnwin[idx_num];
+	uint64_t num_positions = getPositionsBegin(number_elements);
+	uint64_t positions_size = packed_idx != NULL ? positions_packed.size() * sizeof(uint64_t)
+		: (number_elements + 1ULL) * sizeof(uint64_t) + num_positions * sizeof(seq_pos);
+	uint64_t data_size = SHM_ALIGN(limit * sizeof(uint32_t)) + 2 * sizeof(uint64_t) * limit + SHM_ALIGN(tries_data_size) + positions_size;
+
+	ShmSegment seg;
+	char* data = seg.create(ShmSegment::getName(prefix, idx_part, "idx"), SHM_INDEX_MAGIC, src_size, src_mtime, data_size);
+	if (data == NULL)
+		return false;
+
+	uint64_t* counts = seg.header()->counts;
+	counts[0] = limit;
+	counts[1] = tries_data_size;
+	counts[2] = number_elements;
+	counts[3] = num_positions;
+	counts[4] = bucket.entry_size | (bucket.key_size << 8) | (bucket.id_size << 16);
+	counts[5] = packed_idx != NULL ? widths.idx_bits | (widths.pos_bits << 8) | (widths.seq_bits << 16) : 0;
+
+	uint32_t* kmer_counts = reinterpret_cast<uint32_t*>(data);
+	for (uint32_t i = 0; i < limit; i++)
+		kmer_counts[i] = i < lookup_tbl.size() ? lookup_tbl[i].count : 0;
+	data += SHM_ALIGN(limit * sizeof(uint32_t));
+
+	uint64_t* tries = reinterpret_cast<uint64_t*>(data);
+	for (uint32_t i = 0; i < limit; i++)
 	{
-		if (lookup_tbl[i].trie_F != NULL)
-		{
-			delete[] lookup_tbl[i].trie_F;
-			lookup_tbl[i].trie_F = NULL;
-			lookup_tbl[i].trie_R = NULL;
-		}
-		if (lookup_tbl[i].trie_R != NULL)
-		{
-			delete[] lookup_tbl[i].trie_R;
-			lookup_tbl[i].trie_R = NULL;
-		}
+		bool is_set = i < lookup_tbl.size() && lookup_tbl[i].count != 0;
+		tries[2 * i] = is_set && lookup_tbl[i].trie_F != NULL ? reinterpret_cast<const char*>(lookup_tbl[i].trie_F) - tries_data : FLAT_TRIE_NONE;
+		tries[2 * i + 1] = is_set && lookup_tbl[i].trie_R != NULL ? reinterpret_cast<const char*>(lookup_tbl[i].trie_R) - tries_data : FLAT_TRIE_NONE;
 	}
-	lookup_tbl.clear();
+	data += 2 * sizeof(uint64_t) * limit;
 
-	// positions_tbl
-	for (int i = 0; i < positions_tbl.size(); i++)
+	memcpy(data, tries_data, tries_data_size);
+	data += SHM_ALIGN(tries_data_size);
+	if (packed_idx != NULL)
 	{
-		if (positions_tbl[i].arr != NULL)
-		{
-			delete[] positions_tbl[i].arr;
-			positions_tbl[i].arr = NULL;
-		}
+		memcpy(data, positions_packed.data(), positions_size);
+	}
+	else
+	{
+		memcpy(data, positions_offsets, (number_elements + 1ULL) * sizeof(uint64_t));
+		data += (number_elements + 1ULL) * sizeof(uint64_t);
+		memcpy(data, positions, num_positions * sizeof(seq_pos));
 	}
-	positions_tbl.clear();
+
+	seg.commit();
+	seg.detach();
+
+	return true;
+} // ~Index::publishShm
+
+void Index::clear()
+{
+	// lookup_tbl and the burst tries it points into
+	lookup_tbl.clear();
+#if !defined(_WIN32)
+	if (tries_map != NULL)
+		munmap(tries_map, tries_map_size);
+#endif
+	tries_map = NULL;
+	tries_map_size = 0;
+	std::vector<char>().swap(tries_buf);
+
+	tries_data = NULL;
+	tries_data_size = 0;
+
+	// positions_tbl
+	std::vector<seq_pos>().swap(positions_tbl);
+	std::vector<uint64_t>().swap(positions_idx);
+	positions = NULL;
+	positions_offsets = NULL;
+	std::vector<uint64_t>().swap(positions_packed);
+	packed_idx = NULL;
+	packed_pos = NULL;
+	memset(&widths, 0, sizeof(widths));
+	bucket = bucket_layout();
+
+	shm.detach();
 } // ~Index::clear
\ No newline at end of file
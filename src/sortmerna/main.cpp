@@ -37,9 +37,10 @@
 #include "output.hpp"
 #include "readstats.hpp"
 #include "cmd.hpp"
+#include "runcontext.hpp"
 
 // forward
-void postProcess(Runopts & opts, Readstats & readstats, Output & output); // processor.cpp
+void postProcess(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx); // processor.cpp
 
 /*! @fn main()
 	@brief main function, parses command line arguments and launches the processing
@@ -58,30 +59,37 @@ int main(int argc, char** argv)
 		CmdSession cmd;
 		cmd.run(opts);
 	}
+	else if (opts.stream)
+	{
+		Readstats readstats(opts);
+		Output output(opts, readstats);
+		alignStream(opts, readstats, output);
+	}
 	else
 	{
 		Readstats readstats(opts);
 		Output output(opts, readstats);
+		RunContext ctx(opts, readstats); // shared by the tasks
 
 		switch (opts.alirep)
 		{
 		case Runopts::ALIGN_REPORT::align:
-			align(opts, readstats, output);
+			align(opts, readstats, output, ctx);
 			break;
 		case Runopts::ALIGN_REPORT::postproc:
-			postProcess(opts, readstats, output);
+			postProcess(opts, readstats, output, ctx);
 			break;
 		case Runopts::ALIGN_REPORT::report:
-			generateReports(opts, readstats, output);
+			generateReports(opts, readstats, output, ctx);
 			break;
 		case Runopts::ALIGN_REPORT::alipost:
-			align(opts, readstats, output);
-			postProcess(opts, readstats, output);
+			align(opts, readstats, output, ctx);
+			postProcess(opts, readstats, output, ctx);
 			break;
 		case Runopts::ALIGN_REPORT::all:
-			align(opts, readstats, output);
-			postProcess(opts, readstats, output);
-			generateReports(opts, readstats, output);
+			align(opts, readstats, output, ctx);
+			postProcess(opts, readstats, output, ctx);
+			generateReports(opts, readstats, output, ctx);
 			break;
 		}
 	}
@@ -53,6 +53,19 @@ void Runopts::optReads(char **argv, int &narg)
 			"must be given after the option --reads\n", RED, COLOFF);
 		exit(EXIT_FAILURE);
 	}
+	else if (strcmp(argv[narg + 1], "-") == 0)
+	{
+		// the reads are piped on stdin. Only the first Reads file (R1) can be stdin
+		if (!readsfile.empty())
+		{
+			fprintf(stderr, "\n  %sERROR%s: only the first reads file can be read from stdin '-'\n", RED, COLOFF);
+			exit(EXIT_FAILURE);
+		}
+		readsfile = argv[narg + 1];
+		stream = true;
+		narg += 2;
+		have_reads = true;
+	}
 	else
 	{
 		// check the file exists
@@ -69,7 +82,16 @@ void Runopts::optReads(char **argv, int &narg)
 			// reset file pointer to start of file
 			fseek(file, 0, SEEK_SET);
 
-			readsfile = argv[narg + 1];
+			if (readsfile.empty())
+				readsfile = argv[narg + 1];
+			else if (readsfile_r2.empty())
+				readsfile_r2 = argv[narg + 1]; // paired-end reads in two files: the second file holds the mates (R2)
+			else
+			{
+				fprintf(stderr, "\n  %sERROR%s: option --reads can be given at most twice (paired-end reads "
+					"in two files)\n", RED, COLOFF);
+				exit(EXIT_FAILURE);
+			}
 			narg += 2;
 			fclose(file);
 
@@ -98,6 +120,19 @@ void Runopts::optReadsGz(char **argv, int &narg)
 			"must be given after the option --reads-gz\n", RED, COLOFF);
 		exit(EXIT_FAILURE);
 	}
+	else if (strcmp(argv[narg + 1], "-") == 0)
+	{
+		// the reads are piped on stdin. Only the first Reads file (R1) can be stdin
+		if (!readsfile.empty())
+		{
+			fprintf(stderr, "\n  %sERROR%s: only the first reads file can be read from stdin '-'\n", RED, COLOFF);
+			exit(EXIT_FAILURE);
+		}
+		readsfile = argv[narg + 1];
+		stream = true;
+		narg += 2;
+		have_reads_gz = true;
+	}
 	else
 	{
 		// check the file exists
@@ -114,7 +149,16 @@ void Runopts::optReadsGz(char **argv, int &narg)
 			// reset file pointer to start of file
 			gzseek(file, 0, SEEK_SET);
 
-			readsfile = argv[narg + 1];
+			if (readsfile.empty())
+				readsfile = argv[narg + 1];
+			else if (readsfile_r2.empty())
+				readsfile_r2 = argv[narg + 1]; // paired-end reads in two files: the second file holds the mates (R2)
+			else
+			{
+				fprintf(stderr, "\n  %sERROR%s: option --reads-gz can be given at most twice (paired-end reads "
+					"in two files)\n", RED, COLOFF);
+				exit(EXIT_FAILURE);
+			}
 			narg += 2;
 			gzclose(file);
 
@@ -246,7 +290,8 @@ void Runopts::optRef(char **argv, int &narg)
 
 void Runopts::optAligned(char **argv, int &narg)
 {
-	if ((argv[narg + 1] == NULL) || (argv[narg + 1][0] == '-'))
+	// '-' is stdout
+	if ((argv[narg + 1] == NULL) || (argv[narg + 1][0] == '-' && argv[narg + 1][1] != '\0'))
 	{
 		fprintf(stderr, "\n  %sERROR%s: a filename must follow the option --aligned [STRING]\n", RED, COLOFF);
 		exit(EXIT_FAILURE);
@@ -284,7 +329,8 @@ void Runopts::optAligned(char **argv, int &narg)
 
 void Runopts::optOther(char **argv, int &narg)
 {
-	if ((argv[narg + 1] == NULL) || (argv[narg + 1][0] == '-'))
+	// '-' is stdout
+	if ((argv[narg + 1] == NULL) || (argv[narg + 1][0] == '-' && argv[narg + 1][1] != '\0'))
 	{
 		fprintf(stderr, "\n  %sERROR%s: a filename must follow the option "
 			"--other [STRING]\n", RED, COLOFF);
@@ -845,6 +891,70 @@ void Runopts::optSQ(char **argv, int &narg)
 	}
 } // ~Runopts::optSQ
 
+void Runopts::optReadStore(char **argv, int &narg)
+{
+	if (read_store)
+	{
+		fprintf(stderr, "\n  %sERROR%s: BOOL --read_store has been set twice, please verify "
+			"your choice.\n\n", RED, COLOFF);
+		exit(EXIT_FAILURE);
+	}
+	else
+	{
+		read_store = true;
+		narg++;
+	}
+} // ~Runopts::optReadStore
+
+void Runopts::optPrefetchMem(char **argv, int &narg)
+{
+	if (argv[narg + 1] == NULL)
+	{
+		fprintf(stderr, "\n  %sERROR%s: --prefetch_mem [INT] requires a non-negative integer "
+			"as input (ex. --prefetch_mem 8192)\n", RED, COLOFF);
+		exit(EXIT_FAILURE);
+	}
+	// set the memory for prefetching the index parts
+	if (prefetch_mem < 0)
+	{
+		char* end = 0;
+		prefetch_mem = strtoll(argv[narg + 1], &end, 10); // convert to integer
+		if (prefetch_mem < 0 || *end != '\0')
+		{
+			fprintf(stderr, "\n  %sERROR%s: --prefetch_mem [INT] requires a non-negative "
+				"integer (>=0) as input (ex. --prefetch_mem 8192)\n", RED, COLOFF);
+			exit(EXIT_FAILURE);
+		}
+		narg += 2;
+	}
+	else
+	{
+		fprintf(stderr, "\n  %sERROR%s: --prefetch_mem [INT] has been set twice, please "
+			"verify your choice\n\n", RED, COLOFF);
+		printlist();
+		exit(EXIT_FAILURE);
+	}
+} // ~Runopts::optPrefetchMem
+
+void Runopts::optShm(char **argv, int &narg)
+{
+#if defined(_WIN32)
+	fprintf(stderr, "\n  %sERROR%s: --shm (POSIX shared memory) is not supported on Windows.\n\n", RED, COLOFF);
+	exit(EXIT_FAILURE);
+#endif
+	if (shm)
+	{
+		fprintf(stderr, "\n  %sERROR%s: BOOL --shm has been set twice, please verify "
+			"your choice.\n\n", RED, COLOFF);
+		exit(EXIT_FAILURE);
+	}
+	else
+	{
+		shm = true;
+		narg++;
+	}
+} // ~Runopts::optShm
+
 void Runopts::optPasses(char **argv, int &narg)
 {
 	if (passes_set)
@@ -1153,6 +1263,23 @@ void Runopts::opt_threads_rep(char **argv, int &narg)
 	narg += 2;
 } // ~Runopts::opt_threads_rep
 
+void Runopts::opt_threads_gz(char **argv, int &narg)
+{
+	std::stringstream ss;
+
+	if (argv[narg + 1] == NULL)
+	{
+		ss << "\n  " << RED << "ERROR" << COLOFF
+			<< ": --thgz [INT] requires an integer for number of "
+			<< "threads inflating BGZF compressed reads (ex. --thgz 4)" << std::endl;
+		std::cerr << ss.str(); ss.str("");
+		exit(EXIT_FAILURE);
+	}
+
+	num_inflate_thread = std::stoi(argv[narg + 1]);
+	narg += 2;
+} // ~Runopts::opt_threads_gz
+
   // Required parameter
 void Runopts::opt_d_KeyValDatabase(char **argv, int &narg)
 {
@@ -1361,6 +1488,12 @@ void Runopts::process(int argc, char**argv, bool dryrun)
 			else if (strcmp(opt, "full_search") == 0) optFullSearch(argv, narg);
 			// do not output SQ tags in the SAM file
 			else if (strcmp(opt, "SQ") == 0) optSQ(argv, narg);
+			// parse the reads once into a binary read store used by all passes
+			else if (strcmp(opt, "read_store") == 0) optReadStore(argv, narg);
+			// memory for loading the next index part while the current one is searched
+			else if (strcmp(opt, "prefetch_mem") == 0) optPrefetchMem(argv, narg);
+			// share the loaded index parts between processes
+			else if (strcmp(opt, "shm") == 0) optShm(argv, narg);
 			else if (strcmp(opt, "passes") == 0) optPasses(argv, narg); // --passes
 			else if (strcmp(opt, "id") == 0) optId(argv, narg);
 			else if (strcmp(opt, "coverage") == 0) optCoverage(argv, narg);
@@ -1371,6 +1504,7 @@ void Runopts::process(int argc, char**argv, bool dryrun)
 			else if (strcmp(opt, "threads") == 0) opt_threads(argv, narg); // '--threads 1:1:8' num alignment threads
 			else if (strcmp(opt, "thpp") == 0) opt_threads_pp(argv, narg); // '--thpp 1:1' num post-proc threads
 			else if (strcmp(opt, "threp") == 0) opt_threads_rep(argv, narg); // '--threp 1:1' num report threads
+			else if (strcmp(opt, "thgz") == 0) opt_threads_gz(argv, narg); // '--thgz 4' num BGZF inflate threads
 			else if (strcmp(opt, "dbg_put_db") == 0) opt_debug_put_kvdb(narg); // '--dbg_put_db'
 			else optUnknown(argv, narg, opt);
 		}
@@ -1387,8 +1521,18 @@ void Runopts::process(int argc, char**argv, bool dryrun)
 		}//~switch
 	}//~while ( narg < argc )
 
+	// the reads are piped on stdin: buffered (not synchronized with C stdio) streams.
+	// Has to precede the redirect below as it resets the standard stream buffers
+	if (stream)
+		std::ios_base::sync_with_stdio(false);
+
+	// FASTA/FASTQ reads go to stdout: keep it clean of the log messages
+	if (filetype_ar == "-" || filetype_or == "-")
+		std::cout.rdbuf(std::cerr.rdbuf());
+
 	// validate the options
-	test_kvdb_path();
+	if (!stream)
+		test_kvdb_path(); // the reads from stdin are aligned without the Key-value DB
 
 	 // ERROR messages ******* 
 	 // Reads file is mandatory
@@ -1439,6 +1583,34 @@ void Runopts::process(int argc, char**argv, bool dryrun)
 		}
 	}
 
+	// The reads from stdin are aligned, post-processed and reported in a single pass
+	if (stream && (alirep != ALIGN_REPORT::all || read_store || interactive))
+	{
+		fprintf(stderr, "\n  %sERROR%s: [Line %d: %s] options --task, --read_store and --cmd cannot be used "
+			"with the reads from stdin '-'.\n\n", RED, COLOFF, __LINE__, __FILE__);
+		exit(EXIT_FAILURE);
+	}
+
+	// stdout '-' only takes the FASTA/FASTQ reads
+	if (filetype_ar == "-" && filetype_or == "-")
+	{
+		fprintf(stderr, "\n  %sERROR%s: [Line %d: %s] only one of --aligned and --other can be "
+			"stdout '-'.\n\n", RED, COLOFF, __LINE__, __FILE__);
+		exit(EXIT_FAILURE);
+	}
+	if ((filetype_ar == "-" || filetype_or == "-") && !fastxout)
+	{
+		fprintf(stderr, "\n  %sERROR%s: [Line %d: %s] stdout '-' can only be used together "
+			"with the --fastx option.\n\n", RED, COLOFF, __LINE__, __FILE__);
+		exit(EXIT_FAILURE);
+	}
+	if (filetype_ar == "-" && (samout || blastout || otumapout || de_novo_otu || doLog))
+	{
+		fprintf(stderr, "\n  %sERROR%s: [Line %d: %s] options --sam, --blast, --otu_map, --de_novo_otu and --log "
+			"need a file name: they cannot be used with --aligned '-'.\n\n", RED, COLOFF, __LINE__, __FILE__);
+		exit(EXIT_FAILURE);
+	}
+
 	// An OTU map can only be constructed with the single best alignment per read
 	if (otumapout && num_alignments_set)
 	{
@@ -1587,6 +1759,23 @@ void Runopts::process(int argc, char**argv, bool dryrun)
 	}
 } // ~Runopts::process
 
+/*
+ * Smith-Waterman scoring matrix for genome sequences. Depends on the options only, so it is built once per run
+ * and shared (read only) by all the Reads and threads
+ */
+void Runopts::initScoringMatrix()
+{
+	scoring_matrix.clear();
+	for (int l = 0; l < 4; ++l)
+	{
+		for (int m = 0; m < 4; ++m)
+			scoring_matrix.push_back(static_cast<int8_t>(l == m ? match : mismatch)); // weight_match : weight_mismatch (must be negative)
+		scoring_matrix.push_back(static_cast<int8_t>(score_N)); // ambiguous base
+	}
+	for (int m = 0; m < 5; ++m)
+		scoring_matrix.push_back(static_cast<int8_t>(score_N)); // ambiguous base
+} // ~Runopts::initScoringMatrix
+
 
 
 
@@ -1654,23 +1843,30 @@ void printlist()
 		<<                       "  STRING       "                                                                            << COLOFF
 		<<                                       "   FASTA/FASTQ raw reads file                                "              << GREEN 
 		<<                                                                                                     "mandatory"    << COLOFF << std::endl
+		<< "                                         Given twice for paired-end reads in two files (R1, R2)"                 << std::endl
+		<< "                                         '-' reads from stdin: all the index parts are searched in a"            << std::endl
+		<< "                                         single pass and the E-value is computed per read"                       << std::endl
 #ifdef HAVE_LIBZ
 		<< "        OR"                                                                                                       << std::endl << BOLD                                                                                                    
 		<< "    --reads-gz       "                                                                                            << COLOFF << UNDL
 		<<                       "  STRING       "                                                                            << COLOFF
 		<<                                       "   FASTA/FASTQ compressed (with gzip) reads file             "              << GREEN 
-		<<                                                                                                     "mandatory"    << COLOFF << std::endl << BOLD
+		<<                                                                                                     "mandatory"    << COLOFF << std::endl
+		<< "                                         Given twice for paired-end reads in two files (R1, R2)"                 << std::endl << BOLD
 #endif
 		<< "    --aligned        "                                                                                            << COLOFF << UNDL
 		<<                       "  STRING       "                                                                            << COLOFF
 		<<                                       "   aligned reads filepath + base file name                   "              << GREEN 
 		<<                                                                                                     "mandatory"    << COLOFF << std::endl
-		<< "                                         (appropriate extension will be added)"                                   << std::endl << std::endl
+		<< "                                         (appropriate extension will be added)"                                   << std::endl
+		<< "                                         '-' writes the FASTA/FASTQ reads to stdout, a named pipe"               << std::endl
+		<< "                                         (FIFO) is written as is"                                                 << std::endl << std::endl
 		<< "  [COMMON OPTIONS]: "                                                                                             << std::endl << BOLD
 		<< "    --other         "                                                                                             << COLOFF << UNDL
 		<<                      "  STRING        "                                                                            << COLOFF
 		<<                                       "   rejected reads filepath + base file name                  "              << std::endl
-		<< "                                         (appropriate extension will be added)                     "              << std::endl << BOLD
+		<< "                                         (appropriate extension will be added)                     "              << std::endl
+		<< "                                         '-' and a named pipe (FIFO) as for --aligned"                            << std::endl << BOLD
 		<< "    --fastx         "                                                                                             << COLOFF << UNDL
 		<<                      "  BOOL          "                                                                            << COLOFF
 		<<                                       "   output FASTA/FASTQ file                                   "              << UNDL 
@@ -1734,12 +1930,12 @@ void printlist()
 		<<                      "  BOOL          "                                                                            << COLOFF
 		<<                                       "   both paired-end reads go in --aligned fasta/q file        "              << UNDL 
 		<<                                                                                                     "off"          << COLOFF << std::endl
-		<< "                                        (interleaved reads only, see Section 4.2.4 of User Manual)"               << std::endl << BOLD
+		<< "                                        (interleaved reads or two reads files, see Section 4.2.4 of User Manual)" << std::endl << BOLD
 		<< "    --paired_out    "                                                                                             << COLOFF << UNDL
 		<<                      "   BOOL         "                                                                            << COLOFF
 		<<                                       "   both paired-end reads go in --other fasta/q file          "              << UNDL 
 		<<                                                                                                     "off"          << COLOFF << std::endl
-		<< "                                       (interleaved reads only, see Section 4.2.4 of User Manual)"                << std::endl << BOLD
+		<< "                                       (interleaved reads or two reads files, see Section 4.2.4 of User Manual)"  << std::endl << BOLD
 		<< "    --match         "                                                                                             << COLOFF << UNDL
 		<<                      "  INT           "                                                                            << COLOFF
 		<<                                       "   SW score (positive integer) for a match                   "              << UNDL 
@@ -1821,6 +2017,27 @@ void printlist()
 		<< "                                         matches in the index rather than stopping"                               << std::endl
 		<< "                                         after finding a 0-error match (<1%% gain in"                             << std::endl
 		<< "                                         sensitivity with up four-fold decrease in speed)"                        << std::endl << BOLD
+		<< "    --read_store    "                                                                                             << COLOFF << UNDL 
+		<<                      "  BOOL          "                                                                            << COLOFF
+		<<                                       "   parse the reads file once into a binary read store        "              << UNDL 
+		<<                                                                                                     "off"          << COLOFF << std::endl
+		<< "                                         (KVDB folder) and stream all the subsequent passes"                      << std::endl
+		<< "                                         (index parts, post-processing, reports) from it"                         << std::endl << BOLD
+		<< "    --prefetch_mem  "                                                                                             << COLOFF << UNDL 
+		<<                      "  INT           "                                                                            << COLOFF
+		<<                                       "   memory (Mbytes) for holding the searched index part and   "              << UNDL 
+		<<                                                                                                     "RAM/2"        << COLOFF << std::endl
+		<< "                                         the next one, loaded in the background. The next part"                   << std::endl
+		<< "                                         is only prefetched if both fit (0 - no prefetching)."                    << std::endl
+		<< "                                         With --task 3, 4 it also bounds the references kept"                     << std::endl
+		<< "                                         for the post-processing and the reports"                                 << std::endl << BOLD
+		<< "    --shm           "                                                                                             << COLOFF << UNDL 
+		<<                      "  BOOL          "                                                                            << COLOFF
+		<<                                       "   share the index parts and references between concurrent   "              << UNDL 
+		<<                                                                                                     "off"          << COLOFF << std::endl
+		<< "                                         runs: the first run publishes each part into POSIX shared"               << std::endl
+		<< "                                         memory, the later runs map it read-only instead of loading"              << std::endl
+		<< "                                         (the segments /smr_* stay until removed or the index changes)"           << std::endl << BOLD
 		<< "    --pid           "                                                                                             << COLOFF << UNDL 
 		<<                      "  BOOL          "                                                                            << COLOFF
 		<<                                       "   add pid to output file names                              "              << UNDL 
@@ -1863,7 +2080,11 @@ void printlist()
 		<< "    --threp         "                                                                                             << COLOFF << UNDL
 		<<                      "  INT:INT:INT   "                                                                            << COLOFF
 		<<                                       "   number of Report Read:Process threads to use              "              << UNDL
-		<<                                                                                                     "1:1"          << COLOFF << std::endl << std::endl;
+		<<                                                                                                     "1:1"          << COLOFF << std::endl << BOLD
+		<< "    --thgz          "                                                                                             << COLOFF << UNDL
+		<<                      "  INT           "                                                                            << COLOFF
+		<<                                       "   number of threads inflating BGZF compressed reads         "              << UNDL
+		<<                                                                                                     "<=4"          << COLOFF << std::endl << std::endl;
 		
 	std::cout << ss.str();
 }//~printlist()
\ No newline at end of file
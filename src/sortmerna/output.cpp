@@ -31,6 +31,7 @@
 *               Rob Knight, robknight@ucsd.edu
 */
 #include "unistd.h"
+#include <sys/stat.h>
 #include <iomanip>
 #include <fstream>
 #include <cmath> // log, exp
@@ -47,11 +48,28 @@
 #include "read.hpp"
 #include "options.hpp"
 #include "refstats.hpp"
+#include "runcontext.hpp"
 
 
 // forward
 void reportsJob(std::vector<Read> & reads, Runopts & opts, References & refs, Refstats & refstats, Output & output); // callback
 
+/*
+ * The FASTA/FASTQ output path is stdout '-' or a named pipe (FIFO). The reads are streamed to it as is:
+ * no suffix is added, the paired reads go to it interleaved, and it is not truncated on init
+ * (opening and closing a FIFO would signal the end of stream to the consumer).
+ */
+static bool isPipe(std::string & path)
+{
+	if (path == "-")
+	{
+		path = "/dev/stdout";
+		return true;
+	}
+	struct stat info;
+	return stat(path.data(), &info) == 0 && S_ISFIFO(info.st_mode);
+}
+
 void Output::init(Runopts & opts, Readstats & readstats)
 {
 	// attach pid to output files
@@ -68,16 +86,27 @@ void Output::init(Runopts & opts, Readstats & readstats)
 		{
 			// fasta/fastq output
 			fastaOutFile = opts.filetype_ar;
-			if (opts.pid)
+			if (!isPipe(fastaOutFile))
 			{
-				fastaOutFile.append("_");
-				fastaOutFile.append(pidStr.str());
-			}
-			fastaOutFile.append(".");
-			fastaOutFile.append(readstats.suffix);
+				if (opts.pid)
+				{
+					fastaOutFile.append("_");
+					fastaOutFile.append(pidStr.str());
+				}
+				if (!opts.readsfile_r2.empty())
+				{
+					// paired-end reads in two files: the mates go to '_fwd' and '_rev' files
+					fastaOutFile_rev = fastaOutFile + "_rev." + readstats.suffix;
+					fastaOutFile.append("_fwd");
+					fastaout_rev.open(fastaOutFile_rev);
+					fastaout_rev.close();
+				}
+				fastaOutFile.append(".");
+				fastaOutFile.append(readstats.suffix);
 
-			fastaout.open(fastaOutFile);
-			fastaout.close();
+				fastaout.open(fastaOutFile);
+				fastaout.close();
+			}
 		}
 
 		if (opts.samout)
@@ -172,17 +201,27 @@ void Output::init(Runopts & opts, Readstats & readstats)
 		{
 			// output stream for other reads
 			std::ofstream fastaNonAlignOut;
-			// add suffix database name to accepted reads file
-			if (opts.pid)
+			if (!isPipe(opts.filetype_or))
 			{
-				opts.filetype_or += "_";
-				opts.filetype_or += pidStr.str();
+				// add suffix database name to accepted reads file
+				if (opts.pid)
+				{
+					opts.filetype_or += "_";
+					opts.filetype_or += pidStr.str();
+				}
+				if (!opts.readsfile_r2.empty())
+				{
+					otherFile_rev = opts.filetype_or + "_rev." + readstats.suffix;
+					opts.filetype_or += "_fwd";
+					fastaNonAlignOut.open(otherFile_rev);
+					fastaNonAlignOut.close();
+				}
+				opts.filetype_or += ".";
+				opts.filetype_or += readstats.suffix;
+				// create the other reads file
+				fastaNonAlignOut.open(opts.filetype_or);
+				fastaNonAlignOut.close();
 			}
-			opts.filetype_or += ".";
-			opts.filetype_or += readstats.suffix;
-			// create the other reads file
-			fastaNonAlignOut.open(opts.filetype_or);
-			fastaNonAlignOut.close();
 		}
 	}
 } // ~Output::init
@@ -219,12 +258,9 @@ void Output::report_blast
 			uint32_t bitscore = (uint32_t)((float)((refstats.gumbel[refs.num].first)
 				* (read.hits_align_info.alignv[i].score1) - std::log(refstats.gumbel[refs.num].second)) / (float)std::log(2));
 
-			double evalue_score = (double)refstats.gumbel[refs.num].second
-				* refstats.full_ref[refs.num]
-				* refstats.full_read[refs.num]
-				* std::exp(-refstats.gumbel[refs.num].first * read.hits_align_info.alignv[i].score1);
+			double evalue_score = refstats.getEvalue(refs.num, read.sequence.size(), read.hits_align_info.alignv[i].score1);
 
-			std::string refseq = refs.buffer[read.hits_align_info.alignv[i].ref_seq].sequence;
+			const char* refseq = refs.buffer[read.hits_align_info.alignv[i].ref_seq].getSeq();
 			std::string ref_id = refs.buffer[read.hits_align_info.alignv[i].ref_seq].id;
 
 			if (read.hits_align_info.alignv[i].strand)
@@ -457,38 +493,24 @@ void Output::report_blast
 } // ~ Output::report_blast
 
 
-void Output::writeSamHeader(Runopts & opts)
+void Output::writeSamHeader(Runopts & opts, Refstats & refstats)
 {
 	samout << "@HD\tVN:1.0\tSO:unsorted\n";
 
-	// TODO: this line is taken from "Index::load_stats". To be finished (20171215).
-#if 0
-	for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); index_num++)
+	// @SQ line of each reference sequence, from the catalog of each index
+	if (opts.yes_SQ)
 	{
-		//@SQ header
-		if (opts.yes_SQ) acceptedsam << "@SQ\tSN:" << s << "\tLN:" << len_seq << "\n";
-		// number of nucleotide sequences in the reference file
-		uint32_t num_sq = 0;
-		stats.read(reinterpret_cast<char*>(&num_sq), sizeof(uint32_t));
-
-		// loop through each @SQ
-		for (uint32_t j = 0; j < num_sq; j++)
+		for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); index_num++)
 		{
-			// length of the sequence id
-			uint32_t len_id = 0;
-			stats.read(reinterpret_cast<char*>(&len_id), sizeof(uint32_t));
-			// the sequence id string
-			std::string s(len_id + 1, 0); // AK
-			std::vector<char> vs(s.begin(), s.end());
-			stats.read(reinterpret_cast<char*>(&vs[0]), sizeof(char)*len_id);
-			// the length of the sequence itself
-			uint32_t len_seq = 0;
-			stats.read(reinterpret_cast<char*>(&len_seq), sizeof(uint32_t));
-			//		 @SQ header
-			if (opts.yes_SQ) acceptedsam << "@SQ\tSN:" << s << "\tLN:" << len_seq << "\n";
-		} // ~for
-	} // ~for
-#endif
+			RefCatalog & catalog = refstats.catalogs[index_num];
+			for (size_t i = 0; i < catalog.size(); ++i)
+			{
+				const ref_catalog_rec & rec = catalog.at(i);
+				samout << "@SQ\tSN:" << catalog.getId(rec) << "\tLN:" << rec.seq_len << "\n";
+			}
+		}
+	}
+
 	samout << "@PG\tID:sortmerna\tVN:1.0\tCL:" << opts.cmdline << std::endl;
 
 } // ~Output::writeSamHeader
@@ -608,12 +630,8 @@ void Output::report_fasta(Runopts & opts, std::vector<Read> & reads)
 				// output aligned read
 				if (opts.fastxout)
 				{
-					for (Read read: reads)
-					{
-						fastaout << read.header << std::endl << read.sequence << std::endl;
-						if (read.format == Format::FASTQ)
-							fastaout << '+' << std::endl << read.quality << std::endl;
-					}
+					for (Read & read: reads)
+						writeFastx(fastaout, fastaout_rev, read);
 				}
 			}//~the read was accepted
 		}//~if paired-in or paired-out
@@ -624,11 +642,7 @@ void Output::report_fasta(Runopts & opts, std::vector<Read> & reads)
 			{
 				// output aligned read
 				if (opts.fastxout)
-				{
-					fastaout << reads[0].header << std::endl << reads[0].sequence << std::endl;
-					if (reads[0].format == Format::FASTQ)
-						fastaout << '+' << std::endl << reads[0].quality << std::endl;
-				}
+					writeFastx(fastaout, fastaout_rev, reads[0]);
 			} //~if read was accepted
 		}//~if not paired-in or paired-out
 	}//~if ( ptr_filetype_ar != NULL )
@@ -643,27 +657,31 @@ void Output::report_fasta(Runopts & opts, std::vector<Read> & reads)
 			if ((!reads[0].hit && !reads[1].hit) ||
 				((reads[0].hit ^ reads[1].hit) && opts.pairedout))
 			{
-				for (Read read : reads)
-				{
-					fastaNonAlignOut << read.header << std::endl << read.sequence << std::endl;
-					if (read.format == Format::FASTQ)
-						fastaNonAlignOut << '+' << std::endl << read.quality << std::endl;
-				}
+				for (Read & read : reads)
+					writeFastx(fastaNonAlignOut, fastaNonAlignOut_rev, read);
 			}//~the read was accepted
 		}//~if (pairedin_gv || pairedout_gv)
 		else // output reads single
 		{
 			// the read was accepted
 			if (!reads[0].hit)
-			{
-				fastaNonAlignOut << reads[0].header << std::endl << reads[0].sequence << std::endl;
-				if (reads[0].format == Format::FASTQ)
-					fastaNonAlignOut << '+' << std::endl << reads[0].quality << std::endl;
-			}
+				writeFastx(fastaNonAlignOut, fastaNonAlignOut_rev, reads[0]);
 		} // ~ if (!(pairedin_gv || pairedout_gv))
 	} //~if ( opts.fastxout )  
 } // ~Output::report_fasta
 
+/*
+ * Write the read in FASTA/FASTQ format. For the paired-end reads in two files ('strm_rev' is open)
+ * the mates (odd read IDs) go to 'strm_rev'
+ */
+void Output::writeFastx(std::ofstream & strm, std::ofstream & strm_rev, Read & read)
+{
+	std::ofstream & out = strm_rev.is_open() && read.id % 2 == 1 ? strm_rev : strm;
+	out << read.header << std::endl << read.sequence << std::endl;
+	if (read.format == Format::FASTQ)
+		out << '+' << std::endl << read.quality << std::endl;
+} // ~Output::writeFastx
+
 void Output::report_denovo(Runopts & opts, std::vector<Read> & reads)
 {
 	std::stringstream ss;
@@ -753,6 +771,16 @@ void Output::openfiles(Runopts & opts)
 		}
 	}
 
+	if (opts.fastxout && fastaOutFile_rev.size() != 0 && !fastaout_rev.is_open()) {
+		fastaout_rev.open(fastaOutFile_rev, std::ios::app | std::ios::binary);
+		if (!fastaout_rev.good())
+		{
+			ss << "  " << RED << "ERROR" << COLOFF << ": could not open FASTA/Q output file " << fastaOutFile_rev << " for writing.\n";
+			std::cerr << ss.str(); ss.str("");
+			exit(EXIT_FAILURE);
+		}
+	}
+
 	if (opts.fastxout && opts.filetype_or.size() != 0 && !fastaNonAlignOut.is_open())
 	{
 		fastaNonAlignOut.open(opts.filetype_or, std::ios::app | std::ios::binary);
@@ -764,6 +792,17 @@ void Output::openfiles(Runopts & opts)
 		}
 	}
 
+	if (opts.fastxout && otherFile_rev.size() != 0 && !fastaNonAlignOut_rev.is_open())
+	{
+		fastaNonAlignOut_rev.open(otherFile_rev, std::ios::app | std::ios::binary);
+		if (!fastaNonAlignOut_rev.good())
+		{
+			ss << "  " << RED << "ERROR" << COLOFF << ": could not open FASTA/Q Non-aligned output file " << otherFile_rev << " for writing." << std::endl;
+			std::cerr << ss.str(); ss.str("");
+			exit(EXIT_FAILURE);
+		}
+	}
+
 	if (denovo_otus_file.size() != 0 && !denovoreads.is_open())
 	{
 		denovoreads.open(denovo_otus_file, std::ios::app | std::ios::binary);
@@ -795,13 +834,15 @@ void Output::closefiles()
 	if (samout.is_open()) { samout.flush(); samout.close(); }
 	if (fastaout.is_open()) { fastaout.flush(); fastaout.close(); }
 	if (fastaNonAlignOut.is_open()) { fastaNonAlignOut.flush(); fastaNonAlignOut.close(); }
+	if (fastaout_rev.is_open()) { fastaout_rev.flush(); fastaout_rev.close(); }
+	if (fastaNonAlignOut_rev.is_open()) { fastaNonAlignOut_rev.flush(); fastaNonAlignOut_rev.close(); }
 	if (denovoreads.is_open()) { denovoreads.flush(); denovoreads.close(); }
 
 	std::cout << "Output.closefiles called. Flushed and closed" << std::endl;
 }
 
 // called from main. TODO: move into a class?
-void generateReports(Runopts & opts, Readstats & readstats, Output & output)
+void generateReports(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx)
 {
 	int N_READ_THREADS = opts.num_read_thread_rep;
 	int N_PROC_THREADS = opts.num_proc_thread_rep;
@@ -812,7 +853,7 @@ void generateReports(Runopts & opts, Readstats & readstats, Output & output)
 	std::cout << ss.str(); ss.str("");
 
 	ThreadPool tpool(N_READ_THREADS + N_PROC_THREADS);
-	KeyValueDatabase kvdb(opts.kvdbPath);
+	KeyValueDatabase & kvdb = ctx.getKvdb();
 	bool indb = readstats.restoreFromDb(kvdb);
 
 	if (indb) {
@@ -822,11 +863,10 @@ void generateReports(Runopts & opts, Readstats & readstats, Output & output)
 
 	ReadsQueue readQueue("read_queue", opts.queue_size_max, N_READ_THREADS); // shared: Processor pops, Reader pushes
 	ReadsQueue writeQueue("write_queue", opts.queue_size_max, N_PROC_THREADS); // Not used for Reports
-	Refstats refstats(opts, readstats);
-	References refs;
+	Refstats & refstats = ctx.getRefstats();
 
 	output.openfiles(opts);
-	if (opts.samout) output.writeSamHeader(opts);
+	if (opts.samout) output.writeSamHeader(opts, refstats);
 
 	// loop through every reference file passed to option --ref (ex. SSU 16S and SSU 18S)
 	for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
@@ -838,7 +878,7 @@ void generateReports(Runopts & opts, Readstats & readstats, Output & output)
 				<< index_num << " part " << idx_part+1 << "/" << refstats.num_index_parts[index_num] << "  ... ";
 			std::cout << ss.str(); ss.str("");
 			auto starts = std::chrono::high_resolution_clock::now();
-			refs.load(index_num, idx_part, opts, refstats);
+			References & refs = ctx.getRefs(index_num, idx_part);
 			std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - starts; // ~20 sec Debug/Win
 			ss << "done [" << std::setprecision(2) << std::fixed << elapsed.count() << " sec]" << std::endl;
 			std::cout << ss.str(); ss.str("");
@@ -847,7 +887,7 @@ void generateReports(Runopts & opts, Readstats & readstats, Output & output)
 
 			for (int i = 0; i < N_READ_THREADS; ++i)
 			{
-				tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, loopCount));
+				tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, readstats, loopCount, i, N_READ_THREADS));
 			}
 
 			// add processor jobs
@@ -857,7 +897,7 @@ void generateReports(Runopts & opts, Readstats & readstats, Output & output)
 			}
 			++loopCount;
 			tpool.waitAll(); // wait till processing is done on one index part
-			refs.clear();
+			ctx.releaseRefs(index_num, idx_part);
 			writeQueue.reset(N_PROC_THREADS);
 			readQueue.reset(N_READ_THREADS);
 
@@ -34,6 +34,8 @@
 #include <algorithm>
 #include <locale>
 #include <iomanip> // output formatting
+#include <mutex>
+#include <thread>
 
 #include "paralleltraversal.hpp"
 #include "kseq.h"
@@ -54,6 +56,7 @@
 #include "reader.hpp"
 #include "writer.hpp"
 #include "output.hpp"
+#include "runcontext.hpp"
 
 
 #if defined(_WIN32)
@@ -64,6 +67,7 @@
 
 // forward
 int clear_dir(std::string dpath);
+void writeLog(Runopts & opts, Readstats & readstats, Output & output); // processor.cpp
 
  // see "heuristic 1" below
  //#define HEURISTIC1_OFF
@@ -96,6 +100,7 @@ void alignmentCb
 		Readstats & readstats, 
 		Refstats & refstats, 
 		Read & read,
+		hit_buffers & hits,
 		bool isLastStrand
 	)
 {
@@ -144,12 +149,13 @@ void alignmentCb
 	uint32_t windowshift = opts.skiplengths[index.index_num][0];
 	// keep track of windows (read positions) which have been already traversed in the burst trie
 	// initially all False
-	vector<bool> read_pos_searched(read.sequence.size());
+	vector<bool> & read_pos_searched = hits.read_pos_searched;
+	read_pos_searched.assign(read.sequence.size(), false);
 
 	uint32_t pass_n = 0; // Pass number (possible value 0,1,2)
 	uint32_t max_SW_score = read.sequence.size() *opts.match; // the maximum SW score attainable for this read
 
-	std::vector<UCHAR> bitvec; // window (prefix/suffix) bitvector
+	std::vector<UCHAR> & bitvec = hits.bitvec; // window (prefix/suffix) bitvector
 
 	// TODO: below 2 values are unique per index part. Move to index?
 	uint32_t bitvec_size = (refstats.partialwin[index.index_num] - 2) << 2; // e.g. 9 - 2 = 0000 0111 << 2 = 0001 1100 = 28
@@ -180,7 +186,8 @@ void alignmentCb
 				// subsearch 1(a), to skip subsearch 1(b)
 				bool accept_zero_kmer = false;
 				// ids for k-mers that hit the database
-				vector<id_win> id_hits; // TODO: add directly to 'id_win_hits'? - No, id_win_hits may contain hits from different index parts.
+				vector<id_win> & id_hits = hits.id_hits; // TODO: add directly to 'id_win_hits'? - No, id_win_hits may contain hits from different index parts.
+				id_hits.clear();
 
 				bitvec.resize(bitvec_size);
 				std::fill(bitvec.begin(), bitvec.end(), 0);
@@ -238,6 +245,7 @@ void alignmentCb
 						read.id,
 						win_pos,
 						refstats.partialwin[index.index_num],
+						index.bucket,
 						opts
 					);
 				} //~if exact half window exists in the burst trie
@@ -302,6 +310,7 @@ void alignmentCb
 							read.id,
 							win_pos,
 							refstats.partialwin[index.index_num], 
+							index.bucket,
 							opts);
 					}//~if exact half window exists in the reverse burst trie                    
 				}//~if (!accept_zero_kmer)
@@ -309,10 +318,7 @@ void alignmentCb
 				// associate the ids with the read window number
 				if (!id_hits.empty())
 				{
-					for (uint32_t i = 0; i < id_hits.size(); i++)
-					{
-						read.id_win_hits.push_back(id_hits[i]);
-					}
+					hits.id_win_hits.insert(hits.id_win_hits.end(), id_hits.begin(), id_hits.end());
 					read.readhit++;
 				}
 			} // ~if not read_pos_searched[win_pos]
@@ -321,7 +327,7 @@ void alignmentCb
 			if (win_num == numwin - 1)
 			{
 				compute_lis_alignment(
-					read, opts, index, refs, readstats, refstats,
+					read, hits, opts, index, refs, readstats, refstats,
 					search, // returns False if the alignment is found -> stop searching
 					max_SW_score,
 					read_to_count
@@ -362,7 +368,7 @@ void alignmentCb
 } // ~alignmentCb
 
 // called from main
-void align(Runopts & opts, Readstats & readstats, Output & output)
+void align(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx)
 {
 	std::stringstream ss;
 
@@ -392,12 +398,26 @@ void align(Runopts & opts, Readstats & readstats, Output & output)
 	std::cout << ss.str(); ss.str("");
 
 	ThreadPool tpool(numThreads);
-	KeyValueDatabase kvdb(opts.kvdbPath);
+	KeyValueDatabase & kvdb = ctx.getKvdb();
 	ReadsQueue readQueue("read_queue", opts.queue_size_max, opts.num_read_thread); // shared: Processor pops, Reader pushes
 	ReadsQueue writeQueue("write_queue", opts.queue_size_max, numProcThread); // shared: Processor pushes, Writer pops
-	Refstats refstats(opts, readstats);
-	Index index;
-	References refs;
+	Refstats & refstats = ctx.getRefstats();
+
+	// double buffer: the Processors search the index part in slot 'cur' while the
+	// next part is loaded into the other slot by the 'prefetcher' thread.
+	// The references of both parts are held by the run context
+	Index index[2];
+	int cur = 0;
+	bool is_prefetched = false; // the next part is (being) loaded into the other slot
+	std::thread prefetcher;
+
+	// every part of every index passed to option '--ref' in the search order
+	std::vector<std::pair<uint16_t, uint16_t>> parts;
+	for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
+		for (uint16_t idx_part = 0; idx_part < refstats.num_index_parts[index_num]; ++idx_part)
+			parts.push_back({ index_num, idx_part });
+
+	uint64_t mem_budget = ctx.memBudget();
 
 	int loopCount = 0; // counter of total number of processing iterations
 
@@ -405,18 +425,34 @@ void align(Runopts & opts, Readstats & readstats, Output & output)
 	auto starts = std::chrono::high_resolution_clock::now();
 	std::chrono::duration<double> elapsed;
 
-	// loop through every index passed to option '--ref'
-	for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
+	for (size_t p = 0; p < parts.size(); ++p)
 	{
-		// iterate every part of an index
-		for (uint16_t idx_part = 0; idx_part < refstats.num_index_parts[index_num]; ++idx_part)
+		uint16_t index_num = parts[p].first;
+		uint16_t idx_part = parts[p].second;
+
+		if (is_prefetched)
+		{
+			ss << __func__ << ":" << __LINE__ << " Waiting for prefetched index " << index_num
+				<< " part " << idx_part + 1 << "/" << refstats.num_index_parts[index_num] << " ... ";
+			std::cout << ss.str(); ss.str("");
+			starts = std::chrono::high_resolution_clock::now();
+
+			prefetcher.join();
+			cur = 1 - cur;
+			is_prefetched = false;
+
+			elapsed = std::chrono::high_resolution_clock::now() - starts;
+			ss << "done [" << std::setprecision(2) << std::fixed << elapsed.count() << "] sec" << std::endl;
+			std::cout << ss.str(); ss.str("");
+		}
+		else
 		{
 			ss << __func__ << ":" << __LINE__ << " Loading index " << index_num 
 				<< " part " << idx_part + 1 << "/" << refstats.num_index_parts[index_num] << " ... ";
 			std::cout << ss.str(); ss.str("");
 			starts = std::chrono::high_resolution_clock::now();
 
-			index.load(index_num, idx_part, opts, refstats);
+			index[cur].load(index_num, idx_part, opts, refstats);
 
 			elapsed = std::chrono::high_resolution_clock::now() - starts; // ~20 sec Debug/Win
 			ss << "done [" << std::setprecision(2) << std::fixed << elapsed.count() << "] sec" << std::endl;
@@ -426,44 +462,147 @@ void align(Runopts & opts, Readstats & readstats, Output & output)
 			std::cout << ss.str(); ss.str("");
 			starts = std::chrono::high_resolution_clock::now();
 
-			refs.load(index_num, idx_part, opts, refstats);
+			ctx.getRefs(index_num, idx_part);
 
-//			std::chrono::duration<double> elapsed = std::chrono::duration_cast<std::chrono::duration<double>>(std::chrono::high_resolution_clock::now() - t);
 			elapsed = std::chrono::high_resolution_clock::now() - starts; // ~20 sec Debug/Win
 			ss << "done [" << std::setprecision(2) << std::fixed << elapsed.count() << "] sec" << std::endl;
 			std::cout << ss.str(); ss.str("");
+		}
 
-			starts = std::chrono::high_resolution_clock::now();
-			for (int i = 0; i < opts.num_read_thread; i++)
+		// prefetch the next part while this one is searched, if both fit into the memory budget
+		if (p + 1 < parts.size())
+		{
+			uint16_t next_num = parts[p + 1].first;
+			uint16_t next_part = parts[p + 1].second;
+			uint64_t mem_need = ctx.partMemSize(index_num, idx_part) + ctx.partMemSize(next_num, next_part);
+			if (mem_need <= mem_budget)
 			{
-				tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, loopCount));
+				int next = 1 - cur;
+				prefetcher = std::thread([&index, &ctx, &opts, &refstats, next, next_num, next_part]() {
+					index[next].load(next_num, next_part, opts, refstats);
+					ctx.getRefs(next_num, next_part);
+				});
+				is_prefetched = true;
 			}
-
-			for (int i = 0; i < opts.num_write_thread; i++)
+			else
 			{
-				tpool.addJob(Writer("writer_" + std::to_string(i), writeQueue, kvdb, opts));
+				ss << __func__ << ":" << __LINE__ << " Not prefetching index " << next_num << " part " << next_part + 1
+					<< ": two parts need " << (mem_need >> 20) << " MB, the limit is " << (mem_budget >> 20) << " MB (--prefetch_mem)" << std::endl;
+				std::cout << ss.str(); ss.str("");
 			}
+		}
 
-			// add processor jobs
-			for (int i = 0; i < numProcThread; i++)
-			{
-				tpool.addJob(Processor("proc_" + std::to_string(i), readQueue, writeQueue, opts, index, refs, output, readstats, refstats, alignmentCb));
-			}
-			++loopCount;
+		starts = std::chrono::high_resolution_clock::now();
+		for (int i = 0; i < opts.num_read_thread; i++)
+		{
+			tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, readstats, loopCount, i, opts.num_read_thread));
+		}
 
-			tpool.waitAll(); // wait till all reads are processed against the current part
-			index.clear();
-			refs.clear();
-			writeQueue.reset(numProcThread);
-			readQueue.reset(opts.num_read_thread);
+		for (int i = 0; i < opts.num_write_thread; i++)
+		{
+			tpool.addJob(Writer("writer_" + std::to_string(i), writeQueue, kvdb, opts));
+		}
 
-			elapsed = std::chrono::high_resolution_clock::now() - starts;
-			ss << __func__ << ":" << __LINE__ << " paralleltraversal: Done index " << index_num << " Part: " << idx_part + 1 
-				<< " Time: " << std::setprecision(2) << std::fixed << elapsed.count() << " sec" << std::endl << std::endl;
-			std::cout << ss.str(); ss.str("");
-		} // ~for(idx_part)
-	} // ~for(index_num)
+		// add processor jobs
+		References & refs = ctx.getRefs(index_num, idx_part);
+		for (int i = 0; i < numProcThread; i++)
+		{
+			tpool.addJob(Processor("proc_" + std::to_string(i), readQueue, writeQueue, opts, index[cur], refs, output, readstats, refstats, alignmentCb));
+		}
+		++loopCount;
+
+		tpool.waitAll(); // wait till all reads are processed against the current part
+		index[cur].clear();
+		ctx.releaseRefs(index_num, idx_part);
+		writeQueue.reset(numProcThread);
+		readQueue.reset(opts.num_read_thread);
+
+		elapsed = std::chrono::high_resolution_clock::now() - starts;
+		ss << __func__ << ":" << __LINE__ << " paralleltraversal: Done index " << index_num << " Part: " << idx_part + 1 
+			<< " Time: " << std::setprecision(2) << std::fixed << elapsed.count() << " sec" << std::endl << std::endl;
+		std::cout << ss.str(); ss.str("");
+	} // ~for(parts)
 
 	// store readstats calculated in alignment
 	kvdb.put("Readstats", readstats.toString());
 } // ~align
+
+// called from main
+void alignStream(Runopts & opts, Readstats & readstats, Output & output)
+{
+	std::stringstream ss;
+
+	unsigned int numCores = std::thread::hardware_concurrency(); // find number of CPU cores
+	int numProcThread = opts.num_proc_thread == 0 ? numCores : opts.num_proc_thread;
+
+	ss << "Number of cores: " << numCores
+		<< " Read threads: 1"
+		<< " Processor threads: " << numProcThread
+		<< std::endl;
+	std::cout << ss.str(); ss.str("");
+
+	ThreadPool tpool(1 + numProcThread);
+	ReadsQueue readQueue("read_queue", opts.queue_size_max, 1); // shared: StreamProcessor pops, StreamReader pushes
+	Refstats refstats(opts, readstats);
+	std::mutex report_lock;
+
+	// all the index parts are loaded up front and stay resident
+	size_t num_parts = 0;
+	for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
+		num_parts += refstats.num_index_parts[index_num];
+
+	std::vector<Index> indices(num_parts);
+	std::vector<References> refs(num_parts);
+
+	auto starts = std::chrono::high_resolution_clock::now();
+	std::chrono::duration<double> elapsed;
+
+	for (uint16_t index_num = 0, i = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
+	{
+		for (uint16_t idx_part = 0; idx_part < refstats.num_index_parts[index_num]; ++idx_part, ++i)
+		{
+			ss << __func__ << ":" << __LINE__ << " Loading index " << index_num
+				<< " part " << idx_part + 1 << "/" << refstats.num_index_parts[index_num] << " ... ";
+			std::cout << ss.str(); ss.str("");
+
+			indices[i].load(index_num, idx_part, opts, refstats);
+			refs[i].load(index_num, idx_part, opts, refstats);
+
+			ss << "done" << std::endl;
+			std::cout << ss.str(); ss.str("");
+		}
+	}
+
+	elapsed = std::chrono::high_resolution_clock::now() - starts;
+	ss << __func__ << ":" << __LINE__ << " Loaded " << num_parts << " index parts and references ["
+		<< std::setprecision(2) << std::fixed << elapsed.count() << "] sec" << std::endl;
+	std::cout << ss.str(); ss.str("");
+
+	output.openfiles(opts);
+	if (opts.samout) output.writeSamHeader(opts, refstats);
+
+	starts = std::chrono::high_resolution_clock::now();
+
+	tpool.addJob(StreamReader("reader_0", opts, readQueue, readstats));
+	for (int i = 0; i < numProcThread; i++)
+	{
+		tpool.addJob(StreamProcessor("proc_" + std::to_string(i), readQueue, opts, indices, refs, output, readstats, refstats, report_lock, alignmentCb));
+	}
+	tpool.waitAll(); // wait till the end of the stream
+
+	for (auto & index : indices)
+		index.clear();
+	for (auto & ref : refs)
+		ref.clear();
+
+	elapsed = std::chrono::high_resolution_clock::now() - starts;
+	ss << __func__ << ":" << __LINE__ << " Done reads: " << readstats.number_total_read
+		<< " Time: " << std::setprecision(2) << std::fixed << elapsed.count() << " sec" << std::endl;
+	std::cout << ss.str(); ss.str("");
+
+	readstats.stats_calc_done = true;
+	if (readstats.number_total_read > 0)
+		writeLog(opts, readstats, output);
+
+	if (opts.otumapout) readstats.printOtuMap(output.otumapFile);
+} // ~alignStream
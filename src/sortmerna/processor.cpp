@@ -24,11 +24,43 @@
 #include "ThreadPool.hpp"
 #include "reader.hpp"
 #include "writer.hpp"
+#include "runcontext.hpp"
 
 // forward
 void computeStats(Read & read, Readstats & readstats, Refstats & refstats, References & refs, Runopts & opts);
+void reportsJob(std::vector<Read> & reads, Runopts & opts, References & refs, Refstats & refstats, Output & output);
 void writeLog(Runopts & opts, Readstats & readstats, Output & output);
 
+/*
+ * Search the forward and/or reverse strands of the read on the index part depending on Run options
+ */
+static void alignStrands(
+	Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats,
+	Read & read, hit_buffers & hits,
+	void(*callback)(Runopts & opts, Index & index, References & refs, Output & output, Readstats & readstats, Refstats & refstats, Read & read, hit_buffers & hits, bool isLastStrand)
+)
+{
+	int32_t strandCount = 0;
+	//opts.forward = true; // TODO: this discards the possiblity of forward = false
+	bool singleStrand = opts.forward ^ opts.reverse; // search single strand
+	if (singleStrand)
+		strandCount = 1; // only search the forward xor reverse strand
+	else 
+		strandCount = 2; // search both strands. The default when neither -F or -R were specified
+
+	for (int32_t count = 0; count < strandCount; ++count)
+	{
+		if ((singleStrand && opts.reverse) || count == 1)
+		{
+			if (!read.reversed)
+				read.revIntStr();
+		}
+		callback(opts, index, refs, output, readstats, refstats, read, hits, singleStrand || count == 1);
+		//opts.forward = false;
+		hits.id_win_hits.clear(); // bug 46
+	}
+} // ~alignStrands
+
 void Processor::run()
 {
 	int countReads = 0;
@@ -41,58 +73,127 @@ void Processor::run()
 		std::cout << ss.str();
 	}
 
+	ReadBatch batch; // Reads popped from the read queue
+	ReadBatch wbatch; // Reads to push on the write queue
+	hit_buffers hits; // seed search buffers of this thread
+
 	for (;;)
 	{
-		Read read = readQueue.pop(); // returns an empty read if queue is empty
-		if (read.isEmpty && readQueue.getPushers() == 0)
+		if (!readQueue.pop(batch)) // blocks until a batch is available. False at the end of stream
 		{
-			break;
+			if (readQueue.getPushers() == 0)
+				break;
+			continue;
 		}
-		alreadyProcessed = (read.isRestored && read.lastIndex == index.index_num && read.lastPart == index.part);
 
-		if (read.isEmpty || !read.isValid || alreadyProcessed) {
-			if (alreadyProcessed) ++countProcessed;
+		for (auto & read : batch)
+		{
+			alreadyProcessed = (read.isRestored && read.lastIndex == index.index_num && read.lastPart == index.part);
+
+			if (read.isEmpty || !read.isValid || alreadyProcessed) {
+				if (alreadyProcessed) ++countProcessed;
+				continue;
+			}
+
+			// search the forward and/or reverse strands depending on Run options
+			alignStrands(opts, index, refs, output, readstats, refstats, read, hits, callback);
+
+			if (read.isValid && !read.isEmpty) 
+			{
+				wbatch.push_back(std::move(read));
+				if (wbatch.size() >= READ_BATCH_SIZE)
+					writeQueue.push(wbatch);
+			}
+
+			countReads++;
+		} // ~for batch
+	}
+	writeQueue.push(wbatch); // the last incomplete batch
+	writeQueue.decrPushers(); // signal this processor done adding
+	writeQueue.notify(); // wake up writer waiting on queue.pop()
+
+	{
+		std::stringstream ss;
+		ss << STAMP << "Processor " << id << " thread " << std::this_thread::get_id() << " done. Processed " << countReads
+			<< " reads. Skipped already processed: " << countProcessed << " reads" << std::endl;
+		std::cout << ss.str();
+	}
+} // ~Processor::run
+
+/*
+ * Aligns each read on all the index parts, then post-processes and reports it straight away i.e. no Key-value DB
+ * and no re-reading of the Reads between the passes. Used with the reads piped on stdin.
+ */
+void StreamProcessor::run()
+{
+	int countReads = 0;
+
+	{
+		std::stringstream ss;
+		ss << STAMP << "StreamProcessor " << id << " thread " << std::this_thread::get_id() << " started" << std::endl;
+		std::cout << ss.str();
+	}
+
+	size_t cap = opts.pairedin || opts.pairedout ? 2 : 1;
+	std::vector<Read> reads;
+	ReadBatch batch; // Reads popped from the read queue. The paired reads are always in the same batch
+	hit_buffers hits; // seed search buffers of this thread
+
+	for (;;)
+	{
+		if (!readQueue.pop(batch)) // blocks until a batch is available. False at the end of stream
+		{
+			if (readQueue.getPushers() == 0)
+				break;
 			continue;
 		}
 
-		// search the forward and/or reverse strands depending on Run options
-		int32_t strandCount = 0;
-		//opts.forward = true; // TODO: this discards the possiblity of forward = false
-		bool singleStrand = opts.forward ^ opts.reverse; // search single strand
-		if (singleStrand)
-			strandCount = 1; // only search the forward xor reverse strand
-		else 
-			strandCount = 2; // search both strands. The default when neither -F or -R were specified
-
-		for (int32_t count = 0; count < strandCount; ++count)
+		for (auto & read : batch)
 		{
-			if ((singleStrand && opts.reverse) || count == 1)
+			if (read.isEmpty || !read.isValid)
+				continue;
+
+			for (size_t i = 0; i < indices.size(); ++i)
 			{
-				if (!read.reversed)
+				// each part starts on the forward strand as a read re-read from the Reads file
+				if (read.reversed)
 					read.revIntStr();
+				if (opts.min_lis > 0) read.best = opts.min_lis; // see 'Read::restoreFromDb'
+				alignStrands(opts, indices[i], refs[i], output, readstats, refstats, read, hits, callback);
 			}
-			callback(opts, index, refs, output, readstats, refstats, read, singleStrand || count == 1);
-			//opts.forward = false;
-			read.id_win_hits.clear(); // bug 46
+			// the reads shorter than the seed are invalidated by the search but still go to the 'other' reads
+			read.isValid = true;
+			++countReads;
 		}
 
-		if (read.isValid && !read.isEmpty) 
+		// OTU map, statistics and the output streams are shared by all the processors
+		std::lock_guard<std::mutex> lock(report_lock);
+		for (size_t i = 0; i + cap <= batch.size(); i += cap)
 		{
-			writeQueue.push(read);
-		}
+			reads.clear();
+			for (size_t j = 0; j < cap; ++j)
+				reads.push_back(std::move(batch[i + j]));
+
+			for (auto & read : reads)
+			{
+				if (read.isEmpty || !read.isValid) continue;
+				for (auto & ref : refs)
+					computeStats(read, readstats, refstats, ref, opts);
+			}
+
+			if (reads.back().isEmpty || !reads.back().isValid) continue;
 
-		countReads++;
+			for (auto & ref : refs)
+				reportsJob(reads, opts, ref, refstats, output);
+		}
 	}
-	writeQueue.decrPushers(); // signal this processor done adding
-	writeQueue.notify(); // wake up writer waiting on queue.pop()
 
 	{
 		std::stringstream ss;
-		ss << STAMP << "Processor " << id << " thread " << std::this_thread::get_id() << " done. Processed " << countReads
-			<< " reads. Skipped already processed: " << countProcessed << " reads" << std::endl;
+		ss << STAMP << "StreamProcessor " << id << " thread " << std::this_thread::get_id() << " done. Processed " << countReads << " reads" << std::endl;
 		std::cout << ss.str();
 	}
-} // ~Processor::run
+} // ~StreamProcessor::run
 
 void PostProcessor::run()
 {
@@ -105,26 +206,35 @@ void PostProcessor::run()
 		std::cout << ss.str();
 	}
 
+	ReadBatch batch; // Reads popped from the read queue
+	ReadBatch wbatch; // Reads to push on the write queue
+
 	for (;;)
 	{
-		Read read = readQueue.pop(); // returns an empty read if queue is empty
-		if (read.isEmpty)
+		if (!readQueue.pop(batch)) // blocks until a batch is available. False at the end of stream
 		{ 
 			if (readQueue.getPushers() == 0) 
 				break; // queue is empty and no more pushers => end processing
-			
-			if (!read.isValid) 
-				continue;
+			continue;
 		}
 
-		callback(read, readstats, refstats, refs, opts);
-		++countReads;
-
-		if (read.isValid && !read.isEmpty && !read.hit_denovo) 
+		for (auto & read : batch)
 		{
-			writeQueue.push(read);
+			if (read.isEmpty || !read.isValid)
+				continue;
+
+			callback(read, readstats, refstats, refs, opts);
+			++countReads;
+
+			if (read.isValid && !read.isEmpty && !read.hit_denovo) 
+			{
+				wbatch.push_back(std::move(read));
+				if (wbatch.size() >= READ_BATCH_SIZE)
+					writeQueue.push(wbatch);
+			}
 		}
 	}
+	writeQueue.push(wbatch); // the last incomplete batch
 	writeQueue.decrPushers(); // signal this processor done adding
 	writeQueue.notify(); // notify in case no Reads were ever pushed to the Write queue
 
@@ -145,35 +255,39 @@ void ReportProcessor::run()
 		std::cout << ss.str();
 	}
 
-	int cap = opts.pairedin || opts.pairedout ? 2 : 1;
+	size_t cap = opts.pairedin || opts.pairedout ? 2 : 1;
 	std::vector<Read> reads;
-	Read read;
-	int i = 0;
-	bool isDone = false;
+	ReadBatch batch; // Reads popped from the queue. The paired reads are always in the same batch
 
-	for (;!isDone;)
+	for (;;)
 	{
-		reads.clear();
-		for (i = 0; i < cap; ++i)
+		if (!readQueue.pop(batch)) // blocks until a batch is available. False at the end of stream
 		{
-			read = readQueue.pop();  // returns an empty read if queue is empty
-			reads.push_back(read);
-			if (read.isEmpty)
-			{
-				if (readQueue.getPushers() == 0)
-				{
-					isDone = true;
-					break;
-				}
-				if (!read.isValid)
-					break;
-			}
+			if (readQueue.getPushers() == 0)
+				break;
+			continue;
 		}
 
-		if (reads.back().isEmpty || !reads.back().isValid) continue;
+		for (size_t i = 0; i + cap <= batch.size(); i += cap)
+		{
+			reads.clear();
+			for (size_t j = 0; j < cap; ++j)
+				reads.push_back(std::move(batch[i + j]));
+
+			if (reads.back().isEmpty || !reads.back().isValid) continue;
 
-		callback(reads, opts, refs, refstats, output);
-		countReads+=i;
+			callback(reads, opts, refs, refstats, output);
+			countReads += static_cast<int>(cap);
+		}
+
+		// the batches are even and start on even read IDs (see 'Reader'), so only the last read of the file can be unpaired
+		if (batch.size() % cap != 0)
+		{
+			std::stringstream ss;
+			ss << STAMP << YELLOW << "WARNING" << COLOFF << ": the last read " << batch.back().id
+				<< " has no mate in the paired reads file, it is not reported" << std::endl;
+			std::cerr << ss.str();
+		}
 	}
 
 	{
@@ -185,7 +299,7 @@ void ReportProcessor::run()
 } // ~ReportProcessor::run
 
 // called from main
-void postProcess(Runopts & opts, Readstats & readstats, Output & output)
+void postProcess(Runopts & opts, Readstats & readstats, Output & output, RunContext & ctx)
 {
 	int N_READ_THREADS = opts.num_read_thread_pp;
 	int N_PROC_THREADS = opts.num_proc_thread_pp; // opts.num_proc_threads
@@ -198,7 +312,7 @@ void postProcess(Runopts & opts, Readstats & readstats, Output & output)
 	}
 
 	ThreadPool tpool(N_READ_THREADS + N_PROC_THREADS + opts.num_write_thread);
-	KeyValueDatabase kvdb(opts.kvdbPath);
+	KeyValueDatabase & kvdb = ctx.getKvdb();
 	ReadsQueue readQueue("read_queue", opts.queue_size_max, N_READ_THREADS); // shared: Processor pops, Reader pushes
 	ReadsQueue writeQueue("write_queue", opts.queue_size_max, N_PROC_THREADS); // shared: Processor pushes, Writer pops
 	bool indb = readstats.restoreFromDb(kvdb);
@@ -213,8 +327,7 @@ void postProcess(Runopts & opts, Readstats & readstats, Output & output)
 
 	//if (!readstats.stats_calc_done)
 	//{
-		Refstats refstats(opts, readstats);
-		References refs;
+		Refstats & refstats = ctx.getRefstats();
 
 		// loop through every reference file passed to option --ref (ex. SSU 16S and SSU 18S)
 		for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
@@ -230,7 +343,7 @@ void postProcess(Runopts & opts, Readstats & readstats, Output & output)
 				}
 
 				auto starts = std::chrono::high_resolution_clock::now(); // index loading start
-				refs.load(index_num, idx_part, opts, refstats);
+				References & refs = ctx.getRefs(index_num, idx_part);
 				std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - starts;
 
 				{
@@ -243,7 +356,7 @@ void postProcess(Runopts & opts, Readstats & readstats, Output & output)
 
 				for (int i = 0; i < N_READ_THREADS; ++i)
 				{
-					tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, loopCount));
+					tpool.addJob(Reader("reader_" + std::to_string(i), opts, readQueue, kvdb, readstats, loopCount, i, N_READ_THREADS));
 				}
 
 				for (int i = 0; i < opts.num_write_thread; i++)
@@ -258,7 +371,7 @@ void postProcess(Runopts & opts, Readstats & readstats, Output & output)
 				}
 				++loopCount;
 				tpool.waitAll(); // wait till processing is done on one index part
-				refs.clear();
+				ctx.releaseRefs(index_num, idx_part);
 				readQueue.reset(N_READ_THREADS);
 				writeQueue.reset(N_PROC_THREADS);
 
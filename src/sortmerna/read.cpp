@@ -66,23 +66,6 @@ std::string alignment_struct2::toString()
 	return buf;
 } // ~toString
 
- // initialize Smith-Waterman scoring matrix for genome sequences
-void Read::initScoringMatrix(Runopts & opts)
-{
-	int8_t val = 0;
-	for (int l = 0; l < 4; ++l)
-	{
-		for (int m = 0; m < 4; ++m) {
-			val = l == m ? opts.match : opts.mismatch; // weight_match : weight_mismatch (must be negative)
-			scoring_matrix.push_back(val);
-		}
-		scoring_matrix.push_back(opts.score_N); // ambiguous base
-	}
-	for (int m = 0; m < 5; ++m) {
-		scoring_matrix.push_back(opts.score_N); // ambiguous base
-	}
-}
-
 std::string Read::matchesToJson() {
 	rapidjson::StringBuffer sbuf;
 	rapidjson::Writer<rapidjson::StringBuffer> writer(sbuf);
@@ -127,12 +110,6 @@ std::string Read::toString()
 	std::copy_n(static_cast<char*>(static_cast<void*>(&readhit)), sizeof(readhit), std::back_inserter(buf));
 	//std::copy_n(static_cast<char*>(static_cast<void*>(&best)), sizeof(best), std::back_inserter(buf));
 
-	// id_win_hits vector - TODO: remove?
-#if 0
-	size_t id_win_hits_size = id_win_hits.size();
-	std::copy_n(static_cast<char*>(static_cast<void*>(&id_win_hits_size)), sizeof(id_win_hits_size), std::back_inserter(buf)); // add vector size
-	for (auto it = id_win_hits.begin(); it != id_win_hits.end(); ++it) buf += it->toString(); // add values
-#endif
 	// hits_align_info
 	std::string hits_align_info_str = hits_align_info.toString();
 	size_t hits_align_info_size = hits_align_info_str.length();
@@ -144,7 +121,6 @@ std::string Read::toString()
 
 bool Read::restoreFromDb(KeyValueDatabase & kvdb)
 {
-	int id_win_hits_len = 0;
 	std::string bstr = kvdb.get(std::to_string(id));
 	if (bstr.size() == 0) { isRestored = false; return isRestored; }
 	size_t offset = 0;
@@ -176,22 +152,6 @@ bool Read::restoreFromDb(KeyValueDatabase & kvdb)
 	//std::memcpy(static_cast<void*>(&best), bstr.data() + offset, sizeof(best));
 	//offset += sizeof(best);
 
-	// std::vector<id_win> id_win_hits TODO: remove?
-#if 0
-	size_t id_win_hits_size = 0;
-	std::memcpy(static_cast<void*>(&id_win_hits_size), bstr.data() + offset, sizeof(id_win_hits_size));
-	offset += sizeof(id_win_hits_size);
-	std::string id_win_str;
-	for (int i = 0; i < id_win_hits_size; ++i)
-	{
-		//id_win_str.assign(sizeof(id_win::id) + sizeof(id_win::win), 0);
-		//std::memcpy(static_cast<void*>(&id_win_str[0]), bstr.data() + offset, sizeof(id_win::id) + sizeof(id_win::win));
-		std::copy_n(bstr.data() + offset, sizeof(id_win::id) + sizeof(id_win::win), std::back_inserter(id_win_str));
-		id_win_hits.push_back(id_win(id_win_str));
-		offset += (sizeof(id_win::id) + sizeof(id_win::win));
-		id_win_str.clear();
-	}
-#endif
 	// alignment_struct2 hits_align_info
 	size_t hits_align_info_size = 0;
 	std::memcpy(static_cast<void*>(&hits_align_info_size), bstr.data() + offset, sizeof(hits_align_info_size));
@@ -234,7 +194,7 @@ void Read::calcMismatchGapId(References & refs, int alignIdx, uint32_t & mismatc
 	int32_t qb = hits_align_info.alignv[alignIdx].ref_begin1; // index of the first char in the reference matched part
 	int32_t pb = hits_align_info.alignv[alignIdx].read_begin1; // index of the first char in the read matched part
 
-	std::string refseq = refs.buffer[hits_align_info.alignv[alignIdx].ref_seq].sequence;
+	const char* refseq = refs.buffer[hits_align_info.alignv[alignIdx].ref_seq].getSeq();
 
 	for (uint32_t cidx = 0; cidx < hits_align_info.alignv[alignIdx].cigar.size(); ++cidx)
 	{
@@ -7,6 +7,8 @@
  */
 
 #include <string>
+#include <iostream> // std::cin
+#include <memory> // std::unique_ptr
 #include <locale> // std::isspace
 #include <fstream> // std::ifstream
 #include <sstream> // std::stringstream
@@ -19,9 +21,122 @@
 
 #include "reader.hpp"
 #include "gzip.hpp"
+#include "readstore.hpp"
+#include "readoffsets.hpp"
+#include "fastxmmap.hpp"
+
+/*
+ * Sequential parser of a FASTA/FASTQ file (compressed or not) used for the paired-end reads in two files
+ * and for the reads piped on stdin (path '-')
+ */
+class FastxStream {
+public:
+	FastxStream(Runopts & opts, const std::string & path)
+		: path(path), gzip(opts), isFastq(false)
+	{
+		if (path != "-")
+			ifs.open(path, std::ios_base::in | std::ios_base::binary);
+		if (path != "-" && !ifs.is_open())
+		{
+			std::cerr << STAMP << "failed to open " << path << std::endl;
+			exit(EXIT_FAILURE);
+		}
+	}
+
+	bool next(Read & read); // parse the next record into the read. False at the end of file
+
+private:
+	std::string path;
+	std::ifstream ifs;
+	std::istream & is = path == "-" ? std::cin : ifs; // the stream parsed
+	Gzip gzip; // reads both zipped and non-zipped files
+	std::string line;
+	std::string pending; // FASTA header of the next record
+	bool isFastq;
+}; // ~class FastxStream
+
+/*
+ * fastq: 0(header), 1(seq), 2(+), 3(quality)
+ * fasta: 0(header), 1..n(seq)
+ */
+bool FastxStream::next(Read & read)
+{
+	read.clear();
+	for (int count = 0; ; ++count)
+	{
+		if (pending.empty())
+		{
+			int stat = gzip.getline(is, line);
+			if (stat == RL_END)
+				break;
+			if (stat == RL_ERR)
+			{
+				std::cerr << STAMP << "ERROR reading from Reads file " << path << " Exiting..." << std::endl;
+				exit(EXIT_FAILURE);
+			}
+			// right-trim whitespace in place (removes '\r' too)
+			line.erase(std::find_if(line.rbegin(), line.rend(), [l = std::locale{}](auto ch) { return !std::isspace(ch, l); }).base(), line.end());
+			if (line.empty())
+			{
+				--count;
+				continue;
+			}
+		}
+		else
+		{
+			line.swap(pending);
+			pending.clear();
+		}
+
+		if (count == 0)
+		{
+			isFastq = (line[0] == FASTQ_HEADER_START);
+			read.format = isFastq ? Format::FASTQ : Format::FASTA;
+			read.header = line;
+			read.isEmpty = false;
+		}
+		else if (isFastq)
+		{
+			if (count == 1)
+				read.sequence = line;
+			else if (count == 3)
+			{
+				read.quality = line;
+				return true;
+			}
+		}
+		else if (line[0] == FASTA_HEADER_START)
+		{
+			pending.swap(line);
+			return true;
+		}
+		else
+			read.sequence += line; // FASTA multi-line sequence
+	}
+	return !read.isEmpty;
+} // ~FastxStream::next
 
 void Reader::read()
 {
+	if (!opts.readsfile_r2.empty())
+	{
+		readPaired();
+		return;
+	}
+
+	if (opts.read_store && readStore())
+		return;
+
+	if (!opts.have_reads_gz && readMmap())
+		return;
+
+	// the stream parsing (compressed Reads file) is not sharded. The first Reader pushes all the reads
+	if (shard > 0)
+	{
+		done(0, std::chrono::duration<double>(0));
+		return;
+	}
+
 	std::ifstream ifs(opts.readsfile, std::ios_base::in | std::ios_base::binary);
 	if (!ifs.is_open()) {
 		std::cerr << STAMP << "failed to open " << opts.readsfile << std::endl;
@@ -58,7 +173,7 @@ void Reader::read()
 				if (!read.isEmpty)
 				{
 					read.init(opts, kvdb, read_id); // load alignment statistics from DB
-					readQueue.push(read);
+					addRead(read);
 				}
 				break;
 			}
@@ -100,7 +215,7 @@ void Reader::read()
 				if (!read.isEmpty)
 				{ // push previous read object to queue
 					read.init(opts, kvdb, read_id);
-					readQueue.push(read);
+					addRead(read);
 					++read_id;
 				}
 
@@ -131,107 +246,327 @@ void Reader::read()
 		} // ~for getline
 
 		std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
-		readQueue.decrPushers(); // signal the reader done adding
-		readQueue.notify(); // notify processor that might be waiting to pop
-
-		{
-			std::stringstream ss;
-			ss << STAMP << id << " thread: " << std::this_thread::get_id() << " done. Elapsed time: "
-				<< std::setprecision(2) << std::fixed << elapsed.count() << " sec Reads added: " << read_id + 1
-				<< " readQueue.size: " << readQueue.size() << std::endl;
-			std::cout << ss.str();
-		}
+		done(read_id + 1, elapsed);
 	}
 	ifs.close();
 } // ~Reader::read
 
-bool Reader::loadReadByIdx(Runopts & opts, Read & read)
+/*
+ * Move the read into the current batch. The full batch is pushed to the queue
+ */
+void Reader::addRead(Read & read)
 {
+	if (batch.capacity() == 0)
+		batch.reserve(READ_BATCH_SIZE);
+	batch.push_back(std::move(read));
+	if (batch.size() >= READ_BATCH_SIZE)
+		readQueue.push(batch);
+}
+
+void Reader::done(unsigned int num_reads, std::chrono::duration<double> elapsed)
+{
+	readQueue.push(batch); // the last incomplete batch
+	readQueue.decrPushers(); // signal the reader done adding
+	readQueue.notify(); // notify processor that might be waiting to pop
+
 	std::stringstream ss;
-	bool isok = false;
+	ss << STAMP << id << " thread: " << std::this_thread::get_id() << " done. Elapsed time: "
+		<< std::setprecision(2) << std::fixed << elapsed.count() << " sec Reads added: " << num_reads
+		<< " readQueue.size: " << readQueue.size() << std::endl;
+	std::cout << ss.str();
+} // ~Reader::done
 
-	std::ifstream ifs(opts.readsfile, std::ios_base::in | std::ios_base::binary);
-	if (!ifs.is_open()) 
+/*
+ * Read the paired-end reads from two files. The mates are pushed one after another: the read N of the first file
+ * gets the ID 2N, its mate in the second file 2N + 1 i.e. the same IDs as in an interleaved Reads file,
+ * so the pairs reach the processors exactly as for the interleaved reads.
+ * The two files are not sharded. The first Reader pushes all the reads.
+ */
+void Reader::readPaired()
+{
+	if (shard > 0)
 	{
-		std::cerr << STAMP << "failed to open " << opts.readsfile << std::endl;
-		exit(EXIT_FAILURE);
+		done(0, std::chrono::duration<double>(0));
+		return;
 	}
-	else
+
+	FastxStream fwd(opts, opts.readsfile);
+	FastxStream rev(opts, opts.readsfile_r2);
+	Read read;
+	unsigned int read_id = 0;
+
 	{
-		std::string line;
-		unsigned int read_id = 0; // read ID
-		bool isFastq = true;
-		Gzip gzip(opts);
+		std::stringstream ss;
+		ss << STAMP << id << " thread: " << std::this_thread::get_id() << " started. Paired Reads files "
+			<< opts.readsfile << " " << opts.readsfile_r2 << std::endl;
+		std::cout << ss.str();
+	}
+	auto t = std::chrono::high_resolution_clock::now();
 
-		auto t = std::chrono::high_resolution_clock::now();
+	for (;;)
+	{
+		bool is_fwd = fwd.next(read);
+		if (is_fwd)
+		{
+			read.init(opts, kvdb, read_id++); // load alignment statistics from DB
+			addRead(read);
+		}
+		if (rev.next(read) != is_fwd)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the paired Reads files have different number of reads. "
+				<< "Read " << read_id / 2 << " has no mate" << std::endl;
+			exit(EXIT_FAILURE);
+		}
+		if (!is_fwd)
+			break;
+		read.init(opts, kvdb, read_id++);
+		addRead(read);
+	}
+
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	done(read_id, elapsed);
+} // ~Reader::readPaired
+
+/*
+ * Stream the reads from the read store built by 'Readstats::calculate' on the first pass.
+ * Each Reader takes an equal range of the records [beg, end). The range bounds are even so that
+ * the paired reads are never split between Readers.
+ * Returns False if the store is not available, in which case the Reads file is parsed.
+ */
+bool Reader::readStore()
+{
+	ReadStore store(opts);
+	if (!store.open())
+		return false;
 
-		// read lines from the reads file
-		for (int count = 0, stat = 0; ; ) // count lines in a single read
+	Read read;
+	uint64_t num_recs = store.header.num_recs;
+	uint64_t beg = (num_recs * shard / num_shards) & ~1ULL;
+	uint64_t end = shard + 1 < num_shards ? (num_recs * (shard + 1) / num_shards) & ~1ULL : num_recs;
+	unsigned int read_id = static_cast<unsigned int>(beg);
+
+	{
+		std::stringstream ss;
+		ss << STAMP << id << " thread: " << std::this_thread::get_id() << " started. Using read store " << ReadStore::getPath(opts)
+			<< " records [" << beg << ", " << end << ")" << std::endl;
+		std::cout << ss.str();
+	}
+	auto t = std::chrono::high_resolution_clock::now();
+
+	if (beg < end && (beg == 0 || store.seek(beg)))
+	{
+		for (; read_id < end && store.next(read); ++read_id)
 		{
-			stat = gzip.getline(ifs, line);
-			if (stat == RL_END) break;
+			read.init(opts, kvdb, read_id); // load alignment statistics from DB
+			addRead(read);
+		}
+	}
 
-			if (stat == RL_ERR)
-			{
-				std::cerr << STAMP << "ERROR reading from Reads file. Exiting..." << std::endl;
-				exit(1);
-			}
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	done(static_cast<unsigned int>(read_id - beg), elapsed);
 
-			if (line.empty()) continue;
+	return true;
+} // ~Reader::readStore
 
-			line.erase(std::find_if(line.rbegin(), line.rend(), [l = std::locale{}](auto ch) { return !std::isspace(ch, l); }).base(), line.end());
+/*
+ * Scan the memory mapped non-compressed Reads file. Returns False if the file cannot be mapped,
+ * in which case the Reads file is parsed from the stream.
+ *
+ * Each Reader scans its own byte range of the file given by the read checkpoints recorded on the
+ * statistics pass ('Readstats::getShard'). The ranges start on the record boundaries and carry the ID
+ * of their first read, so no re-synchronization on the record start is necessary.
+ * Without the checkpoints the first Reader scans the whole file.
+ */
+bool Reader::readMmap()
+{
+	FastxMmap fastx(opts.readsfile);
+	if (!fastx.isOpen())
+		return false;
 
-			if ( line[0] == FASTA_HEADER_START || line[0] == FASTQ_HEADER_START )
-			{
-				if (!read.isEmpty) {
-					isok = true;
-					break; // read is ready
-				}
+	Read read;
+	FastxRec rec;
+	uint64_t beg = 0;
+	uint64_t end = UINT64_MAX;
+	uint64_t first_id = 0;
+	bool is_shard = true; // this Reader has reads to push
 
-				// add header -->
-				if (read_id == read.id)
-				{
-					isFastq = (line[0] == FASTQ_HEADER_START);
-					read.format = isFastq ? Format::FASTQ : Format::FASTA;
-					read.header = line;
-					read.isEmpty = false;
-				}
-				else {
-					++read_id;
-					count = 0; // for fastq
-				}
-			} // ~if header line
-			else if ( !read.isEmpty )
-			{
-				// add sequence -->
-				if ( isFastq )
-				{
-					++count;
-					if ( line[0] == '+' ) continue;
-					if ( count == 3 )
-					{
-						read.quality = line; // last line in Fastq read
-						continue;
-					}
-				}
-				read.sequence += line;
-			}
-		} // ~for getline
+	if (num_shards > 1)
+	{
+		if (readstats.checkpoints.empty())
+			is_shard = shard == 0;
+		else
+			is_shard = readstats.getShard(shard, num_shards, beg, end, first_id);
+	}
 
-		std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	if (!is_shard)
+	{
+		done(0, std::chrono::duration<double>(0));
+		return true;
+	}
 
-		//ss << id << " thread: " << std::this_thread::get_id() << " done. Elapsed time: "
-		//	<< std::setprecision(2) << std::fixed << elapsed.count() << " sec Reads added: " << read_id << std::endl;
-		//std::cout << ss.str(); ss.str("");
+	unsigned int read_id = static_cast<unsigned int>(first_id);
+
+	{
+		std::stringstream ss;
+		ss << STAMP << id << " thread: " << std::this_thread::get_id() << " started. Memory mapped " << opts.readsfile 
+			<< " from offset " << beg << " read " << first_id << std::endl;
+		std::cout << ss.str();
 	}
+	auto t = std::chrono::high_resolution_clock::now();
 
-	ifs.close();
+	fastx.seek(beg);
+	for (; fastx.next(rec) && rec.offset < end; ++read_id)
+	{
+		read.clear();
+		read.format = fastx.isFastq() ? Format::FASTQ : Format::FASTA;
+		read.header.assign(rec.header, rec.header_len);
+		read.sequence.assign(rec.sequence, rec.seq_len);
+		if (rec.qual_len > 0)
+			read.quality.assign(rec.quality, rec.qual_len);
+		read.isEmpty = false;
+		read.init(opts, kvdb, read_id); // load alignment statistics from DB
+		addRead(read);
+	}
+
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	done(static_cast<unsigned int>(read_id - first_id), elapsed);
+
+	return true;
+} // ~Reader::readMmap
+
+/*
+ * Load the read 'read.id' from the Reads file. Uses (in that order) the read store, the read offsets index,
+ * or scans the Reads file from the start if neither is available.
+ * The paired-end reads in two files are always scanned: the even IDs from the first file, the odd IDs from the second.
+ */
+bool Reader::loadReadByIdx(Runopts & opts, Read & read)
+{
+	if (!opts.readsfile_r2.empty())
+	{
+		unsigned int id = read.id;
+		read.id = id / 2;
+		bool isok = scanReadByIdx(opts, id % 2 == 0 ? opts.readsfile : opts.readsfile_r2, read);
+		read.id = id;
+		return isok;
+	}
 
-	return isok;
+	if (opts.read_store)
+	{
+		ReadStore store(opts);
+		if (store.open())
+			return store.loadByIdx(read);
+	}
 
-} // ~Reader::loadRead
+	{
+		ReadOffsets offsets(opts);
+		if (offsets.open())
+			return offsets.loadByIdx(read);
+	}
+
+	return scanReadByIdx(opts, opts.readsfile, read);
+} // ~Reader::loadReadByIdx
+
+/*
+ * Scan the Reads file 'readsfile' from the start up to the read number 'read.id'
+ */
+bool Reader::scanReadByIdx(Runopts & opts, const std::string & readsfile, Read & read)
+{
+	if (!opts.have_reads_gz)
+	{
+		FastxMmap fastx(readsfile);
+		if (fastx.isOpen())
+		{
+			FastxRec rec;
+			for (unsigned int read_id = 0; fastx.next(rec); ++read_id)
+			{
+				if (read_id < read.id) continue;
+				read.format = fastx.isFastq() ? Format::FASTQ : Format::FASTA;
+				read.header.assign(rec.header, rec.header_len);
+				read.sequence.assign(rec.sequence, rec.seq_len);
+				if (rec.qual_len > 0)
+					read.quality.assign(rec.quality, rec.qual_len);
+				read.isEmpty = false;
+				return true;
+			}
+			return false;
+		}
+	}
+
+	// stream parsing (compressed Reads file)
+	unsigned int id = read.id;
+	FastxStream fastx(opts, readsfile);
+	for (unsigned int read_id = 0; fastx.next(read); ++read_id)
+	{
+		if (read_id == id)
+		{
+			read.id = id;
+			return true;
+		}
+	}
+	read.id = id;
+	return false;
+} // ~Reader::scanReadByIdx
 
 bool Reader::loadReadById(Runopts & opts, Read & read)
 {
 	return true;
-} // ~Reader::loadReadById
\ No newline at end of file
+} // ~Reader::loadReadById
+
+/*
+ * The paired-end mates from the second file get the odd IDs as in 'Reader::readPaired'
+ */
+void StreamReader::read()
+{
+	bool isPaired = !opts.readsfile_r2.empty();
+	FastxStream fwd(opts, opts.readsfile);
+	std::unique_ptr<FastxStream> rev(isPaired ? new FastxStream(opts, opts.readsfile_r2) : nullptr);
+	Read read;
+	unsigned int read_id = 0;
+
+	{
+		std::stringstream ss;
+		ss << STAMP << id << " thread: " << std::this_thread::get_id() << " started. Reading stdin" << std::endl;
+		std::cout << ss.str();
+	}
+	auto t = std::chrono::high_resolution_clock::now();
+
+	for (;;)
+	{
+		bool is_fwd = fwd.next(read);
+		if (is_fwd)
+			addRead(read, read_id++);
+		if (isPaired && rev->next(read) != is_fwd)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the paired Reads files have different number of reads. "
+				<< "Read " << read_id / 2 << " has no mate" << std::endl;
+			exit(EXIT_FAILURE);
+		}
+		if (!is_fwd)
+			break;
+		if (isPaired)
+			addRead(read, read_id++);
+	}
+
+	readQueue.push(batch); // the last incomplete batch
+	readQueue.decrPushers(); // signal the reader done adding
+	readQueue.notify(); // notify processor that might be waiting to pop
+
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	std::stringstream ss;
+	ss << STAMP << id << " thread: " << std::this_thread::get_id() << " done. Elapsed time: "
+		<< std::setprecision(2) << std::fixed << elapsed.count() << " sec Reads added: " << read_id << std::endl;
+	std::cout << ss.str();
+} // ~StreamReader::read
+
+void StreamReader::addRead(Read & read, unsigned int read_id)
+{
+	++readstats.number_total_read;
+	readstats.full_read_main += read.sequence.size();
+	read.init(opts, read_id);
+
+	if (batch.capacity() == 0)
+		batch.reserve(READ_BATCH_SIZE);
+	batch.push_back(std::move(read));
+	if (batch.size() >= READ_BATCH_SIZE)
+		readQueue.push(batch);
+} // ~StreamReader::addRead
\ No newline at end of file
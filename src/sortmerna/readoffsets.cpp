@@ -0,0 +1,389 @@
+/**
+ * FILE: readoffsets.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Sidecar index of the Reads file for random access to the reads. See 'readoffsets.hpp' for the layout.
+ */
+
+#include <iostream>
+#include <sstream>
+#include <algorithm> // std::fill_n, std::upper_bound, std::find_if
+#include <cstring> // std::memcpy, std::memchr
+#include <functional>
+#include <locale> // std::isspace
+
+#include <sys/types.h>
+#include <sys/stat.h>
+
+#include "readoffsets.hpp"
+#include "readstore.hpp"
+#include "options.hpp"
+#include "read.hpp"
+
+#define READOFFSETS_IO_BUF 1048576U // 1MB stream buffer
+
+// forward
+bool dirExists(std::string dpath);
+
+/*
+ * Inflates a compressed file starting from an access point. See zlib 'examples/zran.c'
+ */
+class GzSeeker {
+public:
+	GzSeeker(std::ifstream & ifs) : ifs(ifs), z_in(IN_SIZE), bpos(0), skip_trailer(0), is_raw(false), is_init(false) {}
+	~GzSeeker() { if (is_init) (void)inflateEnd(&strm); }
+
+	bool start(const gz_access_point & point, uint64_t offset); // position at 'offset' in the inflated data
+	bool getline(std::string & line);
+
+private:
+	std::ifstream & ifs;
+	z_stream strm;
+	std::vector<unsigned char> z_in;
+	std::string out; // inflated data
+	size_t bpos; // position in 'out'
+	int skip_trailer; // bytes of the gzip member trailer yet to skip after a raw deflate stream
+	bool is_raw; // inflating raw deflate data i.e. started inside a gzip member
+	bool is_init;
+
+	bool fill(); // inflate the next portion of data into 'out'
+};
+
+bool GzSeeker::start(const gz_access_point & point, uint64_t offset)
+{
+	strm.zalloc = Z_NULL;
+	strm.zfree = Z_NULL;
+	strm.opaque = Z_NULL;
+	strm.avail_in = 0;
+	strm.next_in = Z_NULL;
+	is_raw = point.bits >= 0;
+	if (inflateInit2(&strm, is_raw ? -15 : 31) != Z_OK)
+		return false;
+	is_init = true;
+
+	ifs.clear();
+	ifs.seekg(point.bits > 0 ? point.in - 1 : point.in);
+	if (point.bits > 0)
+	{
+		int ch = ifs.get();
+		if (ch == EOF)
+			return false;
+		(void)inflatePrime(&strm, point.bits, ch >> (8 - point.bits));
+	}
+	if (!point.window.empty())
+		(void)inflateSetDictionary(&strm, reinterpret_cast<const Bytef*>(point.window.data()), static_cast<uInt>(point.window.size()));
+
+	// discard the data up to the offset
+	for (uint64_t skip = offset - point.out; skip > 0; )
+	{
+		if (bpos == out.size() && !fill())
+			return false;
+		size_t len = static_cast<size_t>(std::min<uint64_t>(skip, out.size() - bpos));
+		bpos += len;
+		skip -= len;
+	}
+	return true;
+} // ~GzSeeker::start
+
+bool GzSeeker::fill()
+{
+	out.resize(OUT_SIZE);
+	strm.next_out = reinterpret_cast<unsigned char*>(&out[0]);
+	strm.avail_out = OUT_SIZE;
+
+	while (strm.avail_out == OUT_SIZE)
+	{
+		if (strm.avail_in == 0)
+		{
+			ifs.read(reinterpret_cast<char*>(z_in.data()), IN_SIZE);
+			strm.avail_in = static_cast<uInt>(ifs.gcount());
+			strm.next_in = z_in.data();
+			if (strm.avail_in == 0)
+				return false;
+		}
+
+		if (skip_trailer > 0)
+		{
+			uInt len = std::min<uInt>(skip_trailer, strm.avail_in);
+			strm.next_in += len;
+			strm.avail_in -= len;
+			skip_trailer -= len;
+			if (skip_trailer == 0)
+				inflateReset2(&strm, 31); // next member
+			continue;
+		}
+
+		int ret = inflate(&strm, Z_NO_FLUSH);
+		if (ret == Z_STREAM_END)
+		{
+			if (is_raw)
+			{
+				skip_trailer = 8; // CRC32, ISIZE
+				is_raw = false;
+			}
+			else
+				inflateReset(&strm);
+		}
+		else if (ret != Z_OK && ret != Z_BUF_ERROR)
+			return false;
+	}
+	out.resize(OUT_SIZE - strm.avail_out);
+	bpos = 0;
+
+	return true;
+} // ~GzSeeker::fill
+
+bool GzSeeker::getline(std::string & line)
+{
+	line.clear();
+	for (;;)
+	{
+		if (bpos < out.size())
+		{
+			const char* line_start = out.data() + bpos;
+			const char* line_end = static_cast<const char*>(std::memchr(line_start, '\n', out.size() - bpos));
+			if (line_end)
+			{
+				line.append(line_start, line_end);
+				bpos = line_end - out.data() + 1;
+				return true;
+			}
+			line.append(line_start, out.size() - bpos);
+			bpos = out.size();
+		}
+		if (!fill())
+			return !line.empty();
+	}
+} // ~GzSeeker::getline
+
+/*
+ * Parse a single FASTA/FASTQ record from the lines
+ * fastq: 0(header), 1(seq), 2(+), 3(quality)
+ * fasta: 0(header), 1..n(seq)
+ */
+static bool parseRecord(std::function<bool(std::string &)> getline, Read & read)
+{
+	std::string line;
+	bool isFastq = false;
+	int count = 0;
+
+	while (getline(line))
+	{
+		// right-trim whitespace in place (removes '\r' too)
+		line.erase(std::find_if(line.rbegin(), line.rend(), [l = std::locale{}](auto ch) { return !std::isspace(ch, l); }).base(), line.end());
+		if (line.empty())
+			continue;
+
+		if (read.isEmpty)
+		{
+			if (line[0] != FASTA_HEADER_START && line[0] != FASTQ_HEADER_START)
+				return false;
+			isFastq = line[0] == FASTQ_HEADER_START;
+			read.format = isFastq ? Format::FASTQ : Format::FASTA;
+			read.header = line;
+			read.isEmpty = false;
+			continue;
+		}
+
+		if (isFastq)
+		{
+			++count;
+			if (count == 1)
+				read.sequence = line;
+			if (count == 3)
+			{
+				read.quality = line;
+				break;
+			}
+			continue;
+		}
+
+		if (line[0] == FASTA_HEADER_START)
+			break; // next record
+		read.sequence += line; // FASTA multi-line sequence
+	}
+
+	return !read.isEmpty;
+} // ~parseRecord
+
+std::string ReadOffsets::getPath(Runopts & opts)
+{
+	return opts.kvdbPath + "/readoffsets.bin";
+}
+
+/*
+ * Create a new index in the Key-value DB folder. The folder is created if it does not yet exist.
+ */
+bool ReadOffsets::create()
+{
+	if (!dirExists(opts.kvdbPath))
+	{
+#if defined(_WIN32)
+		_mkdir(opts.kvdbPath.data());
+#else
+		mkdir(opts.kvdbPath.data(), 0755);
+#endif
+	}
+
+	std::string path = getPath(opts);
+	buf.resize(READOFFSETS_IO_BUF);
+	fs.rdbuf()->pubsetbuf(buf.data(), buf.size());
+	fs.open(path, std::ios_base::out | std::ios_base::binary | std::ios_base::trunc);
+	if (!fs.is_open())
+	{
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed to create read offsets index " << path << std::endl;
+		return false;
+	}
+
+	std::fill_n((char*)&header, sizeof(header), 0);
+	std::memcpy(header.magic, READOFFSETS_MAGIC, sizeof(header.magic));
+	header.version = READOFFSETS_VERSION;
+	header.is_gz = opts.have_reads_gz ? 1 : 0;
+	ReadStore::getSrcStat(opts, header.src_size, header.src_mtime);
+
+	// placeholder. The final header is written in 'commit'
+	fs.write(reinterpret_cast<char*>(&header), sizeof(header));
+
+	return true;
+} // ~ReadOffsets::create
+
+void ReadOffsets::add(uint64_t offset)
+{
+	fs.write(reinterpret_cast<char*>(&offset), sizeof(offset));
+	++header.num_recs;
+}
+
+void ReadOffsets::commit(std::vector<gz_access_point> & points)
+{
+	header.num_points = points.size();
+	header.points_pos = sizeof(header) + header.num_recs * sizeof(uint64_t);
+
+	for (auto & point : points)
+	{
+		int32_t bits = point.bits;
+		uint32_t wlen = static_cast<uint32_t>(point.window.size());
+		fs.write(reinterpret_cast<char*>(&point.out), sizeof(point.out));
+		fs.write(reinterpret_cast<char*>(&point.in), sizeof(point.in));
+		fs.write(reinterpret_cast<char*>(&bits), sizeof(bits));
+		fs.write(reinterpret_cast<char*>(&wlen), sizeof(wlen));
+		fs.write(point.window.data(), wlen);
+	}
+	fs.seekp(0);
+	fs.write(reinterpret_cast<char*>(&header), sizeof(header));
+	fs.close();
+
+	std::stringstream ss;
+	ss << STAMP << "Read offsets index " << getPath(opts) << " created. Records: " << header.num_recs
+		<< " Access points: " << header.num_points << std::endl;
+	std::cout << ss.str();
+} // ~ReadOffsets::commit
+
+/*
+ * Open an existing index for reading.
+ * The index is only used if it was built from the current Reads file i.e. the size and the modification time match.
+ */
+bool ReadOffsets::open()
+{
+	std::string path = getPath(opts);
+	fs.open(path, std::ios_base::in | std::ios_base::binary);
+	if (!fs.is_open())
+		return false;
+
+	fs.read(reinterpret_cast<char*>(&header), sizeof(header));
+
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	if (!fs || std::memcmp(header.magic, READOFFSETS_MAGIC, sizeof(header.magic)) != 0
+		|| header.version != READOFFSETS_VERSION || header.points_pos == 0
+		|| !ReadStore::getSrcStat(opts, src_size, src_mtime) || src_size != header.src_size || src_mtime != header.src_mtime)
+	{
+		fs.close();
+		return false;
+	}
+
+	return true;
+} // ~ReadOffsets::open
+
+void ReadOffsets::close()
+{
+	if (fs.is_open())
+		fs.close();
+}
+
+bool ReadOffsets::loadPoints()
+{
+	if (points.size() == header.num_points)
+		return true;
+
+	points.resize(header.num_points);
+	fs.seekg(header.points_pos);
+	for (auto & point : points)
+	{
+		int32_t bits = 0;
+		uint32_t wlen = 0;
+		fs.read(reinterpret_cast<char*>(&point.out), sizeof(point.out));
+		fs.read(reinterpret_cast<char*>(&point.in), sizeof(point.in));
+		fs.read(reinterpret_cast<char*>(&bits), sizeof(bits));
+		fs.read(reinterpret_cast<char*>(&wlen), sizeof(wlen));
+		if (!fs || wlen > GZ_WINDOW)
+			break;
+		point.bits = bits;
+		point.window.resize(wlen);
+		fs.read(&point.window[0], wlen);
+	}
+	if (fs.fail())
+	{
+		points.clear();
+		return false;
+	}
+	return true;
+} // ~ReadOffsets::loadPoints
+
+/*
+ * Load the read 'read.id'. The record offset is looked up in the index, so the cost does not depend on the read ID.
+ * A compressed Reads file is inflated from the closest access point i.e. at most GZ_ACCESS_SPAN bytes are discarded.
+ */
+bool ReadOffsets::loadByIdx(Read & read)
+{
+	if (read.id >= header.num_recs)
+		return false;
+
+	uint64_t offset = 0;
+	fs.seekg(sizeof(header) + static_cast<uint64_t>(read.id) * sizeof(uint64_t));
+	fs.read(reinterpret_cast<char*>(&offset), sizeof(offset));
+	if (fs.fail())
+		return false;
+
+	std::ifstream ifs(opts.readsfile, std::ios_base::in | std::ios_base::binary);
+	if (!ifs.is_open())
+	{
+		std::cerr << STAMP << "failed to open " << opts.readsfile << std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	unsigned int id = read.id;
+	bool isok = false;
+	read.clear();
+
+	if (!header.is_gz)
+	{
+		ifs.seekg(offset);
+		isok = parseRecord([&ifs](std::string & line) { return !!std::getline(ifs, line); }, read);
+	}
+	else if (loadPoints())
+	{
+		// last access point at or before the offset
+		auto point = std::upper_bound(points.begin(), points.end(), offset,
+			[](uint64_t off, const gz_access_point & pt) { return off < pt.out; });
+		if (point != points.begin())
+		{
+			GzSeeker seeker(ifs);
+			isok = seeker.start(*(point - 1), offset)
+				&& parseRecord([&seeker](std::string & line) { return seeker.getline(line); }, read);
+		}
+	}
+
+	read.id = id;
+	return isok;
+} // ~ReadOffsets::loadByIdx
@@ -25,6 +25,9 @@
 #include "readstats.hpp"
 #include "kvdb.hpp"
 #include "gzip.hpp"
+#include "readstore.hpp"
+#include "readoffsets.hpp"
+#include "fastxmmap.hpp"
 
 const std::string Readstats::dbkey = "Readstats";
 
@@ -33,6 +36,15 @@ void Readstats::calculate()
 	std::stringstream ss;
 	uint64_t tcount = 0;
 
+	if (!opts.readsfile_r2.empty())
+	{
+		calculatePaired();
+		return;
+	}
+
+	if (!opts.have_reads_gz && calculateMmap())
+		return;
+
 	std::ifstream ifs(opts.readsfile, std::ios_base::in | std::ios_base::binary);
 	if (!ifs.is_open()) {
 		ss << "Failed to open Reads file: " << opts.readsfile << "\n";
@@ -43,9 +55,19 @@ void Readstats::calculate()
 	{
 		std::string line; // line from the Reads file
 		std::string sequence; // full sequence of a Read (can contain multiple lines for Fasta files)
+		std::string header; // header of the current record. Only used when building the read store
+		std::string quality; // quality of the current record. Only used when building the read store
 		bool isFastq = false;
 		bool isFasta = false;
+		bool hasRec = false; // flags a record has been started i.e. a header was seen
 		Gzip gzip(opts);
+		ReadStore store(opts);
+		bool isStore = opts.read_store && store.create(); // build the read store in the same pass
+		ReadOffsets offsets(opts);
+		std::vector<gz_access_point> points;
+		bool isOffsets = !offsets.open() && offsets.create(); // build the read offsets index unless up to date
+		if (isOffsets)
+			gzip.trackOffsets(&points);
 
 		auto t = std::chrono::high_resolution_clock::now();
 
@@ -64,6 +86,8 @@ void Readstats::calculate()
 					++number_total_read;
 					full_read_main += sequence.length();
 				}
+				if (isStore && hasRec)
+					store.add(header, sequence, quality);
 				break;
 			}
 
@@ -118,6 +142,16 @@ void Readstats::calculate()
 					++number_total_read;
 					full_read_main += sequence.length();
 				}
+				if (isStore)
+				{
+					if (hasRec)
+						store.add(header, sequence, quality);
+					header = line;
+					quality.clear();
+				}
+				if (isOffsets)
+					offsets.add(gzip.tell());
+				hasRec = true;
 
 				count = 0; // FASTA record start
 				sequence.clear(); // clear container for the new record
@@ -136,6 +170,18 @@ void Readstats::calculate()
 						std::cout << ss.str(); ss.str("");
 						exit(EXIT_FAILURE);
 					}
+					if (count == 2 && line[0] != '+')
+					{
+						ss << __FILE__ << ":" << __LINE__ << " Expected the FASTQ '+' line after the sequence. Total reads processed: "
+							<< number_total_read
+							<< " Last sequence: " << sequence
+							<< " Last line read: " << line
+							<< " Exiting..." << std::endl;
+						std::cout << ss.str(); ss.str("");
+						exit(EXIT_FAILURE);
+					}
+					if (count == 3 && isStore)
+						quality = line;
 					if ( count == 3 || line[0] == '+' ) 
 						continue; // fastq.quality
 				} // ~if fastq
@@ -144,6 +190,11 @@ void Readstats::calculate()
 			}
 		} // ~for getline
 
+		if (isStore)
+			store.commit(isFastq ? Format::FASTQ : Format::FASTA, number_total_read, full_read_main);
+		if (isOffsets)
+			offsets.commit(points);
+
 		std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
 		ss << std::setprecision(2) << std::fixed 
 			<< "Readstats::calculate done. Elapsed time: " << elapsed.count() 
@@ -153,10 +204,256 @@ void Readstats::calculate()
 	ifs.close();
 } // ~Readstats::calculate
 
+/*
+ * 'calculate' on the memory mapped non-compressed Reads file. Only the lengths are needed, so nothing is copied
+ * unless the read store is being built.
+ * Returns False if the file cannot be mapped.
+ */
+bool Readstats::calculateMmap()
+{
+	std::stringstream ss;
+	FastxMmap fastx(opts.readsfile);
+	if (!fastx.isOpen())
+		return false;
+
+	FastxRec rec;
+	ReadStore store(opts);
+	bool isStore = opts.read_store && store.create(); // build the read store in the same pass
+	ReadOffsets offsets(opts);
+	bool isOffsets = !offsets.open() && offsets.create(); // build the read offsets index unless up to date
+	bool isFirst = true;
+	uint64_t num_recs = 0; // number of records including those with empty sequence i.e. as numbered by Reader
+
+	auto t = std::chrono::high_resolution_clock::now();
+
+	std::cout << "Readstats::calculate starting ...   ";
+
+	while (fastx.next(rec))
+	{
+		if (isFirst && !(rec.header[0] == FASTA_HEADER_START || rec.header[0] == FASTQ_HEADER_START))
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the line [" << rec.getHeader() << "] is not FASTA/Q header" << std::endl;
+			exit(EXIT_FAILURE);
+		}
+		if (!isFirst && fastx.isFastq() && rec.header[0] != FASTQ_HEADER_START)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the line [" << rec.getHeader() << "] is not FASTQ header. number_total_read= "
+				<< number_total_read << std::endl;
+			exit(EXIT_FAILURE);
+		}
+		if (fastx.isFastq() && !rec.has_plus)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the FASTQ read [" << rec.getHeader() << "] has no '+' line "
+				<< "after the sequence. number_total_read= " << number_total_read << std::endl;
+			exit(EXIT_FAILURE);
+		}
+		isFirst = false;
+
+		if (num_recs % READ_CHECKPOINT_INTERVAL == 0)
+			checkpoints.push_back({ rec.offset, num_recs });
+		++num_recs;
+
+		if (rec.seq_len > 0)
+		{
+			++number_total_read;
+			full_read_main += rec.seq_len;
+		}
+
+		if (isStore)
+			store.add(rec.getHeader(), rec.getSequence(), rec.qual_len > 0 ? rec.getQuality() : "");
+		if (isOffsets)
+			offsets.add(rec.offset);
+	}
+
+	if (isStore)
+		store.commit(fastx.isFastq() ? Format::FASTQ : Format::FASTA, number_total_read, full_read_main);
+	if (isOffsets)
+	{
+		std::vector<gz_access_point> points; // none for a non-compressed file
+		offsets.commit(points);
+	}
+
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	ss << std::setprecision(2) << std::fixed
+		<< "Readstats::calculate done. Elapsed time: " << elapsed.count()
+		<< " sec. Reads processed: " << number_total_read << std::endl;
+	std::cout << ss.str(); ss.str("");
+
+	return true;
+} // ~Readstats::calculateMmap
+
+/*
+ * Count the records, the non-empty reads and their nucleotides in the Reads file 'path'
+ */
+static void countReads(Runopts & opts, const std::string & path, uint64_t & num_recs, uint64_t & num_reads, uint64_t & num_bases)
+{
+	if (!opts.have_reads_gz)
+	{
+		FastxMmap fastx(path);
+		if (fastx.isOpen())
+		{
+			FastxRec rec;
+			for (; fastx.next(rec); ++num_recs)
+			{
+				if (rec.seq_len == 0) continue;
+				++num_reads;
+				num_bases += rec.seq_len;
+			}
+			return;
+		}
+	}
+
+	std::ifstream ifs(path, std::ios_base::in | std::ios_base::binary);
+	if (!ifs.is_open())
+	{
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed to open Reads file " << path << std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	std::string line;
+	uint64_t seq_len = 0; // sequence length of the current record
+	bool isFastq = false;
+	Gzip gzip(opts);
+
+	// fastq: 0(header), 1(seq), 2(+), 3(quality)
+	// fasta: 0(header), 1..n(seq)
+	for (int count = 0, stat = 0; ; ++count)
+	{
+		stat = gzip.getline(ifs, line);
+		if (stat == RL_END)
+			break;
+		if (stat == RL_ERR)
+		{
+			std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed reading from Reads file " << path << std::endl;
+			exit(EXIT_FAILURE);
+		}
+
+		line.erase(std::find_if(line.rbegin(), line.rend(), [l = std::locale{}](auto ch) { return !std::isspace(ch, l); }).base(), line.end());
+		if (line.empty())
+		{
+			--count;
+			continue; // skip empty line
+		}
+
+		if (num_recs == 0 && count == 0)
+			isFastq = line[0] == FASTQ_HEADER_START;
+		if (count == 4 && isFastq)
+			count = 0;
+
+		if ((isFastq && count == 0) || (!isFastq && line[0] == FASTA_HEADER_START))
+		{
+			if (seq_len > 0)
+			{
+				++num_reads;
+				num_bases += seq_len;
+			}
+			++num_recs;
+			seq_len = 0;
+			count = 0;
+		}
+		else if (!isFastq || count == 1)
+			seq_len += line.size();
+	}
+	if (seq_len > 0)
+	{
+		++num_reads;
+		num_bases += seq_len;
+	}
+} // ~countReads
+
+/*
+ * 'calculate' for the paired-end reads in two files ('--reads' given twice). Both files must hold the same
+ * number of records. The read store, the read offsets index and the read checkpoints are not built:
+ * the Reader interleaves the mates on the fly.
+ */
+void Readstats::calculatePaired()
+{
+	std::stringstream ss;
+	uint64_t num_recs[2] = { 0, 0 };
+
+	auto t = std::chrono::high_resolution_clock::now();
+
+	std::cout << "Readstats::calculate starting ...   ";
+
+	countReads(opts, opts.readsfile, num_recs[0], number_total_read, full_read_main);
+	countReads(opts, opts.readsfile_r2, num_recs[1], number_total_read, full_read_main);
+
+	if (num_recs[0] != num_recs[1])
+	{
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": the paired Reads files have different number of reads: "
+			<< opts.readsfile << " : " << num_recs[0] << " " << opts.readsfile_r2 << " : " << num_recs[1] << std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	std::chrono::duration<double> elapsed = std::chrono::high_resolution_clock::now() - t;
+	ss << std::setprecision(2) << std::fixed
+		<< "Readstats::calculate done. Elapsed time: " << elapsed.count()
+		<< " sec. Reads processed: " << number_total_read << " in " << num_recs[0] << " pairs" << std::endl;
+	std::cout << ss.str(); ss.str("");
+} // ~Readstats::calculatePaired
+
+/*
+ * Byte range [beg, end) of the Reads file and the ID of its first read for the Reader number 'shard' out of 'num_shards'.
+ * The ranges start on the read checkpoints found by 'calculateMmap' i.e. always on a record boundary.
+ * Returns False if the shard is empty or the checkpoints are not available (compressed Reads file).
+ */
+bool Readstats::getShard(int shard, int num_shards, uint64_t & beg, uint64_t & end, uint64_t & read_id)
+{
+	size_t num_cp = checkpoints.size();
+	size_t first = num_cp * shard / num_shards;
+	size_t last = num_cp * (shard + 1) / num_shards;
+
+	if (first == last)
+		return false;
+
+	beg = checkpoints[first].offset;
+	read_id = checkpoints[first].read_id;
+	end = last < num_cp ? checkpoints[last].offset : UINT64_MAX;
+
+	return true;
+} // ~Readstats::getShard
+
+/*
+ * Restore the counts computed by 'calculate' from an existing read store built on a previous run
+ * over the same Reads file. Saves the full pass over the Reads file.
+ */
+bool Readstats::restoreFromStore()
+{
+	ReadStore store(opts);
+	if (!store.open())
+		return false;
+
+	number_total_read = store.header.number_total_read;
+	full_read_main = store.header.full_read_main;
+
+	std::stringstream ss;
+	ss << STAMP << "Restored from read store " << ReadStore::getPath(opts) 
+		<< " Reads: " << number_total_read << std::endl;
+	std::cout << ss.str();
+
+	return true;
+} // ~Readstats::restoreFromStore
+
 bool Readstats::check_file_format()
 {
 	std::stringstream ss;
 	bool exit_early = false;
+
+	// the reads on stdin can only be peeked. The compressed reads are not known until inflated - FASTQ is assumed
+	if (opts.stream)
+	{
+		int ch = std::cin.peek();
+		if (ch == std::char_traits<char>::eof())
+		{
+			ss << "[" << __func__ << ":" << __LINE__ << "]" << RED << "  ERROR" << COLOFF
+				<< ": empty reads stream on stdin" << std::endl;
+			std::cerr << ss.str();
+			return true;
+		}
+		filesig = opts.have_reads_gz ? FASTQ_HEADER_START : static_cast<char>(ch);
+		return exit_early;
+	}
+
 #ifdef HAVE_LIBZ
 	// Check file format (if ZLIB supported)
 	gzFile fp = gzopen(opts.readsfile.c_str(), "r");
@@ -188,7 +485,7 @@ bool Readstats::check_file_format()
 void Readstats::calcSuffix()
 {
 	const std::string suff = opts.readsfile.substr(opts.readsfile.rfind('.') + 1);
-	if (suff.length() > 0 && !opts.have_reads_gz)
+	if (suff.length() > 0 && !opts.have_reads_gz && !opts.stream)
 		suffix.assign(suff);
 	else if (filesig == FASTA_HEADER_START)
 		suffix.assign("fasta");
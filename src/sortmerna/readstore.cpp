@@ -0,0 +1,273 @@
+/**
+ * FILE: readstore.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Compact binary store of the Reads file. See 'readstore.hpp' for the layout.
+ */
+
+#include <iostream>
+#include <sstream>
+#include <algorithm> // std::fill_n
+#include <cstring> // std::memcpy
+
+#include <sys/types.h>
+#include <sys/stat.h>
+
+#include "readstore.hpp"
+#include "options.hpp"
+#include "read.hpp"
+
+#define READSTORE_IO_BUF 1048576U // 1MB stream buffer
+
+// forward
+bool dirExists(std::string dpath);
+
+std::string ReadStore::getPath(Runopts & opts)
+{
+	return opts.kvdbPath + "/readstore.bin";
+}
+
+bool ReadStore::getSrcStat(Runopts & opts, uint64_t & size, int64_t & mtime)
+{
+	struct stat info;
+	if (stat(opts.readsfile.data(), &info) != 0)
+		return false;
+	size = static_cast<uint64_t>(info.st_size);
+	mtime = static_cast<int64_t>(info.st_mtime);
+	return true;
+}
+
+/*
+ * Create a new store in the Key-value DB folder. The folder is created if it does not yet exist.
+ */
+bool ReadStore::create()
+{
+	if (!dirExists(opts.kvdbPath))
+	{
+#if defined(_WIN32)
+		_mkdir(opts.kvdbPath.data());
+#else
+		mkdir(opts.kvdbPath.data(), 0755);
+#endif
+	}
+
+	std::string path = getPath(opts);
+	buf.resize(READSTORE_IO_BUF);
+	fs.rdbuf()->pubsetbuf(buf.data(), buf.size());
+	fs.open(path, std::ios_base::out | std::ios_base::binary | std::ios_base::trunc);
+	if (!fs.is_open())
+	{
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed to create read store " << path << std::endl;
+		return false;
+	}
+
+	std::fill_n((char*)&header, sizeof(header), 0);
+	std::memcpy(header.magic, READSTORE_MAGIC, sizeof(header.magic));
+	header.version = READSTORE_VERSION;
+	getSrcStat(opts, header.src_size, header.src_mtime);
+
+	// placeholder. The final header is written in 'commit'
+	fs.write(reinterpret_cast<char*>(&header), sizeof(header));
+	pos = sizeof(header);
+	offsets.clear();
+
+	return true;
+} // ~ReadStore::create
+
+void ReadStore::add(const std::string & rheader, const std::string & sequence, const std::string & quality)
+{
+	uint32_t len = static_cast<uint32_t>(rheader.size());
+	std::string rec;
+	rec.reserve(rheader.size() + sequence.size() / 4 + quality.size() + 16);
+
+	offsets.push_back(pos);
+
+	// header
+	rec.append(reinterpret_cast<char*>(&len), sizeof(len));
+	rec.append(rheader);
+
+	// sequence 2-bit packed + ambiguity list
+	len = static_cast<uint32_t>(sequence.size());
+	rec.append(reinterpret_cast<char*>(&len), sizeof(len));
+	size_t packed_pos = rec.size();
+	rec.append((sequence.size() + 3) / 4, 0);
+	std::string exc; // ambiguity list
+	uint32_t num_exc = 0;
+	for (uint32_t i = 0; i < len; ++i)
+	{
+		char ch = sequence[i];
+		char code = nt_table[(int)ch & 0x7f];
+		if (code == 4 || nt_map[(int)code] != ch)
+		{
+			exc.append(reinterpret_cast<char*>(&i), sizeof(i));
+			exc.push_back(ch);
+			++num_exc;
+			code = code == 4 ? 0 : code;
+		}
+		rec[packed_pos + (i >> 2)] |= static_cast<char>(code << ((i & 3) << 1));
+	}
+	rec.append(reinterpret_cast<char*>(&num_exc), sizeof(num_exc));
+	rec.append(exc);
+
+	// quality
+	len = static_cast<uint32_t>(quality.size());
+	rec.append(reinterpret_cast<char*>(&len), sizeof(len));
+	rec.append(quality);
+
+	fs.write(rec.data(), rec.size());
+	pos += rec.size();
+} // ~ReadStore::add
+
+void ReadStore::commit(Format format, uint64_t number_total_read, uint64_t full_read_main)
+{
+	header.format = format == Format::FASTQ ? 1 : 0;
+	header.num_recs = offsets.size();
+	header.number_total_read = number_total_read;
+	header.full_read_main = full_read_main;
+	header.offsets_pos = pos;
+
+	fs.write(reinterpret_cast<char*>(offsets.data()), offsets.size() * sizeof(uint64_t));
+	fs.seekp(0);
+	fs.write(reinterpret_cast<char*>(&header), sizeof(header));
+	fs.close();
+	offsets.clear();
+
+	std::stringstream ss;
+	ss << STAMP << "Read store " << getPath(opts) << " created. Records: " << header.num_recs << std::endl;
+	std::cout << ss.str();
+} // ~ReadStore::commit
+
+/*
+ * Open an existing store for reading.
+ * The store is only used if it was built from the current Reads file i.e. the size and the modification time match.
+ */
+bool ReadStore::open()
+{
+	std::string path = getPath(opts);
+	buf.resize(READSTORE_IO_BUF);
+	fs.rdbuf()->pubsetbuf(buf.data(), buf.size());
+	fs.open(path, std::ios_base::in | std::ios_base::binary);
+	if (!fs.is_open())
+		return false;
+
+	fs.read(reinterpret_cast<char*>(&header), sizeof(header));
+
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	if (!fs || std::memcmp(header.magic, READSTORE_MAGIC, sizeof(header.magic)) != 0
+		|| header.version != READSTORE_VERSION || header.offsets_pos == 0
+		|| !getSrcStat(opts, src_size, src_mtime) || src_size != header.src_size || src_mtime != header.src_mtime)
+	{
+		fs.close();
+		return false;
+	}
+	pos = 0;
+
+	return true;
+} // ~ReadStore::open
+
+void ReadStore::close()
+{
+	if (fs.is_open())
+		fs.close();
+}
+
+bool ReadStore::loadOffsets()
+{
+	if (offsets.size() == header.num_recs)
+		return true;
+	offsets.resize(header.num_recs);
+	fs.seekg(header.offsets_pos);
+	fs.read(reinterpret_cast<char*>(offsets.data()), header.num_recs * sizeof(uint64_t));
+	return !fs.fail();
+}
+
+/*
+ * Read the record at the current stream position.
+ * Every field is checked before it is used, so a truncated or corrupt store fails here instead of writing out of bounds.
+ * The lengths cannot exceed the records section, which ends at the offset table.
+ */
+bool ReadStore::readRecord(Read & read)
+{
+	uint32_t len = 0;
+	uint32_t num_exc = 0;
+	uint32_t epos = 0;
+	bool is_ok = true;
+
+	read.clear();
+
+	is_ok = fs.read(reinterpret_cast<char*>(&len), sizeof(len)) && len <= header.offsets_pos;
+	if (is_ok)
+	{
+		read.header.resize(len);
+		is_ok = static_cast<bool>(fs.read(&read.header[0], len));
+	}
+
+	is_ok = is_ok && fs.read(reinterpret_cast<char*>(&len), sizeof(len)) && len / 4 <= header.offsets_pos;
+	if (is_ok)
+	{
+		std::string packed((len + 3) / 4, 0);
+		is_ok = static_cast<bool>(fs.read(&packed[0], packed.size()));
+		read.sequence.resize(len);
+		for (uint32_t i = 0; is_ok && i < len; ++i)
+			read.sequence[i] = nt_map[(packed[i >> 2] >> ((i & 3) << 1)) & 3];
+	}
+
+	// the characters other than A,C,G,T at their positions in the sequence
+	is_ok = is_ok && fs.read(reinterpret_cast<char*>(&num_exc), sizeof(num_exc)) && num_exc <= read.sequence.size();
+	for (uint32_t i = 0; is_ok && i < num_exc; ++i)
+	{
+		is_ok = fs.read(reinterpret_cast<char*>(&epos), sizeof(epos)) && epos < read.sequence.size()
+			&& fs.read(&read.sequence[epos], 1);
+	}
+
+	is_ok = is_ok && fs.read(reinterpret_cast<char*>(&len), sizeof(len)) && len <= header.offsets_pos;
+	if (is_ok)
+	{
+		read.quality.resize(len);
+		is_ok = static_cast<bool>(fs.read(&read.quality[0], len));
+	}
+
+	if (!is_ok)
+	{
+		std::cerr << STAMP << RED << "ERROR" << COLOFF << ": failed reading record " << pos << " from read store " << getPath(opts)
+			<< ". The store is truncated or corrupt, remove it to parse the Reads file again" << std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	read.format = header.format == 1 ? Format::FASTQ : Format::FASTA;
+	read.isEmpty = false;
+
+	return true;
+} // ~ReadStore::readRecord
+
+bool ReadStore::next(Read & read)
+{
+	if (pos >= header.num_recs)
+		return false;
+	readRecord(read);
+	++pos;
+	return true;
+}
+
+bool ReadStore::seek(uint64_t idx)
+{
+	if (idx > header.num_recs || !loadOffsets())
+		return false;
+	fs.seekg(idx < header.num_recs ? offsets[idx] : header.offsets_pos);
+	pos = idx;
+	return true;
+}
+
+bool ReadStore::loadByIdx(Read & read)
+{
+	if (read.id >= header.num_recs || !loadOffsets())
+		return false;
+
+	unsigned int id = read.id;
+	fs.seekg(offsets[id]);
+	readRecord(read);
+	read.id = id;
+	return true;
+} // ~ReadStore::loadByIdx
@@ -0,0 +1,136 @@
+/**
+ * FILE: refcatalog.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Catalog of the reference sequences of an index. See 'refcatalog.hpp'
+ */
+
+#include <fstream>
+#include <cstring> // memcmp
+
+#include "refcatalog.hpp"
+
+/*
+ * The catalog is of the reference file the index was built from, and has the sequences of every index part
+ * in the order 'References::load' loads them.
+ */
+bool RefCatalog::load(const std::string & path, uint64_t src_size, const std::vector<index_parts_stats> & parts)
+{
+	std::ifstream is(path.c_str(), std::ios::in | std::ios::binary);
+	ref_catalog_header hdr;
+	if (!is.read(reinterpret_cast<char*>(&hdr), sizeof(hdr)) || memcmp(hdr.magic, REF_CATALOG_MAGIC, sizeof(hdr.magic)) != 0
+		|| hdr.version != REF_CATALOG_VERSION || hdr.src_size != src_size || hdr.num_parts != parts.size()
+		|| hdr.ids_pos != sizeof(ref_catalog_header) + sizeof(ref_catalog_rec) * hdr.num_refs || hdr.size < hdr.ids_pos)
+		return false;
+
+	std::vector<ref_catalog_rec> cat_recs(hdr.num_refs);
+	std::string cat_ids(hdr.size - hdr.ids_pos, '\0');
+	is.read(reinterpret_cast<char*>(cat_recs.data()), sizeof(ref_catalog_rec) * cat_recs.size());
+	is.read(&cat_ids[0], cat_ids.size());
+	if (!is)
+		return false;
+
+	// the records of each part follow each other in the order of the part
+	std::vector<uint64_t> cat_part_first(1, 0);
+	for (uint32_t part = 0; part < hdr.num_parts; ++part)
+	{
+		uint64_t first = cat_part_first.back();
+		uint64_t numseq_part = parts[part].numseq_part;
+		if (first + numseq_part > cat_recs.size())
+			return false;
+		for (uint64_t i = 0; i < numseq_part; ++i)
+		{
+			const ref_catalog_rec & rec = cat_recs[first + i];
+			if (rec.part != part || rec.ordinal != i || rec.id_pos + rec.id_len > cat_ids.size())
+				return false;
+		}
+		cat_part_first.push_back(first + numseq_part);
+	}
+	if (cat_part_first.back() != cat_recs.size())
+		return false;
+
+	recs.swap(cat_recs);
+	ids.swap(cat_ids);
+	part_first.swap(cat_part_first);
+	index();
+	return true;
+} // ~RefCatalog::load
+
+void RefCatalog::build(const std::vector<std::pair<std::string, uint32_t>> & sam_sq)
+{
+	recs.clear();
+	ids.clear();
+	part_first.clear();
+	for (auto & sq : sam_sq)
+	{
+		ref_catalog_rec rec;
+		rec.header_pos = 0;
+		rec.id_pos = ids.size();
+		rec.id_len = (uint32_t)sq.first.size();
+		rec.seq_len = sq.second;
+		rec.part = 0;
+		rec.ordinal = 0;
+		recs.push_back(rec);
+		ids.append(sq.first);
+	}
+	index();
+} // ~RefCatalog::build
+
+const ref_catalog_rec* RefCatalog::find(uint32_t part, uint32_t ordinal) const
+{
+	if (part + 1 >= part_first.size() || part_first[part] + ordinal >= part_first[part + 1])
+		return 0;
+	return &recs[part_first[part] + ordinal];
+} // ~RefCatalog::find
+
+const ref_catalog_rec* RefCatalog::find(const std::string & id) const
+{
+	if (slots.empty())
+		return 0;
+	size_t mask = slots.size() - 1;
+	for (size_t slot = hash(id.data(), id.size()) & mask; slots[slot] != 0; slot = (slot + 1) & mask)
+	{
+		const ref_catalog_rec & rec = recs[slots[slot] - 1];
+		if (rec.id_len == id.size() && ids.compare(rec.id_pos, rec.id_len, id) == 0)
+			return &rec;
+	}
+	return 0;
+} // ~RefCatalog::find
+
+/*
+ * The table is at most half full. A repeated id keeps the slot of its first record
+ */
+void RefCatalog::index()
+{
+	size_t num_slots = 1;
+	while (num_slots < 2 * recs.size()) num_slots <<= 1;
+	slots.assign(num_slots, 0);
+
+	size_t mask = num_slots - 1;
+	for (uint32_t i = 0; i < recs.size(); ++i)
+	{
+		const ref_catalog_rec & rec = recs[i];
+		size_t slot = hash(ids.data() + rec.id_pos, rec.id_len) & mask;
+		bool is_repeated = false;
+		for (; slots[slot] != 0 && !is_repeated; slot = (slot + 1) & mask)
+		{
+			const ref_catalog_rec & prev = recs[slots[slot] - 1];
+			is_repeated = prev.id_len == rec.id_len && ids.compare(prev.id_pos, prev.id_len, ids, rec.id_pos, rec.id_len) == 0;
+		}
+		if (!is_repeated)
+			slots[slot] = i + 1;
+	}
+} // ~RefCatalog::index
+
+// FNV-1a
+uint64_t RefCatalog::hash(const char* id, size_t len)
+{
+	uint64_t hash = 14695981039346656037ULL;
+	for (size_t i = 0; i < len; ++i)
+	{
+		hash ^= static_cast<unsigned char>(id[i]);
+		hash *= 1099511628211ULL;
+	}
+	return hash;
+} // ~RefCatalog::hash
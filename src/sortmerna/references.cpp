@@ -10,11 +10,24 @@
 #include <ios>
 #include <cstdint>
 #include <locale>
+#include <cstring> // memcpy
+
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#if !defined(_WIN32)
+#include <unistd.h>
+#include <sys/mman.h>
+#endif
+
+#include "zlib.h"
 
 #include "references.hpp"
 #include "refstats.hpp"
 #include "options.hpp"
 #include "common.hpp"
+#include "shm.hpp"
+#include "indexdb.hpp" // ref_store_header
 
 // prototype: 'load_ref'
 void References::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
@@ -22,6 +35,16 @@ void References::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refst
 	std::stringstream ss;
 	num = idx_num;
 	part = idx_part;
+	catalog = &refstats.catalogs[idx_num];
+
+	// copy the references published by another process ('--shm')
+	if (opts.shm && loadShm(idx_num, idx_part, opts))
+		return;
+
+	// map the reference sequences stored by indexdb
+	if (loadStore(idx_num, idx_part, opts, refstats))
+		return;
+
 	uint32_t numseq_part = refstats.index_parts_stats_vec[idx_num][idx_part].numseq_part;
 
 	std::ifstream ifs(opts.indexfiles[idx_num].first, std::ios_base::in | std::ios_base::binary); // open reference file
@@ -34,9 +57,34 @@ void References::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refst
 		exit(EXIT_FAILURE);
 	}
 
+	// gzipped reference file: inflate the section of the file used to construct this index part.
+	// The offsets in the index stats are in the inflated data
+	std::istringstream gzs;
+	bool is_gz = ifs.get() == 0x1f && ifs.get() == 0x8b;
+	ifs.clear();
+	ifs.seekg(0);
+	if (is_gz)
+	{
+		ifs.close();
+		gzFile gzf = gzopen(opts.indexfiles[idx_num].first.data(), "rb");
+		std::string section(refstats.index_parts_stats_vec[idx_num][idx_part].seq_part_size, 0);
+		if (gzf == NULL
+			|| gzseek(gzf, refstats.index_parts_stats_vec[idx_num][idx_part].start_part, SEEK_SET) == -1
+			|| gzread(gzf, &section[0], (unsigned)section.size()) != (int)section.size())
+		{
+			ss << "  " << RED << "ERROR" << COLOFF << ": [Line " << __LINE__ << ": " << __FILE__
+				<< "] could not inflate the sequences used to construct the index from " << opts.indexfiles[idx_num].first << std::endl;
+			std::cerr << ss.str(); ss.str("");
+			exit(EXIT_FAILURE);
+		}
+		gzclose(gzf);
+		gzs.str(section);
+	}
+	std::istream & in = is_gz ? static_cast<std::istream &>(gzs) : ifs;
+
 	// set the file pointer to the first sequence added to the index for this index file section
-	ifs.seekg(refstats.index_parts_stats_vec[idx_num][idx_part].start_part);
-	if (ifs.fail())
+	if (!is_gz) ifs.seekg(refstats.index_parts_stats_vec[idx_num][idx_part].start_part);
+	if (in.fail())
 	{
 		ss << "  " << RED << "ERROR" << COLOFF << ": [Line " << __LINE__ << ": " << __FILE__
 			<< "] could not locate the sequences used to construct the index" << std::endl
@@ -54,11 +102,11 @@ void References::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refst
 
 	for (int count = 0; num_seq_read != numseq_part; )
 	{
-		if (!lastRec) std::getline(ifs, line);
+		if (!lastRec) std::getline(in, line);
 
 		if (line.empty() && !lastRec)
 		{
-			if (ifs.eof()) lastRec = true;
+			if (in.eof()) lastRec = true;
 			continue;
 		}
 
@@ -121,10 +169,151 @@ void References::load(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refst
 			convert_fix(line);
 			rec.sequence += line;
 		} // ~not header
-		if (ifs.eof()) lastRec = true; // push and break
+		if (in.eof()) lastRec = true; // push and break
 	} // ~for
+
+	if (opts.shm)
+		publishShm(idx_num, idx_part, opts);
 } // ~References::load
 
+/*
+ * Map the reference sequences of the index part written by indexdb (see 'ref_store_header'). The sequences stay
+ * in the mapping, only the headers and the ids are copied.
+ * The mapped pages are shared by all the processes searching the index, so the references are not published with '--shm'
+ *
+ * @return false if there is no store of the index part e.g. the index was built by an earlier indexdb
+ */
+bool References::loadStore(uint32_t idx_num, uint32_t idx_part, Runopts & opts, Refstats & refstats)
+{
+#if defined(_WIN32)
+	return false;
+#else
+	std::string path = opts.indexfiles[idx_num].second + ".ref_" + std::to_string(idx_part) + ".dat";
+	int fd = open(path.data(), O_RDONLY);
+	if (fd < 0)
+		return false;
+
+	struct stat info;
+	if (fstat(fd, &info) != 0 || static_cast<size_t>(info.st_size) < sizeof(ref_store_header))
+	{
+		close(fd);
+		return false;
+	}
+
+	size_t size = info.st_size;
+	void* addr = mmap(0, size, PROT_READ, MAP_SHARED, fd, 0);
+	close(fd); // the mapping keeps the file referenced
+	if (addr == MAP_FAILED)
+		return false;
+	std::shared_ptr<char> mapped(static_cast<char*>(addr), [size](char* p) { munmap(p, size); });
+
+	// the store is of the section of the reference file the index part was built from
+	const ref_store_header* hdr = reinterpret_cast<const ref_store_header*>(mapped.get());
+	index_parts_stats & part_stats = refstats.index_parts_stats_vec[idx_num][idx_part];
+	struct stat ref_info;
+	if (memcmp(hdr->magic, REF_STORE_MAGIC, sizeof(hdr->magic)) != 0 || hdr->version != REF_STORE_VERSION || hdr->size != size
+		|| hdr->num_refs != part_stats.numseq_part || hdr->start_part != part_stats.start_part || hdr->seq_part_size != part_stats.seq_part_size
+		|| stat(opts.indexfiles[idx_num].first.data(), &ref_info) != 0 || hdr->src_size != static_cast<uint64_t>(ref_info.st_size)
+		|| hdr->seqs_pos != sizeof(ref_store_header) + 2 * sizeof(uint64_t) * (hdr->num_refs + 1))
+		return false;
+
+	const uint64_t* seq_offsets = reinterpret_cast<const uint64_t*>(mapped.get() + sizeof(ref_store_header));
+	const uint64_t* header_offsets = seq_offsets + hdr->num_refs + 1;
+	if (hdr->seqs_pos + seq_offsets[hdr->num_refs] != hdr->headers_pos || hdr->headers_pos + header_offsets[hdr->num_refs] != size)
+		return false;
+
+	const char* seqs = mapped.get() + hdr->seqs_pos;
+	const char* headers = mapped.get() + hdr->headers_pos;
+	buffer.resize(hdr->num_refs);
+	for (uint32_t i = 0; i < hdr->num_refs; ++i)
+	{
+		BaseRecord & rec = buffer[i];
+		rec.header.assign(headers + header_offsets[i], header_offsets[i + 1] - header_offsets[i]);
+		rec.seq = seqs + seq_offsets[i];
+		rec.seq_len = seq_offsets[i + 1] - seq_offsets[i];
+		rec.format = Format::FASTA;
+		rec.id = rec.getId();
+		rec.nid = i;
+		rec.isEmpty = false;
+	}
+	store = mapped;
+
+	return true;
+#endif
+} // ~References::loadStore
+
+/*
+ * Segment data - for each reference:
+ *   uint32_t header length, header, uint32_t sequence length, sequence (converted), uint32_t quality length, quality, uint8_t format
+ *
+ * The sequences stay in the segment, which is mapped until the last copy of 'store' is released, so all the processes
+ * attached to the segment share them. Only the headers, the ids and the qualities are copied.
+ */
+bool References::loadShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts)
+{
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	ShmSegment seg;
+	if (!ShmSegment::getSrcStat({ opts.indexfiles[idx_num].first, opts.indexfiles[idx_num].second + ".stats" }, src_size, src_mtime)
+		|| !seg.attach(ShmSegment::getName(opts.indexfiles[idx_num].second, idx_part, "ref"), SHM_REFS_MAGIC, src_size, src_mtime))
+		return false;
+
+	uint64_t num_refs = seg.header()->counts[0];
+	const char* data = seg.data();
+	uint32_t len = 0;
+	buffer.resize(num_refs);
+	for (uint64_t i = 0; i < num_refs; ++i)
+	{
+		BaseRecord & rec = buffer[i];
+		memcpy(&len, data, sizeof(len)); data += sizeof(len);
+		rec.header.assign(data, len); data += len;
+		memcpy(&len, data, sizeof(len)); data += sizeof(len);
+		rec.seq = data;
+		rec.seq_len = len; data += len;
+		memcpy(&len, data, sizeof(len)); data += sizeof(len);
+		rec.quality.assign(data, len); data += len;
+		rec.format = *data++ == 1 ? Format::FASTQ : Format::FASTA;
+		rec.id = rec.getId();
+		rec.nid = i;
+		rec.isEmpty = false;
+	}
+	store.reset(const_cast<char*>(seg.data()), [seg](char*) mutable { seg.detach(); });
+
+	return true;
+} // ~References::loadShm
+
+void References::publishShm(uint32_t idx_num, uint32_t idx_part, Runopts & opts)
+{
+	uint64_t src_size = 0;
+	int64_t src_mtime = 0;
+	if (!ShmSegment::getSrcStat({ opts.indexfiles[idx_num].first, opts.indexfiles[idx_num].second + ".stats" }, src_size, src_mtime))
+		return;
+
+	uint64_t data_size = 0;
+	for (auto & rec : buffer)
+		data_size += 3 * sizeof(uint32_t) + rec.header.size() + rec.sequence.size() + rec.quality.size() + 1;
+
+	ShmSegment seg;
+	char* data = seg.create(ShmSegment::getName(opts.indexfiles[idx_num].second, idx_part, "ref"), SHM_REFS_MAGIC, src_size, src_mtime, data_size);
+	if (data == NULL)
+		return;
+
+	seg.header()->counts[0] = buffer.size();
+	for (auto & rec : buffer)
+	{
+		for (auto str : { &rec.header, &rec.sequence, &rec.quality })
+		{
+			uint32_t len = static_cast<uint32_t>(str->size());
+			memcpy(data, &len, sizeof(len)); data += sizeof(len);
+			memcpy(data, str->data(), len); data += len;
+		}
+		*data++ = rec.format == Format::FASTQ ? 1 : 0;
+	}
+
+	seg.commit();
+	seg.detach();
+} // ~References::publishShm
+
   // convert sequence to numerical form and fix ambiguous chars
 void References::convert_fix(std::string & seq)
 {
@@ -140,7 +329,7 @@ std::string References::convertChar(int idx)
 	std::stringstream ss;
 	std::string chstr;
 	//const char nt_map[5] = { 'A', 'C', 'G', 'T', 'N' }; // TODO: move to common
-	for (std::string::iterator it = buffer[idx].sequence.begin(); it != buffer[idx].sequence.end(); ++it)
+	for (const char* it = buffer[idx].getSeq(); it != buffer[idx].getSeq() + buffer[idx].getSeqLen(); ++it)
 	{
 		if (*it < 5)
 			chstr += nt_map[(int)*it];
@@ -156,14 +345,23 @@ std::string References::convertChar(int idx)
 
 /* 
  * For debugging needs.
- * Find a reference index given a header.
+ * Find a reference index given a reference id. Looked up in the catalog of the index,
+ * the references are only scanned for an id repeated in another part or without a catalog.
+ *
+ * @return index into the buffer, -1 if there is no reference with the id in the loaded part
  */
 int References::findref(std::string id)
 {
+	const ref_catalog_rec* rec = catalog != 0 ? catalog->find(id) : 0;
+	if (rec != 0 && catalog->find(part, rec->ordinal) == rec)
+		return rec->ordinal;
+	if (rec == 0 && catalog != 0 && catalog->find(part, 0) != 0)
+		return -1; // the catalog has all the parts
+
 	int retpos = -1;
 	for (int i = 0; i < buffer.size(); ++i)
 	{
-		if (std::string::npos != buffer[i].header.find(id)) {
+		if (buffer[i].id == id) {
 			retpos = i;
 			break; 
 		}
@@ -175,4 +373,5 @@ int References::findref(std::string id)
 void References::clear()
 {
 	buffer.clear(); // TODO: is this enough?
+	store.reset();
 } // ~References::clear
@@ -8,6 +8,11 @@
 #include <sstream>
 #include <ios>
 #include <vector>
+#include <map>
+#include <mutex>
+#include <cstring> // memcmp, memset
+#include <cstddef> // offsetof
+#include <cmath> // log, exp
 
 #include "sls_alignment_evaluer.hpp" // ../alp/
 
@@ -16,6 +21,10 @@
 #include "options.hpp"
 #include "indexdb.hpp"
 
+// Gumbel parameters computed or loaded by this process, keyed by the key fields of 'gumbel_cache_rec'
+static std::map<std::string, std::pair<double, double>> gumbel_cache;
+static std::mutex gumbel_cache_lock;
+
 Refstats::Refstats(Runopts & opts, Readstats & readstats)
 	:
 	num_index_parts(opts.indexfiles.size(), 0),
@@ -26,7 +35,10 @@ Refstats::Refstats(Runopts & opts, Readstats & readstats)
 	minimal_score(opts.indexfiles.size(), 0),
 	gumbel(opts.indexfiles.size(), std::pair<double, double>(-1.0, -1.0)),
 	numbvs(opts.indexfiles.size(), 0),
-	numseq(opts.indexfiles.size(), 0)
+	numseq(opts.indexfiles.size(), 0),
+	entropy(opts.indexfiles.size(), 0),
+	evalue(opts.evalue),
+	is_per_read(opts.stream)
 {
 	std::stringstream ss;
 	ss << __func__ << ":" << __LINE__ << " Index Statistics calculation Start ...";
@@ -146,68 +158,135 @@ void Refstats::load(Runopts & opts, Readstats & readstats)
 
 		index_parts_stats_vec.push_back(hold);
 
-		// Gumbel parameters
-		long **substitutionScoreMatrix = scoring_matrix;
-		long gapOpen1 = opts.gap_open;
-		long gapOpen2 = opts.gap_open;
-		long gapEpen1 = opts.gap_extension;
-		long gapEpen2 = opts.gap_extension;
-		bool insertions_after_deletions = false;
-		double max_time = -1; // required if radomization parameters are set
-		double max_mem = 500;
-		double eps_lambda = 0.001;
-		double eps_K = 0.005;
-		long randomSeed = 182345345;
-		double *letterFreqs1 = new double[alphabetSize];
-		double *letterFreqs2 = new double[alphabetSize];
-		long number_of_samples = 14112;
-		long number_of_samples_for_preliminary_stages = 39;
+		// catalog of the reference sequences. Indexes built by earlier versions of indexdb have none, the @SQ ids and lengths are used
+		catalogs.push_back(RefCatalog());
+		bool has_catalog = catalogs.back().load(opts.indexfiles[index_num].second + ".refcat", filesize, hold);
+		std::vector<std::pair<std::string, uint32_t>> sam_sq;
+
+		// predicted search memory of each index part, after the @SQ ids. Indexes built by earlier versions of indexdb have none
+		std::vector<part_mem_stats> part_mem_hold;
+		std::streampos sq_pos = stats.tellg();
+		uint32_t num_sq = 0;
+		stats.read(reinterpret_cast<char*>(&num_sq), sizeof(uint32_t));
+		for (uint32_t j = 0; j < num_sq && stats.good(); j++)
+		{
+			uint32_t len_id = 0;
+			stats.read(reinterpret_cast<char*>(&len_id), sizeof(uint32_t));
+			if (has_catalog)
+			{
+				stats.seekg(len_id + sizeof(uint32_t), std::ios_base::cur); // the id and the sequence length
+				continue;
+			}
+			std::string id(len_id, '\0');
+			uint32_t len_seq = 0;
+			stats.read(&id[0], len_id);
+			stats.read(reinterpret_cast<char*>(&len_seq), sizeof(uint32_t));
+			sam_sq.push_back(std::pair<std::string, uint32_t>(id, len_seq));
+		}
+		if (!has_catalog)
+			catalogs.back().build(sam_sq);
+		char magic[sizeof(PART_MEM_MAGIC)] = { 0 };
+		uint16_t num_mem = 0;
+		if (stats.read(magic, sizeof(magic)) && memcmp(magic, PART_MEM_MAGIC, sizeof(magic)) == 0
+			&& stats.read(reinterpret_cast<char*>(&num_mem), sizeof(uint16_t)) && num_mem == num_index_parts[index_num])
+		{
+			part_mem_hold.resize(num_mem);
+			stats.read(reinterpret_cast<char*>(part_mem_hold.data()), sizeof(part_mem_stats) * num_mem);
+			if (!stats)
+				part_mem_hold.clear();
+		}
+		part_mem.push_back(part_mem_hold);
+		stats.clear();
+		stats.seekg(sq_pos);
 
+		// Gumbel parameters. The ALP simulation is only run for a new scoring or a new reference
+		gumbel_cache_rec gumbel_rec;
+		memset(&gumbel_rec, 0, sizeof(gumbel_rec));
 		for (long i = 0; i < alphabetSize; i++)
+			for (long j = 0; j < alphabetSize; j++)
+				gumbel_rec.scoring[i * alphabetSize + j] = scoring_matrix[i][j];
+		gumbel_rec.gap_open = opts.gap_open;
+		gumbel_rec.gap_extension = opts.gap_extension;
+		for (long i = 0; i < alphabetSize; i++)
+			gumbel_rec.background_freq[i] = background_freq_gv[i];
+
+		std::string gumbel_path = opts.indexfiles[index_num].second + ".gumbel";
+		if (!findGumbel(gumbel_path, gumbel_rec))
 		{
-			// background probabilities for ACGT based on reference file
-			letterFreqs1[i] = background_freq_gv[i];
-			letterFreqs2[i] = background_freq_gv[i];
+			long **substitutionScoreMatrix = scoring_matrix;
+			long gapOpen1 = opts.gap_open;
+			long gapOpen2 = opts.gap_open;
+			long gapEpen1 = opts.gap_extension;
+			long gapEpen2 = opts.gap_extension;
+			bool insertions_after_deletions = false;
+			double max_time = -1; // required if radomization parameters are set
+			double max_mem = 500;
+			double eps_lambda = 0.001;
+			double eps_K = 0.005;
+			long randomSeed = 182345345;
+			double *letterFreqs1 = new double[alphabetSize];
+			double *letterFreqs2 = new double[alphabetSize];
+			long number_of_samples = 14112;
+			long number_of_samples_for_preliminary_stages = 39;
+
+			for (long i = 0; i < alphabetSize; i++)
+			{
+				// background probabilities for ACGT based on reference file
+				letterFreqs1[i] = background_freq_gv[i];
+				letterFreqs2[i] = background_freq_gv[i];
+			}
+
+			Sls::AlignmentEvaluer gumbelCalculator; // object to store the Gumbel parameters
+
+			// set the randomization parameters
+			// (will yield the same Lamba and K values on subsequent runs with the same input files)
+			gumbelCalculator.set_gapped_computation_parameters_simplified(
+				max_time,
+				number_of_samples,
+				number_of_samples_for_preliminary_stages);
+
+			gumbelCalculator.initGapped(
+				alphabetSize,
+				substitutionScoreMatrix,
+				letterFreqs1,
+				letterFreqs2,
+				gapOpen1,
+				gapEpen1,
+				gapOpen2,
+				gapEpen2,
+				insertions_after_deletions,
+				eps_lambda,
+				eps_K,
+				max_time,
+				max_mem,
+				randomSeed);
+
+			gumbel_rec.lambda = gumbelCalculator.parameters().lambda;
+			gumbel_rec.K = gumbelCalculator.parameters().K;
+
+			delete[] letterFreqs2;
+			delete[] letterFreqs1;
+
+			storeGumbel(gumbel_path, gumbel_rec);
 		}
 
-		Sls::AlignmentEvaluer gumbelCalculator; // object to store the Gumbel parameters
-
-		// set the randomization parameters
-		// (will yield the same Lamba and K values on subsequent runs with the same input files)
-		gumbelCalculator.set_gapped_computation_parameters_simplified(
-			max_time,
-			number_of_samples,
-			number_of_samples_for_preliminary_stages);
-
-		gumbelCalculator.initGapped(
-			alphabetSize,
-			substitutionScoreMatrix,
-			letterFreqs1,
-			letterFreqs2,
-			gapOpen1,
-			gapEpen1,
-			gapOpen2,
-			gapEpen2,
-			insertions_after_deletions,
-			eps_lambda,
-			eps_K,
-			max_time,
-			max_mem,
-			randomSeed);
-
-		gumbel[index_num].first = gumbelCalculator.parameters().lambda;
-		gumbel[index_num].second = gumbelCalculator.parameters().K;
-
-		delete[] letterFreqs2;
-		delete[] letterFreqs1;
+		gumbel[index_num].first = gumbel_rec.lambda;
+		gumbel[index_num].second = gumbel_rec.K;
 
 		// Shannon's entropy for reference sequence nucleotide distribution
-		double entropy_H_gv =
+		double entropy_H_gv = entropy[index_num] =
 			-(background_freq_gv[0] * (log(background_freq_gv[0]) / log(2))
 				+ background_freq_gv[1] * (log(background_freq_gv[1]) / log(2))
 				+ background_freq_gv[2] * (log(background_freq_gv[2]) / log(2))
 				+ background_freq_gv[3] * (log(background_freq_gv[3]) / log(2)));
 
+		// the reads are streamed: the size of the reads is not known. See 'searchSpace'
+		if (is_per_read)
+		{
+			stats.close();
+			continue;
+		}
+
 		// Length correction for Smith-Waterman alignment score
 		uint64_t expect_L = static_cast<uint64_t>(log((gumbel[index_num].second)*full_read[index_num] * full_ref[index_num]) / entropy_H_gv);
 
@@ -226,34 +305,6 @@ void Refstats::load(Runopts & opts, Readstats & readstats)
 			/ -(gumbel[index_num].first));
 
 
-		// TODO: move to Output::writeSamHeader
-		// SAM @SQ data
-		if (opts.samout)
-		{
-#if 0
-			// number of nucleotide sequences in the reference file
-			uint32_t num_sq = 0;
-			stats.read(reinterpret_cast<char*>(&num_sq), sizeof(uint32_t));
-
-			// loop through each @SQ
-			for (uint32_t j = 0; j < num_sq; j++)
-			{
-				// length of the sequence id
-				uint32_t len_id = 0;
-				stats.read(reinterpret_cast<char*>(&len_id), sizeof(uint32_t));
-				// the sequence id string
-				std::string s(len_id + 1, 0); // AK
-				std::vector<char> vs(s.begin(), s.end());
-				stats.read(reinterpret_cast<char*>(&vs[0]), sizeof(char)*len_id);
-				// the length of the sequence itself
-				uint32_t len_seq = 0;
-				stats.read(reinterpret_cast<char*>(&len_seq), sizeof(uint32_t));
-				@SQ header
-					if (opts.yes_SQ) acceptedsam << "@SQ\tSN:" << s << "\tLN:" << len_seq << "\n";
-			}
-#endif
-		}
-
 		stats.close();
 	} // ~for loop indices
 
@@ -264,4 +315,109 @@ void Refstats::load(Runopts & opts, Readstats & readstats)
 	};
 
 	delete[] scoring_matrix;
-} // ~Index::load_stats
\ No newline at end of file
+} // ~Index::load_stats
+
+/*
+ * Look up the Gumbel parameters of the record key, first among the ones of this process, then in the cache file
+ *
+ * @return true and the record 'lambda' and 'K' set if found
+ */
+bool Refstats::findGumbel(const std::string & path, gumbel_cache_rec & rec)
+{
+	std::string key(reinterpret_cast<const char*>(&rec), offsetof(gumbel_cache_rec, lambda));
+	std::lock_guard<std::mutex> lock(gumbel_cache_lock);
+
+	auto it = gumbel_cache.find(key);
+	if (it != gumbel_cache.end())
+	{
+		rec.lambda = it->second.first;
+		rec.K = it->second.second;
+		return true;
+	}
+
+	std::ifstream ifs(path, std::ios::in | std::ios::binary);
+	char magic[sizeof(GUMBEL_CACHE_MAGIC)] = { 0 };
+	uint32_t version = 0;
+	if (!ifs.read(magic, sizeof(magic)) || memcmp(magic, GUMBEL_CACHE_MAGIC, sizeof(magic)) != 0
+		|| !ifs.read(reinterpret_cast<char*>(&version), sizeof(uint32_t)) || version != GUMBEL_CACHE_VERSION)
+		return false;
+
+	gumbel_cache_rec cached;
+	while (ifs.read(reinterpret_cast<char*>(&cached), sizeof(gumbel_cache_rec)))
+	{
+		if (memcmp(&cached, &rec, key.size()) == 0 && cached.lambda > 0 && cached.K > 0)
+		{
+			rec.lambda = cached.lambda;
+			rec.K = cached.K;
+			gumbel_cache[key] = std::make_pair(rec.lambda, rec.K);
+			return true;
+		}
+	}
+	return false;
+} // ~Refstats::findGumbel
+
+/*
+ * Keep the computed Gumbel parameters for this process, and append them to the cache file.
+ * A missing or outdated cache file is started anew. The index directory may be read-only - then nothing is written
+ */
+void Refstats::storeGumbel(const std::string & path, const gumbel_cache_rec & rec)
+{
+	std::string key(reinterpret_cast<const char*>(&rec), offsetof(gumbel_cache_rec, lambda));
+	std::lock_guard<std::mutex> lock(gumbel_cache_lock);
+	gumbel_cache[key] = std::make_pair(rec.lambda, rec.K);
+
+	bool is_valid = false;
+	{
+		std::ifstream ifs(path, std::ios::in | std::ios::binary);
+		char magic[sizeof(GUMBEL_CACHE_MAGIC)] = { 0 };
+		uint32_t version = 0;
+		is_valid = ifs.read(magic, sizeof(magic)) && memcmp(magic, GUMBEL_CACHE_MAGIC, sizeof(magic)) == 0
+			&& ifs.read(reinterpret_cast<char*>(&version), sizeof(uint32_t)) && version == GUMBEL_CACHE_VERSION;
+	}
+
+	std::ofstream ofs(path, std::ios::out | std::ios::binary | (is_valid ? std::ios::app : std::ios::trunc));
+	if (!ofs.good())
+		return;
+	if (!is_valid)
+	{
+		ofs.write(GUMBEL_CACHE_MAGIC, sizeof(GUMBEL_CACHE_MAGIC));
+		ofs.write(reinterpret_cast<const char*>(&GUMBEL_CACHE_VERSION), sizeof(uint32_t));
+	}
+	ofs.write(reinterpret_cast<const char*>(&rec), sizeof(gumbel_cache_rec));
+} // ~Refstats::storeGumbel
+
+/*
+ * Search space of a single read when the reads are streamed: the E-value is per read (as BLAST per query)
+ * instead of per the whole Reads file. The same length correction as in 'load' with a single read of the given length.
+ */
+double Refstats::searchSpace(uint16_t index_num, size_t read_len)
+{
+	double K = gumbel[index_num].second;
+	uint64_t expect_L = static_cast<uint64_t>(log(K * read_len * full_ref[index_num]) / entropy[index_num]);
+	uint64_t ref_len = full_ref[index_num];
+	if (ref_len > expect_L * numseq[index_num])
+		ref_len -= expect_L * numseq[index_num];
+	uint64_t len = read_len > expect_L ? read_len - expect_L : 1;
+	return (double)ref_len * len;
+} // ~Refstats::searchSpace
+
+uint32_t Refstats::getMinimalScore(uint16_t index_num, size_t read_len)
+{
+	if (!is_per_read)
+		return minimal_score[index_num];
+
+	return static_cast<uint32_t>(
+		(log(evalue / (gumbel[index_num].second * searchSpace(index_num, read_len))))
+		/ -(gumbel[index_num].first));
+} // ~Refstats::getMinimalScore
+
+double Refstats::getEvalue(uint16_t index_num, size_t read_len, int32_t score)
+{
+	if (!is_per_read)
+		return (double)gumbel[index_num].second
+			* full_ref[index_num]
+			* full_read[index_num]
+			* std::exp(-gumbel[index_num].first * score);
+
+	return gumbel[index_num].second * searchSpace(index_num, read_len) * std::exp(-gumbel[index_num].first * score);
+} // ~Refstats::getEvalue
\ No newline at end of file
@@ -0,0 +1,145 @@
+/**
+ * FILE: runcontext.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Objects shared by the tasks of a run. See 'runcontext.hpp'
+ */
+
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <algorithm> // std::max
+
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <unistd.h> // sysconf
+
+#include "runcontext.hpp"
+#include "readstats.hpp"
+#include "refstats.hpp"
+#include "kvdb.hpp"
+#include "indexdb.hpp" // kmer_flat
+
+RunContext::RunContext(Runopts & opts, Readstats & readstats)
+	:
+	opts(opts),
+	readstats(readstats)
+{}
+
+RunContext::~RunContext() {} // 'KeyValueDatabase' and 'Refstats' are complete here
+
+KeyValueDatabase & RunContext::getKvdb()
+{
+	if (!kvdb)
+		kvdb.reset(new KeyValueDatabase(opts.kvdbPath));
+	return *kvdb;
+} // ~RunContext::getKvdb
+
+Refstats & RunContext::getRefstats()
+{
+	if (refstats)
+		return *refstats;
+
+	refstats.reset(new Refstats(opts, readstats));
+
+	// the references are used again by the post-processing and the reports
+	if (opts.alirep == Runopts::ALIGN_REPORT::alipost || opts.alirep == Runopts::ALIGN_REPORT::all)
+	{
+		uint64_t refs_mem = 0;
+		uint64_t index_mem = 0; // largest index part without its references
+		for (uint16_t index_num = 0; index_num < (uint16_t)opts.indexfiles.size(); ++index_num)
+		{
+			for (uint16_t idx_part = 0; idx_part < refstats->num_index_parts[index_num]; ++idx_part)
+			{
+				uint64_t part_refs_mem = refsMemSize(index_num, idx_part);
+				refs_mem += part_refs_mem;
+				index_mem = std::max(index_mem, partMemSize(index_num, idx_part) - part_refs_mem);
+			}
+		}
+		keep_refs = refs_mem + 2 * index_mem <= memBudget();
+
+		std::stringstream ss;
+		ss << STAMP << (keep_refs ? "Keeping" : "Not keeping") << " the references of all the index parts between the tasks: "
+			<< (refs_mem >> 20) << " MB and the searched index parts " << (2 * index_mem >> 20) << " MB, the limit is "
+			<< (memBudget() >> 20) << " MB (--prefetch_mem)" << std::endl;
+		std::cout << ss.str();
+	}
+
+	return *refstats;
+} // ~RunContext::getRefstats
+
+/*
+ * The references are loaded outside the lock: the main thread and the prefetcher thread never ask for the same part at the same time
+ */
+References & RunContext::getRefs(uint16_t index_num, uint16_t idx_part)
+{
+	References* part_refs = 0;
+	{
+		std::lock_guard<std::mutex> lock(refs_lock);
+		part_refs = &refs[std::make_pair(index_num, idx_part)]; // the map nodes do not move
+	}
+	if (part_refs->buffer.empty())
+		part_refs->load(index_num, idx_part, opts, getRefstats());
+	return *part_refs;
+} // ~RunContext::getRefs
+
+void RunContext::releaseRefs(uint16_t index_num, uint16_t idx_part)
+{
+	if (keep_refs)
+		return;
+	std::lock_guard<std::mutex> lock(refs_lock);
+	refs.erase(std::make_pair(index_num, idx_part));
+} // ~RunContext::releaseRefs
+
+/*
+ * Estimate the memory (bytes) taken by an index part and its reference sequences once loaded:
+ * the look-up table, the burst tries and positions files, and the raw reference section.
+ * Indexes built by the current indexdb record the prediction in the '.stats' file (see 'part_mem_stats').
+ */
+uint64_t RunContext::partMemSize(uint16_t index_num, uint16_t idx_part)
+{
+	Refstats & refstats = getRefstats();
+
+	// predicted by indexdb
+	if (idx_part < refstats.part_mem[index_num].size())
+		return refstats.part_mem[index_num][idx_part].total();
+
+	uint64_t size = (uint64_t(1) << refstats.lnwin[index_num]) * sizeof(kmer_flat);
+	for (auto ext : { ".bursttrie_", ".pos_" })
+	{
+		struct stat info;
+		std::string file = opts.indexfiles[index_num].second + ext + std::to_string(idx_part) + ".dat";
+		if (stat(file.data(), &info) == 0)
+			size += static_cast<uint64_t>(info.st_size);
+	}
+	size += refsMemSize(index_num, idx_part);
+	return size;
+} // ~RunContext::partMemSize
+
+uint64_t RunContext::refsMemSize(uint16_t index_num, uint16_t idx_part)
+{
+	Refstats & refstats = getRefstats();
+
+	// predicted by indexdb
+	if (idx_part < refstats.part_mem[index_num].size())
+		return refstats.part_mem[index_num][idx_part].references;
+
+	return refstats.index_parts_stats_vec[index_num][idx_part].seq_part_size;
+} // ~RunContext::refsMemSize
+
+/*
+ * Memory (bytes) available for holding the searched index part and the prefetched one, and the references kept
+ * between the tasks. See '--prefetch_mem'
+ */
+uint64_t RunContext::memBudget()
+{
+	if (opts.prefetch_mem >= 0)
+		return static_cast<uint64_t>(opts.prefetch_mem) << 20;
+
+	long pages = sysconf(_SC_PHYS_PAGES);
+	long page_size = sysconf(_SC_PAGE_SIZE);
+	if (pages <= 0 || page_size <= 0)
+		return 0;
+	return static_cast<uint64_t>(pages) * static_cast<uint64_t>(page_size) / 2;
+} // ~RunContext::memBudget
@@ -0,0 +1,251 @@
+/**
+ * FILE: shm.cpp
+ * Created: Oct 17, 2026 Sat
+ * @copyright 2016-19 Clarity Genomics BVBA
+ *
+ * Named POSIX shared memory segments. See 'shm.hpp'
+ */
+
+#include <iostream>
+#include <sstream>
+#include <iomanip>
+#include <atomic>
+#include <cstring> // memcpy, memcmp, strerror
+#include <cerrno>
+#include <climits> // PATH_MAX
+#include <cstdlib> // realpath
+#include <ctime>
+
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#if !defined(_WIN32)
+#include <unistd.h>
+#include <signal.h> // kill
+#include <sys/mman.h>
+#endif
+
+#include "shm.hpp"
+#include "common.hpp"
+
+/*
+ * Segment name for the given part of an index or a reference file, e.g. '/smr_1f2e3d4c5b6a7988_idx_0'
+ * The name is derived from the canonical path, so all the processes using the same files share the segment.
+ */
+std::string ShmSegment::getName(const std::string & path, uint32_t part, const char * kind)
+{
+	std::string fpath = path;
+#if !defined(_WIN32)
+	char rpath[PATH_MAX];
+	if (realpath(path.data(), rpath) != NULL)
+		fpath = rpath;
+#endif
+	// FNV-1a
+	uint64_t hash = 14695981039346656037ULL;
+	for (auto ch : fpath)
+	{
+		hash ^= static_cast<unsigned char>(ch);
+		hash *= 1099511628211ULL;
+	}
+
+	std::stringstream ss;
+	ss << "/smr_" << std::hex << std::setw(16) << std::setfill('0') << hash << std::dec << "_" << kind << "_" << part;
+	return ss.str();
+} // ~ShmSegment::getName
+
+bool ShmSegment::getSrcStat(const std::vector<std::string> & files, uint64_t & size, int64_t & mtime)
+{
+	size = 0;
+	mtime = 0;
+	for (auto & file : files)
+	{
+		struct stat info;
+		if (stat(file.data(), &info) != 0)
+			return false;
+		size += static_cast<uint64_t>(info.st_size);
+		mtime = mtime * 31 + static_cast<int64_t>(info.st_mtime); // any of the files replaced changes the value
+	}
+	return true;
+} // ~ShmSegment::getSrcStat
+
+/*
+ * Map an existing segment read-only.
+ * A segment published from different source files is removed, so that it can be published again.
+ *
+ * @return false if there is no complete segment built from the current source files
+ */
+bool ShmSegment::attach(const std::string & name, const char * magic, uint64_t src_size, int64_t src_mtime)
+{
+#if defined(_WIN32)
+	return false;
+#else
+	int fd = shm_open(name.data(), O_RDONLY, 0);
+	if (fd < 0)
+		return false;
+
+	struct stat info;
+	if (fstat(fd, &info) != 0 || static_cast<size_t>(info.st_size) < sizeof(shm_header))
+	{
+		close(fd);
+		return false;
+	}
+
+	void* addr = mmap(0, info.st_size, PROT_READ, MAP_SHARED, fd, 0);
+	close(fd); // the mapping keeps the segment referenced
+	if (addr == MAP_FAILED)
+		return false;
+
+	const volatile shm_header* hdr = static_cast<shm_header*>(addr);
+	bool is_ready = hdr->ready == 1;
+	std::atomic_thread_fence(std::memory_order_acquire); // the data is complete once 'ready' is seen
+
+	if (!is_ready || memcmp(const_cast<const char*>(hdr->magic), magic, sizeof(hdr->magic)) != 0 || hdr->version != SHM_VERSION
+		|| hdr->size != static_cast<uint64_t>(info.st_size) || hdr->src_size != src_size || hdr->src_mtime != src_mtime)
+	{
+		munmap(addr, info.st_size);
+		// stale segment. A segment not yet ready is being written by another process - leave it unless the process is gone
+		if (is_ready)
+			shm_unlink(name.data());
+		else
+			removeStale(name);
+		return false;
+	}
+
+	base = static_cast<char*>(addr);
+	size = info.st_size;
+	return true;
+#endif
+} // ~ShmSegment::attach
+
+/*
+ * Create a new segment for publishing. The memory is reserved up front, so a full shared memory
+ * file system fails here rather than when the data is written.
+ *
+ * @return pointer to the data, or NULL if the segment already exists (published by another process) or cannot be created
+ */
+char* ShmSegment::create(const std::string & name, const char * magic, uint64_t src_size, int64_t src_mtime, uint64_t data_size)
+{
+#if defined(_WIN32)
+	return NULL;
+#else
+	int fd = shm_open(name.data(), O_RDWR | O_CREAT | O_EXCL, 0644);
+	if (fd < 0 && errno == EEXIST && removeStale(name))
+		fd = shm_open(name.data(), O_RDWR | O_CREAT | O_EXCL, 0644); // left incomplete by a process that died
+	if (fd < 0)
+	{
+		if (errno != EEXIST)
+			std::cerr << STAMP << YELLOW << "WARNING" << COLOFF << ": could not create shared memory segment " << name
+				<< ": " << strerror(errno) << std::endl;
+		return NULL;
+	}
+
+	size_t sz = sizeof(shm_header) + data_size;
+#if defined(__linux__)
+	int err = posix_fallocate(fd, 0, sz);
+#else
+	int err = ftruncate(fd, sz) == 0 ? 0 : errno;
+#endif
+	void* addr = err == 0 ? mmap(0, sz, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0) : MAP_FAILED;
+	if (addr == MAP_FAILED)
+	{
+		std::cerr << STAMP << YELLOW << "WARNING" << COLOFF << ": could not allocate " << (sz >> 20)
+			<< " MB of shared memory for " << name << ": " << strerror(err ? err : errno) << std::endl;
+		close(fd);
+		shm_unlink(name.data());
+		return NULL;
+	}
+	close(fd);
+
+	base = static_cast<char*>(addr);
+	size = sz;
+	this->name = name;
+
+	shm_header* hdr = header();
+	memset(hdr, 0, sizeof(shm_header));
+	memcpy(hdr->magic, magic, sizeof(hdr->magic));
+	hdr->version = SHM_VERSION;
+	hdr->size = sz;
+	hdr->src_size = src_size;
+	hdr->src_mtime = src_mtime;
+	hdr->owner_pid = static_cast<int64_t>(getpid());
+	hdr->created = static_cast<int64_t>(time(NULL));
+
+	return base + sizeof(shm_header);
+#endif
+} // ~ShmSegment::create
+
+void ShmSegment::commit()
+{
+	std::atomic_thread_fence(std::memory_order_release); // the data is written before 'ready'
+	static_cast<volatile shm_header*>(header())->ready = 1;
+
+	std::stringstream ss;
+	ss << STAMP << "Published " << (size >> 20) << " MB to shared memory segment " << name << std::endl;
+	std::cout << ss.str();
+} // ~ShmSegment::commit
+
+/*
+ * A segment not ready is stale if the process publishing it has exited without completing it, or has not completed it
+ * in SHM_PUBLISH_TIMEOUT (e.g. the pid was reused). Until the publishing process records itself in the new segment,
+ * the time of the segment is its last modification.
+ * The publishing process is looked up on this host, i.e. the processes sharing the segments must see each other's pids.
+ *
+ * @return true if the segment was stale and is removed
+ */
+bool ShmSegment::removeStale(const std::string & name)
+{
+#if defined(_WIN32)
+	return false;
+#else
+	int fd = shm_open(name.data(), O_RDONLY, 0);
+	if (fd < 0)
+		return false;
+
+	struct stat info;
+	if (fstat(fd, &info) != 0)
+	{
+		close(fd);
+		return false;
+	}
+	void* addr = MAP_FAILED;
+	if (static_cast<size_t>(info.st_size) >= sizeof(shm_header))
+		addr = mmap(0, sizeof(shm_header), PROT_READ, MAP_SHARED, fd, 0);
+	close(fd);
+
+	int64_t now = static_cast<int64_t>(time(NULL));
+	bool is_stale = false;
+	if (addr == MAP_FAILED)
+	{
+		// the segment is being sized by its publishing process
+		is_stale = now - static_cast<int64_t>(info.st_mtime) > SHM_PUBLISH_TIMEOUT;
+	}
+	else
+	{
+		const volatile shm_header* hdr = static_cast<shm_header*>(addr);
+		int64_t owner_pid = hdr->owner_pid;
+		int64_t created = owner_pid != 0 ? hdr->created : static_cast<int64_t>(info.st_mtime);
+		bool is_owner_gone = owner_pid != 0 && kill(static_cast<pid_t>(owner_pid), 0) != 0 && errno == ESRCH;
+		is_stale = hdr->ready != 1 && (is_owner_gone || now - created > SHM_PUBLISH_TIMEOUT);
+		munmap(addr, sizeof(shm_header));
+	}
+
+	if (!is_stale)
+		return false;
+
+	std::cerr << STAMP << YELLOW << "WARNING" << COLOFF << ": removing the shared memory segment " << name
+		<< " left incomplete by its publishing process" << std::endl;
+	shm_unlink(name.data());
+	return true;
+#endif
+} // ~ShmSegment::removeStale
+
+void ShmSegment::detach()
+{
+#if !defined(_WIN32)
+	if (base != NULL)
+		munmap(base, size);
+#endif
+	base = NULL;
+	size = 0;
+	name.clear();
+} // ~ShmSegment::detach
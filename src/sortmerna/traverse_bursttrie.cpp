@@ -94,7 +94,7 @@ uint32_t table[4][16][14] = {
 
 /*! @fn traversetrie_align() */
 void traversetrie_align(
-	NodeElement *trie_t,
+	const FlatNodeElement *trie_t,
 	uint32_t lev_t,
 	unsigned char depth,
 	UCHAR *win_k1_ptr,
@@ -104,6 +104,7 @@ void traversetrie_align(
 	int64_t readn, // TODO: never used - remove?
 	uint32_t win_num,
 	uint32_t partialwin,
+	const bucket_layout & bucket,
 	Runopts & opts
 )
 {
@@ -148,7 +149,7 @@ void traversetrie_align(
 				// (1) the node element holds a pointer to another trie node
 				if (value == 1)
 				{
-					traversetrie_align(trie_t->nodetype.trie,
+					traversetrie_align(trie_t->child(),
 						lev_t,
 						++depth,
 						win_k1_ptr,
@@ -158,6 +159,7 @@ void traversetrie_align(
 						readn,
 						win_num,
 						partialwin,
+						bucket,
 						opts
 					);
 
@@ -181,13 +183,13 @@ void traversetrie_align(
 					// number of characters per entry
 					uint32_t s = partialwin - depth;
 
-					unsigned char* start_bucket = (unsigned char*)trie_t->nodetype.bucket;
+					const unsigned char* start_bucket = trie_t->bucket();
 					if (start_bucket == NULL)
 					{
 						fprintf(stderr, "  ERROR: pointer start_bucket == NULL (paralleltraversal.cpp)\n");
 						exit(EXIT_FAILURE);
 					}
-					unsigned char* end_bucket = start_bucket + trie_t->size;
+					const unsigned char* end_bucket = start_bucket + trie_t->size;
 					if (end_bucket == NULL)
 					{
 						fprintf(stderr, "  ERROR: pointer end_bucket == NULL (paralleltraversal.cpp)\n");
@@ -200,7 +202,7 @@ void traversetrie_align(
 						uint32_t depth_b = depth;
 						lev_t = lev_t_bucket_pivot;
 						bool local_accept_kmer = false;
-						uint32_t entry_str = *((uint32_t*)start_bucket);
+						uint32_t entry_str = bucket.getKey(start_bucket);
 
 						// for each nt in the string
 						for (uint32_t j = 0; j < s; j++)
@@ -247,7 +249,7 @@ void traversetrie_align(
 							if (local_accept_kmer)
 							{
 								id_win entry = { 0,0 };
-								entry.id = *((uint32_t*)start_bucket + 1);
+								entry.id = bucket.getId(start_bucket);
 								entry.win = win_num;
 
 								// empty id_hits array, add 0-error id and exit
@@ -281,7 +283,7 @@ void traversetrie_align(
 						}//~for each 2 bits
 
 						// next entry
-						start_bucket += ENTRYSIZE;
+						start_bucket += bucket.entry_size;
 					}//~for each entry
 
 					lev_t = lev_t_trie_pivot;
@@ -22,23 +22,25 @@ void Writer::write()
 
 	auto t = std::chrono::high_resolution_clock::now();
 	int numPopped = 0;
+	ReadBatch batch;
 	for (;;) 
 	{
-		Read read = writeQueue.pop();
-		if (read.isEmpty)
+		if (!writeQueue.pop(batch)) // blocks until a batch is available. False at the end of stream
 		{
 			if (writeQueue.getPushers() == 0)
 				break; // no more records in the queue and no pushers => stop processing
-
-			if (!read.isValid) 
-				continue;
+			continue;
 		}
-		++numPopped;
-		//std::string matchResultsStr = read.matchesToJson();
-		std::string readstr = read.toString();
-		if (!opts.dbg_put_kvdb && readstr.size() > 0)
+
+		for (auto & read : batch)
 		{
-			kvdb.put(std::to_string(read.id), readstr);
+			++numPopped;
+			//std::string matchResultsStr = read.matchesToJson();
+			std::string readstr = read.toString();
+			if (!opts.dbg_put_kvdb && readstr.size() > 0)
+			{
+				kvdb.put(std::to_string(read.id), readstr);
+			}
 		}
 	}
 
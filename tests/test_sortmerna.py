@@ -10,13 +10,15 @@ import re
 import sys
 from subprocess import Popen, PIPE, run
 from os import close, remove, environ, listdir, unlink
-from os.path import abspath, exists, join, dirname, isfile
+from os.path import abspath, exists, join, dirname, isfile, basename, getsize, realpath
 from tempfile import mkstemp, mkdtemp
 from shutil import rmtree
 
 import skbio.io
 import platform
+import gzip
 import time
+import struct
 
 # ----------------------------------------------------------------------------
 # Copyright (c) 2014--, Evguenia Kopylova
@@ -57,6 +59,7 @@ class SortmernaTests(unittest.TestCase):
         
         # reads
         self.set2 = join(self.root, "set2_environmental_study_550_amplicon.fasta")
+        self.set2_bgzf = join(self.root, "set2_environmental_study_550_amplicon_bgzf.fasta.gz")
         self.set3 = join(self.root, "empty_file.fasta")
         self.set4 = join(self.root, "set4_mate_pairs_metatranscriptomics.fastq")
         self.set5 = join(self.root, "set5_simulated_amplicon_silva_bac_16s.fasta")
@@ -123,7 +126,8 @@ class SortmernaTests(unittest.TestCase):
     #END test_ref_shorter_than_seed
 
     def test_indexdb_rna_tmpdir_arg(self):
-        """ Test writing to --tmpdir
+        """ Test --tmpdir is accepted and nothing is written to it,
+            the keys for the minimal perfect hash are kept in memory
         """
         print("test_indexdb_rna_tmpdir_arg")
         start = time.time()
@@ -160,20 +164,16 @@ class SortmernaTests(unittest.TestCase):
         for fp in expected_db_files:
             self.assertTrue(exists(fp))
             
-        # check temporary folder was that set by --tmpdir
-        query = re.compile(b'temporary file was here: (.*?)\n')
-        m = query.search(stdout)
-        tmp_dir = ""
-        if m:
-            tmp_dir = dirname(m.group(1)).decode("utf-8")
-        self.assertEqual(tmpdir, tmp_dir)
+        # check no temporary file was written
+        self.assertFalse(re.search(b'temporary file was here', stdout))
+        self.assertEqual([], listdir(tmpdir))
         rmtree(tmpdir)
             
         print("test_indexdb_rna_tmpdir_arg: Run time: {}".format(time.time() - start))
     #END test_indexdb_rna_tmpdir_arg
 
     def test_indexdb_rna_TMPDIR_env(self):
-        """ Test writing to TMPDIR env variable
+        """ Test nothing is written to TMPDIR env variable
         """
         print("test_indexdb_rna_TMPDIR_env")
         start = time.time()
@@ -213,20 +213,16 @@ class SortmernaTests(unittest.TestCase):
         for fp in expected_db_files:
             self.assertTrue(exists(fp))
             
-        # check temporary folder was that set by --tmpdir
-        query = re.compile(b'temporary file was here: (.*?)\n')
-        m = query.search(stdout)
-        tmp_dir = ""
-        if m:
-            tmp_dir = dirname(m.group(1)).decode("utf-8")
-        self.assertEqual(tmpdir, tmp_dir)
+        # check no temporary file was written
+        self.assertFalse(re.search(b'temporary file was here', stdout))
+        self.assertEqual([], listdir(tmpdir))
         rmtree(tmpdir)
             
         print("test_indexdb_rna_TMPDIR_env: Run time: {}".format(time.time() - start))
     #END test_indexdb_rna_TMPDIR_env
 
     def test_indexdb_rna_tmp_dir_system(self):
-        """ Test writing to /tmp folder
+        """ Test indexing with no TMPDIR set does not need a temporary folder
         """
         FUNC = 'test_indexdb_rna_tmp_dir_system'
         print(FUNC)
@@ -265,17 +261,9 @@ class SortmernaTests(unittest.TestCase):
                                             '.pos_0.dat', '.stats'])
         for fp in expected_db_files:
             self.assertTrue(exists(fp))
-        # check temporary folder was that set by --tmpdir
-        query = re.compile(b'temporary file was here: (.*?)\n')
+        # check no temporary file was written
         print('stdout: {}'.format(stdout))
-        m = query.search(stdout)
-        
-        if 'Windows' in platform.platform():
-            tmp_dir = environ.get('TMP')
-            print('TEMP: {}'.format(tmp_dir))
-        else:
-            if m: tmp_dir = dirname(m.group(1).decode('utf-8'))
-            self.assertEqual("/tmp", tmp_dir)
+        self.assertFalse(re.search(b'temporary file was here', stdout))
             
         print("test_indexdb_rna_tmp_dir_system: Run time: {}".format(time.time() - start))
     #END test_indexdb_rna_tmp_dir_system
@@ -372,6 +360,13 @@ class SortmernaTests(unittest.TestCase):
                                             '.pos_4.dat',
                                             '.pos_5.dat',
                                             '.pos_6.dat',
+                                            '.ref_0.dat',
+                                            '.ref_1.dat',
+                                            '.ref_2.dat',
+                                            '.ref_3.dat',
+                                            '.ref_4.dat',
+                                            '.ref_5.dat',
+                                            '.ref_6.dat',
                                             '.stats'])
 
         # Make sure all db_files exist
@@ -381,6 +376,218 @@ class SortmernaTests(unittest.TestCase):
         print("test_indexdb_split_databases: Run time: {}".format(time.time() - start))
     #END test_indexdb_split_databases
 
+    def test_indexdb_threads(self):
+        """ Test indexing a database split into 7 parts
+            using 4 threads builds the same index as 1 thread
+        """
+        print("test_indexdb_threads")
+        start = time.time()
+
+        exts = ['.stats']
+        for part in range(7):
+            exts += ['.bursttrie_%d.dat' % part, '.kmer_%d.dat' % part, '.pos_%d.dat' % part]
+
+        index_dbs = []
+        for threads in ['1', '4']:
+            index_db = join(self.output_dir, "db_gg_13_8_th" + threads)
+            index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+            indexdb_command = [self.indexdb_rna,
+                               "--ref", index_path,
+                               "-m", "0.05",
+                               "--threads", threads]
+            print('test_indexdb_threads: {}'.format(indexdb_command))
+            proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+            self.assertEqual(0, proc.returncode)
+            index_dbs.append(index_db)
+
+        for ext in exts:
+            with open(index_dbs[0] + ext, 'rb') as f1, open(index_dbs[1] + ext, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        print("test_indexdb_threads: Run time: {}".format(time.time() - start))
+    #END test_indexdb_threads
+
+    def test_indexdb_mph(self):
+        """ Test indexing a database with each of the minimal perfect hash algorithms
+        """
+        print("test_indexdb_mph")
+        start = time.time()
+
+        for algo in ['chm', 'bdz', 'chd']:
+            index_db = join(self.output_dir, "GQ099317_" + algo)
+            index_path = "%s,%s" % (self.db_GQ099317, index_db)
+            indexdb_command = [self.indexdb_rna,
+                               "--ref", index_path,
+                               "--mph", algo,
+                               "-v"]
+            print('test_indexdb_mph: {}'.format(indexdb_command))
+            proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+            self.assertEqual(0, proc.returncode)
+            self.assertTrue(('Minimal perfect hash: ' + algo).encode() in proc.stdout)
+            for ext in ['.bursttrie_0.dat', '.kmer_0.dat', '.pos_0.dat', '.stats']:
+                self.assertTrue(exists(index_db + ext))
+
+        # unknown algorithm
+        proc = run([self.indexdb_rna, "--ref", "%s,%s" % (self.db_GQ099317, join(self.output_dir, "GQ099317_x")),
+                    "--mph", "xyz"], stdout=PIPE, stderr=PIPE)
+        self.assertNotEqual(0, proc.returncode)
+
+        print("test_indexdb_mph: Run time: {}".format(time.time() - start))
+    #END test_indexdb_mph
+
+    def test_indexdb_gz(self):
+        """ Test indexing a gzipped database split into 7 parts
+            builds the same index as the plain database
+        """
+        print("test_indexdb_gz")
+        start = time.time()
+
+        db_gz = join(self.output_dir, "gg_13_8_ref_set.fasta.gz")
+        with open(self.db_gg_13_8, 'rb') as fin, gzip.open(db_gz, 'wb') as fout:
+            fout.write(fin.read())
+
+        exts = []
+        for part in range(7):
+            exts += ['.bursttrie_%d.dat' % part, '.kmer_%d.dat' % part, '.pos_%d.dat' % part]
+
+        index_dbs = []
+        for ref in [self.db_gg_13_8, db_gz]:
+            index_db = join(self.output_dir, "db_gg_13_8_gz" + str(len(index_dbs)))
+            index_path = "%s,%s" % (ref, index_db)
+            indexdb_command = [self.indexdb_rna,
+                               "--ref", index_path,
+                               "-m", "0.05"]
+            print('test_indexdb_gz: {}'.format(indexdb_command))
+            proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+            self.assertEqual(0, proc.returncode)
+            self.assertTrue(exists(index_db + '.stats'))
+            index_dbs.append(index_db)
+
+        for ext in exts:
+            with open(index_dbs[0] + ext, 'rb') as f1, open(index_dbs[1] + ext, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        print("test_indexdb_gz: Run time: {}".format(time.time() - start))
+    #END test_indexdb_gz
+
+    def test_indexdb_append(self):
+        """ Test indexing the sequences appended to a database split into 7 parts (--append)
+            builds the same index as indexing the whole database
+        """
+        print("test_indexdb_append")
+        start = time.time()
+
+        with open(self.db_gg_13_8) as f:
+            seqs = ['>' + seq for seq in f.read().split('>')[1:]]
+        db_append = join(self.output_dir, "gg_13_8_ref_set_append.fasta")
+        with open(db_append, 'w') as f:
+            f.write(''.join(seqs[:len(seqs) // 2]))
+
+        index_append = join(self.output_dir, "db_gg_13_8_append")
+        index_full = join(self.output_dir, "db_gg_13_8_full")
+        indexdb_commands = [[self.indexdb_rna, "--ref", "%s,%s" % (db_append, index_append), "-m", "0.05"],
+                            [self.indexdb_rna, "--ref", "%s,%s" % (db_append, index_append), "-m", "0.05", "--append"],
+                            [self.indexdb_rna, "--ref", "%s,%s" % (db_append, index_full), "-m", "0.05"]]
+        for num_cmd, indexdb_command in enumerate(indexdb_commands):
+            if num_cmd == 1:
+                with open(db_append, 'a') as f:
+                    f.write(''.join(seqs[len(seqs) // 2:]))
+            print('test_indexdb_append: {}'.format(indexdb_command))
+            proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+            self.assertEqual(0, proc.returncode)
+
+        exts = ['.stats']
+        for part in range(7):
+            exts += ['.bursttrie_%d.dat' % part, '.kmer_%d.dat' % part, '.pos_%d.dat' % part]
+        self.assertFalse(exists(index_append + '.kmer_7.dat'))
+
+        for ext in exts:
+            with open(index_append + ext, 'rb') as f1, open(index_full + ext, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        # nothing more to index
+        proc = run(indexdb_commands[1] + ["-v"], stdout=PIPE, stderr=PIPE)
+        self.assertEqual(0, proc.returncode)
+        self.assertTrue(b'the index is up to date' in proc.stdout)
+
+        # a base of a sequence of the index changed, the id and the length kept
+        header, seq = seqs[0].split('\n', 1)
+        seqs[0] = header + '\n' + ('A' if seq[0] == 'N' else 'N') + seq[1:]
+        with open(db_append, 'w') as f:
+            f.write(''.join(seqs))
+        proc = run(indexdb_commands[1], stdout=PIPE, stderr=PIPE)
+        self.assertNotEqual(0, proc.returncode)
+        self.assertTrue(b'have changed' in proc.stderr)
+
+        print("test_indexdb_append: Run time: {}".format(time.time() - start))
+    #END test_indexdb_append
+
+    def test_indexdb_compact(self):
+        """ Test the compact index (--compact) of the database split into 7 parts takes fewer parts,
+            and the reads of 'test_multiple_databases_search' align the same on the compact index
+        """
+        print("test_indexdb_compact")
+        start = time.time()
+
+        def num_parts(index):
+            return len([name for name in listdir(self.output_dir) if name.startswith(basename(index) + '.pos_')])
+
+        index_gg = join(self.output_dir, "db_gg_13_8")
+        index_gg_compact = join(self.output_dir, "db_gg_13_8_compact")
+        for index, opts in [(index_gg, []), (index_gg_compact, ["--compact"])]:
+            indexdb_command = [self.indexdb_rna, "--ref", "%s,%s" % (self.db_gg_13_8, index), "-m", "0.05"] + opts
+            print('test_indexdb_compact: {}'.format(indexdb_command))
+            proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+            self.assertEqual(0, proc.returncode)
+        self.assertEqual(7, num_parts(index_gg))
+        self.assertTrue(num_parts(index_gg_compact) < num_parts(index_gg))
+
+        index_path = self._silva_index_path()
+        index_path_compact = self._silva_index_path("_compact")
+        self._build_index(index_path)
+        self._build_index(index_path_compact, ["--compact"])
+        self.assertTrue(getsize(join(self.output_dir, "db_bac16s_compact.pos_0.dat"))
+                        < getsize(join(self.output_dir, "db_bac16s.pos_0.dat")))
+
+        procs, aligned = self._assert_same_alignment(["--ref", index_path], ["--ref", index_path_compact])
+        self.assertEqual(4, aligned[0].count('>'))
+
+        print("test_indexdb_compact: Run time: {}".format(time.time() - start))
+    #END test_indexdb_compact
+
+    def test_indexdb_auto_parts(self):
+        """ Test the database split by the predicted search memory (--auto-parts) takes several parts,
+            each predicted within the given memory, and '-m' cannot be used with '--auto-parts'
+        """
+        print("test_indexdb_auto_parts")
+        start = time.time()
+
+        index_gg = join(self.output_dir, "db_gg_13_8")
+        indexdb_command = [self.indexdb_rna, "--ref", "%s,%s" % (self.db_gg_13_8, index_gg), "--auto-parts", "10.5"]
+        print('test_indexdb_auto_parts: {}'.format(indexdb_command))
+        proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+        self.assertEqual(0, proc.returncode)
+        self.assertTrue(len([name for name in listdir(self.output_dir) if name.startswith("db_gg_13_8.pos_")]) > 1)
+
+        # predicted search memory of each part at the end of the stats file
+        with open(index_gg + ".stats", 'rb') as f:
+            stats = f.read()
+        at = stats.find(b'SMRPMEMS')
+        self.assertTrue(at > 0)
+        num_parts = struct.unpack_from('<H', stats, at + 8)[0]
+        self.assertTrue(num_parts > 1)
+        for part in range(num_parts):
+            part_mem = struct.unpack_from('<QQQQ', stats, at + 10 + part * 32)
+            self.assertTrue(sum(part_mem) <= 10.5 * 1048576)
+
+        indexdb_command = [self.indexdb_rna, "--ref", "%s,%s" % (self.db_gg_13_8, index_gg), "--auto-parts", "10.5", "-m", "1"]
+        print('test_indexdb_auto_parts: {}'.format(indexdb_command))
+        proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+        self.assertNotEqual(0, proc.returncode)
+
+        print("test_indexdb_auto_parts: Run time: {}".format(time.time() - start))
+    #END test_indexdb_auto_parts
+
     def test_multiple_databases_search(self):
         """ Test sortmerna on 6 reads against
             arc-16s and bac-16s databases.
@@ -449,6 +656,407 @@ class SortmernaTests(unittest.TestCase):
         print("test_multiple_databases_search: Run time: {}".format(time.time() - start))
     #END test_multiple_databases_search
 
+    def _fastx_records(self, path):
+        """ The header, the sequence and the quality of each read of the FASTA/FASTQ file, sorted.
+            A missing file has no reads
+        """
+        records = []
+        if exists(path):
+            with open(path) as f:
+                lines = [line.rstrip('\r\n') for line in f]
+            is_fastq = len(lines) > 0 and lines[0].startswith('@')
+            for line in lines:
+                if is_fastq:
+                    if len(records) == 0 or len(records[-1]) == 4:
+                        records.append([line])
+                    else:
+                        records[-1].append(line)
+                elif line.startswith('>'):
+                    records.append([line, ''])
+                elif records:
+                    records[-1][1] += line
+        return sorted([record[0], record[1], record[3] if is_fastq else ''] for record in records)
+
+    def _log_results(self, path):
+        """ The statistics of the log file, without the time stamp """
+        with open(path) as f:
+            log = f.read()
+        return log[log.index(" Results:"):].strip().splitlines()[:-1]
+
+    def _silva_index_path(self, index_suffix=""):
+        """ The '--ref' value of the bac-16s and arc-16s databases of 'test_multiple_databases_search' """
+        if 'Windows' in platform.platform():
+            separator = ';'
+        else:
+            separator = ':'
+        return "%s,%s%s%s,%s" % (self.db_bac16s,
+                                 join(self.output_dir, "db_bac16s" + index_suffix),
+                                 separator,
+                                 self.db_arc16s,
+                                 join(self.output_dir, "db_arc16s" + index_suffix))
+
+    def _build_index(self, index_path, opts=[]):
+        """ Index each reference file, index name pair of 'index_path' """
+        indexdb_command = [self.indexdb_rna, "--ref", index_path, "-v"] + opts
+        print('{}: {}'.format(self._testMethodName, indexdb_command))
+        proc = run(indexdb_command, stdout=PIPE, stderr=PIPE)
+        self.assertEqual(0, proc.returncode)
+
+    def _run_set7(self, name, opts, exts=[".fasta"]):
+        """ Align the reads of 'test_multiple_databases_search' with the options 'opts', which give the references.
+            Returns the process and the aligned reads report of each extension of 'exts'
+        """
+        report_opts = {".fasta": ["--fastx"], ".blast": ["--blast", "1"], ".sam": ["--sam"], "_otus.txt": ["--otu_map"]}
+        aligned_basename = join(self.output_dir, "aligned_" + name)
+        sortmerna_command = [self.sortmerna,
+                             "--reads", self.set7,
+                             "--aligned", aligned_basename,
+                             "-d", join(self.output_dir, "kvdb_" + name),
+                             "--task", self.ALIGN_REPORT] + opts
+        for ext in exts:
+            sortmerna_command += report_opts[ext]
+
+        print('{}: {}'.format(self._testMethodName, sortmerna_command))
+        proc = run(sortmerna_command, stdout=PIPE, stderr=PIPE)
+        if proc.stderr: print(proc.stderr)
+        self.assertEqual(0, proc.returncode)
+
+        reports = []
+        for ext in exts:
+            with open(aligned_basename + ext) as f:
+                reports.append(f.read())
+        return proc, reports
+
+    def _assert_same_alignment(self, extra_opts_a, extra_opts_b, exts=[".fasta"], before_b=None):
+        """ Test the reads of 'test_multiple_databases_search' align and report the same
+            with the options 'extra_opts_a' and 'extra_opts_b'. 'before_b' is called between the runs.
+            Returns the processes of both runs and the reports of the first run.
+            Used by:
+                test_prefetch_mem
+                test_shm
+                test_indexdb_compact
+                test_gumbel_cache
+                test_keep_references
+                test_ref_store
+                test_ref_catalog
+                test_positions_table
+        """
+        proc_a, reports_a = self._run_set7("a", extra_opts_a, exts)
+        if before_b: before_b()
+        proc_b, reports_b = self._run_set7("b", extra_opts_b, exts)
+        self.assertEqual(reports_a, reports_b)
+        return [proc_a, proc_b], reports_a
+
+    def test_prefetch_mem(self):
+        """ Test the reads of 'test_multiple_databases_search' align the same
+            whether the next index part is prefetched (default) or not (--prefetch_mem 0)
+        """
+        print("test_prefetch_mem")
+        start = time.time()
+
+        index_path = self._silva_index_path()
+        self._build_index(index_path)
+
+        procs, aligned = self._assert_same_alignment(["--ref", index_path], ["--ref", index_path, "--prefetch_mem", "0"])
+        self.assertTrue(b'Waiting for prefetched index' in procs[0].stdout)
+        self.assertTrue(b'Not prefetching index' in procs[1].stdout)
+        self.assertEqual(4, aligned[0].count('>'))
+
+        print("test_prefetch_mem: Run time: {}".format(time.time() - start))
+    #END test_prefetch_mem
+
+    def test_keep_references(self):
+        """ Test the reads of 'test_multiple_databases_search' align and report the same whether
+            the references are kept between the tasks of '--task 4' (default) or loaded by each task (--prefetch_mem 0)
+        """
+        print("test_keep_references")
+        start = time.time()
+
+        index_path = self._silva_index_path()
+        self._build_index(index_path)
+
+        procs, aligned = self._assert_same_alignment(["--ref", index_path], ["--ref", index_path, "--prefetch_mem", "0"],
+                                                     [".fasta", ".blast"])
+        self.assertTrue(b'Keeping the references' in procs[0].stdout)
+        self.assertTrue(b'Not keeping the references' in procs[1].stdout)
+        self.assertEqual(4, aligned[0].count('>'))
+
+        print("test_keep_references: Run time: {}".format(time.time() - start))
+    #END test_keep_references
+
+    def test_ref_store(self):
+        """ Test the reads of 'test_multiple_databases_search' align and report the same whether
+            the references are mapped from the store written by indexdb or parsed from the reference file
+        """
+        print("test_ref_store")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_bac16s")
+        index_path = "%s,%s" % (self.db_bac16s, index_db)
+        self._build_index(index_path)
+        self.assertTrue(exists(index_db + ".ref_0.dat"))
+
+        # the second run parses the reference file
+        procs, aligned = self._assert_same_alignment(["--ref", index_path], ["--ref", index_path],
+                                                     [".fasta", ".blast", ".sam"],
+                                                     before_b=lambda: remove(index_db + ".ref_0.dat"))
+        self.assertTrue(aligned[0].count('>') > 0)
+
+        print("test_ref_store: Run time: {}".format(time.time() - start))
+    #END test_ref_store
+
+    def test_ref_catalog(self):
+        """ Test the SAM @SQ lines are of every reference sequence, and the reads of
+            'test_multiple_databases_search' are reported the same whether the ids are
+            taken from the reference catalog written by indexdb or from the references
+        """
+        print("test_ref_catalog")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_bac16s")
+        index_path = "%s,%s" % (self.db_bac16s, index_db)
+        self._build_index(index_path)
+        self.assertTrue(exists(index_db + ".refcat"))
+
+        # the id and the length of each reference sequence
+        sq_lines = []
+        with open(self.db_bac16s) as f:
+            for line in f:
+                line = line.rstrip()
+                if line.startswith('>'):
+                    sq_lines.append(["@SQ\tSN:" + line.split(' ')[0].lstrip('>@') + "\tLN:", 0])
+                elif sq_lines:
+                    sq_lines[-1][1] += len(line)
+        sq_lines = [sq + str(len_seq) for sq, len_seq in sq_lines]
+
+        # the second run takes the ids from the references
+        opts = ["--ref", index_path, "--SQ", "--id", "0.97", "--coverage", "0.97"]
+        procs, aligned = self._assert_same_alignment(opts, opts, [".sam", "_otus.txt"],
+                                                     before_b=lambda: remove(index_db + ".refcat"))
+        self.assertEqual(sq_lines, [line for line in aligned[0].splitlines() if line.startswith("@SQ")])
+        self.assertTrue(len(aligned[1]) > 0)
+
+        print("test_ref_catalog: Run time: {}".format(time.time() - start))
+    #END test_ref_catalog
+
+    def test_positions_table(self):
+        """ Test the (L+1)-mer positions table written by indexdb is one contiguous array of positions
+            with the offsets of each (L+1)-mer, and the reads of 'test_multiple_databases_search' align
+            the same as on the table of the legacy layout, one array per (L+1)-mer
+        """
+        print("test_positions_table")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_bac16s")
+        index_path = "%s,%s" % (self.db_bac16s, index_db)
+        self._build_index(index_path)
+
+        # magic, version, number of (L+1)-mers, number of positions
+        with open(index_db + ".pos_0.dat", 'rb') as f:
+            table = f.read()
+        magic, version, number_elements, num_positions = struct.unpack_from('<8sIIQ', table)
+        self.assertEqual(b'SMRPOSTB', magic)
+        self.assertEqual(1, version)
+        self.assertEqual(24 + 8 * (number_elements + 1) + 8 * num_positions, len(table))
+
+        positions_idx = struct.unpack_from('<%dQ' % (number_elements + 1), table, 24)
+        self.assertEqual(0, positions_idx[0])
+        self.assertEqual(num_positions, positions_idx[-1])
+        self.assertTrue(all(positions_idx[i] < positions_idx[i + 1] for i in range(number_elements)))
+
+        # the position on the sequence, the sequence number
+        positions_at = 24 + 8 * (number_elements + 1)
+        with open(self.db_bac16s) as f:
+            num_seqs = f.read().count('>')
+        positions = struct.unpack_from('<%dI' % (2 * num_positions), table, positions_at)
+        self.assertTrue(max(positions[1::2]) < num_seqs)
+
+        def write_legacy():
+            with open(index_db + ".pos_0.dat", 'wb') as f:
+                f.write(struct.pack('<I', number_elements))
+                for i in range(number_elements):
+                    f.write(struct.pack('<I', positions_idx[i + 1] - positions_idx[i]))
+                    f.write(table[positions_at + 8 * positions_idx[i]:positions_at + 8 * positions_idx[i + 1]])
+
+        opts = ["--ref", index_path]
+        procs, aligned = self._assert_same_alignment(opts, opts, [".fasta", ".blast"], before_b=write_legacy)
+        self.assertTrue(aligned[0].count('>') > 0)
+
+        print("test_positions_table: Run time: {}".format(time.time() - start))
+    #END test_positions_table
+
+    def test_shm(self):
+        """ Test the reads of 'test_multiple_databases_search' align the same
+            when the index parts are published to the shared memory (--shm) by the first run
+            and attached by the second run
+        """
+        print("test_shm")
+        start = time.time()
+
+        if 'Windows' in platform.platform():
+            print("test_shm: --shm is not supported on Windows")
+            return
+
+        index_path = self._silva_index_path()
+        self._build_index(index_path)
+
+        # the segments of the indexes of this test, see 'ShmSegment::getName'
+        def segment_prefix(index):
+            fnv = 14695981039346656037
+            for ch in index.encode():
+                fnv = ((fnv ^ ch) * 1099511628211) & 0xffffffffffffffff
+            return "smr_%016x_" % fnv
+        prefixes = set(segment_prefix(path) for index in ["db_bac16s", "db_arc16s"]
+                       for path in [join(self.output_dir, index), realpath(join(self.output_dir, index))])
+
+        try:
+            opts = ["--ref", index_path, "--shm"]
+            procs, aligned = self._assert_same_alignment(opts, opts)
+        finally:
+            for name in listdir('/dev/shm'):
+                if name[:len("smr_") + 17] in prefixes:
+                    remove(join('/dev/shm', name))
+
+        # the first run publishes, the second run attaches
+        self.assertTrue(b'Published' in procs[0].stdout)
+        self.assertFalse(b'Published' in procs[1].stdout)
+        self.assertEqual(4, aligned[0].count('>'))
+
+        print("test_shm: Run time: {}".format(time.time() - start))
+    #END test_shm
+
+    def test_gumbel_cache(self):
+        """ Test the Gumbel parameters computed by the first run are cached next to the index
+            and reused by the second run with the same scoring, and a new scoring adds a record
+        """
+        print("test_gumbel_cache")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_bac16s")
+        index_path = "%s,%s" % (self.db_bac16s, index_db)
+        self._build_index(index_path)
+
+        # magic, version, then a record of the scoring matrix, the gap penalties, the background frequencies, lambda and K
+        header_size = 12
+        record_size = 16 * 8 + 2 * 8 + 4 * 8 + 2 * 8
+
+        def assert_num_records(num_records):
+            self.assertEqual(header_size + num_records * record_size, getsize(index_db + ".gumbel"))
+
+        self._assert_same_alignment(["--ref", index_path], ["--ref", index_path], before_b=lambda: assert_num_records(1))
+        assert_num_records(1)
+
+        self._run_set7("match", ["--ref", index_path, "--match", "3"])
+        assert_num_records(2)
+
+        print("test_gumbel_cache: Run time: {}".format(time.time() - start))
+    #END test_gumbel_cache
+
+    def test_paired_reads_two_files(self):
+        """ Test sortmerna on the 6 reads of 'test_multiple_databases_search'
+            given as 3 pairs in two files (--reads twice).
+            The aligned mates go to separate _fwd and _rev files.
+        """
+        FUNC = "test_paired_reads_two_files"
+        print(FUNC)
+        start = time.time()
+
+        index_path = "%s,%s" % (self.db_bac16s, join(self.output_dir, "db_bac16s"))
+        datadir = join(self.output_dir, 'kvdb')
+
+        # split the reads into two mate files: reads 0,2,4 -> R1, reads 1,3,5 -> R2
+        reads = list(skbio.io.read(self.set7, format='fasta'))
+        reads_r1 = join(self.output_dir, "set7_R1.fasta")
+        reads_r2 = join(self.output_dir, "set7_R2.fasta")
+        skbio.io.write((seq for seq in reads[0::2]), format='fasta', into=reads_r1)
+        skbio.io.write((seq for seq in reads[1::2]), format='fasta', into=reads_r2)
+
+        cmd = [self.indexdb_rna, "--ref", index_path, "-v"]
+        print("{}: {}".format(FUNC, cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+
+        aligned_basename = join(self.output_dir, "aligned")
+
+        cmd = [self.sortmerna,
+                "--ref", index_path,
+                "--reads", reads_r1,
+                "--reads", reads_r2,
+                "--aligned", aligned_basename,
+                "--log",
+                "--fastx",
+                "-d", datadir,
+                "--task", self.ALIGN_REPORT]
+
+        print("{}: {}".format(FUNC, cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+        if proc.stderr: print(proc.stderr)
+
+        with open(aligned_basename + ".log") as f_log:
+            for line in f_log:
+                if line.startswith("    Total reads = "):
+                    total_reads_log = (re.split(' = ', line)[1]).strip()
+                elif line.startswith("    Total reads passing E-value threshold"):
+                    num_hits_log = (re.split(' = | \(', line)[1]).strip()
+        self.assertEqual("6", total_reads_log)
+
+        num_hits_file = 0
+        for suffix, mate in (("_fwd.fasta", "R1"), ("_rev.fasta", "R2")):
+            self.assertTrue(exists(aligned_basename + suffix))
+            ids = set(seq.metadata['id'] for seq in (reads[0::2] if mate == "R1" else reads[1::2]))
+            for seq in skbio.io.read(aligned_basename + suffix, format='fasta'):
+                self.assertTrue(seq.metadata['id'] in ids)
+                num_hits_file += 1
+        self.assertEqual(num_hits_log, str(num_hits_file))
+
+        print("{}: Run time: {}".format(FUNC, time.time() - start))
+    #END test_paired_reads_two_files
+
+    def test_reads_stdin(self):
+        """ Test sortmerna on the 6 reads of 'test_multiple_databases_search'
+            piped on stdin (--reads -). The other (non-aligned) reads go to stdout (--other -).
+        """
+        FUNC = "test_reads_stdin"
+        print(FUNC)
+        start = time.time()
+
+        index_path = "%s,%s" % (self.db_bac16s, join(self.output_dir, "db_bac16s"))
+
+        cmd = [self.indexdb_rna, "--ref", index_path, "-v"]
+        print("{}: {}".format(FUNC, cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+
+        aligned_basename = join(self.output_dir, "aligned")
+
+        cmd = [self.sortmerna,
+                "--ref", index_path,
+                "--reads", "-",
+                "--aligned", aligned_basename,
+                "--other", "-",
+                "--log",
+                "--fastx"]
+
+        print("{}: {}".format(FUNC, cmd))
+        with open(self.set7, 'rb') as f_reads:
+            proc = run(cmd, stdin=f_reads, stdout=PIPE, stderr=PIPE)
+
+        with open(aligned_basename + ".log") as f_log:
+            for line in f_log:
+                if line.startswith("    Total reads = "):
+                    total_reads_log = (re.split(' = ', line)[1]).strip()
+                elif line.startswith("    Total reads passing E-value threshold"):
+                    num_hits_log = (re.split(' = | \(', line)[1]).strip()
+        self.assertEqual("6", total_reads_log)
+
+        num_hits_file = sum(1 for seq in skbio.io.read(aligned_basename + ".fasta", format='fasta'))
+        self.assertEqual(num_hits_log, str(num_hits_file))
+
+        # the other reads on stdout only
+        num_other = proc.stdout.decode().count('>')
+        self.assertEqual(6, num_hits_file + num_other)
+
+        print("{}: Run time: {}".format(FUNC, time.time() - start))
+    #END test_reads_stdin
+
     def output_test(self, aligned_basename, other_basename):
         """ Test output of unit test functions.
             Used by:
@@ -860,6 +1468,247 @@ class SortmernaTests(unittest.TestCase):
         print("test_simulated_amplicon_12_part_index: Run time: {}".format(time.time() - start))
     #END test_simulated_amplicon_12_part_index
 
+    def test_simulated_amplicon_read_store(self):
+        """ Test the reads parsed into the binary read store (--read_store) and streamed from it
+            are written to the aligned and the other reads files unchanged
+        """
+        print("test_simulated_amplicon_read_store")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_gg_13_8")
+        index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+        datadir = join(self.output_dir, 'kvdb')
+
+        cmd = [self.indexdb_rna, "--ref", index_path, "-v"]
+        print("test_simulated_amplicon_read_store: {}".format(cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+        self.assertEqual(0, proc.returncode)
+
+        aligned_basename = join(self.output_dir, "aligned")
+        other_basename = join(self.output_dir, "other")
+        cmd = [self.sortmerna,
+                "--ref", index_path,
+                "--reads", self.set7,
+                "--aligned", aligned_basename,
+                "--other", other_basename,
+                "--fastx",
+                "--read_store",
+                "-d", datadir,
+                "--task", self.ALIGN_REPORT]
+        print("test_simulated_amplicon_read_store: {}".format(cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+        if proc.stderr: print(proc.stderr)
+        self.assertEqual(0, proc.returncode)
+        self.assertTrue(exists(join(datadir, "readstore.bin")))
+
+        reads = self._fastx_records(aligned_basename + ".fasta") + self._fastx_records(other_basename + ".fasta")
+        self.assertEqual(self._fastx_records(self.set7), sorted(reads))
+
+        print("test_simulated_amplicon_read_store: Run time: {}".format(time.time() - start))
+    #END test_simulated_amplicon_read_store
+
+    def test_read_threads(self):
+        """ Test the reads sharded between several Reader threads (--threads N:1:N) align and report
+            the same as the reads parsed by one Reader thread
+        """
+        print("test_read_threads")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_gg_13_8")
+        index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+        self._build_index(index_path)
+
+        # non-compressed, more reads than the 16384 between two read checkpoints for several shards
+        reads = join(self.output_dir, "set2.fasta")
+        with gzip.open(self.set2 + ".gz", 'rb') as f_gz, open(reads, 'wb') as f:
+            f.write(f_gz.read())
+
+        results = []
+        for threads in ["1:1:3", "3:1:3"]:
+            aligned_basename = join(self.output_dir, "aligned_" + threads[0])
+            other_basename = join(self.output_dir, "other_" + threads[0])
+            cmd = [self.sortmerna,
+                    "--ref", index_path,
+                    "--reads", reads,
+                    "--aligned", aligned_basename,
+                    "--other", other_basename,
+                    "--fastx",
+                    "--log",
+                    "--threads", threads,
+                    "-d", join(self.output_dir, "kvdb_" + threads[0]),
+                    "--task", self.ALIGN_REPORT]
+            print("test_read_threads: {}".format(cmd))
+            proc = run(cmd, stdout=PIPE, stderr=PIPE)
+            if proc.stderr: print(proc.stderr)
+            self.assertEqual(0, proc.returncode)
+
+            # each Reader maps its own range of the reads file
+            shards = re.findall(rb'Memory mapped .* from offset (\d+) read (\d+)', proc.stdout)
+            self.assertEqual(int(threads[0]), len(set(shards)))
+
+            results.append([self._fastx_records(aligned_basename + ".fasta"),
+                            self._fastx_records(other_basename + ".fasta"),
+                            self._log_results(aligned_basename + ".log")])
+
+        self.assertEqual(100000, len(results[0][0]) + len(results[0][1]))
+        self.assertEqual(results[0], results[1])
+
+        print("test_read_threads: Run time: {}".format(time.time() - start))
+    #END test_read_threads
+
+    def test_reads_bgzf(self):
+        """ Test the first 3000 reads of set2 compressed in BGZF blocks align and report the same
+            whether inflated by one or several threads (--thgz), and the same as the non-compressed reads
+        """
+        print("test_reads_bgzf")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_gg_13_8")
+        index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+        self._build_index(index_path)
+
+        reads = join(self.output_dir, "set2_bgzf.fasta")
+        with gzip.open(self.set2_bgzf, 'rb') as f_gz, open(reads, 'wb') as f:
+            f.write(f_gz.read())
+
+        results = []
+        for num_run, opts in enumerate([["--reads", reads],
+                                        ["--reads-gz", self.set2_bgzf, "--thgz", "1"],
+                                        ["--reads-gz", self.set2_bgzf, "--thgz", "4"]]):
+            aligned_basename = join(self.output_dir, "aligned_" + str(num_run))
+            other_basename = join(self.output_dir, "other_" + str(num_run))
+            cmd = [self.sortmerna,
+                    "--ref", index_path,
+                    "--aligned", aligned_basename,
+                    "--other", other_basename,
+                    "--fastx",
+                    "--log",
+                    "-d", join(self.output_dir, "kvdb_" + str(num_run)),
+                    "--task", self.ALIGN_REPORT] + opts
+            print("test_reads_bgzf: {}".format(cmd))
+            proc = run(cmd, stdout=PIPE, stderr=PIPE)
+            if proc.stderr: print(proc.stderr)
+            self.assertEqual(0, proc.returncode)
+            if num_run > 0:
+                self.assertTrue(('BGZF input detected. Using %s inflate threads' % opts[-1]).encode() in proc.stdout)
+
+            results.append([self._fastx_records(aligned_basename + ".fasta"),
+                            self._fastx_records(other_basename + ".fasta"),
+                            self._log_results(aligned_basename + ".log")])
+
+        self.assertEqual(3000, len(results[0][0]) + len(results[0][1]))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+        print("test_reads_bgzf: Run time: {}".format(time.time() - start))
+    #END test_reads_bgzf
+
+    def test_reads_mmap(self):
+        """ Test the memory mapped non-compressed FASTQ and multi-line FASTA reads are written
+            to the aligned and the other reads files unchanged, and a FASTQ read without
+            the '+' line is an error
+        """
+        print("test_reads_mmap")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_gg_13_8")
+        index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+        self._build_index(index_path)
+
+        reads_fastq = join(self.output_dir, "set7.fastq")
+        reads_fasta = join(self.output_dir, "set7_multiline.fasta")
+        with open(reads_fastq, 'w') as f_fastq, open(reads_fasta, 'w') as f_fasta:
+            for header, seq, qual in self._fastx_records(self.set7):
+                f_fastq.write('@%s\n%s\n+\n%s\n' % (header[1:], seq, 'I' * len(seq)))
+                f_fasta.write(header + '\n' + '\n'.join(seq[i:i + 40] for i in range(0, len(seq), 40)) + '\n')
+
+        for num_run, reads in enumerate([reads_fastq, reads_fasta]):
+            aligned_basename = join(self.output_dir, "aligned_" + str(num_run))
+            other_basename = join(self.output_dir, "other_" + str(num_run))
+            cmd = [self.sortmerna,
+                    "--ref", index_path,
+                    "--reads", reads,
+                    "--aligned", aligned_basename,
+                    "--other", other_basename,
+                    "--fastx",
+                    "-d", join(self.output_dir, "kvdb_" + str(num_run)),
+                    "--task", self.ALIGN_REPORT]
+            print("test_reads_mmap: {}".format(cmd))
+            proc = run(cmd, stdout=PIPE, stderr=PIPE)
+            if proc.stderr: print(proc.stderr)
+            self.assertEqual(0, proc.returncode)
+            self.assertTrue(b'Memory mapped' in proc.stdout)
+
+            ext = ".fastq" if reads == reads_fastq else ".fasta"
+            aligned = self._fastx_records(aligned_basename + ext) + self._fastx_records(other_basename + ext)
+            self.assertEqual(self._fastx_records(reads), sorted(aligned))
+
+        # the '+' line of the second read replaced
+        with open(reads_fastq) as f:
+            lines = f.read().splitlines()
+        lines[6] = 'I' * len(lines[5])
+        with open(reads_fastq, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        cmd = [self.sortmerna, "--ref", index_path, "--reads", reads_fastq, "--aligned", join(self.output_dir, "aligned_bad"),
+               "-d", join(self.output_dir, "kvdb_bad"), "--task", self.ALIGN_REPORT]
+        print("test_reads_mmap: {}".format(cmd))
+        proc = run(cmd, stdout=PIPE, stderr=PIPE)
+        self.assertNotEqual(0, proc.returncode)
+
+        print("test_reads_mmap: Run time: {}".format(time.time() - start))
+    #END test_reads_mmap
+
+    def test_read_offsets(self):
+        """ Test the read offsets index (readoffsets.bin) written on the first pass over the reads,
+            and the reads loaded by their ID with it ('read' command of --cmd) from the compressed
+            reads through the gzip access points, and from the non-compressed reads
+        """
+        print("test_read_offsets")
+        start = time.time()
+
+        index_db = join(self.output_dir, "db_gg_13_8")
+        index_path = "%s,%s" % (self.db_gg_13_8, index_db)
+        self._build_index(index_path)
+
+        reads = join(self.output_dir, "set2.fasta")
+        with gzip.open(self.set2 + ".gz", 'rb') as f_gz, open(reads, 'wb') as f:
+            f.write(f_gz.read())
+        with open(reads) as f:
+            records = ['>' + record for record in f.read().split('>')[1:]]
+        read_ids = [0, 54321, len(records) - 1]
+
+        for num_run, reads_opts in enumerate([["--reads-gz", self.set2 + ".gz"], ["--reads", reads]]):
+            datadir = join(self.output_dir, "kvdb_" + str(num_run))
+            opts = ["--ref", index_path, "--aligned", join(self.output_dir, "aligned_" + str(num_run)), "-d", datadir] + reads_opts
+            cmd = [self.sortmerna, "--task", "0"] + opts
+            print("test_read_offsets: {}".format(cmd))
+            proc = run(cmd, stdout=PIPE, stderr=PIPE)
+            if proc.stderr: print(proc.stderr)
+            self.assertEqual(0, proc.returncode)
+
+            # magic, version, is_gz, src_size, src_mtime, num_recs, num_points, points_pos
+            with open(join(datadir, "readoffsets.bin"), 'rb') as f:
+                header = struct.unpack('<8sIIQqQQQ', f.read(56))
+            self.assertEqual(b'SMROFFST', header[0])
+            self.assertEqual(num_run == 0, header[2] == 1)
+            self.assertEqual(len(records), header[5])
+            if num_run == 0:
+                # an access point every 1MB of the inflated reads
+                self.assertTrue(header[6] > 1)
+
+            cmd = [self.sortmerna, "--cmd"] + opts
+            commands = ''.join("read --id=%d\n" % read_id for read_id in read_ids) + "exit\n"
+            print("test_read_offsets: {} {}".format(cmd, commands))
+            proc = run(cmd, input=commands.encode(), stdout=PIPE, stderr=PIPE)
+            if proc.stderr: print(proc.stderr)
+            self.assertEqual(0, proc.returncode)
+            for read_id in read_ids:
+                header, seq = records[read_id].split('\n', 1)
+                self.assertTrue(("Read load OK 1\n%s\n%s\n" % (header, seq.replace('\n', ''))).encode() in proc.stdout)
+
+        print("test_read_offsets: Run time: {}".format(time.time() - start))
+    #END test_read_offsets
+
     def test_environmental_output(self):
         """ Test outputting FASTA file for de novo
             clustering using environmental data.